@@ -36,8 +36,12 @@ from argos.qt import QtCore, QtWidgets, QtSlot
 from argos.qt.misc import handleException, initQApplication
 from argos.reg.basereg import nameToIdentifier
 from argos.repo.colors import CmLibSingleton, DEF_FAV_COLOR_MAPS
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.fileindex import globalFileIndex
+from argos.repo.filewatcher import RepoFileWatcher
 from argos.repo.registry import globalRtiRegistry
 from argos.repo.repotreemodel import RepoTreeModel
+from argos.repo.searchindex import SearchIndexer
 from argos.utils.config import getConfigParameter, deleteParameter
 from argos.utils.dirs import argosConfigDirectory, normRealPath, ensureFileExists
 from argos.utils.moduleinfo import versionStrToTuple
@@ -144,8 +148,13 @@ class ArgosApplication(QtCore.QObject):
         if DEBUGGING:
             self.qApplication.focusChanged.connect(self.focusChanged) # for debugging
 
-        self._repo = RepoTreeModel()
+        self._repo = RepoTreeModel(asyncFetching=True)
+        self._searchIndexer = SearchIndexer(self._repo, parent=self)
+        self._fileWatcher = RepoFileWatcher(self._repo, parent=self)
+        self._fileWatcher.sigFileRefreshed.connect(self._searchIndexer.scheduleWalk)
         self._rtiRegistry = globalRtiRegistry()
+        self._fileHandlePool = globalFileHandlePool()
+        self._fileIndex = globalFileIndex()
         self._inspectorRegistry = InspectorRegistry()
 
         self._mainWindows = []
@@ -176,6 +185,8 @@ class ArgosApplication(QtCore.QObject):
         if actions:
             actions[0].trigger()
 
+        self._fileHandlePool.startIdleTimer()
+
         if self._runTestWalk:
             testWalkDialog = self._mainWindows[0].testWalkDialog
             testWalkDialog.walkAllRepoNodes(allInspectors=True, allDetailTabs=True)
@@ -249,6 +260,20 @@ class ArgosApplication(QtCore.QObject):
         return self._repo
 
 
+    @property
+    def searchIndexer(self):
+        """ Returns the indexer that is used to search the files in the repository
+        """
+        return self._searchIndexer
+
+
+    @property
+    def fileWatcher(self):
+        """ Returns the watcher that updates the repository when files change on disk
+        """
+        return self._fileWatcher
+
+
     @property
     def rtiRegistry(self):
         """ Returns the repository tree item (rti) registry
@@ -354,6 +379,10 @@ class ArgosApplication(QtCore.QObject):
         cfg['plugins']['inspectors'] = self.inspectorRegistry.marshall()
         cfg['plugins']['file-formats'] = self.rtiRegistry.marshall()
 
+        cfg['fileHandlePool'] = self._fileHandlePool.marshall()
+        cfg['fileIndex'] = self._fileIndex.marshall()
+        cfg['fileWatcher'] = self._fileWatcher.marshall()
+
         # Save windows as a dict instead of a list to improve readability of the resulting JSON
         cfg['windows'] = {}
         for winNr, mainWindow in enumerate(self.mainWindows):
@@ -387,6 +416,10 @@ class ArgosApplication(QtCore.QObject):
         self.inspectorRegistry.unmarshall(pluginCfg.get('inspectors', {}))
         self.rtiRegistry.unmarshall(pluginCfg.get('file-formats', {}))
 
+        self._fileHandlePool.unmarshall(cfg.get('fileHandlePool', {}))
+        self._fileIndex.unmarshall(cfg.get('fileIndex', {}))
+        self._fileWatcher.unmarshall(cfg.get('fileWatcher', {}))
+
         for winId, winCfg in cfg.get('windows', {}).items():
             assert winId.startswith('win-'), "Win ID doesn't start with 'win-': {}".format(winId)
             self.addNewMainWindow(cfg=winCfg)
@@ -486,8 +519,7 @@ class ArgosApplication(QtCore.QObject):
                 For example filePatterns = ['my_file.nc, 'your_file.nc']
                 For example filePatterns = ['*.h5']
         """
-        for fileName in fileNames:
-            self.repo.loadFile(fileName, rtiRegItem=None)
+        self.repo.loadFiles(fileNames, rtiRegItem=None)
 
 
     def getRecentFiles(self):
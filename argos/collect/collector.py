@@ -539,7 +539,22 @@ class Collector(BasePanel):
         self.sigContentsChanged.emit(UpdateReason.COLLECTOR_SPIN_BOX)
 
 
-    def getSlicedArray(self, copy=True):
+    def getSlicedArrayShape(self):
+        """ Returns the shape of the array that getSlicedArray returns, without reading it.
+
+            Returns None if no slice can be made (i.e. the RTI is not sliceable).
+        """
+        if not self._rti or not self.rtiIsSliceable:
+            return None
+
+        shape = []
+        for comboBox in self._comboBoxes:
+            dimNr = self._comboBoxDimensionIndex(comboBox)
+            shape.append(1 if dimNr >= FAKE_DIM_OFFSET else self._rti.arrayShape[dimNr])
+        return tuple(shape)
+
+
+    def getSlicedArray(self, copy=True, regionSlices=None):
         """ Slice the rti using a tuple of slices made from the values of the combo and spin boxes.
 
             :param copy: If True (the default), a copy is made so that inspectors cannot
@@ -547,6 +562,9 @@ class Collector(BasePanel):
                 potential optimization, but only if you are absolutely sure that you don't modify
                 the the slicedArray in your inspector! Note that this function calls transpose,
                 which can still make a copy of the array for certain permutations.
+            :param regionSlices: If given, a tuple with a slice object per combo box. Only this
+                region of the sliced array is read. Can be used to read (strided) parts of large
+                slices. The slices of fake dimensions are ignored.
 
             :return: ArrayWithMask array with the same number of dimension as the number of
                 comboboxes (this can be zero!).
@@ -579,6 +597,14 @@ class Collector(BasePanel):
             dimNr = spinBox.property("dim_nr")
             sliceList[dimNr] = spinBox.value()
 
+        if regionSlices is not None:
+            assert len(regionSlices) == len(self._comboBoxes), \
+                "Expected {} region slices, got: {}".format(len(self._comboBoxes), regionSlices)
+            for comboBox, regionSlice in zip(self._comboBoxes, regionSlices):
+                dimNr = self._comboBoxDimensionIndex(comboBox)
+                if dimNr < FAKE_DIM_OFFSET:
+                    sliceList[dimNr] = regionSlice
+
         # Make the array slicer. It needs to be a tuple, a list of only integers will be
         # interpreted as an index. With a tuple, array[(exp1, exp2, ..., expN)] is equivalent to
         # array[exp1, exp2, ..., expN].
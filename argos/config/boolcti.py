@@ -86,18 +86,19 @@ class  BoolCti(AbstractCti):
         return ""
 
 
-    def insertChild(self, childItem, position=None):
-        """ Inserts a child item to the current item.
+    def insertChildren(self, childItems, position=None):
+        """ Inserts child items to the current item.
 
             Overridden from BaseTreeItem.
         """
-        childItem = super(BoolCti, self).insertChild(childItem, position=None)
+        childItems = super(BoolCti, self).insertChildren(childItems, position=None)
 
         enableChildren = self.enabled and self.data != self.childrenDisabledValue
-        #logger.debug("BoolCti.insertChild: {} enableChildren={}".format(childItem, enableChildren))
-        childItem.enableBranch(enableChildren)
-        childItem.enabled = enableChildren
-        return childItem
+        #logger.debug("BoolCti.insertChildren: {} enableChildren={}".format(childItems, enableChildren))
+        for childItem in childItems:
+            childItem.enableBranch(enableChildren)
+            childItem.enabled = enableChildren
+        return childItems
 
 
     @property
@@ -22,13 +22,15 @@ from __future__ import division, print_function
 import logging
 import warnings
 
+import numpy as np
 import pyqtgraph as pg
 
+from argos.inspector.pgplugins.maskedimage import subsampleUnmasked
 from argos.qt import QtCore, QtWidgets, QtSignal
 
 
 from argos.utils.cls import checkType
-from pgcolorbar.colorlegend import ColorLegendItem
+from pgcolorbar.colorlegend import ColorLegendItem, NoFiniteDataError
 
 # from argos.info import DEBUGGING
 # from argos.qt import Qt, QtCore, QtWidgets, QtSignal
@@ -43,6 +45,8 @@ class ArgosColorLegendItem(ColorLegendItem):
 
         Suppresses the FutureWarning of PyQtGraph in _updateHistogram.
         Overrides the _imageItemHasIntegerData method.
+        Excludes the masked values of a MaskedImageItem from the histogram range.
+        Can calculate the histogram from statistics that are shared with the inspector.
         Adds context menu with reset color scale action.
         Middle mouse click resets the axis with the settings in the config tree.
     """
@@ -64,6 +68,64 @@ class ArgosColorLegendItem(ColorLegendItem):
         self.addAction(self.resetColorScaleAction)
 
 
+    def setStatisticsFunction(self, statisticsFunction):
+        """ Sets the function that returns the statistics of the image values.
+
+            If set, the histogram is calculated from the sorted values of the ArrayStatistics
+            object that the function returns, instead of from the image. The inspector can cache
+            these statistics so that they are shared with its auto-range methods, and are not
+            calculated again when the image is redrawn with the same data. If None, the image of
+            the image item is used.
+
+            The histogram is updated when the image is changed (or set visible).
+        """
+        self._statisticsFunction = statisticsFunction
+        self._statisticsHistogram = None
+
+
+    def _updateHistogram(self):
+        """ Updates the histogram with data from the image.
+
+            Overridden to calculate the histogram from the statistics, if a statistics function
+            has been set. The histogram is reused as long as the statistics object stays the same.
+        """
+        statisticsFunction = getattr(self, '_statisticsFunction', None)
+        imageItem = self.getImageItem()
+        if (statisticsFunction is None or not self.histogramIsVisible or
+                imageItem is None or imageItem.image is None):
+            super(ArgosColorLegendItem, self)._updateHistogram()
+            return
+
+        try:
+            statistics = statisticsFunction()
+            forIntegers = self._imageItemHasIntegerData(imageItem)
+
+            cacheKey = (statistics, forIntegers)
+            if self._statisticsHistogram is not None and self._statisticsHistogram[0] == cacheKey:
+                histogram = self._statisticsHistogram[1]
+            else:
+                histRange = statistics.finiteRange
+                histBins = np.asarray(self._calcHistogramBins(
+                    (float(histRange[0]), float(histRange[1])), forIntegers=forIntegers))
+                histogram = (histBins[:-1], statistics.histogram(histBins))
+                self._statisticsHistogram = (cacheKey, histogram)
+
+        except NoFiniteDataError as ex:
+            logger.debug("No finite data. Unable to calculate histogram: {}".format(ex))
+            self.histPlotDataItem.setData([])  # seems necessary to clear data from screen
+            self.histPlotDataItem.clear()
+        except Exception as ex:
+            logger.warning("Unable to calculate histogram: {}".format(ex))
+            self.histPlotDataItem.setData([])
+            self.histPlotDataItem.clear()
+        else:
+            self.histPlotDataItem.setData(*histogram)
+
+            # Discard outliers when setting the histogram height (as in ColorLegendItem).
+            histYrange = np.percentile(histogram[1], (self.histHeightPercentile, ))[0]
+            self.histViewBox.setRange(xRange=(-histYrange, 0), padding=None)
+
+
     @classmethod
     def _imageItemHasIntegerData(cls, imageItem):
         """ Returns True if the imageItem contains integer data.
@@ -80,6 +142,27 @@ class ArgosColorLegendItem(ColorLegendItem):
             return super(ArgosColorLegendItem, cls)._imageItemHasIntegerData(imageItem)
 
 
+    def _calcHistogramRange(self, imgArr, step='auto', targetImageSize=200):
+        """ Calculates the range of the histogram.
+
+            Overridden so that the masked values of a MaskedImageItem are excluded. They are no
+            longer replaced by Nans in the image. The range is returned as floats, so that the
+            bins of small integer types are calculated without overflow.
+        """
+        maskArray = getattr(self.getImageItem(), 'maskArray', None)
+        if maskArray is None or imgArr is None or imgArr.size == 0:
+            mn, mx = super(ArgosColorLegendItem, self)._calcHistogramRange(
+                imgArr, step=step, targetImageSize=targetImageSize)
+            return (mn, mx) if mn is None else (float(mn), float(mx))
+
+        stepData = subsampleUnmasked(imgArr, maskArray, step=step,
+                                     targetImageSize=targetImageSize)
+        if stepData.size == 0:
+            return (np.nan, np.nan)  # As for an all-NaN image
+        else:
+            return (float(stepData.min()), float(stepData.max()))
+
+
     def emitResetColorScaleSignal(self):
         """ Emits the sigColorScaleReset to request the inspectors to reset the color scale
         """
@@ -31,6 +31,7 @@ from argos.info import DEBUGGING
 from argos.config.boolcti import BoolCti, BoolGroupCti
 from argos.config.choicecti import ChoiceCti
 from argos.config.groupcti import MainGroupCti
+from argos.config.qtctis import ColorCti
 from argos.inspector.abstract import AbstractInspector, InvalidDataError, UpdateReason
 from argos.inspector.pgplugins.colorbar import ArgosColorLegendItem
 from argos.inspector.pgplugins.pgctis import (
@@ -38,14 +39,19 @@ from argos.inspector.pgplugins.pgctis import (
     PgAxisCti, PgAxisFlipCti, PgAspectRatioCti, PgAxisRangeCti, PgGridCti,
     PgColorMapCti, PgColorLegendCti, PgColorLegendLabelCti, PgShowHistCti,
     PgShowDragLinesCti, setXYAxesAutoRangeOn, PgPlotDataItemCti)
+from argos.inspector.pgplugins.imagepyramid import ImagePyramidLayer, REDUCTIONS
+from argos.inspector.pgplugins.maskedimage import MaskedImageItem, imageArrayFromSlice
 from argos.inspector.pgplugins.pgplotitem import ArgosPgPlotItem
+from argos.inspector.pgplugins.tiledimage import (
+    MIN_TILED_PIXELS, TiledImageLayer, TiledSliceReader)
 from argos.qt import Qt, QtCore, QtGui, QtSlot
 
-from argos.utils.cls import arrayHasRealNumbers, checkType, isAnArray, toString
+from argos.utils.cls import arrayHasRealNumbers, checkType, toString
 from argos.utils.cls import arrayKindLabel
 from argos.utils.defs import RIGHT_ARROW
-from argos.utils.masks import (ArrayWithMask, replaceMaskedValueWithFloat,
-                               nanPercentileOfSubsampledArrayWithMask)
+from argos.utils.masks import (SAMPLING_SUBSAMPLE, ArrayWithMask, PlotBuffers,
+                               StatisticsCache, sanitizeForPlotting)
+from argos.utils.tilecache import TileCache
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +62,11 @@ ROW_IMAGE,    COL_IMAGE    = 2, 0
 ROW_VER_LINE, COL_VER_LINE = 2, 1
 ROW_PROBE,    COL_PROBE    = 3, 0  # colspan = 2
 
+CROSS_HAIR_Z_VALUE = 10  # Draw the cross-hair on top of the image tiles
+DEFAULT_REFRESH_RATE = 60  # Frames per second if the refresh rate of the screen is unknown.
 
-def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, subsample):
+
+def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, sampling):
     """ Calculates the range from the inspectors' sliced array. Discards percentage of the minimum
         and percentage of the maximum values of the inspector.slicedArray
 
@@ -68,30 +77,34 @@ def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, subsample):
             horizontal or vertical cross hairs.
             If the cursor is outside the image, there is no valid data under the cross-hair and
             the range will be determined from the sliced array as a fall back.
-        :param bool subsample: if True, the image will be subsampled (to 200 by 200) before
-            calculating the range. This to improve performance by large images.
+        :param sampling: one of the SAMPLING_METHODS of the masks module. With 'subsample' the
+            image will be subsampled (to 200 by 200) before calculating the range, with 'sketch'
+            the range is approximated in a single pass over all data. This to improve
+            performance by large images.
     """
     checkType(pgImagePlot2d.slicedArray, ArrayWithMask) # sanity check
 
+    # The statistics are cached so that they are only calculated once per (part of the) slice.
     if crossPlot is None:
-        array = pgImagePlot2d.slicedArray  # the whole image
+        key, getArray = None, lambda: pgImagePlot2d.slicedArray  # the whole image
 
     elif crossPlot == 'horizontal':
         if pgImagePlot2d.crossPlotRow is not None:
-            array = pgImagePlot2d.slicedArray[pgImagePlot2d.crossPlotRow, :]
+            key, getArray = ('row', pgImagePlot2d.crossPlotRow), pgImagePlot2d.horCrossSection
         else:
-            array = pgImagePlot2d.slicedArray # fall back on complete sliced array
+            key, getArray = None, lambda: pgImagePlot2d.slicedArray # fall back on sliced array
 
     elif crossPlot == 'vertical':
         if pgImagePlot2d.crossPlotCol is not None:
-            array = pgImagePlot2d.slicedArray[:, pgImagePlot2d.crossPlotCol]
+            key, getArray = ('col', pgImagePlot2d.crossPlotCol), pgImagePlot2d.verCrossSection
         else:
-            array = pgImagePlot2d.slicedArray # fall back on complete sliced array
+            key, getArray = None, lambda: pgImagePlot2d.slicedArray # fall back on sliced array
     else:
         raise ValueError("crossPlot must be: None, 'horizontal' or 'vertical', got: {}"
                          .format(crossPlot))
 
-    return nanPercentileOfSubsampledArrayWithMask(array, (percentage, 100 - percentage), subsample)
+    statistics = pgImagePlot2d.sliceStatistics.statistics(key, sampling, getArray)
+    return statistics.percentiles((percentage, 100 - percentage))
 
 
 def crossPlotAutoRangeMethods(pgImagePlot2d, crossPlot, intialItems=None):
@@ -184,6 +197,8 @@ class PgImagePlot2dCti(MainGroupCti):
             PgShowHistCti(pgImagePlot2d.colorLegendItem))
         self.showDragLinesCti = self.colorCti.insertChild(
             PgShowDragLinesCti(pgImagePlot2d.colorLegendItem))
+        self.maskColorCti = self.colorCti.insertChild(
+            ColorCti('masked values', QtGui.QColor('#B0B0B0')))
 
         colorAutoRangeFunctions = defaultAutoRangeMethods(self.pgImagePlot2d)
         self.colorLegendCti = self.colorCti.insertChild(
@@ -194,6 +209,17 @@ class PgImagePlot2dCti(MainGroupCti):
         # improves performance for large images and reduces aliasing. If autoDownsample is not
         # specified, then ImageItem will choose whether to downsample the image based on its size.
         self.autoDownSampleCti = self.insertChild(BoolCti('auto down sample', True))
+
+        # If True, large slices are not read completely. A strided overview is read, and the
+        # tiles in view are read at the resolution that the zoom level requires.
+        self.tiledReadingCti = self.insertChild(BoolCti('tiled reading', True))
+
+        # Large images that are not read in tiles are shown with a multi-resolution pyramid,
+        # which is built in the background. The levels are reduced by taking the mean, maximum
+        # or minimum of blocks of 2x2 pixels.
+        self.pyramidCti = self.insertChild(
+            ChoiceCti('pyramid', 0, configValues=list(REDUCTIONS) + [None],
+                      displayValues=['mean', 'maximum', 'minimum', 'off']))
         self.zoomModeCti = self.insertChild(BoolCti('rectangle zoom mode', False))
 
         ### Probe and cross-hair plots ###
@@ -307,7 +333,13 @@ class PgImagePlot2d(AbstractInspector):
         # The sliced array is kept in memory. This may be different per inspector, e.g. 3D
         # inspectors may decide that this uses to much memory. The slice is therefor not stored
         # in the collector.
+        # If tiled reading is used, the slicedArray contains only a strided overview of the slice.
+        # The full resolution values are then read with the reader of the tiledImageLayer.
         self.slicedArray = None
+        self.sliceShape = None
+
+        # Statistics of the slice and its cross sections, shared by all auto-range methods.
+        self.sliceStatistics = StatisticsCache()
 
         self.titleLabel = pg.LabelItem('title goes here...')
 
@@ -316,15 +348,29 @@ class PgImagePlot2d(AbstractInspector):
         self.viewBox = self.imagePlotItem.getViewBox()
         self.viewBox.disableAutoRange(BOTH_AXES)
 
-        self.imageItem = pg.ImageItem()
-        self.imageItem.setPos(-0.5, -0.5) # Center on pixels (see pg.ImageView.setImage source code)
+        self.imageItem = MaskedImageItem()  # Centered on the pixels with setRect in _drawContents
         self.imagePlotItem.addItem(self.imageItem)
 
         self.colorLegendItem = ArgosColorLegendItem(self.imageItem)
+        self.colorLegendItem.setStatisticsFunction(self._imageStatistics)
+
+        self._tileCache = TileCache()
+        self.tiledImageLayer = TiledImageLayer(self.viewBox, self.imageItem, parent=self)
+        self.pyramidLayer = ImagePyramidLayer(self.viewBox, self.imageItem, parent=self)
 
         # Probe and cross hair plots
         self.crossPlotRow = None # the row coordinate of the cross hair. None if no cross hair.
         self.crossPlotCol = None # the col coordinate of the cross hair. None if no cross hair.
+        self._horPlotBuffers = PlotBuffers()  # Reused on every mouse move.
+        self._verPlotBuffers = PlotBuffers()
+
+        # The probe is updated at most once per frame of the display. See mouseMoved.
+        self._probeScenePos = None
+        self._probePending = False
+        self._probeTimer = QtCore.QTimer(self)
+        self._probeTimer.setSingleShot(True)
+        self._probeTimer.timeout.connect(self._onProbeTimeout)
+
         self.horCrossPlotItem = ArgosPgPlotItem()
         self.verCrossPlotItem = ArgosPgPlotItem()
         self.horCrossPlotItem.setXLink(self.imagePlotItem)
@@ -342,6 +388,22 @@ class PgImagePlot2d(AbstractInspector):
         self.crossLineVerShadow = pg.InfiniteLine(angle=90, movable=False, pen=self.crossShadowPen)
         self.crossLineHorizontal = pg.InfiniteLine(angle=0, movable=False, pen=self.crossPen)
         self.crossLineVertical = pg.InfiniteLine(angle=90, movable=False, pen=self.crossPen)
+        for crossLine in (self.crossLineHorShadow, self.crossLineVerShadow,
+                          self.crossLineHorizontal, self.crossLineVertical):
+            crossLine.setZValue(CROSS_HAIR_Z_VALUE)
+
+        # The items in the cross plots are created once and only updated when the cursor moves.
+        # The plot data items depend on the cross-hair pen config and are made in _resetCrossPlots
+        self.horCrossDataItem = None
+        self.verCrossDataItem = None
+        self.horCrossLineShadow90 = pg.InfiniteLine(angle=90, movable=False,
+                                                    pen=self.crossShadowPen)
+        self.horCrossLine90 = pg.InfiniteLine(angle=90, movable=False, pen=self.crossPen)
+        self.verCrossLineShadow0 = pg.InfiniteLine(angle=0, movable=False,
+                                                   pen=self.crossShadowPen)
+        self.verCrossLine0 = pg.InfiniteLine(angle=0, movable=False, pen=self.crossPen)
+        self.horCrossPoint90 = pg.PlotDataItem(symbolPen=self.crossPen, symbolSize=10)
+        self.verCrossPoint0 = pg.PlotDataItem(symbolPen=self.crossPen, symbolSize=10)
 
         self.imagePlotItem.addItem(self.crossLineVerShadow, ignoreBounds=True)
         self.imagePlotItem.addItem(self.crossLineHorShadow, ignoreBounds=True)
@@ -389,7 +451,11 @@ class PgImagePlot2d(AbstractInspector):
         """ Is called before destruction. Can be used to clean-up resources.
         """
         logger.debug("Finalizing: {}".format(self))
+        self._probeTimer.stop()
         self.colorLegendItem.finalize()
+        self.tiledImageLayer.finalize()
+        self.pyramidLayer.finalize()
+        self._tileCache.clear()
         self.imagePlotItem.scene().sigMouseMoved.disconnect(self.mouseMoved)
         self.imagePlotItem.close()
         self.graphicsLayoutWidget.close()
@@ -408,6 +474,10 @@ class PgImagePlot2d(AbstractInspector):
         """
         logger.debug("Clearing inspector contents")
         self.slicedArray = None
+        self.sliceShape = None
+        self.sliceStatistics.invalidate()
+        self.tiledImageLayer.setReader(None)
+        self.pyramidLayer.setImage(None)
         self.titleLabel.setText('')
 
         # Don't clear the imagePlotItem, the imageItem is only added in the constructor.
@@ -436,6 +506,8 @@ class PgImagePlot2d(AbstractInspector):
 
         self.horCrossPlotItem.clear()
         self.verCrossPlotItem.clear()
+        self.horCrossDataItem = None
+        self.verCrossDataItem = None
 
         # Hide the complete widget. # TODO: do we still need the lines above?
         self.graphicsLayoutWidget.hide()
@@ -483,7 +555,23 @@ class PgImagePlot2d(AbstractInspector):
                 self.verPlotAdded = False
                 gridLayout.activate()
 
-        slicedArray = self.collector.getSlicedArray()
+        if reason == UpdateReason.RTI_CHANGED:
+            self._tileCache.clear()  # The contents of the RTI may have changed.
+
+        sliceShape = self.collector.getSlicedArrayShape()
+        if (self.config.tiledReadingCti.configValue and sliceShape is not None and
+                np.prod(sliceShape) > MIN_TILED_PIXELS):
+            rtiInfo = self.collector.rtiInfo
+            sliceKey = (rtiInfo['path'], rtiInfo['slices'], rtiInfo['y-dim'], rtiInfo['x-dim'])
+            tiledReader = TiledSliceReader(self._readSliceRegion, sliceShape, sliceKey,
+                                           self._tileCache)
+            slicedArray = tiledReader.readOverview()
+        else:
+            tiledReader = None
+            slicedArray = self.collector.getSlicedArray()
+
+        self.tiledImageLayer.setReader(None)
+
         if slicedArray is None:
             self._clearContents()
             raise InvalidDataError()  # Don't show message, to common.
@@ -492,7 +580,19 @@ class PgImagePlot2d(AbstractInspector):
             raise InvalidDataError(
                 "Selected item contains {} data.".format(arrayKindLabel(slicedArray.data)))
         else:
+            # The slice is read again after a config change but its contents are the same then.
+            sliceChanged = (reason != UpdateReason.CONFIG_CHANGED or self.slicedArray is None or
+                            self.slicedArray.shape != slicedArray.shape)
+            if sliceChanged:
+                self.sliceStatistics.invalidate()
+
+            # Likewise the pyramid is kept, so that the view doesn't fall back to level 0.
+            keepPyramid = (not sliceChanged and tiledReader is None and
+                           self.pyramidLayer.reduction == self.config.pyramidCti.configValue)
+            if not keepPyramid:
+                self.pyramidLayer.setImage(None)
             self.slicedArray = slicedArray
+            self.sliceShape = slicedArray.shape if tiledReader is None else tiledReader.shape
 
         # -- Valid plot data from here on --
 
@@ -504,41 +604,32 @@ class PgImagePlot2d(AbstractInspector):
                 self.sigShowMessage.emit(
                     "The cross-hair pen 'line' and 'symbol' config options are both unchecked!")
 
-        numElem = np.prod(self.slicedArray.data.shape)
+        numElem = np.prod(self.sliceShape)
         if numElem == 0:
             self.sigShowMessage.emit("Current slice is empty.")  # Not expected to happen.
         elif numElem == 1:
             self.sigShowMessage.emit("Current slice contains only a single data point.")
 
-        # PyQtGraph doesn't handle masked arrays so we convert the masked values to Nans. Missing
-        # data values are replaced by NaNs. The PyQtGraph image plot shows this as the color at the
-        # lowest end of the color scale. Unfortunately we cannot choose a missing-value color, but
-        # at least the Nans do not influence for the histogram and color range.
-        # We don't update self.slicedArray here because the data probe should still be able to
-        # print the actual value.
-        imageArray = replaceMaskedValueWithFloat(self.slicedArray.data, self.slicedArray.mask,
-                                                 np.nan, copyOnReplace=True)
-
-        # Replace infinite value with Nans because PyQtGraph fails on them. Note that the CTIs of
-        # the cross plots (e.g. horCrossPlotRangeCti) are still connected to self.slicedArray, so
-        # if the cross section consists of only infs, they may not able to update the autorange.
-        # A warning is issued in that case.
-        # We don't update self.slicedArray here because the data probe should still be able to
-        # print the actual value.
-        imageArray = replaceMaskedValueWithFloat(imageArray, np.isinf(self.slicedArray.data),
-                                                 np.nan, copyOnReplace=True)
-
-        # PyQtGraph uses the following dimension order: T, X, Y, Color.
-        # We need to transpose the slicedArray ourselves because axes = {'x':1, 'y':0}
-        # doesn't seem to do anything.
-        imageArray = imageArray.transpose()
+        # The image keeps its data type, masked values are drawn in an overlay with the mask
+        # color and are excluded from the histogram. Infinite values are replaced by Nans. Note
+        # that the CTIs of the cross plots (e.g. horCrossPlotRangeCti) are still connected to
+        # self.slicedArray, so if the cross section consists of only infs, they may not able to
+        # update the autorange. A warning is issued in that case.
+        imageArray, maskArray = imageArrayFromSlice(self.slicedArray)
 
         # Set the _wasIntegerData to True if the original data type was a signed or unsigned. This
         # allows the ArgosColorLegendItem to make histogram bins as if it were an integer
         self.imageItem._wasIntegerData = self.slicedArray.data.dtype.kind in 'ui'
         self.imageItem.setAutoDownsample(self.config.autoDownSampleCti.configValue)
+        self.imageItem.setMaskColor(self.config.maskColorCti.configValue.getRgb())
+        self.imageItem.setMask(maskArray)  # Before setImage so that the histogram excludes it.
         self.imageItem.setImage(imageArray, autoLevels=False)  # Do after _wasIntegerData is set!
 
+        # An overview covers the complete slice.
+        nRows, nCols = self.sliceShape
+        imageRect = QtCore.QRectF(-0.5, -0.5, nCols, nRows)
+        self.imageItem.setRect(imageRect)
+
         self.imagePlotItem.setRectangleZoomOn(self.config.zoomModeCti.configValue)
 
         # Always use pan mode in the cross plots. Rectangle zoom is akward there and it's nice to
@@ -550,158 +641,261 @@ class PgImagePlot2d(AbstractInspector):
         self.verCrossPlotItem.invertY(self.config.yFlippedCti.configValue)
 
         self.probeLabel.setVisible(self.config.probeCti.configValue)
+        self._resetCrossPlots()
 
         self.titleLabel.setText(self.configValue('title').format(**self.collector.rtiInfo))
 
         # self.config.logBranch()
         self.config.updateTarget()
 
+        # Set the reader after the view range is updated, so that only the tiles in view are read.
+        self.tiledImageLayer.setReader(tiledReader)
+        if tiledReader is None and not keepPyramid:
+            self.pyramidLayer.setImage(imageArray, maskArray, imageRect,
+                                       self.config.pyramidCti.configValue)
+
+
+    def _imageStatistics(self):
+        """ Returns the statistics of the (subsampled) image for the histogram of the color legend.
+
+            They are taken from the slice statistics, so they are shared with the color range
+            methods and are only calculated again when the slice changes.
+        """
+        return self.sliceStatistics.statistics(None, SAMPLING_SUBSAMPLE, lambda: self.slicedArray)
+
+
+    def _readSliceRegion(self, rowSlice, colSlice):
+        """ Reads a region of the slice. Is used by the TiledSliceReader.
+        """
+        return self.collector.getSlicedArray(regionSlices=(rowSlice, colSlice))
+
+
+    def horCrossSection(self):
+        """ Returns the row of the slice at the horizontal cross-hair as ArrayWithMask.
+
+            The row has the full resolution, also if tiled reading is used.
+            Returns None if there is no cross-hair.
+        """
+        if self.crossPlotRow is None:
+            return None
+        elif self.tiledImageLayer.reader is None:
+            return self.slicedArray[self.crossPlotRow, :]
+        else:
+            return self.tiledImageLayer.reader.readRow(self.crossPlotRow)
+
+
+    def verCrossSection(self):
+        """ Returns the column of the slice at the vertical cross-hair as ArrayWithMask.
+
+            The column has the full resolution, also if tiled reading is used.
+            Returns None if there is no cross-hair.
+        """
+        if self.crossPlotCol is None:
+            return None
+        elif self.tiledImageLayer.reader is None:
+            return self.slicedArray[:, self.crossPlotCol]
+        else:
+            return self.tiledImageLayer.reader.readCol(self.crossPlotCol)
+
+
+    def _valueAt(self, row, col):
+        """ Returns a (value, masked) tuple with the full resolution value at row and column.
+        """
+        if self.tiledImageLayer.reader is None:
+            index = tuple([row, col])
+            return self.slicedArray.data[index], self.slicedArray.maskAt(index)
+        else:
+            return self.tiledImageLayer.reader.readValue(row, col)
+
+
+    def _resetCrossPlots(self):
+        """ Clears the cross plots and adds the items that are updated when the cursor moves.
+
+            The plot data items are created anew because the cross-hair pen may have changed.
+        """
+        self.horCrossPlotItem.clear()
+        self.verCrossPlotItem.clear()
+
+        self.horCrossDataItem = self.config.crossPenCti.createPlotDataItem()
+        self.verCrossDataItem = self.config.crossPenCti.createPlotDataItem()
+        self.horCrossPlotItem.addItem(self.horCrossDataItem)
+        self.verCrossPlotItem.addItem(self.verCrossDataItem)
+
+        crossBrush = QtGui.QBrush(self.config.crossPenCti.penColor)
+        self.horCrossPoint90.setSymbolBrush(crossBrush)
+        self.verCrossPoint0.setSymbolBrush(crossBrush)
+
+        for item in (self.horCrossLineShadow90, self.horCrossLine90, self.horCrossPoint90):
+            self.horCrossPlotItem.addItem(item, ignoreBounds=True)
+        for item in (self.verCrossLineShadow0, self.verCrossLine0, self.verCrossPoint0):
+            self.verCrossPlotItem.addItem(item, ignoreBounds=True)
+
+        self._setCrossPlotItemsVisible(self.horCrossPlotItem, False)
+        self._setCrossPlotItemsVisible(self.verCrossPlotItem, False)
+
+
+    @staticmethod
+    def _setCrossPlotItemsVisible(crossPlotItem, visible):
+        """ Shows or hides the items of a cross plot.
+        """
+        for item in crossPlotItem.items:
+            item.setVisible(visible)
+
+
+    def _probeInterval(self):
+        """ Returns the number of milliseconds between two frames of the display.
+        """
+        screen = QtGui.QGuiApplication.primaryScreen()
+        refreshRate = screen.refreshRate() if screen is not None else 0
+        if not refreshRate or refreshRate <= 0:
+            refreshRate = DEFAULT_REFRESH_RATE
+        return max(1, int(1000 / refreshRate))
+
 
     @QtSlot(object)
     def mouseMoved(self, viewPos):
+        """ Updates the probe and cross-hair plots for the position under the cursor.
+
+            The mouse may be moved much more often than the display is refreshed. The first
+            movement is handled immediately, the next ones at most once per display frame, using
+            the last position.
+        """
+        self._probeScenePos = viewPos
+        if self._probeTimer.isActive():
+            self._probePending = True
+        else:
+            self.updateProbe()
+            self._probeTimer.start(self._probeInterval())
+
+
+    @QtSlot()
+    def _onProbeTimeout(self):
+        """ Updates the probe if the mouse was moved since the last update.
+        """
+        if self._probePending:
+            self._probePending = False
+            self.updateProbe()
+            self._probeTimer.start(self._probeInterval())
+
+
+    def updateProbe(self):
         """ Updates the probe text with the values under the cursor.
             Draws a vertical line and a symbol at the position of the probe.
+
+            The cross sections are only read when the cursor moves to another pixel.
         """
         try:
+            viewPos = self._probeScenePos
+            if viewPos is None:
+                return
             checkType(viewPos, QtCore.QPointF)
             show_data_point = False # shows the data point as a circle in the cross hair plots
-            self.crossPlotRow, self.crossPlotCol = None, None
-
-            self.probeLabel.setText("<span style='color: #808080'>No data at cursor</span>")
-            self.crossLineHorizontal.setVisible(False)
-            self.crossLineVertical.setVisible(False)
-            self.crossLineHorShadow.setVisible(False)
-            self.crossLineVerShadow.setVisible(False)
-
-            self.horCrossPlotItem.clear()
-            self.verCrossPlotItem.clear()
 
+            row, col = None, None
             if self.slicedArray is not None and self.viewBox.sceneBoundingRect().contains(viewPos):
-
                 # Calculate the row and column at the cursor.
                 scenePos = self.viewBox.mapSceneToView(viewPos)
-                row, col = round(scenePos.y()), round(scenePos.x())
-                row, col = int(row), int(col) # Needed in Python 2
-                nRows, nCols = self.slicedArray.shape
-
-                if (0 <= row < nRows) and (0 <= col < nCols):
-                    self.viewBox.setCursor(Qt.CrossCursor)
-
-                    self.crossPlotRow, self.crossPlotCol = row, col
-                    index = tuple([row, col])
-                    valueStr = toString(self.slicedArray.data[index],
-                                        masked=self.slicedArray.maskAt(index),
-                                        maskFormat='&lt;masked&gt;')
-
-                    if self.config.probeCti.configValue:
-                        txt = "({}, {}) = ({:d}, {:d}) {} {} = {}".format(
-                            self.collector.rtiInfo['x-dim'], self.collector.rtiInfo['y-dim'],
-                            col, row, RIGHT_ARROW, self.collector.rtiInfo['name'], valueStr)
-                        self.probeLabel.setText(txt)
-
-                    # Show cross section at the cursor pos in the line plots
-                    if self.config.horCrossPlotCti.configValue:
-                        self.crossLineHorShadow.setVisible(True)
-                        self.crossLineHorizontal.setVisible(True)
-                        self.crossLineHorShadow.setPos(row)
-                        self.crossLineHorizontal.setPos(row)
-
-                        # Line plot of cross section row.
-                        # First determine which points are connected or separated by masks/nans.
-                        rowData = self.slicedArray.data[row, :]
-                        connected = np.isfinite(rowData)
-                        if isAnArray(self.slicedArray.mask):
-                            connected = np.logical_and(connected, ~self.slicedArray.mask[row, :])
-                        else:
-                            connected = (np.zeros_like(rowData)
-                                         if self.slicedArray.mask else connected)
-
-                        # Replace mask by Nans. Only doing when not showing lines to hack around PyQtGraph issue 1057
-                        # See comment in PgLinePlot1d._drawContents for a more detailed explanation
-                        # TODO: reuse imageItem data array when this hack is no longer necessary
-                        if not self.config.crossPenCti.lineCti.configValue:
-                            rowData = replaceMaskedValueWithFloat(rowData, np.logical_not(connected),
-                                                                  np.nan, copyOnReplace=True)
-
-                        # Replace infinite value with nans because PyQtGraph can't handle them
-                        rowData = replaceMaskedValueWithFloat(rowData, np.isinf(rowData),
-                                                              np.nan, copyOnReplace=True)
-
-                        horPlotDataItem = self.config.crossPenCti.createPlotDataItem()
-                        # TODO: try to use connect='finite' when the hack above is no longer necessary. In that case
-                        # test with array_masked test data
-                        horPlotDataItem.setData(rowData, connect=connected)
-                        self.horCrossPlotItem.addItem(horPlotDataItem)
-
-
-                        # Vertical line in hor-cross plot
-                        crossLineShadow90 = pg.InfiniteLine(angle=90, movable=False,
-                                                            pen=self.crossShadowPen)
-                        crossLineShadow90.setPos(col)
-                        self.horCrossPlotItem.addItem(crossLineShadow90, ignoreBounds=True)
-                        crossLine90 = pg.InfiniteLine(angle=90, movable=False, pen=self.crossPen)
-                        crossLine90.setPos(col)
-                        self.horCrossPlotItem.addItem(crossLine90, ignoreBounds=True)
-
-                        if show_data_point:
-                            crossPoint90 = pg.PlotDataItem(symbolPen=self.crossPen)
-                            crossPoint90.setSymbolBrush(QtGui.QBrush(
-                                    self.config.crossPenCti.penColor))
-                            crossPoint90.setSymbolSize(10)
-                            crossPoint90.setData((col,), (rowData[col],))
-                            self.horCrossPlotItem.addItem(crossPoint90, ignoreBounds=True)
-
-                        self.config.horCrossPlotRangeCti.updateTarget() # update auto range
-                        del rowData # defensive programming
-
-                    if self.config.verCrossPlotCti.configValue:
-                        self.crossLineVerShadow.setVisible(True)
-                        self.crossLineVertical.setVisible(True)
-                        self.crossLineVerShadow.setPos(col)
-                        self.crossLineVertical.setPos(col)
-
-                        # Line plot of cross section row.
-                        # First determine which points are connected or separated by masks/nans.
-                        colData = self.slicedArray.data[:, col]
-                        connected = np.isfinite(colData)
-                        if isAnArray(self.slicedArray.mask):
-                            connected = np.logical_and(connected, ~self.slicedArray.mask[:, col])
-                        else:
-                            connected = (np.zeros_like(colData)
-                                         if self.slicedArray.mask else connected)
-
-                        # Replace mask by Nans. Only doing when not showing lines to hack around PyQtGraph issue 1057
-                        # See comment in PgLinePlot1d._drawContents for a more detailed explanation
-                        if not self.config.crossPenCti.lineCti.configValue:
-                            colData = replaceMaskedValueWithFloat(colData, np.logical_not(connected),
-                                                                  np.nan, copyOnReplace=True)
-
-                        # Replace infinite value with nans because PyQtGraph can't handle them
-                        colData = replaceMaskedValueWithFloat(colData, np.isinf(colData),
-                                                              np.nan, copyOnReplace=True)
-
-                        verPlotDataItem = self.config.crossPenCti.createPlotDataItem()
-                        verPlotDataItem.setData(colData, np.arange(nRows), connect=connected)
-                        self.verCrossPlotItem.addItem(verPlotDataItem)
-
-                        # Horizontal line in ver-cross plot
-                        crossLineShadow0 = pg.InfiniteLine(angle=0, movable=False,
-                                                           pen=self.crossShadowPen)
-                        crossLineShadow0.setPos(row)
-                        self.verCrossPlotItem.addItem(crossLineShadow0, ignoreBounds=True)
-                        crossLine0 = pg.InfiniteLine(angle=0, movable=False, pen=self.crossPen)
-                        crossLine0.setPos(row)
-                        self.verCrossPlotItem.addItem(crossLine0, ignoreBounds=True)
-
-                        if show_data_point:
-                            crossPoint0 = pg.PlotDataItem(symbolPen=self.crossPen)
-                            crossPoint0.setSymbolBrush(QtGui.QBrush(self.config.crossPenCti.penColor))
-                            crossPoint0.setSymbolSize(10)
-                            crossPoint0.setData((colData[row],), (row,))
-                            self.verCrossPlotItem.addItem(crossPoint0, ignoreBounds=True)
-
-                        self.config.verCrossPlotRangeCti.updateTarget() # update auto range
-                        del colData # defensive programming
+                row, col = int(round(scenePos.y())), int(round(scenePos.x()))
+                nRows, nCols = self.sliceShape
+                if not ((0 <= row < nRows) and (0 <= col < nCols)):
+                    row, col = None, None
+
+            if row is not None and (row, col) == (self.crossPlotRow, self.crossPlotCol):
+                return  # Still on the same pixel
+
+            self.crossPlotRow, self.crossPlotCol = row, col
+
+            if row is None:
+                self.probeLabel.setText("<span style='color: #808080'>No data at cursor</span>")
+                self.crossLineHorizontal.setVisible(False)
+                self.crossLineVertical.setVisible(False)
+                self.crossLineHorShadow.setVisible(False)
+                self.crossLineVerShadow.setVisible(False)
+                self._setCrossPlotItemsVisible(self.horCrossPlotItem, False)
+                self._setCrossPlotItemsVisible(self.verCrossPlotItem, False)
+                return
+
+            self.viewBox.setCursor(Qt.CrossCursor)
+
+            value, masked = self._valueAt(row, col)
+            valueStr = toString(value, masked=masked, maskFormat='&lt;masked&gt;')
+
+            if self.config.probeCti.configValue:
+                txt = "({}, {}) = ({:d}, {:d}) {} {} = {}".format(
+                    self.collector.rtiInfo['x-dim'], self.collector.rtiInfo['y-dim'],
+                    col, row, RIGHT_ARROW, self.collector.rtiInfo['name'], valueStr)
+                self.probeLabel.setText(txt)
+            else:
+                self.probeLabel.setText("")
+
+            # Show cross section at the cursor pos in the line plots
+            showHorCrossPlot = (self.config.horCrossPlotCti.configValue and
+                                self.horCrossDataItem is not None)
+            self.crossLineHorShadow.setVisible(showHorCrossPlot)
+            self.crossLineHorizontal.setVisible(showHorCrossPlot)
+            if showHorCrossPlot:
+                self.crossLineHorShadow.setPos(row)
+                self.crossLineHorizontal.setPos(row)
+
+                # Line plot of cross section row.
+                # Determine which points are connected or separated by masks/nans and
+                # replace infinite values with nans because PyQtGraph can't handle them.
+                # Replace mask by Nans. Only doing when not showing lines to hack around PyQtGraph issue 1057
+                # See comment in PgLinePlot1d._drawContents for a more detailed explanation
+                rowArray = self.horCrossSection()
+                rowData, connected = sanitizeForPlotting(
+                    rowArray.data, rowArray.mask,
+                    replaceMasked=not self.config.crossPenCti.lineCti.configValue,
+                    buffers=self._horPlotBuffers)
+
+                # TODO: try to use connect='finite' when the hack above is no longer necessary. In that case
+                # test with array_masked test data
+                self.horCrossDataItem.setData(rowData, connect=connected)
+
+                # Vertical line in hor-cross plot
+                self.horCrossLineShadow90.setPos(col)
+                self.horCrossLine90.setPos(col)
+                if show_data_point:
+                    self.horCrossPoint90.setData((col,), (rowData[col],))
+
+                self._setCrossPlotItemsVisible(self.horCrossPlotItem, True)
+                self.horCrossPoint90.setVisible(show_data_point)
+
+                # Update the auto range. The range doesn't change if auto-range is off.
+                if self.config.horCrossPlotRangeCti.autoRangeCti.configValue:
+                    self.config.horCrossPlotRangeCti.updateTarget()
+                del rowData, rowArray # defensive programming
+
+            showVerCrossPlot = (self.config.verCrossPlotCti.configValue and
+                                self.verCrossDataItem is not None)
+            self.crossLineVerShadow.setVisible(showVerCrossPlot)
+            self.crossLineVertical.setVisible(showVerCrossPlot)
+            if showVerCrossPlot:
+                self.crossLineVerShadow.setPos(col)
+                self.crossLineVertical.setPos(col)
+
+                # Line plot of cross section column. See the row above.
+                colArray = self.verCrossSection()
+                colData, connected = sanitizeForPlotting(
+                    colArray.data, colArray.mask,
+                    replaceMasked=not self.config.crossPenCti.lineCti.configValue,
+                    buffers=self._verPlotBuffers)
+
+                self.verCrossDataItem.setData(colData, np.arange(len(colData)),
+                                              connect=connected)
+
+                # Horizontal line in ver-cross plot
+                self.verCrossLineShadow0.setPos(row)
+                self.verCrossLine0.setPos(row)
+                if show_data_point:
+                    self.verCrossPoint0.setData((colData[row],), (row,))
+
+                self._setCrossPlotItemsVisible(self.verCrossPlotItem, True)
+                self.verCrossPoint0.setVisible(show_data_point)
+
+                if self.config.verCrossPlotRangeCti.autoRangeCti.configValue:
+                    self.config.verCrossPlotRangeCti.updateTarget()
+                del colData, colArray # defensive programming
 
         except Exception as ex:
             # In contrast to _drawContents, this function is a slot and thus must not throw
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Multi-resolution pyramid (mipmap) of images that are in memory.
+
+    Each level halves the number of rows and columns of the previous level by reducing blocks of
+    2 by 2 pixels. The PgImagePlot2d shows the level that matches the screen resolution, so that
+    the cost of zooming and panning depends on the number of screen pixels, not on the size of
+    the image. The pyramid is built in a background thread.
+"""
+from __future__ import division, print_function
+
+import logging
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from argos.inspector.pgplugins.tiledimage import TileImageItem, levelForPixelSize
+from argos.qt import QtCore, QtSignal, QtSlot
+
+logger = logging.getLogger(__name__)
+
+REDUCTION_MEAN = 'mean'
+REDUCTION_MAX = 'max'
+REDUCTION_MIN = 'min'
+REDUCTIONS = (REDUCTION_MEAN, REDUCTION_MAX, REDUCTION_MIN)
+
+MIN_PYRAMID_PIXELS = 2048 * 2048  # Smaller images are shown without pyramid.
+MIN_LEVEL_SIZE = 256  # The coarsest level has at least this many rows or columns.
+
+_PYRAMID_EXECUTOR = None
+
+
+def _pyramidExecutor():
+    """ Returns the executor that builds the pyramids in the background. Creates it if needed.
+    """
+    global _PYRAMID_EXECUTOR
+    if _PYRAMID_EXECUTOR is None:
+        _PYRAMID_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='argos-pyramid')
+    return _PYRAMID_EXECUTOR
+
+
+def _padToEven(array, fillValue):
+    """ Pads a 2D array with fillValue so that it has an even number of rows and columns.
+    """
+    nRows, nCols = array.shape
+    if nRows % 2 == 0 and nCols % 2 == 0:
+        return array
+    padded = np.full((nRows + nRows % 2, nCols + nCols % 2), fillValue, dtype=array.dtype)
+    padded[:nRows, :nCols] = array
+    return padded
+
+
+def _blockCorners(array):
+    """ Returns the four pixels of each block of 2 by 2 pixels as four arrays.
+    """
+    return (array[0::2, 0::2], array[0::2, 1::2], array[1::2, 0::2], array[1::2, 1::2])
+
+
+def reduceImage(image, reduction=REDUCTION_MEAN, mask=None):
+    """ Returns an image with half the number of rows and columns.
+
+        Each pixel is the mean, maximum or minimum of a block of 2 by 2 pixels. Masked values and
+        NaNs are ignored. A pixel is only NaN if the complete block is masked or NaN. If the image
+        has an odd number of rows or columns, the last block is padded with NaNs.
+
+        The result is a float array. Integer images are converted per block corner, so that no
+        float copy of the complete image is made.
+
+        :param image: 2D array of real numbers.
+        :param reduction: one of REDUCTIONS.
+        :param mask: boolean array with the same shape as the image, or None.
+    """
+    assert image.ndim == 2, "Expected a 2D image, got shape: {}".format(image.shape)
+    assert reduction in REDUCTIONS, "Unknown reduction: {!r}".format(reduction)
+
+    floatType = np.result_type(image.dtype, np.float32)
+    nRows, nCols = image.shape
+    nRows, nCols = nRows + nRows % 2, nCols + nCols % 2
+
+    if image.dtype.kind == 'f' and mask is None:
+        corners = _blockCorners(_padToEven(image, np.nan))
+    else:
+        # Convert to float with NaNs for the masked values, one corner at the time.
+        maskCorners = _blockCorners(_padToEven(mask, True)) if mask is not None else [None] * 4
+        corners = []
+        for nr, corner in enumerate(_blockCorners(image)):
+            values = np.full((nRows // 2, nCols // 2), np.nan, dtype=floatType)
+            values[:corner.shape[0], :corner.shape[1]] = corner
+            if maskCorners[nr] is not None:
+                values[maskCorners[nr]] = np.nan
+            corners.append(values)
+
+    if reduction == REDUCTION_MAX:
+        result = np.fmax(np.fmax(corners[0], corners[1]), np.fmax(corners[2], corners[3]))
+    elif reduction == REDUCTION_MIN:
+        result = np.fmin(np.fmin(corners[0], corners[1]), np.fmin(corners[2], corners[3]))
+    else:
+        total = np.zeros(corners[0].shape, dtype=floatType)
+        count = np.zeros(corners[0].shape, dtype=np.uint8)
+        for corner in corners:
+            valid = ~np.isnan(corner)
+            np.add(total, corner, out=total, where=valid)
+            count += valid
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN blocks divide by zero.
+            result = np.divide(total, count, out=np.full_like(total, np.nan), where=count > 0)
+    return result
+
+
+def reduceMask(mask):
+    """ Returns a mask with half the number of rows and columns.
+
+        A pixel is masked if all pixels of the block of 2 by 2 pixels are masked.
+    """
+    corners = _blockCorners(_padToEven(mask, True))
+    return corners[0] & corners[1] & corners[2] & corners[3]
+
+
+class ImagePyramid(object):
+    """ The levels of a multi-resolution pyramid. Level 0 is the original image.
+    """
+    def __init__(self, image, reduction=REDUCTION_MEAN, mask=None, minLevelSize=MIN_LEVEL_SIZE):
+        """ Constructor. Builds the levels, which may take a while for large images.
+
+            :param image: 2D array of real numbers.
+            :param reduction: one of REDUCTIONS.
+            :param mask: boolean array with the same shape as the image, or None.
+            :param minLevelSize: levels are added until the number of rows or columns is
+                smaller than this.
+        """
+        self._reduction = reduction
+        self._levels = [image]
+        self._maskLevels = [mask]
+        while min(self._levels[-1].shape) >= 2 * minLevelSize:
+            self._levels.append(reduceImage(self._levels[-1], reduction, self._maskLevels[-1]))
+            if self._maskLevels[-1] is None:
+                self._maskLevels.append(None)
+            else:
+                self._maskLevels.append(reduceMask(self._maskLevels[-1]))
+
+
+    def __repr__(self):
+        return "<ImagePyramid: {} levels of {}>".format(self.numLevels, self._levels[0].shape)
+
+
+    @property
+    def reduction(self):
+        """ The reduction that is used to calculate the pixels of the levels.
+        """
+        return self._reduction
+
+
+    @property
+    def numLevels(self):
+        """ The number of levels, including the original image.
+        """
+        return len(self._levels)
+
+
+    def level(self, levelNr):
+        """ Returns the image of a level.
+        """
+        return self._levels[levelNr]
+
+
+    def maskLevel(self, levelNr):
+        """ Returns the mask of a level. None if nothing is masked.
+        """
+        return self._maskLevels[levelNr]
+
+
+    def levelForPixelSize(self, pixelSize):
+        """ Returns the number of the coarsest level that still has a pixel per screen pixel.
+
+            :param pixelSize: the size of a screen pixel in image pixels of the original image.
+        """
+        return min(levelForPixelSize(pixelSize), self.numLevels - 1)
+
+
+
+class ImagePyramidBuilder(QtCore.QObject):
+    """ Builds image pyramids in a background thread.
+
+        Only the result of the last build is emitted with sigPyramidBuilt.
+    """
+    sigPyramidBuilt = QtSignal(object)  # ImagePyramid
+    _sigBuildFinished = QtSignal(int, object)  # Build number and pyramid.
+
+
+    def __init__(self, parent=None):
+        """ Constructor
+        """
+        super(ImagePyramidBuilder, self).__init__(parent=parent)
+        self._buildNr = 0
+        self._sigBuildFinished.connect(self._onBuildFinished, type=QtCore.Qt.QueuedConnection)
+
+
+    def build(self, image, reduction=REDUCTION_MEAN, mask=None):
+        """ Starts building the pyramid of an image. The pyramid of a previous build is discarded.
+
+            The image and mask must not be changed until the pyramid is built.
+            :return: the concurrent.futures.Future of the build.
+        """
+        self._buildNr += 1
+        buildNr = self._buildNr
+        logger.debug("Building {} pyramid of {} image".format(reduction, image.shape))
+
+        future = _pyramidExecutor().submit(self._buildPyramid, buildNr, image, reduction, mask)
+        future.add_done_callback(
+            lambda future: self._sigBuildFinished.emit(buildNr, future.result()))
+        return future
+
+
+    def cancel(self):
+        """ Discards the result of the current build.
+        """
+        self._buildNr += 1
+
+
+    def _buildPyramid(self, buildNr, image, reduction, mask):
+        """ Builds the pyramid. Is executed in the background thread.
+
+            Returns None if the build is cancelled before it starts or if it fails.
+        """
+        if buildNr != self._buildNr:
+            return None
+        try:
+            return ImagePyramid(image, reduction=reduction, mask=mask)
+        except Exception as ex:
+            logger.warning("Unable to build image pyramid: {}".format(ex))
+            return None
+
+
+    def _onBuildFinished(self, buildNr, pyramid):
+        """ Emits sigPyramidBuilt if the build is the last one.
+        """
+        if buildNr == self._buildNr and pyramid is not None:
+            self.sigPyramidBuilt.emit(pyramid)
+
+
+
+class ImagePyramidLayer(QtCore.QObject):
+    """ Shows the pyramid level that matches the resolution of a view box.
+
+        Level 0 is shown by the master item. Coarser levels are shown by a separate image item,
+        which uses the levels and lookup table of the master. The master item is hidden
+        meanwhile, so that it doesn't render the full resolution image.
+    """
+    def __init__(self, viewBox, masterItem, parent=None):
+        """ Constructor
+
+            :param viewBox: the pg.ViewBox to which the level item is added.
+            :param masterItem: the ImageItem with the full resolution image.
+        """
+        super(ImagePyramidLayer, self).__init__(parent=parent)
+        self._viewBox = viewBox
+        self._masterItem = masterItem
+        self._pyramid = None
+        self._reduction = None
+        self._rect = None
+        self._levelNr = 0
+        self._levelItem = None
+
+        self._builder = ImagePyramidBuilder(parent=self)
+        self._builder.sigPyramidBuilt.connect(self.setPyramid)
+
+        self._viewBox.sigRangeChanged.connect(self.updateLevel)
+        self._viewBox.sigResized.connect(self.updateLevel)
+
+
+    def finalize(self):
+        """ Disconnects signals and removes the level item.
+        """
+        self._viewBox.sigResized.disconnect(self.updateLevel)
+        self._viewBox.sigRangeChanged.disconnect(self.updateLevel)
+        self._builder.sigPyramidBuilt.disconnect(self.setPyramid)
+        self.setImage(None)
+
+
+    @property
+    def pyramid(self):
+        """ The ImagePyramid of the current image. None if not (yet) built.
+        """
+        return self._pyramid
+
+
+    @property
+    def reduction(self):
+        """ The reduction that was given with the current image. None if there is no image.
+        """
+        return self._reduction
+
+
+    @property
+    def levelNr(self):
+        """ The number of the pyramid level that is shown.
+        """
+        return self._levelNr
+
+
+    def setImage(self, image, mask=None, rect=None, reduction=REDUCTION_MEAN):
+        """ Starts building the pyramid of an image in the background.
+
+            Until the pyramid is built, the image is shown by the master item. No pyramid is
+            built if the image is None, has less than MIN_PYRAMID_PIXELS or the reduction is None.
+
+            :param image: 2D array that the master item shows.
+            :param mask: the mask array of the master item, or None.
+            :param rect: QRectF with the position of the image in the view.
+            :param reduction: one of REDUCTIONS, or None.
+        """
+        self._builder.cancel()
+        self.setPyramid(None)
+        self._reduction = None if image is None else reduction
+        self._rect = rect
+
+        if image is not None and reduction is not None and image.size >= MIN_PYRAMID_PIXELS:
+            self._builder.build(image, reduction, mask)
+
+
+    @QtSlot(object)
+    def setPyramid(self, pyramid):
+        """ Sets the pyramid and shows the level that matches the view resolution.
+        """
+        self._pyramid = pyramid
+        self._showLevel(0)
+        self.updateLevel()
+
+
+    @QtSlot()
+    def updateLevel(self):
+        """ Shows the pyramid level that matches the current resolution of the view box.
+        """
+        if self._pyramid is None:
+            return
+
+        pixelWidth, pixelHeight = self._viewBox.viewPixelSize()
+        levelNr = self._pyramid.levelForPixelSize(min(abs(pixelWidth), abs(pixelHeight)))
+        if levelNr != self._levelNr:
+            self._showLevel(levelNr)
+
+
+    def _showLevel(self, levelNr):
+        """ Replaces the level item. Shows the master item if levelNr is 0.
+        """
+        if self._levelItem is not None:
+            self._viewBox.removeItem(self._levelItem)
+            self._levelItem = None
+
+        self._levelNr = levelNr
+        if levelNr > 0:
+            logger.debug("Showing level {} of {}".format(levelNr, self._pyramid))
+            self._levelItem = TileImageItem(
+                self._masterItem, (levelNr, 0, 0), self._pyramid.level(levelNr),
+                self._pyramid.maskLevel(levelNr), self._rect)
+            self._viewBox.addItem(self._levelItem)
+
+        self._masterItem.setVisible(levelNr == 0)
@@ -31,15 +31,17 @@ from argos.config.groupcti import MainGroupCti
 from argos.config.boolcti import BoolCti
 from argos.config.choicecti import ChoiceCti
 
-from argos.inspector.abstract import AbstractInspector, InvalidDataError
+from argos.inspector.abstract import AbstractInspector, InvalidDataError, UpdateReason
 from argos.inspector.pgplugins.pgctis import (X_AXIS, Y_AXIS, NO_LABEL_STR,
                                               defaultAutoRangeMethods, PgGridCti, PgAxisCti,
                                               setXYAxesAutoRangeOn, PgAxisLabelCti,
                                               PgAxisLogModeCti, PgAxisRangeCti, PgPlotDataItemCti)
 from argos.inspector.pgplugins.pgplotitem import ArgosPgPlotItem
-from argos.utils.cls import arrayHasRealNumbers, checkType, isAnArray, toString
+from argos.utils.cls import arrayHasRealNumbers, checkType, toString
 from argos.utils.cls import arrayKindLabel
+from argos.utils.decimation import Envelope, MIN_BUCKET_SIZE, minMaxEnvelope
 from argos.utils.defs import RIGHT_ARROW
+from argos.utils.masks import PlotBuffers, StatisticsCache, sanitizeForPlotting
 
 
 logger = logging.getLogger(__name__)
@@ -91,6 +93,7 @@ class PgLinePlot1dCti(MainGroupCti):
         self.plotDataItemCti = self.insertChild(PgPlotDataItemCti())
         self.zoomModeCti = self.insertChild(BoolCti('rectangle zoom mode', False))
         self.probeCti = self.insertChild(BoolCti('show probe', True))
+        self.decimationCti = self.insertChild(BoolCti('min-max decimation', True))
 
         # Connect signals.
 
@@ -143,6 +146,16 @@ class PgLinePlot1d(AbstractInspector):
         # in the collector.
         self.slicedArray = None
 
+        # Statistics of the slice, shared by all auto-range methods.
+        self.sliceStatistics = StatisticsCache()
+
+        # If the series is decimated, the overview is the envelope of all samples. It is combined
+        # with a more detailed envelope of the samples in the view. See updateDecimation.
+        self._plotDataItem = None
+        self._overview = None
+        self._overviewColumns = 0
+        self._plotBuffers = PlotBuffers()
+
         self.graphicsLayoutWidget = pg.GraphicsLayoutWidget()
         self.contentsLayout.addWidget(self.graphicsLayoutWidget)
         self.titleLabel = self.graphicsLayoutWidget.addLabel('<plot title goes here>', 0, 0)
@@ -166,6 +179,8 @@ class PgLinePlot1d(AbstractInspector):
         # Based mouseMoved on crosshair.py from the PyQtGraph examples directory.
         # I did not use the SignalProxy because I did not see any difference.
         self.plotItem.scene().sigMouseMoved.connect(self.mouseMoved)
+        self.viewBox.sigXRangeChanged.connect(self.updateDecimation)
+        self.viewBox.sigResized.connect(self.updateDecimation)
 
 
     def finalize(self):
@@ -173,6 +188,8 @@ class PgLinePlot1d(AbstractInspector):
         """
         logger.debug("Finalizing: {}".format(self))
         self.plotItem.scene().sigMouseMoved.disconnect(self.mouseMoved)
+        self.viewBox.sigXRangeChanged.disconnect(self.updateDecimation)
+        self.viewBox.sigResized.disconnect(self.updateDecimation)
         self.plotItem.close()
         self.graphicsLayoutWidget.close()
 
@@ -189,6 +206,9 @@ class PgLinePlot1d(AbstractInspector):
         """ Clears the inspector widget when no valid input is available.
         """
         self.slicedArray = None
+        self.sliceStatistics.invalidate()
+        self._plotDataItem = None
+        self._overview = None
         self.titleLabel.setText('')
         self.plotItem.clear()
         self.plotItem.setLabel('left', '')
@@ -208,8 +228,6 @@ class PgLinePlot1d(AbstractInspector):
         if self._resetRequired(reason, initiator):
             self.resetConfig()
 
-        self.slicedArray = self.collector.getSlicedArray()
-
         slicedArray = self.collector.getSlicedArray()
         if slicedArray is None:
             self._clearContents()
@@ -219,6 +237,10 @@ class PgLinePlot1d(AbstractInspector):
             raise InvalidDataError(
                 "Selected item contains {} data.".format(arrayKindLabel(slicedArray.data)))
         else:
+            # The slice is read again after a config change but its contents are the same then.
+            if (reason != UpdateReason.CONFIG_CHANGED or self.slicedArray is None or
+                    self.slicedArray.shape != slicedArray.shape):
+                self.sliceStatistics.invalidate()
             self.slicedArray = slicedArray
 
         # -- Valid plot data from here on --
@@ -239,21 +261,33 @@ class PgLinePlot1d(AbstractInspector):
         # for omitting the masked data. When showing only symbols the masked values are replaced. When both symbols
         # wnd lines are shown the resulting plot is incorrect as the masked values are not replaced and thus displayed
         # as point. This is unfortunate but can't be helped until the issue is resolved in PyQtGraph.
-        if not self.config.plotDataItemCti.lineCti.configValue:
-            self.slicedArray.replaceMaskedValueWithNan()  # will convert data to float if int
+        # The replacement is done by sanitizeForPlotting, the slicedArray itself is not changed.
+        replaceMasked = not self.config.plotDataItemCti.lineCti.configValue
 
         self.plotItem.clear()
+        self._plotDataItem = None
+        self._overview = None
 
         self.titleLabel.setText(self.configValue('title').format(**self.collector.rtiInfo))
 
-        connected = np.isfinite(self.slicedArray.data)
-        if isAnArray(self.slicedArray.mask):
-            connected = np.logical_and(connected, ~self.slicedArray.mask)
-        else:
-            connected = np.zeros_like(self.slicedArray.data) if self.slicedArray.mask else connected
-
         plotDataItem = self.config.plotDataItemCti.createPlotDataItem()
-        plotDataItem.setData(self.slicedArray.data, connect=connected)
+        numColumns = self._numPixelColumns()
+
+        if (self.config.decimationCti.configValue and
+                len(self.slicedArray.data) > MIN_BUCKET_SIZE * numColumns):
+            # Very long series are drawn as the min/max envelope of the samples per pixel column.
+            # The envelope is updated when the x-range changes. See updateDecimation.
+            self._overview = minMaxEnvelope(self.slicedArray.data, self.slicedArray.mask,
+                                            numColumns)
+            self._overviewColumns = numColumns
+            plotDataItem.setData(self._overview.xs, self._overview.ys,
+                                 connect=self._overview.connect)
+            self._plotDataItem = plotDataItem
+        else:
+            plotData, connected = sanitizeForPlotting(
+                self.slicedArray.data, self.slicedArray.mask, replaceMasked=replaceMasked,
+                buffers=self._plotBuffers)
+            plotDataItem.setData(plotData, connect=connected)
 
         if plotDataItem.opts['pen'] is None and plotDataItem.opts['symbol'] is None:
             self.sigShowMessage.emit("The 'line' and 'symbol' config options are both unchecked!")
@@ -275,6 +309,49 @@ class PgLinePlot1d(AbstractInspector):
         self.config.updateTarget()
 
 
+    def _numPixelColumns(self):
+        """ Returns the width of the view box in pixels.
+        """
+        return max(1, int(round(self.viewBox.width())))
+
+
+    @QtSlot()
+    def updateDecimation(self):
+        """ Recalculates the envelope of the decimated series for the current x-range.
+
+            Only the samples in the view are decimated again. Outside the view the overview is
+            used, so that the bounds of the plot data item remain the same.
+        """
+        if self._overview is None or self._plotDataItem is None:
+            return
+
+        try:
+            data = self.slicedArray.data
+            xMin, xMax = self.viewBox.viewRange()[X_AXIS]
+            numColumns = self._numPixelColumns()
+
+            # One extra sample at both sides, so that the lines to the view edges are drawn.
+            start = max(0, int(np.floor(xMin)) - 1)
+            stop = max(start, min(len(data), int(np.ceil(xMax)) + 2))
+
+            if start == 0 and stop == len(data) and numColumns == self._overviewColumns:
+                envelope = self._overview
+            else:
+                envelope = Envelope.concatenate([
+                    self._overview.select(0, start),
+                    minMaxEnvelope(data, self.slicedArray.mask, numColumns, start, stop),
+                    self._overview.select(stop, len(data))])
+
+            self._plotDataItem.setData(envelope.xs, envelope.ys, connect=envelope.connect)
+
+        except Exception as ex:
+            # This function is a slot and thus must not throw exceptions.
+            if DEBUGGING:
+                raise
+            else:
+                logger.exception(ex)
+
+
     @QtSlot(object)
     def mouseMoved(self, viewPos):
         """ Updates the probe text with the values under the cursor.
@@ -305,7 +382,7 @@ class PgLinePlot1d(AbstractInspector):
                         self.collector.rtiInfo['x-dim'], index, RIGHT_ARROW,
                         self.collector.rtiInfo['name'], valueStr))
 
-                    if np.isfinite(data[index]):
+                    if np.isfinite(data[index]) and not self.slicedArray.maskAt(index):
                         self.crossLineVerShadow.setVisible(True)
                         self.crossLineVerShadow.setPos(index)
                         self.crossLineVertical.setVisible(True)
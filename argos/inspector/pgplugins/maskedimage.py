@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Image item that shows masked values with a separate overlay.
+
+    The image data keeps its original data type. Integer images are therefore not converted to
+    floats to replace the masked values by NaNs, which would take several times the memory.
+"""
+from __future__ import division, print_function
+
+import logging
+
+import numpy as np
+import pyqtgraph as pg
+
+from argos.utils.cls import isAnArray
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MASK_COLOR = (176, 176, 176, 255)  # RGBA
+
+
+def imageArrayFromSlice(arrayWithMask):
+    """ Converts a 2D ArrayWithMask to arrays that can be shown by a MaskedImageItem.
+
+        Returns an (imageArray, maskArray) tuple. The maskArray is None if no values are masked.
+
+        The image keeps the data type of the slice, so that no copy is made. Only infinite values
+        of float arrays are replaced by NaNs, because PyQtGraph fails on them. The original array
+        is not changed so that the data probe can still print the actual values.
+
+        PyQtGraph uses the following dimension order: T, X, Y, Color. The arrays are therefore
+        transposed.
+    """
+    imageArray = arrayWithMask.data
+    if imageArray.dtype.kind == 'f':
+        infinite = np.isinf(imageArray)
+        if infinite.any():
+            imageArray = imageArray.copy()
+            imageArray[infinite] = np.nan
+    elif imageArray.dtype.kind == 'b':
+        imageArray = imageArray.view(np.uint8)
+
+    mask = arrayWithMask.mask
+    if isAnArray(mask):
+        maskArray = mask.transpose() if mask.any() else None
+    elif mask:
+        maskArray = np.ones(imageArray.shape[::-1], dtype=bool)
+    else:
+        maskArray = None
+
+    return imageArray.transpose(), maskArray
+
+
+def subsampleUnmasked(imageArray, maskArray, step='auto', targetImageSize=200):
+    """ Returns the finite values of a subsampled image that are not masked, as a 1D array.
+
+        The step parameter has the same meaning as in pg.ImageItem.getHistogram. If it is 'auto',
+        the image is subsampled to roughly targetImageSize by targetImageSize pixels.
+    """
+    if step == 'auto':
+        step = (max(1, int(np.ceil(imageArray.shape[0] / targetImageSize))),
+                max(1, int(np.ceil(imageArray.shape[1] / targetImageSize))))
+    if np.isscalar(step):
+        step = (step, step)
+
+    stepData = imageArray[::step[0], ::step[1]]
+    if maskArray is not None:
+        stepData = stepData[~maskArray[::step[0], ::step[1]]]
+    else:
+        stepData = stepData.ravel()
+
+    if stepData.dtype.kind == 'f':
+        stepData = stepData[np.isfinite(stepData)]
+    return stepData
+
+
+
+class MaskedImageItem(pg.ImageItem):
+    """ Image item that draws the masked pixels with a single color in an overlay item.
+
+        Masked values are excluded from the histogram.
+    """
+    def __init__(self, *args, **kwargs):
+        """ Constructor. See pg.ImageItem for the parameters.
+        """
+        super(MaskedImageItem, self).__init__(*args, **kwargs)
+        self._maskArray = None
+        self._maskColor = DEFAULT_MASK_COLOR
+
+        # As child item the overlay shares the pixel coordinates of this item.
+        self._maskItem = pg.ImageItem(parent=self)
+        self.setMaskColor(DEFAULT_MASK_COLOR)
+
+
+    @property
+    def maskArray(self):
+        """ Boolean array that is True for masked pixels. None if there are no masked pixels.
+        """
+        return self._maskArray
+
+
+    @property
+    def maskColor(self):
+        """ The RGBA tuple with the color of the masked pixels.
+        """
+        return self._maskColor
+
+
+    def setMaskColor(self, color):
+        """ Sets the color of the masked pixels.
+
+            :param color: RGBA tuple with values between 0 and 255.
+        """
+        self._maskColor = tuple(color)
+        lut = np.array([(0, 0, 0, 0), self._maskColor], dtype=np.uint8)
+        self._maskItem.setLookupTable(lut)
+
+
+    def setMask(self, maskArray):
+        """ Sets the mask. It should have the same shape as the image.
+
+            :param maskArray: boolean array (transposed like the image) or None.
+        """
+        self._maskArray = maskArray
+        if maskArray is None:
+            self._maskItem.clear()
+        else:
+            self._maskItem.setImage(maskArray.view(np.uint8), autoLevels=False, levels=(0, 1))
+
+
+    def clear(self):
+        """ Clears the image and the mask.
+        """
+        super(MaskedImageItem, self).clear()
+        self.setMask(None)
+
+
+    def getHistogram(self, bins='auto', step='auto', perChannel=False, targetImageSize=200,
+                     **kwargs):
+        """ Returns the histogram of the image. Masked values are excluded.
+
+            See pg.ImageItem.getHistogram for the parameters. Uses the implementation of
+            PyQtGraph if no values are masked.
+        """
+        if self._maskArray is None or self.image is None or self.image.size == 0 or perChannel:
+            return super(MaskedImageItem, self).getHistogram(
+                bins=bins, step=step, perChannel=perChannel,
+                targetImageSize=targetImageSize, **kwargs)
+
+        stepData = subsampleUnmasked(self.image, self._maskArray, step=step,
+                                     targetImageSize=targetImageSize)
+        if stepData.size == 0:
+            return None, None
+
+        if isinstance(bins, str) and bins == 'auto':
+            mn, mx = stepData.min(), stepData.max()
+            bins = np.linspace(mn, mx if mx > mn else mn + 1, 500)
+
+        hist = np.histogram(stepData, bins=bins, **kwargs)
+        return hist[1][:-1], hist[0]
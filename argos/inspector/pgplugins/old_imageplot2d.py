@@ -42,7 +42,7 @@ from argos.qt import Qt, QtCore, QtGui, QtSlot
 from argos.utils.cls import arrayHasRealNumbers, checkType, isAnArray, toString
 from argos.utils.cls import arrayKindLabel
 from argos.utils.defs import RIGHT_ARROW
-from argos.utils.masks import replaceMaskedValueWithFloat, nanPercentileOfSubsampledArrayWithMask, ArrayWithMask
+from argos.utils.masks import replaceMaskedValueWithFloat, calcArrayStatistics, ArrayWithMask
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +55,7 @@ ROW_PROBE,    COL_PROBE    = 3, 0  # colspan = 2
 
 
 
-def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, subsample):
+def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, sampling):
     """ Calculates the range from the inspectors' sliced array. Discards percentage of the minimum
         and percentage of the maximum values of the inspector.slicedArray
 
@@ -66,6 +66,7 @@ def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, subsample):
             horizontal or vertical cross hairs.
             If the cursor is outside the image, there is no valid data under the cross-hair and
             the range will be determined from the sliced array as a fall back.
+        :param sampling: one of the SAMPLING_METHODS of the masks module.
     """
     checkType(pgImagePlot2d.slicedArray, ArrayWithMask) # sanity check
 
@@ -87,7 +88,7 @@ def calcPgImagePlot2dDataRange(pgImagePlot2d, percentage, crossPlot, subsample):
         raise ValueError("crossPlot must be: None, 'horizontal' or 'vertical', got: {}"
                          .format(crossPlot))
 
-    return nanPercentileOfSubsampledArrayWithMask(array, (percentage, 100 - percentage), subsample)
+    return calcArrayStatistics(array, sampling).percentiles((percentage, 100 - percentage))
 
 
 def crossPlotAutoRangeMethods(pgImagePlot2d, crossPlot, intialItems=None):
@@ -47,7 +47,7 @@ from argos.qt import QtCore, QtGui, QtWidgets, QtSlot
 from argos.qt.misc import setWidgetSizePolicy
 from argos.repo.colors import CmLibModelSingleton, DEFAULT_COLOR_MAP
 from argos.utils.cls import checkType
-from argos.utils.masks import nanPercentileOfSubsampledArrayWithMask
+from argos.utils.masks import SAMPLING_METHODS, SAMPLING_SUBSAMPLE, calcArrayStatistics
 
 
 from pyqtgraph.graphicsItems.GradientEditorItem import Gradients as GRADIENTS
@@ -139,18 +139,26 @@ def viewBoxAxisRange(viewBox, axisNumber):
         raise AssertionError("No children bbox. Plot range not updated.")
 
 
-def inspectorDataRange(inspector, percentage, subsample):
+def inspectorDataRange(inspector, percentage, sampling):
     """ Calculates the range from the inspectors' sliced array. Discards percentage of the minimum
         and percentage of the maximum values of the inspector.slicedArray
 
         Meant to be used with functools.partial for filling the autorange methods combobox.
         The first parameter is an inspector, it's not an array, because we would then have to
         regenerate the range function every time sliced array of an inspector changes.
+
+        If the inspector has a sliceStatistics attribute (a StatisticsCache), the statistics of
+        the sliced array are taken from there so that they are shared by all range methods.
     """
     logger.debug("Discarding {}% from id: 0x{:08x}".format(percentage, id(inspector.slicedArray)))
 
-    return nanPercentileOfSubsampledArrayWithMask(
-        inspector.slicedArray, (percentage, 100-percentage), subsample)
+    cache = getattr(inspector, 'sliceStatistics', None)
+    if cache is None:
+        statistics = calcArrayStatistics(inspector.slicedArray, sampling)
+    else:
+        statistics = cache.statistics(None, sampling, lambda: inspector.slicedArray)
+
+    return statistics.percentiles((percentage, 100-percentage))
 
 
 def defaultAutoRangeMethods(inspector, intialItems=None):
@@ -231,7 +239,12 @@ class AbstractRangeCti(GroupCti):
                 self.methodCti = ChoiceCti("method", configValues=list(autoRangeFunctions.keys()))
                 self.autoRangeCti.insertChild(self.methodCti)
 
-                self.subsampleCti = BoolCti("subsample", True)
+                # The node name and the order of the values are compatible with the persistent
+                # settings of the boolean subsample CTI that was used before.
+                self.subsampleCti = ChoiceCti(
+                    "subsample", SAMPLING_METHODS.index(SAMPLING_SUBSAMPLE),
+                    configValues=list(SAMPLING_METHODS),
+                    displayValues=['off', 'strided', 'sketch'])
                 self.autoRangeCti.insertChild(self.subsampleCti)
 
             self.paddingCti = IntCti("padding", paddingDefault,
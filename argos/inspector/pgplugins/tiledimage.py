@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Tiled reading of images that are much larger than the screen.
+
+    Instead of the complete slice, the PgImagePlot2d first reads a strided overview. When the
+    user zooms or pans, the tiles that intersect the view are read at the resolution that the
+    zoom level requires. At level L every 2**L-th row and column is read, so a tile of
+    TILE_SIZE by TILE_SIZE pixels covers TILE_SIZE * 2**L rows and columns of the slice.
+
+    The tiles are read one by one, so the image is refined progressively while the GUI remains
+    responsive. Meanwhile tiles of coarser levels (and the overview) are shown. Read tiles are
+    kept in a TileCache, which is bounded by the number of bytes.
+"""
+from __future__ import division, print_function
+
+import logging
+import math
+
+import numpy as np
+
+from argos.inspector.pgplugins.maskedimage import MaskedImageItem, imageArrayFromSlice
+from argos.qt import QtCore, QtSlot
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 512  # Number of rows and columns of a tile.
+OVERVIEW_SIZE = 1024  # Maximum number of rows and columns of the overview.
+MIN_TILED_PIXELS = 4096 * 4096  # Smaller slices are read completely.
+
+UPDATE_DELAY = 50  # Milliseconds after the last change of the view range before tiles are read.
+MAX_FALLBACK_LEVELS = 3  # Show cached tiles of at most this many coarser levels while reading.
+
+
+def levelForPixelSize(pixelSize):
+    """ Returns the coarsest level that still has at least one sample per screen pixel.
+
+        :param pixelSize: the size of a screen pixel in rows or columns of the slice.
+    """
+    if not np.isfinite(pixelSize) or pixelSize < 2:
+        return 0
+    else:
+        return int(math.floor(math.log2(pixelSize)))
+
+
+class TiledSliceReader(object):
+    """ Reads a 2D slice in (strided) tiles, which are kept in a TileCache.
+    """
+    def __init__(self, readFunction, shape, sliceKey, cache):
+        """ Constructor
+
+            :param readFunction: function that reads a region of the slice. It gets a row slice
+                and a column slice as parameters and should return an ArrayWithMask.
+            :param shape: (nRows, nCols) tuple with the shape of the complete slice.
+            :param sliceKey: hashable that identifies the slice. It's part of the keys of the
+                cache, so that a cache can be shared by the slices of an inspector.
+            :param cache: the TileCache.
+        """
+        assert len(shape) == 2, "Expected a 2D shape, got: {}".format(shape)
+        self._readFunction = readFunction
+        self._shape = tuple(shape)
+        self._sliceKey = sliceKey
+        self._cache = cache
+        self._lastRow = None  # (row, ArrayWithMask) tuple of the last cross section.
+        self._lastCol = None
+
+
+    def __repr__(self):
+        return "<TiledSliceReader: {}, shape={}>".format(self._sliceKey, self._shape)
+
+
+    @property
+    def shape(self):
+        """ The (nRows, nCols) shape of the complete slice.
+        """
+        return self._shape
+
+
+    @property
+    def overviewStride(self):
+        """ The step with which the rows and columns of the overview are read.
+        """
+        return max(1, int(math.ceil(max(self._shape) / OVERVIEW_SIZE)))
+
+
+    @property
+    def overviewLevel(self):
+        """ The coarsest level for which tiles are read. Coarser levels use the overview.
+        """
+        return levelForPixelSize(self.overviewStride)
+
+
+    def readOverview(self):
+        """ Reads the slice with the overview stride.
+        """
+        stride = self.overviewStride
+        key = (self._sliceKey, 'overview', stride)
+        overview = self._cache.get(key)
+        if overview is None:
+            overview = self._readFunction(slice(None, None, stride), slice(None, None, stride))
+            self._cache.put(key, overview)
+        return overview
+
+
+    def tileRegion(self, tileId):
+        """ Returns a (rowSlice, colSlice) tuple with the region of the slice that a tile covers.
+
+            :param tileId: (level, tileRow, tileCol) tuple
+        """
+        level, tileRow, tileCol = tileId
+        stride = 2 ** level
+        extent = TILE_SIZE * stride
+        nRows, nCols = self._shape
+        return (slice(tileRow * extent, min(nRows, (tileRow + 1) * extent), stride),
+                slice(tileCol * extent, min(nCols, (tileCol + 1) * extent), stride))
+
+
+    def tilesInRect(self, level, rowRange, colRange):
+        """ Returns the IDs of the tiles at a level that intersect a rectangle.
+
+            The tiles closest to the center of the rectangle come first, so that they are read
+            first.
+
+            :param rowRange: (first, last) tuple. The last row is included.
+            :param colRange: (first, last) tuple. The last column is included.
+        """
+        extent = TILE_SIZE * 2 ** level
+        nRows, nCols = self._shape
+        rowMin, rowMax = max(0, rowRange[0]), min(nRows - 1, rowRange[1])
+        colMin, colMax = max(0, colRange[0]), min(nCols - 1, colRange[1])
+        if rowMin > rowMax or colMin > colMax:
+            return []
+
+        centerRow = (rowMin + rowMax) / 2 / extent
+        centerCol = (colMin + colMax) / 2 / extent
+        tileIds = [(level, tileRow, tileCol)
+                   for tileRow in range(int(rowMin // extent), int(rowMax // extent) + 1)
+                   for tileCol in range(int(colMin // extent), int(colMax // extent) + 1)]
+        tileIds.sort(key=lambda tileId:
+                     (tileId[1] + 0.5 - centerRow) ** 2 + (tileId[2] + 0.5 - centerCol) ** 2)
+        return tileIds
+
+
+    def cachedTile(self, tileId):
+        """ Returns the tile as ArrayWithMask if it's in the cache. Returns None otherwise.
+        """
+        return self._cache.get((self._sliceKey, ) + tuple(tileId))
+
+
+    def readTile(self, tileId):
+        """ Returns the tile as ArrayWithMask. It's read if it's not in the cache.
+        """
+        tile = self.cachedTile(tileId)
+        if tile is None:
+            tile = self._readFunction(*self.tileRegion(tileId))
+            self._cache.put((self._sliceKey, ) + tuple(tileId), tile)
+        return tile
+
+
+    def readValue(self, row, col):
+        """ Returns a (value, masked) tuple with the full-resolution value at row and column.
+        """
+        tileId = (0, row // TILE_SIZE, col // TILE_SIZE)
+        tile = self.cachedTile(tileId)
+        if tile is not None:
+            index = (row % TILE_SIZE, col % TILE_SIZE)
+        else:
+            tile = self._readFunction(slice(row, row + 1), slice(col, col + 1))
+            index = (0, 0)
+        return tile.data[index], tile.maskAt(index)
+
+
+    def readRow(self, row):
+        """ Returns a row of the slice at full resolution as a 1D ArrayWithMask.
+
+            The last row is remembered, because it's used by the cross-hair plot and its range.
+        """
+        if self._lastRow is None or self._lastRow[0] != row:
+            self._lastRow = (row, self._readFunction(slice(row, row + 1), slice(None))[0, :])
+        return self._lastRow[1]
+
+
+    def readCol(self, col):
+        """ Returns a column of the slice at full resolution as a 1D ArrayWithMask.
+
+            The last column is remembered, because it's used by the cross-hair plot and its range.
+        """
+        if self._lastCol is None or self._lastCol[0] != col:
+            self._lastCol = (col, self._readFunction(slice(None), slice(col, col + 1))[:, 0])
+        return self._lastCol[1]
+
+
+
+class TileImageItem(MaskedImageItem):
+    """ Image item that shows a tile.
+
+        Uses the levels, lookup table and mask color of a master image item, which is connected
+        to the color legend.
+    """
+    def __init__(self, masterItem, tileId, imageArray, maskArray, rect):
+        """ Constructor
+
+            :param masterItem: the ImageItem with the overview.
+            :param tileId: (level, tileRow, tileCol) tuple
+            :param imageArray: the image data (already transposed, see imageArrayFromSlice).
+            :param maskArray: the transposed mask of the image, or None if nothing is masked.
+            :param rect: QRectF with the position of the tile in the view.
+        """
+        super(TileImageItem, self).__init__()
+        self._masterItem = masterItem
+        self.tileId = tileId
+        self.setImage(imageArray, autoLevels=False, levels=masterItem.levels)
+        self.setLookupTable(masterItem.lut)
+        self.setMaskColor(masterItem.maskColor)
+        self.setMask(maskArray)
+        self.setRect(rect)
+
+        # Finer levels are drawn on top.
+        self.setZValue(1.0 + 1.0 / (1 + tileId[0]))
+
+
+    def paint(self, painter, *args):
+        """ Copies the levels and lookup table of the master item before painting.
+        """
+        masterLevels = self._masterItem.levels
+        if masterLevels is None:
+            return  # Nothing to paint with yet.
+
+        if self.lut is not self._masterItem.lut:
+            self.setLookupTable(self._masterItem.lut, update=False)
+            self.setLevels(masterLevels)
+        elif self.levels is None or not np.array_equal(self.levels, masterLevels):
+            self.setLevels(masterLevels)
+
+        super(TileImageItem, self).paint(painter, *args)
+
+
+
+class TiledImageLayer(QtCore.QObject):
+    """ Shows the tiles that intersect the view of a view box on top of the overview.
+
+        The tiles are updated when the view range or size changes.
+    """
+    def __init__(self, viewBox, masterItem, parent=None):
+        """ Constructor
+
+            :param viewBox: the pg.ViewBox to which the tile items are added.
+            :param masterItem: the ImageItem with the overview.
+        """
+        super(TiledImageLayer, self).__init__(parent=parent)
+        self._viewBox = viewBox
+        self._masterItem = masterItem
+        self._reader = None
+        self._tileItems = {}  # Maps tile ID to TileImageItem
+        self._pendingTileIds = []
+
+        self._updateTimer = QtCore.QTimer(self)
+        self._updateTimer.setSingleShot(True)
+        self._updateTimer.setInterval(UPDATE_DELAY)
+        self._updateTimer.timeout.connect(self.updateTiles)
+
+        self._readTimer = QtCore.QTimer(self)
+        self._readTimer.setSingleShot(True)
+        self._readTimer.setInterval(0)
+        self._readTimer.timeout.connect(self.readNextTile)
+
+        self._viewBox.sigRangeChanged.connect(self.scheduleUpdate)
+        self._viewBox.sigResized.connect(self.scheduleUpdate)
+
+
+    def finalize(self):
+        """ Disconnects signals and removes the tile items.
+        """
+        self._viewBox.sigResized.disconnect(self.scheduleUpdate)
+        self._viewBox.sigRangeChanged.disconnect(self.scheduleUpdate)
+        self.setReader(None)
+
+
+    @property
+    def reader(self):
+        """ The TiledSliceReader. None if tiling is not used.
+        """
+        return self._reader
+
+
+    @property
+    def tileItems(self):
+        """ Dictionary that maps the IDs of the tiles that are shown to their image items.
+        """
+        return self._tileItems
+
+
+    @property
+    def pendingTileIds(self):
+        """ The IDs of the tiles that will be read (in this order).
+        """
+        return self._pendingTileIds
+
+
+    def setReader(self, reader):
+        """ Sets the TiledSliceReader and removes the tile items of the previous reader.
+
+            The tiles are updated after the view range is set.
+        """
+        self._updateTimer.stop()
+        self._readTimer.stop()
+        self._pendingTileIds = []
+        for tileItem in self._tileItems.values():
+            self._viewBox.removeItem(tileItem)
+        self._tileItems = {}
+
+        self._reader = reader
+        if self._reader is not None:
+            self.scheduleUpdate()
+
+
+    @QtSlot()
+    def scheduleUpdate(self):
+        """ Updates the tiles after a short delay, so that they are not read while zooming.
+        """
+        if self._reader is not None:
+            self._updateTimer.start()
+
+
+    def _targetLevel(self):
+        """ Returns the level that the current zoom factor requires.
+        """
+        xPixelSize, yPixelSize = self._viewBox.viewPixelSize()
+        return levelForPixelSize(min(abs(xPixelSize), abs(yPixelSize)))
+
+
+    @QtSlot()
+    def updateTiles(self):
+        """ Shows the cached tiles that intersect the view and schedules reading the others.
+        """
+        if self._reader is None:
+            return
+
+        level = self._targetLevel()
+        (xMin, xMax), (yMin, yMax) = self._viewBox.viewRange()
+        rowRange = (int(math.floor(yMin)), int(math.ceil(yMax)))
+        colRange = (int(math.floor(xMin)), int(math.ceil(xMax)))
+
+        shownTileIds = []
+        missingTileIds = []
+        if level < self._reader.overviewLevel:
+            for tileId in self._reader.tilesInRect(level, rowRange, colRange):
+                if self._reader.cachedTile(tileId) is None:
+                    missingTileIds.append(tileId)
+                else:
+                    shownTileIds.append(tileId)
+
+        if missingTileIds:
+            # Meanwhile show the coarser tiles that have been read before.
+            maxLevel = min(level + MAX_FALLBACK_LEVELS, self._reader.overviewLevel - 1)
+            for fallbackLevel in range(level + 1, maxLevel + 1):
+                for tileId in self._reader.tilesInRect(fallbackLevel, rowRange, colRange):
+                    if self._reader.cachedTile(tileId) is not None:
+                        shownTileIds.append(tileId)
+
+        for tileId in list(self._tileItems.keys()):
+            if tileId not in shownTileIds:
+                self._viewBox.removeItem(self._tileItems.pop(tileId))
+
+        for tileId in shownTileIds:
+            self._showTile(tileId)
+
+        self._pendingTileIds = missingTileIds
+        if self._pendingTileIds:
+            self._readTimer.start()
+
+
+    @QtSlot()
+    def readNextTile(self):
+        """ Reads the next pending tile and shows it.
+
+            When all tiles are read, the coarser tiles are removed.
+        """
+        if self._reader is None or not self._pendingTileIds:
+            return
+
+        tileId = self._pendingTileIds.pop(0)
+        try:
+            self._reader.readTile(tileId)
+        except Exception as ex:
+            logger.warning("Unable to read tile {}: {}".format(tileId, ex))
+            self._pendingTileIds = []
+            return
+
+        self._showTile(tileId)
+
+        if self._pendingTileIds:
+            self._readTimer.start()
+        else:
+            self.updateTiles()
+
+
+    def _showTile(self, tileId):
+        """ Adds an image item for a cached tile, if there isn't one already.
+        """
+        if tileId in self._tileItems:
+            return
+
+        tile = self._reader.cachedTile(tileId)
+        rowSlice, colSlice = self._reader.tileRegion(tileId)
+        rect = QtCore.QRectF(colSlice.start - 0.5, rowSlice.start - 0.5,
+                             colSlice.stop - colSlice.start, rowSlice.stop - rowSlice.start)
+        imageArray, maskArray = imageArrayFromSlice(tile)
+        tileItem = TileImageItem(self._masterItem, tileId, imageArray, maskArray, rect)
+        self._viewBox.addItem(tileItem, ignoreBounds=True)
+        self._tileItems[tileId] = tileItem
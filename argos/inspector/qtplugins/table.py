@@ -30,13 +30,16 @@ from argos.config.groupcti import GroupCti, MainGroupCti
 from argos.config.intcti import IntCti
 from argos.config.qtctis import FontCti, ColorCti
 from argos.info import DEBUGGING
-from argos.inspector.abstract import AbstractInspector
-from argos.qt import Qt, QtCore, QtGui, QtWidgets
+from argos.inspector.abstract import AbstractInspector, UpdateReason
+from argos.inspector.qtplugins.tableblocks import (
+    DEFAULT_BLOCK_CACHE_BYTES, MIN_BLOCK_READ_CELLS, BlockPrefetcher, SliceBlockReader)
+from argos.qt import Qt, QtCore, QtGui, QtWidgets, QtSlot
 from argos.widgets.constants import MONO_FONT, FONT_SIZE
 from argos.widgets.argostableview import ArgosTableView
 from argos.utils.cls import checkType, checkIsAString
 from argos.utils.cls import toString, isAnArray
 from argos.utils.misc import isQuoted
+from argos.utils.tilecache import TileCache
 
 logger = logging.getLogger(__name__)
 
@@ -125,6 +128,9 @@ class TableInspectorCti(MainGroupCti):
         self.insertChild(BoolCti("separate fields", True))
         self.insertChild(BoolCti("word wrap", False))
 
+        # Large slices are read in blocks when the cells are shown.
+        self.blockReadingCti = self.insertChild(BoolCti('read in blocks', True))
+
         self.encodingCti = self.insertChild(
             ChoiceCti('encoding', editable=True,
                       configValues=['utf-8', 'ascii', 'latin-1', 'windows-1252']))
@@ -238,6 +244,12 @@ class TableInspector(AbstractInspector):
         horHeader.setCascadingSectionResizes(False)
         verHeader.setCascadingSectionResizes(False)
 
+        self._blockCache = TileCache(maxBytes=DEFAULT_BLOCK_CACHE_BYTES)
+        self.blockPrefetcher = BlockPrefetcher(parent=self)
+        self._scrollValues = (0, 0)  # To determine the scroll direction.
+        self.tableView.verticalScrollBar().valueChanged.connect(self._onScrolled)
+        self.tableView.horizontalScrollBar().valueChanged.connect(self._onScrolled)
+
         self._config = TableInspectorCti(tableInspector=self, nodeName='table')
 
         if self.config.defaultRowHeightCti.configValue < 0: # If not yet initialized
@@ -272,7 +284,8 @@ class TableInspector(AbstractInspector):
     def _clearContents(self):
         """ Clears the inspector widget when no valid input is available.
         """
-        pass
+        self.blockPrefetcher.setReader(None)
+        self._blockCache.clear()
 
 
     def _drawContents(self, reason=None, initiator=None):
@@ -302,9 +315,24 @@ class TableInspector(AbstractInspector):
         verHeader.setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
         horHeader.setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
 
-        self.model.updateState(self.collector.getSlicedArray(),
-                               self.collector.rtiInfo,
-                               self.configValue('separate fields'))
+        if reason == UpdateReason.RTI_CHANGED:
+            self._blockCache.clear()  # The contents of the RTI may have changed.
+
+        rtiInfo = self.collector.rtiInfo
+        sliceShape = self.collector.getSlicedArrayShape()
+        if (self.config.blockReadingCti.configValue and sliceShape is not None and
+                np.prod(sliceShape) > MIN_BLOCK_READ_CELLS):
+            sliceKey = (rtiInfo['path'], rtiInfo['slices'], rtiInfo['y-dim'], rtiInfo['x-dim'])
+            blockReader = SliceBlockReader(self._readSliceRegion, sliceShape, sliceKey,
+                                           self._blockCache)
+            slicedArray = None
+        else:
+            blockReader = None
+            slicedArray = self.collector.getSlicedArray()
+
+        self.blockPrefetcher.setReader(blockReader)
+        self.model.updateState(slicedArray, rtiInfo, self.configValue('separate fields'),
+                               blockReader=blockReader)
 
         self.model.encoding = self.config.encodingCti.configValue
         self.model.horAlignment = self.config.horAlignCti.configValue
@@ -383,6 +411,50 @@ class TableInspector(AbstractInspector):
                 logger.debug("Can't restore selection")
 
 
+    def _readSliceRegion(self, rowSlice, colSlice):
+        """ Reads a region of the slice. Is used by the SliceBlockReader.
+        """
+        return self.collector.getSlicedArray(regionSlices=(rowSlice, colSlice))
+
+
+    @QtSlot(int)
+    def _onScrolled(self, _value):
+        """ Schedules reading the blocks ahead of the view in the scroll direction.
+
+            Only has effect if the slice is read in blocks.
+        """
+        try:
+            scrollValues = (self.tableView.verticalScrollBar().value(),
+                            self.tableView.horizontalScrollBar().value())
+            rowDirection = int(np.sign(scrollValues[0] - self._scrollValues[0]))
+            colDirection = int(np.sign(scrollValues[1] - self._scrollValues[1]))
+            self._scrollValues = scrollValues
+
+            nRows, nCols = self.model.rowCount(), self.model.columnCount()
+            if self.blockPrefetcher.reader is None or nRows == 0 or nCols == 0:
+                return
+
+            # rowAt and columnAt return -1 if the table doesn't fill the viewport.
+            viewport = self.tableView.viewport()
+            firstRow = max(0, self.tableView.rowAt(0))
+            firstCol = max(0, self.tableView.columnAt(0))
+            lastRow = self.tableView.rowAt(viewport.height() - 1)
+            lastCol = self.tableView.columnAt(viewport.width() - 1)
+            lastRow = nRows - 1 if lastRow < 0 else lastRow
+            lastCol = nCols - 1 if lastCol < 0 else lastCol
+
+            firstArrayRow, firstArrayCol, _ = self.model.arrayIndex(firstRow, firstCol)
+            lastArrayRow, lastArrayCol, _ = self.model.arrayIndex(lastRow, lastCol)
+            self.blockPrefetcher.prefetch((firstArrayRow, lastArrayRow),
+                                          (firstArrayCol, lastArrayCol),
+                                          rowDirection, colDirection)
+        except Exception as ex:
+            logger.error("Slot is not exception-safe.")
+            logger.exception(ex)
+            if DEBUGGING:
+                raise
+
+
 
 class TableInspectorModel(QtCore.QAbstractTableModel):
     """ Qt table model that gives access to the sliced array,
@@ -400,6 +472,7 @@ class TableInspectorModel(QtCore.QAbstractTableModel):
         self._nCols = 0
         self._fieldNames = []
         self._slicedArray = None # can be a masked array or a regular numpy array
+        self._blockReader = None # SliceBlockReader if the slice is read in blocks
         self._rtiInfo = {}
 
         self._separateFields = True  # User config option
@@ -418,9 +491,12 @@ class TableInspectorModel(QtCore.QAbstractTableModel):
         self.verAlignment = None
 
 
-    def updateState(self, slicedArray, rtiInfo, separateFields):
+    def updateState(self, slicedArray, rtiInfo, separateFields, blockReader=None):
         """ Sets the slicedArray and rtiInfo and other members. This will reset the model.
 
+            If a blockReader is given, the slicedArray should be None. The cells are then read
+            in blocks when the table view requests them.
+
             Will be called from the tableInspector._drawContents.
         """
         logger.debug("TableInspectorModel.updateState called")
@@ -429,16 +505,22 @@ class TableInspectorModel(QtCore.QAbstractTableModel):
             # The sliced array can be a masked array or a (regular) numpy array.
             # The table works fine with masked arrays, no need to replace the masked values.
             self._slicedArray = slicedArray
-            if slicedArray is None:
+            self._blockReader = blockReader
+            if blockReader is not None:
+                self._nRows, self._nCols = blockReader.shape
+                dtype = blockReader.readBlock((0, 0)).data.dtype
+            elif slicedArray is not None:
+                self._nRows, self._nCols = self._slicedArray.shape
+                dtype = self._slicedArray.data.dtype
+            else:
                 self._nRows = 0
                 self._nCols = 0
-                self._fieldNames = []
+                dtype = None
+
+            if dtype is not None and dtype.names:
+                self._fieldNames = dtype.names
             else:
-                self._nRows, self._nCols = self._slicedArray.shape
-                if self._slicedArray.data.dtype.names:
-                    self._fieldNames = self._slicedArray.data.dtype.names
-                else:
-                    self._fieldNames = []
+                self._fieldNames = []
 
             self._rtiInfo = rtiInfo
             self._separateFields = separateFields
@@ -464,26 +546,54 @@ class TableInspectorModel(QtCore.QAbstractTableModel):
             self.endResetModel()
 
 
-    def _cellValue(self, index):
-        """ Returns the data value of the cell at the index (without any string conversion)
+    def arrayIndex(self, row, col):
+        """ Returns an (arrayRow, arrayCol, fieldName) tuple with the position in the sliced array
+            of the cell at row and col. The fieldName is None if the fields are not separated.
+        """
+        nFields = len(self._fieldNames)
+        if self._separateFieldOrientation == Qt.Horizontal:
+            return row, col // nFields, self._fieldNames[col % nFields]
+        elif self._separateFieldOrientation == Qt.Vertical:
+            return row // nFields, col, self._fieldNames[row % nFields]
+        else:
+            return row, col, None
+
+
+    def _cellArray(self, index):
+        """ Returns an (array, arrayIndex, fieldName) tuple with the ArrayWithMask that contains the
+            cell at the index and the position of the cell within that array.
+
+            The array is the sliced array or, if the slice is read in blocks, the block that
+            contains the cell. Returns None if the index is out of range.
         """
         row = index.row()
         col = index.column()
         if (row < 0 or row >= self.rowCount() or col < 0 or col >= self.columnCount()):
             return None
 
-        # The check above should have returned None if the sliced array is None
-        assert self._slicedArray is not None, "Sanity check failed."
-
-        nFields = len(self._fieldNames)
+        # The check above should have returned None if there is no sliced array or block reader.
+        assert self._slicedArray is not None or self._blockReader is not None, \
+            "Sanity check failed."
 
-        data = self._slicedArray.data
-        if self._separateFieldOrientation == Qt.Horizontal:
-            dataValue = data[row, col // nFields][self._fieldNames[col % nFields]]
-        elif self._separateFieldOrientation == Qt.Vertical:
-            dataValue = data[row // nFields, col][self._fieldNames[row % nFields]]
+        arrayRow, arrayCol, fieldName = self.arrayIndex(row, col)
+        if self._blockReader is None:
+            return self._slicedArray, (arrayRow, arrayCol), fieldName
         else:
-            dataValue = data[row, col]
+            block, blockRow, blockCol = self._blockReader.cellBlock(arrayRow, arrayCol)
+            return block, (blockRow, blockCol), fieldName
+
+
+    def _cellValue(self, index):
+        """ Returns the data value of the cell at the index (without any string conversion)
+        """
+        cellArray = self._cellArray(index)
+        if cellArray is None:
+            return None
+
+        array, arrayIndex, fieldName = cellArray
+        dataValue = array.data[arrayIndex]
+        if fieldName is not None:
+            dataValue = dataValue[fieldName]
 
         return dataValue
 
@@ -491,23 +601,16 @@ class TableInspectorModel(QtCore.QAbstractTableModel):
     def _cellMask(self, index):
         """ Returns the data mask of the cell at the index (without any string conversion)
         """
-        row = index.row()
-        col = index.column()
-        if (row < 0 or row >= self.rowCount() or col < 0 or col >= self.columnCount()):
+        cellArray = self._cellArray(index)
+        if cellArray is None:
             return None
 
-        # The check above should have returned None if the sliced array is None
-        assert self._slicedArray is not None, "Sanity check failed."
-
-        nFields = len(self._fieldNames)
-        mask = self._slicedArray.mask
+        array, arrayIndex, fieldName = cellArray
+        mask = array.mask
         if isAnArray(mask):
-            if self._separateFieldOrientation == Qt.Horizontal:
-                maskValue = mask[row, col // nFields][self._fieldNames[col % nFields]]
-            elif self._separateFieldOrientation == Qt.Vertical:
-                maskValue = mask[row // nFields, col][self._fieldNames[row % nFields]]
-            else:
-                maskValue = mask[row, col]
+            maskValue = mask[arrayIndex]
+            if fieldName is not None:
+                maskValue = maskValue[fieldName]
         else:
             maskValue = mask
 
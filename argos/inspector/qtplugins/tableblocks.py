@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Reading the slice of the table inspector in blocks.
+
+    Large slices are not read completely. The table model only knows the shape of the slice and
+    reads the blocks of the cells that the table view requests. The blocks are kept in a
+    TileCache, which is bounded by the number of bytes. While scrolling, the blocks ahead of the
+    view are read in advance when the application is idle.
+"""
+from __future__ import division, print_function
+
+import logging
+
+from argos.qt import QtCore, QtSlot
+
+logger = logging.getLogger(__name__)
+
+BLOCK_ROWS = 256  # Number of rows of a block.
+BLOCK_COLS = 64   # Number of columns of a block.
+MIN_BLOCK_READ_CELLS = 1024 * 1024  # Smaller slices are read completely.
+
+DEFAULT_BLOCK_CACHE_BYTES = 64 * 1024 ** 2
+PREFETCH_DISTANCE = 2  # Number of blocks that are read ahead of the view in the scroll direction.
+
+
+def _rangeAhead(first, last, direction, blockSize, size):
+    """ Returns the (first, last) range of the cells ahead of a visible range.
+
+        If the direction is zero, the visible range itself is returned.
+
+        :param first: first visible row or column.
+        :param last: last visible row or column (included).
+        :param direction: -1, 0 or 1 for scrolling up/left, not scrolling and down/right.
+        :param blockSize: number of rows or columns of a block.
+        :param size: number of rows or columns of the slice.
+    """
+    distance = PREFETCH_DISTANCE * blockSize
+    if direction > 0:
+        return last + 1, min(size - 1, last + distance)
+    elif direction < 0:
+        return max(0, first - distance), first - 1
+    else:
+        return first, last
+
+
+
+class SliceBlockReader(object):
+    """ Reads a 2D slice in blocks of BLOCK_ROWS by BLOCK_COLS, which are kept in a TileCache.
+    """
+    def __init__(self, readFunction, shape, sliceKey, cache):
+        """ Constructor
+
+            :param readFunction: function that reads a region of the slice. It gets a row slice
+                and a column slice as parameters and should return an ArrayWithMask.
+            :param shape: (nRows, nCols) tuple with the shape of the complete slice.
+            :param sliceKey: hashable that identifies the slice. It's part of the keys of the
+                cache, so that a cache can be shared by the slices of an inspector.
+            :param cache: the TileCache.
+        """
+        assert len(shape) == 2, "Expected a 2D shape, got: {}".format(shape)
+        self._readFunction = readFunction
+        self._shape = tuple(shape)
+        self._sliceKey = sliceKey
+        self._cache = cache
+
+
+    def __repr__(self):
+        return "<SliceBlockReader: {}, shape={}>".format(self._sliceKey, self._shape)
+
+
+    @property
+    def shape(self):
+        """ The (nRows, nCols) shape of the complete slice.
+        """
+        return self._shape
+
+
+    def blockRegion(self, blockId):
+        """ Returns a (rowSlice, colSlice) tuple with the region of the slice that a block covers.
+
+            :param blockId: (blockRow, blockCol) tuple
+        """
+        blockRow, blockCol = blockId
+        nRows, nCols = self._shape
+        return (slice(blockRow * BLOCK_ROWS, min(nRows, (blockRow + 1) * BLOCK_ROWS)),
+                slice(blockCol * BLOCK_COLS, min(nCols, (blockCol + 1) * BLOCK_COLS)))
+
+
+    def blocksInRect(self, rowRange, colRange):
+        """ Returns the IDs of the blocks that intersect a rectangle, row by row.
+
+            :param rowRange: (first, last) tuple. The last row is included.
+            :param colRange: (first, last) tuple. The last column is included.
+        """
+        nRows, nCols = self._shape
+        rowMin, rowMax = max(0, rowRange[0]), min(nRows - 1, rowRange[1])
+        colMin, colMax = max(0, colRange[0]), min(nCols - 1, colRange[1])
+        if rowMin > rowMax or colMin > colMax:
+            return []
+
+        return [(blockRow, blockCol)
+                for blockRow in range(rowMin // BLOCK_ROWS, rowMax // BLOCK_ROWS + 1)
+                for blockCol in range(colMin // BLOCK_COLS, colMax // BLOCK_COLS + 1)]
+
+
+    def cachedBlock(self, blockId):
+        """ Returns the block as ArrayWithMask if it's in the cache. Returns None otherwise.
+        """
+        return self._cache.get((self._sliceKey, ) + tuple(blockId))
+
+
+    def readBlock(self, blockId):
+        """ Returns the block as ArrayWithMask. It's read if it's not in the cache.
+        """
+        block = self.cachedBlock(blockId)
+        if block is None:
+            block = self._readFunction(*self.blockRegion(blockId))
+            self._cache.put((self._sliceKey, ) + tuple(blockId), block)
+        return block
+
+
+    def cellBlock(self, row, col):
+        """ Returns a (block, blockRow, blockCol) tuple with the block that contains a cell and the
+            position of the cell within that block. The block is read if it's not in the cache.
+        """
+        block = self.readBlock((row // BLOCK_ROWS, col // BLOCK_COLS))
+        return block, row % BLOCK_ROWS, col % BLOCK_COLS
+
+
+
+class BlockPrefetcher(QtCore.QObject):
+    """ Reads the blocks ahead of the view of a table while scrolling.
+
+        One block is read per event loop iteration, so that the table stays responsive. The
+        blocks are read in the GUI thread because not all repo tree items can be read from
+        another thread.
+    """
+    def __init__(self, parent=None):
+        """ Constructor
+        """
+        super(BlockPrefetcher, self).__init__(parent=parent)
+        self._reader = None
+        self._pendingBlockIds = []
+
+        self._readTimer = QtCore.QTimer(self)
+        self._readTimer.setSingleShot(True)
+        self._readTimer.setInterval(0)
+        self._readTimer.timeout.connect(self.readNextBlock)
+
+
+    @property
+    def reader(self):
+        """ The SliceBlockReader. None if the slice is not read in blocks.
+        """
+        return self._reader
+
+
+    @property
+    def pendingBlockIds(self):
+        """ The IDs of the blocks that will be read (in this order).
+        """
+        return self._pendingBlockIds
+
+
+    def setReader(self, reader):
+        """ Sets the SliceBlockReader and cancels reading the blocks of the previous reader.
+        """
+        self._readTimer.stop()
+        self._pendingBlockIds = []
+        self._reader = reader
+
+
+    def prefetch(self, rowRange, colRange, rowDirection, colDirection):
+        """ Schedules reading the blocks ahead of the visible cells in the scroll direction.
+
+            Replaces the blocks that were scheduled before, since the view has moved.
+
+            :param rowRange: (first, last) tuple with the visible rows of the slice.
+            :param colRange: (first, last) tuple with the visible columns of the slice.
+            :param rowDirection: -1, 0 or 1 for scrolling up, not scrolling vertically or down.
+            :param colDirection: -1, 0 or 1 for scrolling left, not scrolling horizontally or right.
+        """
+        if self._reader is None:
+            return
+
+        nRows, nCols = self._reader.shape
+        blockIds = []
+        if rowDirection:
+            blockIds += self._reader.blocksInRect(
+                _rangeAhead(rowRange[0], rowRange[1], rowDirection, BLOCK_ROWS, nRows), colRange)
+        if colDirection:
+            blockIds += self._reader.blocksInRect(
+                rowRange, _rangeAhead(colRange[0], colRange[1], colDirection, BLOCK_COLS, nCols))
+
+        self._pendingBlockIds = [blockId for blockId in blockIds
+                                 if self._reader.cachedBlock(blockId) is None]
+        if self._pendingBlockIds:
+            self._readTimer.start()
+        else:
+            self._readTimer.stop()
+
+
+    @QtSlot()
+    def readNextBlock(self):
+        """ Reads the next pending block.
+        """
+        if self._reader is None or not self._pendingBlockIds:
+            return
+
+        blockId = self._pendingBlockIds.pop(0)
+        try:
+            self._reader.readBlock(blockId)
+        except Exception as ex:
+            logger.warning("Unable to read block {}: {}".format(blockId, ex))
+            self._pendingBlockIds = []
+            return
+
+        if self._pendingBlockIds:
+            self._readTimer.start()
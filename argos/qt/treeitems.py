@@ -1,3 +1,4 @@
+import itertools
 import logging
 
 from argos.external import six
@@ -26,6 +27,8 @@ class BaseTreeItem(object):
         self._parentItem = None
         self._model = None
         self._childItems = [] # the fetched children
+        self._childNumber = 0 # Row number in the parent's list of children. Kept up to date.
+        self._childrenByName = {} # Maps a nodeName to the first child with that name.
         self._nodePath = self._constructNodePath()
 
     def finalize(self):
@@ -108,6 +111,8 @@ class BaseTreeItem(object):
         assert '/' not in nodeName, "nodeName may not contain slashes"
         self._nodeName = nodeName
         self._recursiveSetNodePath(self._constructNodePath())
+        if self.parentItem is not None:
+            self.parentItem._childrenByName = None # Rebuild when needed
 
     def _constructNodePath(self):
         """ Recursively prepends the parents nodeName to the path until the root node is reached."""
@@ -165,13 +170,19 @@ class BaseTreeItem(object):
 
     def childByNodeName(self, nodeName):
         """ Gets first (direct) child that has the nodeName.
+
+            Uses a dictionary that maps names to children, so this is O(1) in time.
         """
         assert '/' not in nodeName, "nodeName can not contain slashes"
-        for child in self.childItems:
-            if child.nodeName == nodeName:
-                return child
+        if self._childrenByName is None:
+            self._childrenByName = {}
+            for child in self.childItems:
+                self._childrenByName.setdefault(child.nodeName, child)
 
-        raise IndexError("No child item found having nodeName: {}".format(nodeName))
+        try:
+            return self._childrenByName[nodeName]
+        except KeyError:
+            raise IndexError("No child item found having nodeName: {}".format(nodeName))
 
 
     def findByNodePath(self, nodePath):
@@ -205,13 +216,23 @@ class BaseTreeItem(object):
 
     def childNumber(self):
         """ Gets the index (nr) of this node in its parent's list of children.
+
+            The row number is stored in the item when it's inserted or when one of its preceding
+            siblings is inserted or removed, so this is O(1) in time.
         """
-        # This is O(n) in time. # TODO: store row number in the items?
         if self.parentItem is not None:
-            return self.parentItem.childItems.index(self)
+            return self._childNumber
         return 0
 
 
+    def _renumberChildren(self, startRow=0):
+        """ Updates the stored row numbers of the children, starting at startRow.
+        """
+        childItems = self.childItems
+        for row in range(startRow, len(childItems)):
+            childItems[row]._childNumber = row
+
+
     def insertChild(self, childItem, position=None):
         """ Inserts a child item to the current item.
             The childItem must not yet have a parent (it will be set by this function).
@@ -225,16 +246,58 @@ class BaseTreeItem(object):
 
             Returns childItem so that calls may be chained.
         """
+        self.insertChildren([childItem], position=position)
+        return childItem
+
+
+    def insertChildren(self, childItems, position=None):
+        """ Inserts a list of child items to the current item.
+            The childItems must not yet have a parent (it will be set by this function).
+
+            This is faster than calling insertChild for each child. The node path of this item
+            is looked up only once. Descendants that need to do something with each inserted
+            child should override this method, not insertChild.
+
+            IMPORTANT: this does not let the model know that items have been added.
+            Use BaseTreeModel.insertItems instead.
+
+            param childItems: list of BaseTreeItems that will be added
+            param position: integer position before which the items will be added.
+                If position is None (default) the items will be appended at the end.
+
+            Returns childItems so that calls may be chained.
+        """
         if position is None:
             position = self.nChildren()
 
-        assert childItem.parentItem is None, "childItem already has a parent: {}".format(childItem)
-        assert childItem._model is None, "childItem already has a model: {}".format(childItem)
+        assert 0 <= position <= self.nChildren(), \
+            "position should be 0 <= {} <= {}".format(position, self.nChildren())
+
+        model = self.model
+        pathPrefix = self.nodePath + '/'
+        for childItem in childItems:
+            assert childItem.parentItem is None, \
+                "childItem already has a parent: {}".format(childItem)
+            assert childItem._model is None, "childItem already has a model: {}".format(childItem)
+
+            # Set _parentItem directly to prevent the parentItem setter from constructing the
+            # node path of this item again for every child.
+            childItem._parentItem = self
+            childItem._recursiveSetNodePath(pathPrefix + childItem.nodeName)
+            childItem.model = model
+
+        isAppended = position == self.nChildren()
+        self.childItems[position:position] = childItems
+        self._renumberChildren(position)
+
+        if self._childrenByName is not None:
+            if isAppended:
+                for childItem in childItems:
+                    self._childrenByName.setdefault(childItem.nodeName, childItem)
+            else:
+                self._childrenByName = None # Rebuild when needed so that the first child wins.
 
-        childItem.parentItem = self
-        childItem.model = self.model
-        self.childItems.insert(position, childItem)
-        return childItem
+        return childItems
 
 
     def removeChild(self, position):
@@ -245,7 +308,12 @@ class BaseTreeItem(object):
             "position should be 0 < {} <= {}".format(position, len(self.childItems))
 
         self.childItems[position].finalize()
-        self.childItems.pop(position)
+        childItem = self.childItems.pop(position)
+        self._renumberChildren(position)
+
+        if self._childrenByName is not None and \
+                self._childrenByName.get(childItem.nodeName) is childItem:
+            self._childrenByName = None # Rebuild when needed. There may be a child with same name
 
 
     def removeAllChildren(self):
@@ -255,6 +323,7 @@ class BaseTreeItem(object):
         for childItem in self.childItems:
             childItem.finalize()
         self._childItems = []
+        self._childrenByName = {}
 
 
     def logBranch(self, indent=0, level=logging.DEBUG):
@@ -272,12 +341,18 @@ class BaseTreeItem(object):
 class AbstractLazyLoadTreeItem(BaseTreeItem):
     """ Abstract base class for a tree item that can do lazy loading of children.
         Descendants should override the _fetchAllChildren
+
+        Descendants that can have many children can override _iterChildren instead. This
+        should be a generator that yields the children one by one. The children are then fetched
+        in pages of at most maxItems children, so that only the visible part of a large group
+        needs to be created.
     """
     def __init__(self, nodeName=''):
         """ Constructor
         """
         super(AbstractLazyLoadTreeItem, self).__init__(nodeName=nodeName)
         self._canFetchChildren = True # children not yet fetched (successfully or unsuccessfully)
+        self._childIterator = None # Iterator over the remaining children during paged fetching.
 
 
     def hasChildren(self):
@@ -289,25 +364,57 @@ class AbstractLazyLoadTreeItem(BaseTreeItem):
     def canFetchChildren(self):
         """ Returns True if children can be fetched, and False if they already have been fetched.
             Also returns False if they have been fetched and tried.
+
+            During paged fetching this remains True until the last page has been fetched.
         """
         return self._canFetchChildren
 
 
-    def fetchChildren(self):
+    def fetchChildren(self, maxItems=None):
         """ Fetches children.
 
-            The actual work is done by _fetchAllChildren. Descendant classes should typically
-            override that method instead of this one.
+            The actual work is done by _fetchAllChildren or _iterChildren. Descendant classes
+            should typically override one of these methods instead of this one.
+
+            :param maxItems: maximum number of children that are returned. If None, all remaining
+                children are returned. The canFetchChildren method returns True as long as there
+                are children left.
         """
         assert self._canFetchChildren, "canFetchChildren must be True"
+        return self._fetchChildrenPage(maxItems)
+
+
+    def _fetchChildrenPage(self, maxItems):
+        """ Returns at most maxItems children (all if None) from the children iterator.
+
+            Sets _canFetchChildren to False when the iterator is exhausted or has failed.
+        """
+        isExhausted = True # Set to True, even if tried and failed.
         try:
-            childItems = self._fetchAllChildren()
+            if self._childIterator is None:
+                self._childIterator = iter(self._iterChildren())
+
+            if maxItems is None:
+                childItems = list(self._childIterator)
+            else:
+                childItems = list(itertools.islice(self._childIterator, maxItems))
+                isExhausted = len(childItems) < maxItems
         finally:
-            self._canFetchChildren = False # Set to True, even if tried and failed.
+            if isExhausted:
+                self._childIterator = None
+                self._canFetchChildren = False
 
         return childItems
 
 
+    def _iterChildren(self):
+        """ Returns an iterable over the children. The iteration may happen in multiple pages.
+
+            The default implementation returns the result of _fetchAllChildren.
+        """
+        return self._fetchAllChildren()
+
+
     def _fetchAllChildren(self):
         """ The function that actually fetches the children.
 
@@ -324,4 +431,5 @@ class AbstractLazyLoadTreeItem(BaseTreeItem):
         try:
             super(AbstractLazyLoadTreeItem, self).removeAllChildren()
         finally:
+            self._childIterator = None
             self._canFetchChildren = True
@@ -328,6 +328,17 @@ class BaseTreeModel(QtCore.QAbstractItemModel):
         return altItem
 
 
+    def fetchMoreSynchronously(self, parentIndex):
+        """ Fetches (the next page of) the children of the item at parentIndex and only returns
+            when they have been inserted in the model.
+
+            Descendants that fetch children in the background should override this. The base
+            implementation calls fetchMore, which is synchronous.
+        """
+        if self.canFetchMore(parentIndex):
+            self.fetchMore(parentIndex)
+
+
     def insertItem(self, childItem, position=None, parentIndex=None):
         """ Inserts a childItem before row 'position' under the parent index.
 
@@ -357,6 +368,43 @@ class BaseTreeModel(QtCore.QAbstractItemModel):
         return childIndex
 
 
+    def insertItems(self, childItems, position=None, parentIndex=None):
+        """ Inserts a list of childItems before row 'position' under the parent index.
+
+            The views are notified only once, which is much faster than calling insertItem for
+            each child when there are many children.
+
+            If position is None the children will be appended after the last child of the parent.
+            Returns the index of the last inserted child, or an invalid index if childItems is
+            empty.
+        """
+        if parentIndex is None:
+            parentIndex=QtCore.QModelIndex()
+
+        if not childItems:
+            return QtCore.QModelIndex()
+
+        parentItem = self.getItem(parentIndex, altItem=self.invisibleRootTreeItem)
+
+        nChildren = parentItem.nChildren()
+        if position is None:
+            position = nChildren
+
+        assert 0 <= position <= nChildren, \
+            "position should be 0 < {} <= {}".format(position, nChildren)
+
+        lastPosition = position + len(childItems) - 1
+        self.beginInsertRows(parentIndex, position, lastPosition)
+        try:
+            parentItem.insertChildren(childItems, position)
+        finally:
+            self.endInsertRows()
+
+        lastIndex = self.index(lastPosition, 0, parentIndex)
+        assert lastIndex.isValid(), "Sanity check failed: lastIndex not valid"
+        return lastIndex
+
+
     def removeAllChildrenAtIndex(self, parentIndex):
         """ Removes all children of the item at the parentIndex.
             The children's finalize method is called before removing them to give them a
@@ -479,14 +527,17 @@ class BaseTreeModel(QtCore.QAbstractItemModel):
             """ Searches the parent for a direct child having the nodeName.
                 Returns (item, itemIndex) tuple. Raises IndexError if the item cannot be found.
             """
-            if self.canFetchMore(parentIndex):
-                self.fetchMore(parentIndex)
-
-            for rowNr, childItem in enumerate(parentItem.childItems):
-                if childItem.nodeName == nodeName:
-                    childIndex = self.index(rowNr, 0, parentIndex=parentIndex)
+            # The children may be fetched in pages. Fetch until the child is found.
+            while True:
+                self.fetchMoreSynchronously(parentIndex)
+                try:
+                    childItem = parentItem.childByNodeName(nodeName)
+                except IndexError:
+                    if not self.canFetchMore(parentIndex):
+                        raise IndexError("Item not found: {!r}".format(path))
+                else:
+                    childIndex = self.index(childItem.childNumber(), 0, parentIndex=parentIndex)
                     return (childItem, childIndex)
-            raise IndexError("Item not found: {!r}".format(path))
 
 
         def _auxGetByPath(parts, item, index):
@@ -18,6 +18,7 @@
 """ Repository TreeItem (RTI) classes
     Tree items for use in the RepositoryTreeModel
 """
+import functools
 import logging
 import os
 import re
@@ -25,8 +26,9 @@ import re
 from argos.external import six
 from argos.info import DEBUGGING
 from argos.qt.treeitems import AbstractLazyLoadTreeItem
+from argos.repo.filehandlepool import globalFileHandlePool
 from argos.repo.iconfactory import RtiIconFactory
-from argos.utils.cls import checkType, isASequence, isAColorString
+from argos.utils.cls import checkType, isAColorString
 from argos.utils.dirs import normRealPath
 from argos.utils.defs import DIM_TEMPLATE
 
@@ -45,6 +47,65 @@ def shapeToSummary(shape, postfix="elements"):
     return " × ".join([str(elem) for elem in shape]) + " " + postfix
 
 
+class FileHandleAttribute(object):
+    """ Descriptor for RTI attributes that contain objects that depend on an open file handle.
+
+        For example, the h5py.Dataset of an HDF-5 dataset RTI. Reading the attribute first
+        reopens the file handle if it has been released by the file handle pool. When the handle
+        is reopened, the RTIs must set the attribute again in their _refreshFileHandles method.
+    """
+    def __set_name__(self, owner, name):
+        self._attrName = '_fha' + name
+
+
+    def __get__(self, rti, cls=None):
+        if rti is None:
+            return self
+        rti.ensureFileHandle()
+        return rti.__dict__.get(self._attrName)
+
+
+    def __set__(self, rti, value):
+        rti.__dict__[self._attrName] = value
+
+
+
+class MetadataProperty(object):
+    """ Read-only property of which the value is stored in the metadata snapshot of the RTI.
+
+        Use it as a decorator, instead of @property, for properties that read metadata from the
+        file (e.g. the dimension names or the unit), which are requested many times when the
+        repository tree is painted. The getter is only called the first time, subsequent calls
+        return the value from the snapshot until BaseRti.invalidateMetadata is called.
+    """
+    def __init__(self, fget):
+        self.fget = fget
+        self.__doc__ = fget.__doc__
+
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+
+    def __get__(self, rti, cls=None):
+        if rti is None:
+            return self
+        try:
+            return rti._metadata[self._name]
+        except KeyError:
+            value = self.fget(rti)  # Exceptions are not stored, so the next call will try again.
+            rti._metadata[self._name] = value
+            return value
+
+
+@functools.lru_cache(maxsize=None)
+def _metadataPropertyNames(cls):
+    """ Returns the names of the MetadataProperty attributes of an RTI class.
+    """
+    return [name for name in dir(cls) if isinstance(getattr(cls, name, None), MetadataProperty)]
+
+
+
 class BaseRti(AbstractLazyLoadTreeItem):
     """ TreeItem for use in a RepositoryTreeModel. (RTI = Repository TreeItem)
         Base node from which to derive the other types of nodes.
@@ -54,6 +115,14 @@ class BaseRti(AbstractLazyLoadTreeItem):
     _defaultIconGlyph = None  # Can be overridden by defining a _iconGlyph attribute
     _defaultIconColor = None  # Can be overridden by defining a _iconColor attribute
 
+    # Set to True in file RTIs that keep a file handle open. They are added to the file handle
+    # pool, which may release the handle without closing the RTI (see filehandlepool.py).
+    _poolFileHandle = False
+
+    # Set to False in RTIs that use a library that is not thread safe (e.g. NetCDF-C). The
+    # children of these items, and of their descendants, are then fetched in the GUI thread.
+    _fetchInBackground = True
+
     def __init__(self, nodeName, iconColor, fileName=''):
         """ Constructor
 
@@ -66,7 +135,10 @@ class BaseRti(AbstractLazyLoadTreeItem):
         self._iconColor = iconColor
 
         self._isOpen = False
+        self._fileHandleReleased = False # True if the file handle pool closed the resources
+        self._excludedFromPool = False # See excludeFromFileHandlePool
         self._exception = None # Any exception that may occur when opening this item.
+        self._metadata = {} # Snapshot of the MetadataProperty values.
 
         checkType(fileName, six.string_types, allowNone=True)
         if fileName:
@@ -75,17 +147,20 @@ class BaseRti(AbstractLazyLoadTreeItem):
 
 
     @classmethod
-    def createFromFileName(cls, fileName, iconColor):
+    def createFromFileName(cls, fileName, iconColor, nodeName=None):
         """ Creates a BaseRti (or descendant), given a file name.
+
+            If nodeName is None, the base name of the real path of the file is used.
         """
         logger.debug("createFromFileName {}, {}, color={}".format(cls, fileName, iconColor))
         # See https://julien.danjou.info/blog/2013/guide-python-static-class-abstract-methods
         #logger.debug("Trying to create object of class: {!r}".format(cls))
-        basename = os.path.basename(normRealPath(fileName)) # strips trailing slashes
-        if not basename:
-            logger.warning("Empty file name in path: {}. Using '<root>' as root path.")
-            basename = '<root directory>'
-        return cls(nodeName=basename, fileName=fileName, iconColor=iconColor)
+        if nodeName is None:
+            nodeName = os.path.basename(normRealPath(fileName)) # strips trailing slashes
+            if not nodeName:
+                logger.warning("Empty file name in path: {}. Using '<root>' as root path.")
+                nodeName = '<root directory>'
+        return cls(nodeName=nodeName, fileName=fileName, iconColor=iconColor)
 
 
     @property
@@ -120,13 +195,23 @@ class BaseRti(AbstractLazyLoadTreeItem):
         try:
             if self._isOpen:
                 logger.warning("Resources already open. Closing them first before opening.")
-                self._closeResources()
+                self._closeOpenResources()
                 self._isOpen = False
 
             assert not self._isOpen, "Sanity check failed: _isOpen should be false"
             logger.debug("Opening {}".format(self))
-            self._openResources()
-            self._isOpen = True
+            # Only items in the file handle pool can open their resources later, when needed.
+            if self.usesFileHandlePool and self._openFromFileIndex():
+                # The file handle pool opens the resources when the file handle is needed.
+                self._fileHandleReleased = True
+                self._isOpen = True
+                self.invalidateMetadata()
+            else:
+                self._openResources()
+                self._isOpen = True
+                self.invalidateMetadata()
+                if self.usesFileHandlePool:
+                    globalFileHandlePool().add(self)
 
             if self.model:
                 self.model.sigItemChanged.emit(self)
@@ -158,10 +243,11 @@ class BaseRti(AbstractLazyLoadTreeItem):
         try:
             if self._isOpen:
                 logger.debug("Closing {}".format(self))
-                self._closeResources()
+                self._closeOpenResources()
                 self._isOpen = False
             else:
                 logger.debug("Resources already closed (ignored): {}".format(self))
+            self.invalidateMetadata()
 
             if self.model:
                 self.model.sigItemChanged.emit(self)
@@ -175,6 +261,17 @@ class BaseRti(AbstractLazyLoadTreeItem):
             self.setException(ex)
 
 
+    def _openFromFileIndex(self):
+        """ Can be overridden by file RTIs that support the persistent file index.
+
+            Should return True if the children can be created from the index (see fileindex.py),
+            in which case the resources are not opened by self.open. They are opened by the file
+            handle pool as soon as the file handle is needed. The default implementation returns
+            False.
+        """
+        return False
+
+
     def _closeResources(self):
         """ Can be overridden to close the underlying resources.
             The default implementation does nothing.
@@ -183,6 +280,187 @@ class BaseRti(AbstractLazyLoadTreeItem):
         pass
 
 
+    def _closeOpenResources(self):
+        """ Removes the item from the file handle pool and closes the resources.
+
+            The resources are not closed if the pool has already released them.
+        """
+        if self.usesFileHandlePool:
+            globalFileHandlePool().remove(self)
+
+        if self._fileHandleReleased:
+            self._fileHandleReleased = False
+        else:
+            self._closeResources()
+
+
+    @property
+    def usesFileHandlePool(self):
+        """ Returns True if the item is added to the file handle pool when it is opened.
+        """
+        return self._poolFileHandle and not self._excludedFromPool
+
+
+    def excludeFromFileHandlePool(self):
+        """ Keeps the item out of the file handle pool. Its file handle stays open until the item
+            is closed.
+
+            Is used for private copies of file RTIs that are opened for a short time (e.g. to
+            compare or walk a file), so that they don't cause the pool to release the file handles
+            of the repository tree. Must be called before the item is opened.
+        """
+        assert not self._isOpen, "Item is already open: {}".format(self)
+        self._excludedFromPool = True
+
+
+    @property
+    def isFileHandleReleased(self):
+        """ Returns True if the file handle pool has released the file handle of this item.
+
+            The item is still considered to be open, the handle is reopened when it's needed.
+        """
+        return self._fileHandleReleased
+
+
+    def releaseFileHandle(self):
+        """ Closes the underlying resources without closing the item or removing its children.
+
+            Is called by the file handle pool. The resources are reopened on the next access.
+        """
+        if not self._isOpen or self._fileHandleReleased:
+            return
+        try:
+            self._closeResources()
+        except Exception as ex:
+            logger.warning("Error while releasing file handle of {}: {}".format(self, ex))
+        self._fileHandleReleased = True
+
+
+    def reopenFileHandle(self):
+        """ Reopens the underlying resources after they were released by the file handle pool.
+
+            Calls _refreshFileHandles on all descendants so that they can re-acquire the objects
+            that depend on the file handle. Items that can't be refreshed get an exception; their
+            descendants are skipped. Descendants that have their own file handle are skipped.
+        """
+        assert self._fileHandleReleased, "File handle not released: {}".format(self)
+        self._fileHandleReleased = False
+        try:
+            self._openResources()
+        except Exception:
+            self._fileHandleReleased = True
+            raise
+
+        def _refreshDescendants(item):
+            "Refreshes the children of an item before their own children"
+            for childItem in item.childItems:
+                if childItem._poolFileHandle:
+                    continue  # Has its own file handle, e.g. a file that is stored in a file.
+                try:
+                    childItem._refreshFileHandles()
+                except Exception as ex:
+                    # E.g. the item has been removed from the file while the handle was released.
+                    logger.warning("Unable to refresh {}: {}".format(childItem, ex))
+                    childItem.setException(ex)
+                    continue
+                _refreshDescendants(childItem)
+
+        _refreshDescendants(self)
+
+
+    def _refreshFileHandles(self):
+        """ Is called after the file handle of an ancestor has been reopened.
+
+            Descendants that store objects that depend on the file handle (see the
+            FileHandleAttribute class) must override this to get these objects again.
+            The default implementation does nothing.
+        """
+        pass
+
+
+    def fileHandleOwner(self):
+        """ Returns the item (self or an ancestor) that owns the file handle this item depends on.
+
+            That is the first item that has _poolFileHandle set. It's not necessarily in the file
+            handle pool (see excludeFromFileHandlePool). Returns None if there is no such item.
+        """
+        item = self
+        while item is not None:
+            if getattr(item, '_poolFileHandle', False):
+                return item
+            item = item.parentItem
+        return None
+
+
+    def canFetchInBackground(self):
+        """ Returns True if the children of this item can be fetched in a background thread.
+
+            Returns False if this item, or one of its ancestors, has _fetchInBackground set to
+            False, since its library is then also used by the GUI thread to read the data.
+        """
+        item = self
+        while item is not None:
+            if not getattr(item, '_fetchInBackground', True):
+                return False
+            item = item.parentItem
+        return True
+
+
+    def ensureFileHandle(self):
+        """ Makes sure that the file handle this item depends on is open.
+
+            Reopens it if it has been released by the file handle pool.
+        """
+        owner = self.fileHandleOwner()
+        if owner is not None and owner.usesFileHandlePool and owner.isOpen:
+            globalFileHandlePool().acquire(owner)
+
+
+    def snapshotMetadata(self, exclude=()):
+        """ Reads all metadata properties (see MetadataProperty) so that they are stored in the
+            metadata snapshot.
+
+            Is called in the background thread that fetches the children so that painting the
+            tree and the detail panes doesn't need to read the file anymore. Errors are logged;
+            the corresponding properties are not stored and will raise again when accessed.
+
+            :param exclude: names of the properties that should not be read.
+            :return: dictionary with the values that have been read.
+        """
+        metadata = {}
+        for name in _metadataPropertyNames(type(self)):
+            if name in exclude:
+                continue
+            try:
+                metadata[name] = getattr(self, name)
+            except Exception as ex:
+                logger.debug("Unable to read {} of {}: {}".format(name, self, ex))
+        return metadata
+
+
+    def restoreMetadata(self, metadata):
+        """ Adds the values of a metadata dictionary, e.g. from the file index, to the snapshot.
+        """
+        self._metadata.update(metadata)
+
+
+    def invalidateMetadata(self):
+        """ Empties the metadata snapshot so that the metadata is read again on the next access.
+
+            Is called when the item is opened or closed, e.g. when the file is reloaded.
+        """
+        self._metadata = {}
+
+
+    def invalidateCaches(self):
+        """ Is called when the underlying file has changed on disk (see filewatcher.py).
+
+            Descendants that cache values that are read from the file should override this to
+            remove them. The default implementation empties the metadata snapshot.
+        """
+        self.invalidateMetadata()
+
+
     def _checkFileExists(self):
         """ Verifies that the underlying file exists and sets the _exception attribute if not
             Returns True if the file exists.
@@ -215,16 +493,21 @@ class BaseRti(AbstractLazyLoadTreeItem):
         self._exception = None
 
 
-    def fetchChildren(self):
+    def fetchChildren(self, maxItems=None):
         """ Creates child items and returns them.
             Opens the tree item first if it's not yet open.
 
-            Descendants should override _fetchAllChildren, not fetchChildren.
+            Descendants should override _fetchAllChildren (or _iterChildren), not fetchChildren.
+
+            :param maxItems: maximum number of children that are returned. If None, all remaining
+                children are returned. Use canFetchChildren to check if there are more children.
         """
         assert self._iconColor is not None, "Icon color none for: {}".format(self)
         assert self._canFetchChildren, "canFetchChildren must be True"
+        isExhausted = True
         try:
-            self.clearException()
+            if self._childIterator is None:
+                self.clearException()
 
             if not self.isOpen:
                 self.open() # Will set self._exception in case of failure
@@ -235,8 +518,8 @@ class BaseRti(AbstractLazyLoadTreeItem):
 
             childItems = []
             try:
-                childItems = self._fetchAllChildren()
-                assert isASequence(childItems), "ChildItems must be a sequence"
+                childItems = self._fetchChildrenPage(maxItems)
+                isExhausted = not self._canFetchChildren
 
             except Exception as ex:
                 # This can happen, for example, when a NCDF/HDF5 file contains data types that
@@ -248,11 +531,15 @@ class BaseRti(AbstractLazyLoadTreeItem):
 
             return childItems
         finally:
-            self._canFetchChildren = False
+            if isExhausted:
+                self._childIterator = None
+                self._canFetchChildren = False
 
 
     def _fetchAllChildren(self):
         """ The function that actually fetches the children. Default returns no children.
+
+            Descendants with possibly many children can override _iterChildren instead.
         """
         return []
 
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Application-wide pool that limits the number of open file handles.
+
+    File RTIs that keep an operating system file handle open (e.g. HDF-5, NetCDF and Exdir
+    files) set their _poolFileHandle class attribute to True. When they are opened they are added
+    to the pool. If more than maxOpenFiles are open, or if a file hasn't been accessed during
+    idleTimeout seconds, the pool releases the file handle of the least recently used RTI. The
+    tree items stay as they are. The file is reopened when one of its items is accessed again.
+"""
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from argos.qt import Qt, QtCore, QtSignal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_OPEN_FILES = 64
+DEFAULT_IDLE_TIMEOUT = 600  # seconds. Zero or None means no timeout.
+
+IDLE_CHECK_INTERVAL = 30  # seconds
+
+
+class _ReleaseRequester(QtCore.QObject):
+    """ Emits a signal to release file handles in the GUI thread.
+    """
+    sigReleaseRequested = QtSignal()
+
+
+
+class FileHandlePool(object):
+    """ Keeps track of the RTIs with an open file handle, ordered by their last access.
+    """
+    def __init__(self, maxOpenFiles=DEFAULT_MAX_OPEN_FILES, idleTimeout=DEFAULT_IDLE_TIMEOUT):
+        """ Constructor
+
+            :param maxOpenFiles: maximum number of file handles that are kept open.
+            :param idleTimeout: file handles that aren't used for this many seconds are closed.
+        """
+        self._maxOpenFiles = maxOpenFiles
+        self._idleTimeout = idleTimeout
+
+        # Maps id(rti) to (rti, lastAccessTime). The least recently used item comes first.
+        self._openItems = collections.OrderedDict()
+        self._timer = None
+
+        # Children can be fetched in a background thread (see RepoTreeModel.asyncFetching).
+        self._lock = threading.RLock()
+        self._pinnedItems = {}  # Maps id(rti) to the number of times it is pinned.
+
+        # Releasing closes the files of other items, which may use a library that is not thread
+        # safe (e.g. NetCDF-C), or may be read by the GUI thread at that moment. If a file is
+        # opened in a background thread, the release is therefore done later in the GUI thread.
+        self._releaseRequester = _ReleaseRequester()
+        self._releaseRequester.sigReleaseRequested.connect(
+            self._releaseLeastRecentlyUsed, type=Qt.QueuedConnection)
+
+        self._numAccesses = 0
+        self._numReopened = 0
+        self._numReleasedLru = 0
+        self._numReleasedIdle = 0
+        self._peakOpenFiles = 0
+
+
+    def __str__(self):
+        return "<FileHandlePool: {} of max {} open>".format(self.numOpenFiles, self._maxOpenFiles)
+
+
+    @property
+    def maxOpenFiles(self):
+        """ Maximum number of file handles that are kept open.
+        """
+        return self._maxOpenFiles
+
+
+    @maxOpenFiles.setter
+    def maxOpenFiles(self, value):
+        """ Sets the maximum number of open file handles. Releases handles if needed.
+        """
+        assert value > 0, "maxOpenFiles should be positive: {}".format(value)
+        self._maxOpenFiles = value
+        self._releaseLeastRecentlyUsed()
+
+
+    @property
+    def idleTimeout(self):
+        """ File handles that aren't used for this many seconds are closed. None: no timeout
+        """
+        return self._idleTimeout
+
+
+    @idleTimeout.setter
+    def idleTimeout(self, value):
+        """ Sets the idle timeout in seconds. Zero or None disable the timeout.
+        """
+        self._idleTimeout = value
+
+
+    @property
+    def numOpenFiles(self):
+        """ The number of RTIs in the pool that currently have an open file handle.
+        """
+        return len(self._openItems)
+
+
+    def statistics(self):
+        """ Returns a dictionary with usage statistics of the pool.
+        """
+        return collections.OrderedDict([
+            ('open files', self.numOpenFiles),
+            ('max open files', self._maxOpenFiles),
+            ('idle timeout (sec)', self._idleTimeout),
+            ('peak open files', self._peakOpenFiles),
+            ('accesses', self._numAccesses),
+            ('reopened', self._numReopened),
+            ('released (least recently used)', self._numReleasedLru),
+            ('released (idle)', self._numReleasedIdle),
+        ])
+
+
+    def marshall(self):
+        """ Returns a dictionary to save in the persistent settings
+        """
+        return {'maxOpenFiles': self._maxOpenFiles, 'idleTimeout': self._idleTimeout}
+
+
+    def unmarshall(self, cfg):
+        """ Initializes itself from a config dict form the persistent settings.
+        """
+        self.maxOpenFiles = cfg.get('maxOpenFiles', DEFAULT_MAX_OPEN_FILES)
+        self.idleTimeout = cfg.get('idleTimeout', DEFAULT_IDLE_TIMEOUT)
+
+
+    def startIdleTimer(self):
+        """ Starts a timer that periodically closes the file handles that are idle.
+
+            Requires a running Qt event loop.
+        """
+        if self._timer is None:
+            self._timer = QtCore.QTimer()
+            self._timer.setInterval(IDLE_CHECK_INTERVAL * 1000)
+            self._timer.timeout.connect(self.releaseIdleFiles)
+        self._timer.start()
+
+
+    def stopIdleTimer(self):
+        """ Stops the idle timer.
+        """
+        if self._timer is not None:
+            self._timer.stop()
+
+
+    @contextlib.contextmanager
+    def pinned(self, rti):
+        """ Context manager that prevents the file handle of the RTI from being released.
+
+            Is used while the RTI is accessed from a background thread.
+        """
+        with self._lock:
+            self._pinnedItems[id(rti)] = self._pinnedItems.get(id(rti), 0) + 1
+        try:
+            yield rti
+        finally:
+            with self._lock:
+                self._pinnedItems[id(rti)] -= 1
+                if self._pinnedItems[id(rti)] == 0:
+                    del self._pinnedItems[id(rti)]
+
+
+    def add(self, rti):
+        """ Adds an RTI whose file handle was just opened.
+
+            Releases the least recently used file handles if too many are open. When called from
+            a background thread, they are released later, in the GUI thread.
+        """
+        with self._lock:
+            self._openItems[id(rti)] = (rti, time.monotonic())
+            self._peakOpenFiles = max(self._peakOpenFiles, len(self._openItems))
+            if threading.current_thread() is threading.main_thread():
+                self._releaseLeastRecentlyUsed()
+            elif len(self._openItems) > self._maxOpenFiles:
+                self._releaseRequester.sigReleaseRequested.emit()
+
+
+    def remove(self, rti):
+        """ Removes an RTI from the pool. Should be called when the RTI is closed.
+        """
+        with self._lock:
+            self._openItems.pop(id(rti), None)
+
+
+    def acquire(self, rti):
+        """ Marks the RTI as most recently used. Reopens its file handle if it was released.
+        """
+        with self._lock:
+            self._numAccesses += 1
+            key = id(rti)
+            if rti.isFileHandleReleased:
+                logger.debug("Reopening file handle: {}".format(rti.fileName))
+                self._numReopened += 1
+                self._openItems.pop(key, None)
+                rti.reopenFileHandle()
+                self.add(rti)
+            elif key in self._openItems:
+                self._openItems.move_to_end(key)
+                self._openItems[key] = (rti, time.monotonic())
+
+
+    def _releaseLeastRecentlyUsed(self):
+        """ Releases file handles until no more than maxOpenFiles are open.
+
+            Pinned file handles are skipped.
+        """
+        with self._lock:
+            numExcess = len(self._openItems) - self._maxOpenFiles
+            if numExcess <= 0:
+                return
+            for key, (rti, _lastAccess) in list(self._openItems.items()):
+                if numExcess <= 0:
+                    break
+                if key in self._pinnedItems:
+                    continue
+                del self._openItems[key]
+                logger.debug("Releasing least recently used file handle: {}".format(rti.fileName))
+                self._numReleasedLru += 1
+                rti.releaseFileHandle()
+                numExcess -= 1
+
+
+    def releaseIdleFiles(self):
+        """ Releases the file handles that have not been accessed during the idle timeout.
+
+            Pinned file handles are skipped.
+        """
+        if not self._idleTimeout:
+            return
+
+        with self._lock:
+            deadline = time.monotonic() - self._idleTimeout
+            for key, (rti, lastAccess) in list(self._openItems.items()):
+                if lastAccess > deadline:
+                    break
+                if key in self._pinnedItems:
+                    continue
+                del self._openItems[key]
+                logger.debug("Releasing idle file handle: {}".format(rti.fileName))
+                self._numReleasedIdle += 1
+                rti.releaseFileHandle()
+
+
+    def releaseAll(self):
+        """ Releases all file handles that are not pinned.
+        """
+        with self._lock:
+            for key, (rti, _lastAccess) in list(self._openItems.items()):
+                if key not in self._pinnedItems:
+                    del self._openItems[key]
+                    rti.releaseFileHandle()
+
+
+# The pool is implemented as a singleton, just like the RTI registry, so that the RTIs can
+# access it without a reference to the application.
+def createGlobalFileHandlePoolFunction():
+    """ Closure to create the FileHandlePool singleton
+    """
+    globPool = FileHandlePool()
+
+    def accessGlobalFileHandlePool():
+        return globPool
+
+    return accessGlobalFileHandlePool
+
+# This is actually a function definition, not a constant
+#pylint: disable=invalid-name
+
+globalFileHandlePool = createGlobalFileHandlePoolFunction()
+globalFileHandlePool.__doc__ = "Function that returns the FileHandlePool singleton"
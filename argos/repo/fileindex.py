@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Optional persistent index with the tree structure and metadata of large files.
+
+    The index is an SQLite database in the Argos config directory. For each indexed file it
+    stores the absolute path, size and modification time, and per node the path, the RTI class
+    name and the values of its metadata properties (see baserti.MetadataProperty).
+
+    When a file RTI that supports the index is opened, and the file hasn't changed since it was
+    indexed, the tree is built from the index without opening the file. The file is only opened
+    when data is read (via the file handle pool, see filehandlepool.py). Otherwise the file is
+    opened as usual and the index is built in a background thread.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+
+from argos.utils.dirs import argosConfigDirectory, ensureDirectoryExists
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENABLED = False
+INDEX_FILE_NAME = 'file-index.sqlite'
+
+# The attributes are not stored. There can be many and they are only shown in the detail panes.
+EXCLUDED_PROPERTIES = ('attributes', )
+
+IndexNode = collections.namedtuple('IndexNode', ['path', 'className', 'metadata'])
+IndexNode.__doc__ = """ Entry in the index. The path of the root node is '/'.
+"""
+
+
+def parentPath(path):
+    """ Returns the path of the parent of an index node. The parent of the root is None.
+    """
+    if path == '/':
+        return None
+    parent, _ = path.rstrip('/').rsplit('/', 1)
+    return parent or '/'
+
+
+def _fileSignature(fileName):
+    """ Returns a (size, modification time) tuple that is used to detect if a file has changed.
+    """
+    statResult = os.stat(fileName)
+    return statResult.st_size, statResult.st_mtime_ns
+
+
+
+class FileIndex(object):
+    """ Persistent index of the tree structure and metadata of files.
+    """
+    def __init__(self, dbFileName=None, enabled=DEFAULT_ENABLED):
+        """ Constructor
+
+            :param dbFileName: file name of the SQLite database. If None, the database is stored
+                in the Argos config directory.
+            :param enabled: if False, files are neither indexed nor opened from the index.
+        """
+        self._dbFileName = dbFileName
+        self._enabled = enabled
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pendingFiles = {}  # Maps file name to the future of the build.
+
+
+    def __str__(self):
+        return "<FileIndex: {}>".format(self.dbFileName)
+
+
+    @property
+    def dbFileName(self):
+        """ The file name of the SQLite database.
+        """
+        if self._dbFileName is None:
+            return os.path.join(argosConfigDirectory(), INDEX_FILE_NAME)
+        else:
+            return self._dbFileName
+
+
+    @dbFileName.setter
+    def dbFileName(self, value):
+        """ Sets the file name of the SQLite database. None means: use the default location.
+        """
+        self._dbFileName = value
+
+
+    @property
+    def enabled(self):
+        """ If False, files are neither indexed nor opened from the index.
+        """
+        return self._enabled
+
+
+    @enabled.setter
+    def enabled(self, value):
+        """ Enables or disables the index.
+        """
+        self._enabled = value
+
+
+    def marshall(self):
+        """ Returns a dictionary to save in the persistent settings
+        """
+        return {'enabled': self._enabled}
+
+
+    def unmarshall(self, cfg):
+        """ Initializes itself from a config dict form the persistent settings.
+        """
+        self.enabled = cfg.get('enabled', DEFAULT_ENABLED)
+
+
+    def _connect(self):
+        """ Opens a connection to the database and creates the tables if they don't exist yet.
+
+            A new connection is made for every operation because the index is used from
+            different threads.
+        """
+        ensureDirectoryExists(os.path.dirname(self.dbFileName))
+        connection = sqlite3.connect(self.dbFileName, timeout=30)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                fileId INTEGER PRIMARY KEY,
+                fileName TEXT UNIQUE NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS nodes (
+                fileId INTEGER NOT NULL REFERENCES files(fileId) ON DELETE CASCADE,
+                nodeNr INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                className TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (fileId, nodeNr));
+        """)
+        connection.execute("PRAGMA foreign_keys = ON")
+        return connection
+
+
+    def load(self, fileName):
+        """ Returns the index nodes of a file, in the order in which they were added.
+
+            Returns None if the index is disabled, if the file is not indexed, or if it has
+            changed since it was indexed.
+        """
+        if not self._enabled:
+            return None
+
+        fileName = os.path.abspath(fileName)
+        try:
+            size, mtime = _fileSignature(fileName)
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    "SELECT fileId, size, mtime FROM files WHERE fileName = ?",
+                    (fileName, )).fetchone()
+                if row is None:
+                    return None
+
+                fileId, indexedSize, indexedMtime = row
+                if (indexedSize, indexedMtime) != (size, mtime):
+                    logger.debug("File changed since it was indexed: {}".format(fileName))
+                    return None
+
+                cursor = connection.execute(
+                    "SELECT path, className, metadata FROM nodes WHERE fileId = ? "
+                    "ORDER BY nodeNr", (fileId, ))
+                return [IndexNode(path, className, pickle.loads(metadata))
+                        for path, className, metadata in cursor]
+            finally:
+                connection.close()
+        except Exception as ex:
+            logger.warning("Unable to read file index of {}: {}".format(fileName, ex))
+            return None
+
+
+    def store(self, fileName, signature, nodes):
+        """ Stores the index nodes of a file, replacing the current ones.
+
+            :param signature: (size, mtime) tuple of the file before it was indexed. If the file
+                has changed since, the nodes are not stored.
+            :param nodes: list of IndexNode tuples. The metadata values that can't be pickled
+                are left out, they will be read from the file when needed.
+        """
+        fileName = os.path.abspath(fileName)
+        if _fileSignature(fileName) != signature:
+            logger.info("File changed while it was indexed: {}".format(fileName))
+            return
+
+        rows = []
+        for nodeNr, node in enumerate(nodes):
+            metadata = {}
+            for key, value in node.metadata.items():
+                try:
+                    pickle.dumps(value)
+                except Exception as ex:
+                    logger.debug("Not storing {} of {} in index: {}".format(key, node.path, ex))
+                else:
+                    metadata[key] = value
+            rows.append((nodeNr, node.path, node.className, pickle.dumps(metadata)))
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM files WHERE fileName = ?", (fileName, ))
+                cursor = connection.execute(
+                    "INSERT INTO files (fileName, size, mtime) VALUES (?, ?, ?)",
+                    (fileName, signature[0], signature[1]))
+                fileId = cursor.lastrowid
+                connection.executemany(
+                    "INSERT INTO nodes (fileId, nodeNr, path, className, metadata) "
+                    "VALUES ({}, ?, ?, ?, ?)".format(int(fileId)), rows)
+        finally:
+            connection.close()
+        logger.info("Indexed {} nodes of: {}".format(len(rows), fileName))
+
+
+    def remove(self, fileName):
+        """ Removes a file from the index.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM files WHERE fileName = ?",
+                                   (os.path.abspath(fileName), ))
+        finally:
+            connection.close()
+
+
+    def clear(self):
+        """ Removes all files from the index.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM files")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+
+
+    def isBuilding(self, fileName):
+        """ Returns True if the index of the file is being built in the background.
+        """
+        with self._lock:
+            return os.path.abspath(fileName) in self._pendingFiles
+
+
+    def scheduleBuild(self, fileName, indexFunction):
+        """ Builds the index of a file in a background thread.
+
+            Nothing is done if the index is disabled or the file is already being indexed.
+
+            :param indexFunction: function that gets the file name as parameter and returns a
+                list of IndexNode tuples. It should open the file itself; it's called from a
+                different thread than the one that uses the RTIs.
+            :return: the concurrent.futures.Future of the build, or None.
+        """
+        if not self._enabled:
+            return None
+
+        fileName = os.path.abspath(fileName)
+        with self._lock:
+            if fileName in self._pendingFiles:
+                return self._pendingFiles[fileName]
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='argos-file-index')
+            future = self._executor.submit(self._build, fileName, indexFunction)
+            self._pendingFiles[fileName] = future
+            return future
+
+
+    def _build(self, fileName, indexFunction):
+        """ Builds and stores the index of a file. Is executed in the index thread.
+        """
+        try:
+            logger.info("Building file index of: {}".format(fileName))
+            signature = _fileSignature(fileName)
+            self.store(fileName, signature, indexFunction(fileName))
+        except Exception as ex:
+            logger.warning("Unable to build file index of {}: {}".format(fileName, ex))
+        finally:
+            with self._lock:
+                del self._pendingFiles[fileName]
+
+
+
+# The index is implemented as a singleton, just like the file handle pool, so that the RTIs can
+# access it without a reference to the application.
+def createGlobalFileIndexFunction():
+    """ Closure to create the FileIndex singleton
+    """
+    globIndex = FileIndex()
+
+    def accessGlobalFileIndex():
+        return globIndex
+
+    return accessGlobalFileIndex
+
+# This is actually a function definition, not a constant
+#pylint: disable=invalid-name
+
+globalFileIndex = createGlobalFileIndexFunction()
+globalFileIndex.__doc__ = "Function that returns the FileIndex singleton"
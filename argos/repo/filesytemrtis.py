@@ -60,23 +60,24 @@ class DirectoryRti(BaseRti):
         self._checkFileExists() # TODO: check for directory?
 
 
-    def _fetchAllChildren(self):
-        """ Gets all sub directories and files within the current directory.
+    def _iterChildren(self):
+        """ Yields all sub directories and files within the current directory.
             Does not fetch hidden files.
+
+            The directory is listed at once but the child items, which require matching the file
+            name with the registry, are created one page at a time. The directory entries from
+            os.scandir already contain the file type, so no extra stat calls are needed.
         """
-        childItems = []
-        fileNames = sorted(os.listdir(self._fileName), key=lambda s: s.lower())
-        absFileNames = [os.path.join(self._fileName, fn) for fn in fileNames]
+        with os.scandir(self._fileName) as scanIterator:
+            dirEntries = [entry for entry in scanIterator if not entry.name.startswith('.')]
 
-        for fileName, absFileName in zip(fileNames, absFileNames):
-            if not fileName.startswith('.'):
-                childItem = createRtiFromFileName(absFileName)
-                childItems.append(childItem)
+        dirEntries.sort(key=lambda entry: entry.name.lower())
 
-        return childItems
+        for dirEntry in dirEntries:
+            yield createRtiFromDirEntry(dirEntry)
 
 
-def _detectRtiFromFileName(fileName):
+def _detectRtiFromFileName(fileName, isDir=None):
     """ Determines the type of RepoTreeItem to use given a file or directory name.
         Uses a DirectoryRti for directories without a registered extension and an UnknownFileRti
         if the file extension doesn't match one of the registered RTI globs.
@@ -89,12 +90,18 @@ def _detectRtiFromFileName(fileName):
 
          Note that directories can have an extension (e.g. extdir archives). So it is not enough to
          just test if a file is a directory.
+
+        If isDir is None, the file system is queried to determine if the file is a directory.
+        Callers that already know this (e.g. from an os.DirEntry) can pass it to save a stat call.
     """
     #_, extension = os.path.splitext(os.path.normpath(fileName))
     fullPath = os.path.normpath(os.path.abspath(fileName))
     rtiRegItem = globalRtiRegistry().getRtiRegItemByExtension(fullPath)
     if rtiRegItem is None:
-        if os.path.isdir(fileName):
+        if isDir is None:
+            isDir = os.path.isdir(fileName)
+
+        if isDir:
             cls = DirectoryRti
         else:
             logger.debug("No file RTI registered for path: {}".format(fullPath))
@@ -105,12 +112,15 @@ def _detectRtiFromFileName(fileName):
     return cls, rtiRegItem
 
 
-def createRtiFromFileName(fileName):
+def createRtiFromFileName(fileName, isDir=None, nodeName=None):
     """ Determines the type of RepoTreeItem to use given a file or directory name and creates it.
         Uses a DirectoryRti for directories without registered extensions and an UnknownFileRti if the file
         extension doesn't match one of the registered RTI extensions.
+
+        If isDir is given, it's used instead of querying the file system (see _detectRtiFromFileName).
+        If nodeName is given, it's used instead of the base name of the real path of the file.
     """
-    cls, rtiRegItem = _detectRtiFromFileName(fileName)
+    cls, rtiRegItem = _detectRtiFromFileName(fileName, isDir=isDir)
     assert not (cls is None and rtiRegItem is None), "cls and rtiRegItem both none."
 
     iconColor = rtiRegItem.iconColor if rtiRegItem else ICON_COLOR_UNKNOWN
@@ -118,13 +128,26 @@ def createRtiFromFileName(fileName):
     if cls is None:
         logger.warning("Unable to import plugin {}: {}"
                        .format(rtiRegItem.name, rtiRegItem.exception))
-        rti = UnknownFileRti.createFromFileName(fileName, ICON_COLOR_UNKNOWN)
+        rti = UnknownFileRti.createFromFileName(fileName, ICON_COLOR_UNKNOWN, nodeName=nodeName)
         rti.setException(rtiRegItem.exception)
     else:
         logger.debug("Calling createFromFileName: {} ({}, {})".format(cls, fileName, iconColor))
-        rti = cls.createFromFileName(fileName, iconColor)
+        rti = cls.createFromFileName(fileName, iconColor, nodeName=nodeName)
 
     assert rti, "Sanity check failed (createRtiFromFileName). Please report this bug."
 
     return rti
 
+
+def createRtiFromDirEntry(dirEntry):
+    """ Creates a RepoTreeItem for an os.DirEntry, as returned by os.scandir.
+
+        The file type and name are taken from the directory entry, which makes this a lot faster
+        than createRtiFromFileName when listing large directories. Symbolic links are resolved
+        as in createRtiFromFileName; their node name is the base name of the link target.
+    """
+    if dirEntry.is_symlink():
+        return createRtiFromFileName(dirEntry.path)
+    else:
+        return createRtiFromFileName(dirEntry.path, isDir=dirEntry.is_dir(),
+                                     nodeName=dirEntry.name)
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Optional watching of the files and directories in the repository for changes on disk.
+
+    The opened files and the expanded directories are watched with a QFileSystemWatcher. When one
+    of them changes, only the affected items in the repository tree are updated, so that the
+    expansion state of the tree is kept.
+"""
+import logging
+import os
+
+from argos.qt import QtCore, QtSignal, QtSlot
+from argos.repo.filesytemrtis import DirectoryRti, createRtiFromDirEntry
+from argos.repo.repotreemodel import RepoTreeModel, isFileRti
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENABLED = False
+
+# Time in ms after the last change event before the items are updated. Programs often write a
+# file in many small steps, which would otherwise cause an update for every step.
+DEBOUNCE_DELAY = 500
+
+
+def _sortKey(fileName):
+    """ Returns the key that DirectoryRti uses for sorting its children.
+    """
+    return os.path.basename(fileName).lower()
+
+
+
+class RepoFileWatcher(QtCore.QObject):
+    """ Watches the opened files and expanded directories of the repository for changes.
+
+        Changes to a directory add or remove only the affected children. When a file changes, a
+        fresh copy of its RTI is opened and the children of the items that are fetched in the
+        tree are compared with the children of the copy. Removed children are deleted, new ones
+        are inserted and the caches of the children that remain are invalidated.
+    """
+    # Emitted after the items of a changed file have been updated. Parameter: the file RTI.
+    sigFileRefreshed = QtSignal(object)
+
+    def __init__(self, repoTreeModel, enabled=DEFAULT_ENABLED, debounceDelay=DEBOUNCE_DELAY,
+                 parent=None):
+        """ Constructor
+
+            :param repoTreeModel: the RepoTreeModel with the items that are watched.
+            :param enabled: if False, nothing is watched.
+            :param debounceDelay: time in ms after the last change event before updating.
+        """
+        super(RepoFileWatcher, self).__init__(parent=parent)
+        self._model = repoTreeModel
+        self._enabled = False
+        self._watchedItems = {}  # Maps the path to the list of watched RTIs with that path.
+        self._changedPaths = set()
+
+        # The fresh copies of changed files are inserted in a separate model so that they are
+        # never shown.
+        self._copyModel = RepoTreeModel(parent=self)
+
+        self._fileSystemWatcher = QtCore.QFileSystemWatcher(self)
+        self._fileSystemWatcher.fileChanged.connect(self._onPathChanged)
+        self._fileSystemWatcher.directoryChanged.connect(self._onPathChanged)
+
+        self._debounceTimer = QtCore.QTimer(self)
+        self._debounceTimer.setSingleShot(True)
+        self._debounceTimer.setInterval(debounceDelay)
+        self._debounceTimer.timeout.connect(self.processChanges)
+
+        self._model.sigItemChanged.connect(self._onItemChanged)
+        self._model.rowsAboutToBeRemoved.connect(self._onRowsAboutToBeRemoved)
+
+        self.enabled = enabled
+
+
+    def finalize(self):
+        """ Disconnects signals and stops watching.
+        """
+        self.enabled = False
+        self._model.sigItemChanged.disconnect(self._onItemChanged)
+        self._model.rowsAboutToBeRemoved.disconnect(self._onRowsAboutToBeRemoved)
+
+
+    @property
+    def enabled(self):
+        """ If True, the opened files and expanded directories are watched for changes.
+        """
+        return self._enabled
+
+
+    @enabled.setter
+    def enabled(self, value):
+        """ Starts watching the opened items if value is True, stops watching if False.
+        """
+        if value == self._enabled:
+            return
+
+        self._enabled = value
+        if value:
+            self._watchOpenItemsBelow(self._model.invisibleRootTreeItem)
+        else:
+            self._debounceTimer.stop()
+            self._changedPaths.clear()
+            self._watchedItems.clear()
+            watchedPaths = self._fileSystemWatcher.files() + self._fileSystemWatcher.directories()
+            if watchedPaths:
+                self._fileSystemWatcher.removePaths(watchedPaths)
+
+
+    def marshall(self):
+        """ Returns a dictionary to save in the persistent settings
+        """
+        return {'enabled': self._enabled}
+
+
+    def unmarshall(self, cfg):
+        """ Initializes itself from a config dict form the persistent settings.
+        """
+        self.enabled = cfg.get('enabled', DEFAULT_ENABLED)
+
+
+    @property
+    def watchedPaths(self):
+        """ The sorted list of paths that are watched.
+        """
+        return sorted(self._watchedItems.keys())
+
+
+    @staticmethod
+    def isWatchable(rti):
+        """ Returns True if the RTI is a file or a directory that can be watched.
+        """
+        return isinstance(rti, DirectoryRti) or isFileRti(rti)
+
+
+    def _watch(self, rti):
+        """ Starts watching the file or directory of the RTI.
+        """
+        path = rti.fileName
+        watchedItems = self._watchedItems.setdefault(path, [])
+        if not any(item is rti for item in watchedItems):
+            watchedItems.append(rti)
+
+        if path not in self._fileSystemWatcher.files() + self._fileSystemWatcher.directories():
+            logger.debug("Watching for changes: {}".format(path))
+            if not self._fileSystemWatcher.addPath(path):
+                logger.warning("Unable to watch for changes: {}".format(path))
+
+
+    def _unwatch(self, rti):
+        """ Stops watching the RTI. The path is only removed if no other RTI uses it.
+        """
+        path = rti.fileName
+        watchedItems = [item for item in self._watchedItems.get(path, []) if item is not rti]
+        if watchedItems:
+            self._watchedItems[path] = watchedItems
+        elif path in self._watchedItems:
+            del self._watchedItems[path]
+            logger.debug("Stopped watching for changes: {}".format(path))
+            self._fileSystemWatcher.removePath(path)
+
+
+    def _watchOpenItemsBelow(self, item):
+        """ Watches the opened items in the branch of the item (which itself is not watched).
+        """
+        for childItem in item.childItems:
+            if childItem.isOpen and self.isWatchable(childItem):
+                self._watch(childItem)
+            self._watchOpenItemsBelow(childItem)
+
+
+    def _unwatchItemsBelow(self, item):
+        """ Stops watching the item and all its descendants.
+        """
+        for path, watchedItems in list(self._watchedItems.items()):
+            for watchedItem in watchedItems:
+                ancestor = watchedItem
+                while ancestor is not None and ancestor is not item:
+                    ancestor = ancestor.parentItem
+                if ancestor is item:
+                    self._unwatch(watchedItem)
+
+
+    @QtSlot(object)
+    def _onItemChanged(self, rti):
+        """ Starts watching an item when it's opened, stops watching it when it's closed.
+        """
+        if not self._enabled or rti is None or not self.isWatchable(rti):
+            return
+
+        if rti.isOpen:
+            self._watch(rti)
+        else:
+            self._unwatch(rti)
+
+
+    @QtSlot(QtCore.QModelIndex, int, int)
+    def _onRowsAboutToBeRemoved(self, parentIndex, first, last):
+        """ Stops watching the items that are removed from the repository tree.
+        """
+        if not self._enabled:
+            return
+
+        for row in range(first, last + 1):
+            item = self._model.getItem(self._model.index(row, 0, parentIndex))
+            if item is not None:
+                self._unwatchItemsBelow(item)
+
+
+    @QtSlot(str)
+    def _onPathChanged(self, path):
+        """ Schedules the update of the items of a changed path.
+        """
+        logger.debug("Changed on disk: {}".format(path))
+        self._changedPaths.add(path)
+        self._debounceTimer.start()  # Restarts the timer if it's already running.
+
+
+    @QtSlot()
+    def processChanges(self):
+        """ Updates the items of the paths that have changed since the last call.
+        """
+        changedPaths, self._changedPaths = self._changedPaths, set()
+        for path in sorted(changedPaths):
+            self.refreshPath(path)
+
+
+    def refreshPath(self, path):
+        """ Updates the items of the file or directory with the path.
+        """
+        watchedItems = list(self._watchedItems.get(path, []))
+
+        # Files that are written by renaming a temporary file are no longer watched by the
+        # QFileSystemWatcher. Add them again.
+        if watchedItems and os.path.exists(path) and \
+                path not in self._fileSystemWatcher.files() + self._fileSystemWatcher.directories():
+            self._fileSystemWatcher.addPath(path)
+
+        for rti in watchedItems:
+            if self._model.hasFetchesBelow(rti):
+                logger.debug("Postponing update while fetching: {}".format(rti))
+                self._onPathChanged(path)
+            elif isinstance(rti, DirectoryRti):
+                self.refreshDirectory(rti)
+            else:
+                self.refreshFile(rti)
+
+
+    def _indexOfItem(self, item):
+        """ Returns the index of an item in the model.
+        """
+        return self._model.createIndex(item.childNumber(), 0, item)
+
+
+    def _emitItemChanged(self, item):
+        """ Emits the signals that cause the views to repaint the item and the inspector to be
+            updated if it's the current item.
+        """
+        index = self._indexOfItem(item)
+        self._model.dataChanged.emit(index, index.sibling(index.row(), self._model.columnCount() - 1))
+        self._model.sigItemChanged.emit(item)
+
+
+    def refreshDirectory(self, dirRti):
+        """ Adds the new files to the children of the directory and removes the deleted ones.
+
+            If only a part of the children has been fetched (see RepoTreeModel.fetchPageSize),
+            only the new files that are sorted before the last fetched child are added.
+        """
+        dirIndex = self._indexOfItem(dirRti)
+        if not os.path.isdir(dirRti.fileName):
+            logger.info("Directory removed: {}".format(dirRti.fileName))
+            self._model.removeAllChildrenAtIndex(dirIndex)
+            dirRti.setException(IOError("Directory not found: {}".format(dirRti.fileName)))
+            self._emitItemChanged(dirRti)
+            return
+
+        with os.scandir(dirRti.fileName) as scanIterator:
+            dirEntries = {entry.path: entry for entry in scanIterator
+                          if not entry.name.startswith('.')}
+
+        for row in reversed(range(dirRti.nChildren())):
+            childItem = dirRti.child(row)
+            if childItem.fileName not in dirEntries:
+                logger.debug("Removing deleted file: {}".format(childItem.fileName))
+                self._model.deleteItemAtIndex(self._model.index(row, 0, dirIndex))
+
+        childKeys = [_sortKey(childItem.fileName) for childItem in dirRti.childItems]
+        existingPaths = set(childItem.fileName for childItem in dirRti.childItems)
+        isPartial = dirRti.canFetchChildren()
+
+        newEntries = [entry for path, entry in dirEntries.items() if path not in existingPaths]
+        for dirEntry in sorted(newEntries, key=lambda entry: entry.name.lower()):
+            key = dirEntry.name.lower()
+            if isPartial and (not childKeys or key > childKeys[-1]):
+                continue  # Will be fetched with one of the next pages.
+
+            position = next((row for row, childKey in enumerate(childKeys) if childKey > key),
+                            len(childKeys))
+            logger.debug("Adding new file: {}".format(dirEntry.path))
+            self._model.insertItem(createRtiFromDirEntry(dirEntry), position=position,
+                                   parentIndex=dirIndex)
+            childKeys.insert(position, key)
+
+
+    def refreshFile(self, fileRti):
+        """ Updates the items of a file that has changed.
+
+            The structure of the file is read from a fresh copy of the file RTI. Only the items
+            whose children have been fetched in the tree are compared. When the items have been
+            removed and inserted, the file handle is reopened once so that all items, including
+            the inserted ones, read from the changed file. The views are only notified then.
+        """
+        fileIndex = self._indexOfItem(fileRti)
+        if not os.path.isfile(fileRti.fileName):
+            logger.info("File removed: {}".format(fileRti.fileName))
+            return  # Keep the items. The file may be written again (e.g. via a rename).
+
+        logger.info("Updating changed file: {}".format(fileRti.fileName))
+        try:
+            copyRti = type(fileRti).createFromFileName(fileRti.fileName, fileRti.iconColor,
+                                                       nodeName=fileRti.nodeName)
+        except Exception as ex:
+            logger.warning("Unable to read changed file {}: {}".format(fileRti.fileName, ex))
+            return
+
+        usesFileHandle = fileRti.fileHandleOwner() is fileRti
+        if not usesFileHandle and fileRti.isOpen:
+            # Items that don't use a file handle hold their data themselves. Reopen them.
+            fileRti.close()
+            fileRti.open()
+
+        copyRti.excludeFromFileHandlePool()
+        copyIndex = self._copyModel.insertItem(copyRti)
+        changedItems = []
+        try:
+            self._syncChildren(fileRti, fileIndex, copyRti, changedItems)
+
+            if usesFileHandle and fileRti.isOpen:
+                # The inserted items still use the file handle of the copy. Reopening the file
+                # handle refreshes all items (see BaseRti.reopenFileHandle).
+                fileRti.releaseFileHandle()
+                try:
+                    fileRti.ensureFileHandle()
+                except Exception as ex:
+                    logger.warning("Unable to reopen changed file {}: {}"
+                                   .format(fileRti.fileName, ex))
+                    fileRti.setException(ex)
+        finally:
+            self._copyModel.deleteItemAtIndex(copyIndex)
+
+        for item in [fileRti] + changedItems:
+            item.invalidateCaches()
+        for item in changedItems + [fileRti]:
+            self._emitItemChanged(item)
+        self.sigFileRefreshed.emit(fileRti)
+
+
+    def _syncChildren(self, item, itemIndex, copyItem, changedItems):
+        """ Updates the children of the item so that they match those of the copy.
+
+            The children that remain, and of which the caches must be invalidated, are appended
+            to changedItems.
+        """
+        if item.canFetchChildren():
+            if item.nChildren() > 0:
+                # Only a part has been fetched. The remaining ones can't be fetched from the old
+                # file, so start again.
+                self._model.removeAllChildrenAtIndex(itemIndex)
+            return
+
+        copyChildren = copyItem.fetchChildren()
+        copyByName = {}
+        for copyChild in copyChildren:
+            copyByName.setdefault(copyChild.nodeName, copyChild)
+
+        for row in reversed(range(item.nChildren())):
+            childItem = item.child(row)
+            copyChild = copyByName.get(childItem.nodeName)
+            if copyChild is None or type(copyChild) is not type(childItem):
+                logger.debug("Removing: {}".format(childItem.nodePath))
+                self._model.deleteItemAtIndex(self._model.index(row, 0, itemIndex))
+
+        for position, copyChild in enumerate(copyChildren):
+            try:
+                childItem = item.childByNodeName(copyChild.nodeName)
+            except IndexError:
+                logger.debug("Adding: {}/{}".format(item.nodePath, copyChild.nodeName))
+                self._model.insertItem(copyChild, position=min(position, item.nChildren()),
+                                       parentIndex=itemIndex)
+                continue
+
+            childIndex = self._indexOfItem(childItem)
+            usesFileHandle = childItem.fileHandleOwner() is not None
+            if childItem.nChildren() > 0 or (usesFileHandle and not childItem.canFetchChildren()):
+                # The children have been fetched. Compare them as well.
+                copyItem.insertChild(copyChild)
+                self._syncChildren(childItem, childIndex, copyChild, changedItems)
+                changedItems.append(childItem)
+            elif usesFileHandle:
+                changedItems.append(childItem)
+            else:
+                # The item holds its data itself. Replace it by the new one.
+                self._model.replaceItemAtIndex(copyChild, childIndex)
@@ -66,6 +66,7 @@ class RtiIconFactory(object):
     DIMENSION = "dimension"
     SEQUENCE = "sequence"
     SCALAR = "scalar"
+    BUSY = "busy"  # Children are being fetched in the background
 
     # Icon colors from constants defined at the top of this module
     COLOR_UNDEF      = ICON_COLOR_UNDEF
@@ -96,6 +97,7 @@ class RtiIconFactory(object):
         self.registerIcon("move.svg",         self.DIMENSION)
         self.registerIcon("align-left.svg",   self.SEQUENCE)
         self.registerIcon("leaf.svg",         self.SCALAR)
+        self.registerIcon("reset-l.svg",      self.BUSY)
 
 
     @classmethod
@@ -18,8 +18,9 @@
 """
 import logging
 import os.path
+import re
 
-from fnmatch import fnmatch
+from fnmatch import fnmatch, translate
 
 from argos.info import DEBUGGING
 from argos.reg.basereg import BaseRegItem, BaseRegistry, RegType
@@ -41,6 +42,10 @@ ICON_COLOR_PANDAS = '#FB9A99'
 ICON_COLOR_PILLOW = '#FF40FF'
 ICON_COLOR_SCIPY = ICON_COLOR_NUMPY
 ICON_COLOR_JSON = '#880088'
+ICON_COLOR_RAW = '#A0A0A0'
+ICON_COLOR_ARROW = '#D22128'
+ICON_COLOR_AGGREGATION = '#6A3D9A'
+ICON_COLOR_ZARR = '#FF7F00'
 
 
 
@@ -126,6 +131,73 @@ class RtiRegItem(BaseRegItem):
 
 
 
+class RtiGlobMatcher(object):
+    """ Matches file paths with the globs of a list of RtiRegItems in one go.
+
+        Gives the same result as calling RtiRegItem.pathNameMatchesGlobs for each item in turn,
+        and returning the first item that matches, but is much faster for large directories.
+
+        Most globs are of the form '*.ext'. These are stored in a dictionary with the extension
+        as key so that matching a path only requires a dictionary lookup. The remaining globs
+        are compiled into a single regular expression.
+    """
+    def __init__(self, rtiRegItems):
+        """ Constructor
+
+            :param rtiRegItems: list of RtiRegItems. When a path matches the globs of more than
+                one item, the first item is returned.
+        """
+        self._suffixesByExtension = {}  # Maps extension to list of (itemNr, suffix, regItem).
+        self._regexItems = []           # List of (itemNr, regItem) per group in the regex.
+        patterns = []
+
+        for itemNr, rtiRegItem in enumerate(rtiRegItems):
+            for glob in rtiRegItem.globList:
+                glob = os.path.normcase(glob)
+                suffix = glob[1:]
+                extension = suffix[suffix.rfind('.'):]
+                if (glob.startswith('*') and '.' in suffix and
+                        not any(char in suffix for char in '*?[') and
+                        not any(char in extension for char in '/' + os.sep)):
+                    self._suffixesByExtension.setdefault(extension, []).append(
+                        (itemNr, suffix, rtiRegItem))
+                else:
+                    patterns.append('(?P<g{}>{})'.format(len(self._regexItems), translate(glob)))
+                    self._regexItems.append((itemNr, rtiRegItem))
+
+        # The alternatives are tried from left to right, so the first matching item wins.
+        self._regex = re.compile('|'.join(patterns)) if patterns else None
+        self._firstRegexItemNr = self._regexItems[0][0] if self._regexItems else len(rtiRegItems)
+
+
+    def match(self, path):
+        """ Returns the first RtiRegItem that has a glob that matches the path.
+            Returns None if no item matches.
+        """
+        path = os.path.normcase(path)
+        matchingItemNr, matchingItem = None, None
+
+        dotPos = path.rfind('.')
+        if dotPos >= 0:
+            for itemNr, suffix, rtiRegItem in self._suffixesByExtension.get(path[dotPos:], []):
+                if path.endswith(suffix):
+                    matchingItemNr, matchingItem = itemNr, rtiRegItem
+                    break
+
+        # Only try the regular expression if it can contain an item that comes earlier.
+        if self._regex is not None and (matchingItem is None or
+                                        self._firstRegexItemNr < matchingItemNr):
+            match = self._regex.match(path)
+            if match:
+                itemNr, rtiRegItem = self._regexItems[int(match.lastgroup[1:])]
+                if matchingItem is None or itemNr < matchingItemNr:
+                    matchingItem = rtiRegItem
+
+        return matchingItem
+
+
+
+
 class RtiRegistry(BaseRegistry):
     """ Class that can be used to register repository tree items (RTIs).
 
@@ -139,11 +211,39 @@ class RtiRegistry(BaseRegistry):
     DIRECTORY_REG_ITEM = RtiRegItem('Directory', 'argos.repo.filesytemrtis.DirectoryRti',
                                     iconColor=ICON_COLOR_UNKNOWN)
 
+    STACKED_FILES_REG_ITEM = RtiRegItem('Stacked files',
+                                        'argos.repo.rtiplugins.aggregation.StackedFilesRti',
+                                        iconColor=ICON_COLOR_AGGREGATION)
+
+    CONCATENATED_FILES_REG_ITEM = RtiRegItem(
+        'Concatenated files', 'argos.repo.rtiplugins.aggregation.ConcatenatedFilesRti',
+        iconColor=ICON_COLOR_AGGREGATION)
+
     def __init__(self):
         """ Constructor
         """
         super(RtiRegistry, self).__init__()
         self._extensionMap = {}
+        self._globMatcher = None
+
+
+    def clear(self):
+        """ Empties the registry
+        """
+        super(RtiRegistry, self).clear()
+        self._globMatcher = None
+
+
+    @property
+    def globMatcher(self):
+        """ The RtiGlobMatcher with the globs of all registered items.
+
+            It is created on first use and recreated after the registry has been cleared, which
+            happens when the registry is (re)loaded from the persistent settings.
+        """
+        if self._globMatcher is None:
+            self._globMatcher = RtiGlobMatcher(self._items)
+        return self._globMatcher
 
 
     def getRtiRegItemByExtension(self, filePath):
@@ -151,12 +251,9 @@ class RtiRegistry(BaseRegistry):
             Returns None if no class registered for the extension.
         """
         # Current implementation just returns the first rtiRegItem that contains the extension.
-        logger.debug("{} getRtiRegItemByExtension, filePath: {}".format(self, filePath))
-        for rtiRegItem in self._items:
-            if rtiRegItem.pathNameMatchesGlobs(filePath):
-                return rtiRegItem
-
-        return None
+        if DEBUGGING:
+            logger.debug("{} getRtiRegItemByExtension, filePath: {}".format(self, filePath))
+        return self.globMatcher.match(filePath)
 
 
     def getFileDialogFilter(self):
@@ -173,7 +270,9 @@ class RtiRegistry(BaseRegistry):
         """ Creates list of RtiRegItem to append to the 'open-as' and 'reload-as menus
         """
         # Add directory to the context menu so a an Exdir 'file' can be re-opened as a directory
-        return [self.DIRECTORY_REG_ITEM]
+        # The aggregations are added so that the files of a directory can be aggregated.
+        return [self.DIRECTORY_REG_ITEM, self.STACKED_FILES_REG_ITEM,
+                self.CONCATENATED_FILES_REG_ITEM]
 
 
     def getDefaultItems(self):
@@ -196,6 +295,11 @@ class RtiRegistry(BaseRegistry):
                        iconColor=ICON_COLOR_EXDIR,
                        globs='*.exdir'),
 
+            RtiRegItem('Zarr store',
+                       'argos.repo.rtiplugins.zarrio.ZarrStoreRti',
+                       iconColor=ICON_COLOR_ZARR,
+                       globs='*.zarr'),
+
             RtiRegItem('NetCDF file',
                        'argos.repo.rtiplugins.ncdf.NcdfFileRti',
                        iconColor=ICON_COLOR_NCDF4,
@@ -211,6 +315,16 @@ class RtiRegistry(BaseRegistry):
                        iconColor=ICON_COLOR_PANDAS,
                        globs='*.csv'),
 
+            RtiRegItem('Parquet file',
+                       'argos.repo.rtiplugins.arrowio.ParquetFileRti',
+                       iconColor=ICON_COLOR_ARROW,
+                       globs='*.parquet;*.parq'),
+
+            RtiRegItem('Arrow IPC file',
+                       'argos.repo.rtiplugins.arrowio.ArrowIpcFileRti',
+                       iconColor=ICON_COLOR_ARROW,
+                       globs='*.arrow;*.arrows;*.feather'),
+
             RtiRegItem('NumPy binary file',
                        'argos.repo.rtiplugins.numpyio.NumpyBinaryFileRti',
                        iconColor=ICON_COLOR_NUMPY,
@@ -221,6 +335,11 @@ class RtiRegistry(BaseRegistry):
                        iconColor=ICON_COLOR_NUMPY,
                        globs='*.npz'),
 
+            RtiRegItem('Raw binary file',
+                       'argos.repo.rtiplugins.rawio.RawBinaryFileRti',
+                       iconColor=ICON_COLOR_RAW,
+                       globs='*.raw'),
+
             RtiRegItem('NumPy text file',
                        'argos.repo.rtiplugins.numpyio.NumpyTextFileRti',
                        iconColor=ICON_COLOR_NUMPY,
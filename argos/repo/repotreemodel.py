@@ -18,11 +18,17 @@
 """ Data repository functionality
 """
 import logging
-from argos.qt import Qt, QtCore
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from argos.qt import Qt, QtCore, QtSignal, QtSlot
 from argos.qt.treemodels import BaseTreeModel
 #from argos.info import DEBUGGING
+from argos.repo.filehandlepool import globalFileHandlePool
 from argos.repo.filesytemrtis import createRtiFromFileName
 from argos.repo.baserti import BaseRti
+from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNKNOWN
 from argos.repo.registry import ICON_COLOR_UNDEF, RtiRegItem
 from argos.utils.cls import toString, typeName, checkType
 from argos.utils.dirs import normRealPath
@@ -35,6 +41,107 @@ ALIGN_RIGHT = int(Qt.AlignVCenter | Qt.AlignRight)
 
 logger = logging.getLogger(__name__)
 
+LOADING_NODE_NAME = "loading\u2026"
+
+# Maximum number of children that is fetched at once. Qt's fetchMore mechanism fetches the next
+# page when the user scrolls to the end of the fetched children.
+FETCH_PAGE_SIZE = 2000
+
+# A single worker thread is used so that fetches never access the same library concurrently.
+# Items of libraries that are not thread safe at all, e.g. NetCDF-C, are fetched in the GUI
+# thread because the GUI thread reads their data (see BaseRti.canFetchInBackground).
+_FETCH_EXECUTOR = None
+
+
+def _fetchExecutor():
+    """ Returns the executor that fetches the children in the background. Creates it if needed.
+    """
+    global _FETCH_EXECUTOR
+    if _FETCH_EXECUTOR is None:
+        _FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='argos-fetch')
+    return _FETCH_EXECUTOR
+
+
+def isFileRti(rti):
+    """ Returns True if the RTI represents a regular file (and not a node within a file).
+
+        Returns False for directories.
+    """
+    if not rti.fileName or not os.path.isfile(rti.fileName):
+        return False
+    parentItem = rti.parentItem
+    return parentItem is None or parentItem.fileName != rti.fileName
+
+
+
+class LoadingRti(BaseRti):
+    """ Placeholder that is shown as the only child while the children are fetched.
+    """
+    _defaultIconGlyph = RtiIconFactory.BUSY
+
+    def __init__(self, nodeName=LOADING_NODE_NAME, fileName='', iconColor=ICON_COLOR_UNKNOWN):
+        """ Constructor
+        """
+        super(LoadingRti, self).__init__(nodeName, iconColor=iconColor, fileName=fileName)
+        self._canFetchChildren = False  # Has no children
+
+
+    def hasChildren(self):
+        """ Returns False. The placeholder never has children.
+        """
+        return False
+
+
+
+class FetchChildrenTask(object):
+    """ Fetches the children of a tree item in a background thread.
+
+        The result is stored in the childItems and exception attributes. The task can be
+        cancelled, in which case the fetched children are discarded.
+    """
+    def __init__(self, parentItem, maxItems=None):
+        """ Constructor
+
+            :param maxItems: maximum number of children to fetch. None means all children.
+        """
+        self.parentItem = parentItem
+        self.maxItems = maxItems
+        self.childItems = []
+        self.exception = None
+        self.isCancelled = False
+        self.isProcessed = False  # Set when the result has been inserted in the model.
+        self.future = None
+
+
+    def run(self):
+        """ Fetches the children. Is executed in the worker thread.
+        """
+        try:
+            owner = self.parentItem.fileHandleOwner()
+            if owner is None:
+                self._fetchChildren()
+            else:
+                with globalFileHandlePool().pinned(owner):
+                    self._fetchChildren()
+        except Exception as ex:
+            # BaseRti.fetchChildren only re-raises exceptions in debugging mode
+            self.exception = ex
+
+
+    def _fetchChildren(self):
+        """ Fetches the children and fills their metadata snapshots.
+
+            The metadata is read here, in the worker thread, so that painting the new rows in the
+            repository tree doesn't read from the file.
+        """
+        self.childItems = self.parentItem.fetchChildren(maxItems=self.maxItems)
+        for childItem in self.childItems:
+            if self.isCancelled:
+                break
+            childItem.snapshotMetadata()
+
+
+
 class RepoTreeModel(BaseTreeModel):
     """ An implementation QAbstractItemModel that offers read-only access of the application data
         for QTreeViews. The underlying data is stored as repository tree items (BaseRti
@@ -50,14 +157,55 @@ class RepoTreeModel(BaseTreeModel):
 
     COL_DECORATION = COL_NODE_NAME  # Column number that contains the icon. None for no icons
 
+    # Emitted from the worker thread when a FetchChildrenTask has finished.
+    sigFetchFinished = QtSignal(object)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, asyncFetching=False, fetchPageSize=FETCH_PAGE_SIZE):
         """ Constructor
+
+            :param asyncFetching: if True, items are opened and their children are fetched in a
+                background thread, so that opening large files doesn't block the GUI.
+            :param fetchPageSize: maximum number of children that is fetched at once. If None,
+                all children are fetched at once.
         """
         super(RepoTreeModel, self).__init__(parent=parent)
         self._invisibleRootTreeItem = BaseRti(nodeName='<invisible-root>', iconColor='#FFFFFF')
         self._invisibleRootTreeItem.model = self
         self._isEditable = False
+        self._asyncFetching = asyncFetching
+        self._fetchPageSize = fetchPageSize
+        self._pendingFetches = {}  # Maps id(parentItem) to its FetchChildrenTask
+
+        self.sigFetchFinished.connect(self._onFetchFinished, type=Qt.QueuedConnection)
+
+
+    @property
+    def asyncFetching(self):
+        """ If True, items are opened and their children are fetched in a background thread.
+        """
+        return self._asyncFetching
+
+
+    @asyncFetching.setter
+    def asyncFetching(self, value):
+        """ If True, items are opened and their children are fetched in a background thread.
+        """
+        self._asyncFetching = value
+
+
+    @property
+    def fetchPageSize(self):
+        """ Maximum number of children that is fetched at once. None means all children.
+        """
+        return self._fetchPageSize
+
+
+    @fetchPageSize.setter
+    def fetchPageSize(self, value):
+        """ Maximum number of children that is fetched at once. None means all children.
+        """
+        assert value is None or value > 0, "fetchPageSize should be positive: {}".format(value)
+        self._fetchPageSize = value
 
 
     def itemData(self, treeItem, column, role=Qt.DisplayRole):
@@ -166,25 +314,180 @@ class RepoTreeModel(BaseTreeModel):
         if not parentItem:
             return False
 
-        return parentItem.canFetchChildren()
+        return parentItem.canFetchChildren() and not self.isFetching(parentItem)
 
 
     def fetchMore(self, parentIndex):
         """ Fetches any available data for the items with the parent specified by the parent index.
+
+            At most fetchPageSize children are fetched. Qt calls fetchMore again when the user
+            scrolls to the last fetched child.
+
+            If asyncFetching is True, the children are fetched in a background thread and a
+            placeholder item is shown until they are inserted. Items that can't be fetched in
+            the background (see BaseRti.canFetchInBackground) are still fetched directly.
+        """
+        parentItem = self.getItem(parentIndex)
+        if not parentItem:
+            return
+
+        if not parentItem.canFetchChildren() or self.isFetching(parentItem):
+            return
+
+        if self._asyncFetching and parentItem.canFetchInBackground():
+            self._startFetch(parentItem, parentIndex)
+            return
+
+        self.insertItems(parentItem.fetchChildren(maxItems=self._fetchPageSize),
+                         parentIndex=parentIndex)
+
+
+    def fetchMoreSynchronously(self, parentIndex):
+        """ Fetches (the next page of) the children of the item at parentIndex and only returns
+            when they have been inserted in the model. Waits for the background fetch if one is
+            in progress.
         """
         parentItem = self.getItem(parentIndex)
         if not parentItem:
             return
 
-        if not parentItem.canFetchChildren():
+        task = self._pendingFetches.get(id(parentItem))
+        if task is not None:
+            task.future.result()
+            self._onFetchFinished(task)
+        elif parentItem.canFetchChildren():
+            oldAsyncFetching = self._asyncFetching
+            self._asyncFetching = False
+            try:
+                self.fetchMore(parentIndex)
+            finally:
+                self._asyncFetching = oldAsyncFetching
+
+
+    def isFetching(self, parentItem):
+        """ Returns True if the children of the parentItem are being fetched in the background.
+        """
+        return id(parentItem) in self._pendingFetches
+
+
+    def _startFetch(self, parentItem, parentIndex):
+        """ Inserts a placeholder child and starts fetching the children in the background.
+        """
+        logger.debug("Fetching children in the background: {}".format(parentItem))
+        task = FetchChildrenTask(parentItem, maxItems=self._fetchPageSize)
+        self._pendingFetches[id(parentItem)] = task
+        self.insertItem(LoadingRti(fileName=parentItem.fileName), parentIndex=parentIndex)
+
+        task.future = _fetchExecutor().submit(task.run)
+        task.future.add_done_callback(lambda _future: self.sigFetchFinished.emit(task))
+
+
+    def cancelFetch(self, parentIndex):
+        """ Cancels the background fetch of the children of the item at parentIndex.
+
+            The worker thread can't be interrupted. When it is finished its result is discarded
+            and the item is closed. Returns True if a fetch was in progress.
+        """
+        parentItem = self.getItem(parentIndex)
+        task = self._pendingFetches.get(id(parentItem)) if parentItem else None
+        if task is None:
+            return False
+
+        logger.debug("Cancelling fetching of children: {}".format(parentItem))
+        task.isCancelled = True
+        return True
+
+
+    def _fetchTasksBelow(self, item):
+        """ Returns the pending fetch tasks of the item and its descendants.
+        """
+        tasks = []
+        for task in self._pendingFetches.values():
+            ancestor = task.parentItem
+            while ancestor is not None and ancestor is not item:
+                ancestor = ancestor.parentItem
+            if ancestor is item:
+                tasks.append(task)
+        return tasks
+
+
+    def hasFetchesBelow(self, item):
+        """ Returns True if the children of the item or its descendants are being fetched.
+        """
+        return len(self._fetchTasksBelow(item)) > 0
+
+
+    def waitForFetchesBelow(self, item):
+        """ Waits until the background fetches of the item and its descendants have finished.
+        """
+        for task in self._fetchTasksBelow(item):
+            task.isCancelled = True
+            task.future.result()
+            self._onFetchFinished(task)
+
+
+    @QtSlot(object)
+    def _onFetchFinished(self, task):
+        """ Replaces the placeholder by the fetched children. Is called in the GUI thread.
+        """
+        if task.isProcessed:
+            return  # Already processed by fetchMoreSynchronously
+        task.isProcessed = True
+
+        parentItem = task.parentItem
+        del self._pendingFetches[id(parentItem)]
+
+        if task.exception is not None:
+            logger.error("Unable fetch tree item children: {}".format(task.exception))
+            parentItem.setException(task.exception)
+
+        if task.isCancelled:
+            logger.debug("Discarding fetched children of: {}".format(parentItem))
+            for childItem in task.childItems:
+                childItem.finalize()
+            parentItem.removeAllChildren()  # Also makes sure the children can be fetched again.
+            parentItem.close()
             return
 
-        for childItem in parentItem.fetchChildren():
-            self.insertItem(childItem, parentIndex=parentIndex)
+        parentIndex = self.createIndex(parentItem.childNumber(), 0, parentItem)
+        for row in reversed(range(parentItem.nChildren())):  # The placeholder is the last child
+            if isinstance(parentItem.child(row), LoadingRti):
+                self.beginRemoveRows(parentIndex, row, row)
+                try:
+                    parentItem.removeChild(row)
+                finally:
+                    self.endRemoveRows()
+                break
+
+        self.insertItems(task.childItems, parentIndex=parentIndex)
+
+        self.sigItemChanged.emit(parentItem)  # Updates the icon of the parent
+        self.dataChanged.emit(parentIndex, parentIndex.sibling(parentIndex.row(),
+                                                               self.columnCount() - 1))
+
 
-        # Check that Rti implementation correctly sets canFetchChildren
-        assert not parentItem.canFetchChildren(), \
-            "not all children fetched: {}".format(parentItem)
+    def removeAllChildrenAtIndex(self, parentIndex):
+        """ Removes all children of the item at the parentIndex.
+
+            Waits for background fetches below the children. A background fetch of the parent
+            itself is not waited for, it should be cancelled with cancelFetch.
+        """
+        parentItem = self.getItem(parentIndex)
+        if parentItem:
+            for childItem in parentItem.childItems:
+                self.waitForFetchesBelow(childItem)
+        super(RepoTreeModel, self).removeAllChildrenAtIndex(parentIndex)
+
+
+    def deleteItemAtIndex(self, itemIndex):
+        """ Removes the item at the itemIndex.
+
+            Waits for background fetches below the item, so that the item is not closed while the
+            worker thread is still accessing it.
+        """
+        if itemIndex.isValid():
+            self.waitForFetchesBelow(self.getItem(itemIndex))
+        super(RepoTreeModel, self).deleteItemAtIndex(itemIndex)
 
 
     def findFileRtiIndex(self, childIndex):
@@ -238,6 +541,14 @@ class RepoTreeModel(BaseTreeModel):
             If position is None the child will be appended as the last child of the parent.
             Returns the index of the newly inserted RTI
         """
+        repoTreeItem = self._createFileRti(fileName, rtiRegItem)
+        return self.insertItem(repoTreeItem, position=position, parentIndex=parentIndex)
+
+
+    def _createFileRti(self, fileName, rtiRegItem):
+        """ Creates a repo tree item of class rtiRegItem.cls for the file.
+            Autodetects the RTI type if rtiRegItem is None.
+        """
         checkType(rtiRegItem, RtiRegItem, allowNone=True)
         fileName = normRealPath(fileName)
         logger.info("Loading data from: {!r}".format(fileName))
@@ -249,6 +560,17 @@ class RepoTreeModel(BaseTreeModel):
             repoTreeItem = rtiClass.createFromFileName(fileName, rtiRegItem.iconColor)
 
         assert repoTreeItem.parentItem is None, "repoTreeItem {!r}".format(repoTreeItem)
-        return self.insertItem(repoTreeItem, position=position, parentIndex=parentIndex)
+        return repoTreeItem
+
+
+    def loadFiles(self, fileNames, rtiRegItem,
+                  position=None, parentIndex=QtCore.QModelIndex()):
+        """ Loads multiple files in the repository. The items are inserted all at once.
+
+            See loadFile for the parameters. Returns the index of the last inserted RTI, which is
+            invalid if fileNames is empty.
+        """
+        repoTreeItems = [self._createFileRti(fileName, rtiRegItem) for fileName in fileNames]
+        return self.insertItems(repoTreeItems, position=position, parentIndex=parentIndex)
 
 
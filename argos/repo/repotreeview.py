@@ -19,6 +19,8 @@
 from __future__ import print_function
 
 import logging
+import re
+
 from argos.qt import QtWidgets, QtGui, QtCore, QtSignal, QtSlot, Qt
 from argos.config.groupcti import MainGroupCti
 from argos.config.boolcti import BoolCti
@@ -27,6 +29,7 @@ from argos.repo.detailplugins.prop import PropertiesPane
 from argos.repo.detailplugins.quicklook import QuickLookPane
 from argos.repo.registry import globalRtiRegistry
 from argos.repo.repotreemodel import RepoTreeModel
+from argos.repo.searchindex import SearchIndexer, SEARCH_MODES
 from argos.widgets.argostreeview import ArgosTreeView
 from argos.widgets.constants import LEFT_DOCK_WIDTH, DOCK_SPACING, DOCK_MARGIN, COL_KIND_WIDTH
 from argos.widgets.constants import COL_NODE_NAME_WIDTH, COL_ELEM_TYPE_WIDTH, COL_SUMMARY_WIDTH
@@ -41,26 +44,159 @@ logger = logging.getLogger(__name__)
 
 
 
+# Maximum number of search results that are shown.
+MAX_SEARCH_RESULTS = 1000
+
+# Time in ms after the last key press before the search is executed.
+SEARCH_DELAY = 150
+
+
+
+class RepoSearchWidget(QtWidgets.QWidget):
+    """ Search bar plus result list to find nodes in the files that are opened in the repository.
+
+        The search is done in the index of the SearchIndexer, so it doesn't access the files.
+    """
+    # Emitted with the node path of a search result when the user activates it.
+    sigPathActivated = QtSignal(str)
+
+    def __init__(self, searchIndexer, parent=None):
+        """ Constructor.
+        """
+        super(RepoSearchWidget, self).__init__(parent=parent)
+        self._searchIndexer = searchIndexer
+
+        self.mainLayout = QtWidgets.QVBoxLayout(self)
+        self.mainLayout.setSpacing(DOCK_SPACING)
+        self.mainLayout.setContentsMargins(0, 0, 0, 0)
+
+        self.searchLayout = QtWidgets.QHBoxLayout()
+        self.mainLayout.addLayout(self.searchLayout)
+
+        self.searchLineEdit = QtWidgets.QLineEdit()
+        self.searchLineEdit.setPlaceholderText("Search opened files")
+        self.searchLineEdit.setClearButtonEnabled(True)
+        self.searchLineEdit.setToolTip(
+            "Searches the paths of all nodes in the opened files.\n"
+            "Glob patterns must match the complete path, e.g. '*/temperature'.")
+        self.searchLayout.addWidget(self.searchLineEdit)
+
+        self.modeComboBox = QtWidgets.QComboBox()
+        self.modeComboBox.addItems(SEARCH_MODES)
+        self.searchLayout.addWidget(self.modeComboBox)
+
+        self.resultsLabel = QtWidgets.QLabel()
+        self.mainLayout.addWidget(self.resultsLabel)
+
+        self.resultsListWidget = QtWidgets.QListWidget()
+        self.resultsListWidget.setUniformItemSizes(True)
+        self.resultsListWidget.setMaximumHeight(150)
+        self.mainLayout.addWidget(self.resultsListWidget)
+
+        self.searchTimer = QtCore.QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(SEARCH_DELAY)
+        self.searchTimer.timeout.connect(self.search)
+
+        self.searchLineEdit.textChanged.connect(self.searchTimer.start)
+        self.searchLineEdit.returnPressed.connect(self.search)
+        self.modeComboBox.currentIndexChanged.connect(self.search)
+        self.resultsListWidget.itemActivated.connect(
+            lambda listItem: self.sigPathActivated.emit(listItem.text()))
+        self._searchIndexer.sigIndexChanged.connect(self.search)
+
+        self._showResults([], "")
+
+
+    def finalize(self):
+        """ Disconnects signals
+        """
+        self._searchIndexer.sigIndexChanged.disconnect(self.search)
+
+
+    def marshall(self):
+        """ Returns a dictionary to save in the persistent settings
+        """
+        return dict(searchMode=self.modeComboBox.currentText())
+
+
+    def unmarshall(self, cfg):
+        """ Initializes itself from a config dict form the persistent settings.
+        """
+        searchMode = cfg.get('searchMode')
+        if searchMode in SEARCH_MODES:
+            self.modeComboBox.setCurrentText(searchMode)
+
+
+    def _showResults(self, paths, message):
+        """ Fills the result list with the paths. The list is hidden if there is no query.
+        """
+        self.resultsListWidget.clear()
+        self.resultsListWidget.addItems(paths)
+        self.resultsLabel.setText(message)
+        hasQuery = bool(self.searchLineEdit.text())
+        self.resultsLabel.setVisible(hasQuery)
+        self.resultsListWidget.setVisible(hasQuery)
+
+
+    @QtSlot()
+    def search(self):
+        """ Searches the index for the text in the search bar and shows the results.
+        """
+        self.searchTimer.stop()
+        query = self.searchLineEdit.text()
+        if not query:
+            self._showResults([], "")
+            return
+
+        try:
+            paths = self._searchIndexer.search(query, mode=self.modeComboBox.currentText(),
+                                               maxResults=MAX_SEARCH_RESULTS + 1)
+        except re.error as ex:
+            self._showResults([], "Invalid regular expression: {}".format(ex))
+            return
+
+        if len(paths) > MAX_SEARCH_RESULTS:
+            message = "More than {} results".format(MAX_SEARCH_RESULTS)
+        else:
+            message = "{} result{}".format(len(paths), '' if len(paths) == 1 else 's')
+        if self._searchIndexer.isIndexing():
+            message += " (indexing\u2026)"
+
+        self._showResults(paths[:MAX_SEARCH_RESULTS], message)
+
+
+
 class RepoWidget(BasePanel):
     """ Groups the repository tree plus the details dock widgets.
     """
-    def __init__(self, repoTreeModel, collector, parent=None):
+    def __init__(self, repoTreeModel, collector, searchIndexer=None, parent=None):
         """ Constructor.
+
+            :param searchIndexer: SearchIndexer that is used by the search bar. If None, a new
+                one is created for the repoTreeModel.
             :param parent:
         """
         super(RepoWidget, self).__init__(parent=parent)
 
         self.detailDockPanes = []
 
+        if searchIndexer is None:
+            searchIndexer = SearchIndexer(repoTreeModel, parent=self)
+
         self.mainLayout = QtWidgets.QVBoxLayout()
         self.mainLayout.setSpacing(DOCK_SPACING)
         self.mainLayout.setContentsMargins(DOCK_MARGIN, DOCK_MARGIN, DOCK_MARGIN, DOCK_MARGIN)
         self.setLayout(self.mainLayout)
 
+        self.searchWidget = RepoSearchWidget(searchIndexer)
+        self.mainLayout.addWidget(self.searchWidget)
+
         self.mainSplitter = QtWidgets.QSplitter(orientation=Qt.Vertical)
         self.mainLayout.addWidget(self.mainSplitter)
 
         self.repoTreeView = RepoTreeView(repoTreeModel, collector)
+        self.searchWidget.sigPathActivated.connect(self.repoTreeView.selectPath)
         self.mainSplitter.addWidget(self.repoTreeView)
         self.mainSplitter.setCollapsible(0, False)
 
@@ -98,6 +234,7 @@ class RepoWidget(BasePanel):
             treeHeaders = self.repoTreeView.marshall(),
             propertiesPane = self.propertiesPane.marshall(),
             attributesPane = self.attributesPane.marshall(),
+            searchWidget = self.searchWidget.marshall(),
         )
 
         return cfg
@@ -116,6 +253,7 @@ class RepoWidget(BasePanel):
 
         self.propertiesPane.unmarshall(cfg.get('propertiesPane', {}))
         self.attributesPane.unmarshall(cfg.get('attributesPane', {}))
+        self.searchWidget.unmarshall(cfg.get('searchWidget', {}))
 
 
     def repoItemChanged(self, rti):
@@ -312,6 +450,28 @@ class RepoTreeView(ArgosTreeView):
 
 
 
+    @QtSlot(str)
+    def selectPath(self, path):
+        """ Makes the item at the path the current item.
+
+            Only the ancestors of the item are expanded, the item itself is not opened.
+            Returns the index of the item, which is invalid if the path can't be found.
+        """
+        try:
+            iiPath = self.model().findItemAndIndexPath(path)
+        except Exception as ex:
+            logger.warning("Unable to select {!r} because of: {}".format(path, ex))
+            return QtCore.QModelIndex()
+
+        for (_item, index) in iiPath[1:-1]: # skip invisible root and the item itself
+            self.expand(index)
+
+        _item, lastIndex = iiPath[-1]
+        self.setCurrentIndex(lastIndex)
+        self.scrollTo(lastIndex)
+        return lastIndex
+
+
     @QtSlot()
     def openCurrentItem(self):
         """ Opens the current item in the repository.
@@ -345,6 +505,10 @@ class RepoTreeView(ArgosTreeView):
             logger.debug("Index invalid (returning)")
             return
 
+        # If the children are still being fetched in the background, the item is closed when
+        # the fetch is finished.
+        isFetching = self.model().cancelFetch(index)
+
         # First we remove all the children, this will close them as well.
         # It will emit sigAllChildrenRemovedAtIndex, which is connected to the collapse method of
         # all trees. It will thus collapse the current item in all trees. This is necessary,
@@ -355,7 +519,8 @@ class RepoTreeView(ArgosTreeView):
         # which is connected to RepoTreeView.repoTreeItemChanged.
         item = self.model().getItem(index)
         logger.debug("Item: {}".format(item))
-        item.close()
+        if not isFetching:
+            item.close()
 
 
     def expand(self, index):
@@ -419,6 +584,15 @@ class RepoTreeView(ArgosTreeView):
         fileRtiIndex = self.model().findFileRtiIndex(currentIndex)
         isExpanded = self.isExpanded(fileRtiIndex)
 
+        rtiClass = rtiRegItem.getClass(tryImport=True) if rtiRegItem else None
+        if rtiClass is not None:
+            # Imported here so that the plugin is only loaded when it's used.
+            from argos.repo.rtiplugins.rawio import RawBinaryFileRti, askRawLayout
+            if issubclass(rtiClass, RawBinaryFileRti):
+                fileName = self.model().getItem(fileRtiIndex).fileName
+                if not askRawLayout(fileName, parent=self):
+                    return
+
         newRtiIndex = self.model().reloadFileAtIndex(fileRtiIndex, rtiRegItem=rtiRegItem)
 
         try:
@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Repository Tree Items (RTIs) that aggregate the same variable from multiple files.
+
+    The files are given by a directory (all files in it) or a glob pattern (e.g. data/*.nc).
+    The first file is used as template: its tree is shown and each of its arrays is presented
+    as one aggregated array. The StackedFilesRti adds a leading dimension with one element per
+    file, the ConcatenatedFilesRti concatenates the arrays along their first dimension.
+
+    The files are read with the RTI class that is registered for the template file. They are
+    only opened when a slice touches them. Files that keep a file handle open (e.g. HDF-5) are
+    registered with the file handle pool, which limits the number of open handles of the whole
+    application (see filehandlepool.py). Other files are closed again after reading.
+"""
+from __future__ import absolute_import
+
+import collections
+import glob
+import logging
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import numpy.ma as ma
+
+from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
+from argos.utils.cls import importSymbol
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of arrays of the template file that are aggregated.
+MAX_AGGREGATED_ARRAYS = 500
+
+# The shapes are probed in worker processes if there are at least this many files. Not all
+# libraries are thread safe (e.g. netCDF-C), therefore processes are used instead of threads.
+MIN_FILES_FOR_PARALLEL_PROBING = 8
+
+STACK_DIM_NAME = 'file'
+
+# Maximum number of files of which the probing results are cached.
+MAX_PROBE_CACHE_FILES = 10000
+
+# Results of probing: (fileName, modification time, file size) -> {relPath: (shape, typeName)}
+# The least recently used file comes first.
+_PROBE_CACHE = collections.OrderedDict()
+
+
+def aggregationFileNames(pattern):
+    """ Returns the sorted list of files that are aggregated.
+
+        If the pattern is a directory, all (non-hidden) files in it are returned. Otherwise
+        the pattern is interpreted as a glob pattern. Directories that match are only included if
+        they have an extension (e.g. Exdir or Zarr stores)
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*')
+
+    fileNames = []
+    for fileName in glob.glob(pattern):
+        if os.path.isfile(fileName) or os.path.splitext(fileName)[1]:
+            fileNames.append(fileName)
+    return sorted(fileNames)
+
+
+def openRtiAtPath(fileRti, relPath):
+    """ Opens the descendant of a file RTI given its path relative to the file.
+
+        Fetches and inserts the children along the path when needed so that subsequent calls
+        are fast. Raises the exception of the items if the opening or fetching fails. An empty
+        relPath refers to the file RTI itself.
+    """
+    item = fileRti
+    for part in relPath.split('/') if relPath else []:
+        if item.canFetchChildren():
+            for childItem in item.fetchChildren():
+                item.insertChild(childItem)
+        if item.exception is not None:
+            raise item.exception
+        item = item.childByNodeName(part)
+
+    if not item.isOpen:
+        item.open()
+    if item.exception is not None:
+        raise item.exception
+    return item
+
+
+def probeFile(absClassName, fileName, relPaths):
+    """ Opens a file and returns the shape and element type of the items at the relPaths.
+
+        Returns a dictionary mapping the relPath to a (shape, elementTypeName) tuple, or to None
+        if the item can't be opened. Is a module level function so that it can be executed in a
+        worker process.
+    """
+    rtiClass = importSymbol(absClassName)
+    fileRti = rtiClass.createFromFileName(fileName, ICON_COLOR_UNDEF)
+    try:
+        result = {}
+        for relPath in relPaths:
+            try:
+                item = openRtiAtPath(fileRti, relPath)
+                result[relPath] = (tuple(item.arrayShape), item.elementTypeName)
+            except Exception as ex:
+                logger.debug("Unable to probe {!r} in {}: {}".format(relPath, fileName, ex))
+                result[relPath] = None
+        return result
+    finally:
+        fileRti.finalize()
+
+
+def _probeCacheKey(fileName):
+    """ Returns the key that is used to cache the probing results of a file.
+    """
+    stat = os.stat(fileName)
+    return (fileName, stat.st_mtime_ns, stat.st_size)
+
+
+def probeFiles(absClassName, fileNames, relPaths):
+    """ Probes the shape and element type of the relPaths in all files.
+
+        The results are cached. Files that are not in the cache are probed in worker processes
+        if there are at least MIN_FILES_FOR_PARALLEL_PROBING of them.
+
+        Returns a list with a dictionary per file (see probeFile).
+    """
+    relPaths = list(relPaths)
+    results = [None] * len(fileNames)
+    toProbe = []
+    for fileNr, fileName in enumerate(fileNames):
+        key = _probeCacheKey(fileName)
+        cached = _PROBE_CACHE.get(key, {})
+        if key in _PROBE_CACHE:
+            _PROBE_CACHE.move_to_end(key)
+        if all(relPath in cached for relPath in relPaths):
+            results[fileNr] = {relPath: cached[relPath] for relPath in relPaths}
+        else:
+            toProbe.append(fileNr)
+
+    logger.debug("Probing {} of {} files".format(len(toProbe), len(fileNames)))
+
+    if len(toProbe) >= MIN_FILES_FOR_PARALLEL_PROBING:
+        # Use spawn so that the worker doesn't inherit the state of the GUI and file libraries.
+        context = multiprocessing.get_context('spawn')
+        numWorkers = min(len(toProbe), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=numWorkers, mp_context=context) as executor:
+            futures = [executor.submit(probeFile, absClassName, fileNames[fileNr], relPaths)
+                       for fileNr in toProbe]
+            probed = [future.result() for future in futures]
+    else:
+        probed = [probeFile(absClassName, fileNames[fileNr], relPaths) for fileNr in toProbe]
+
+    for fileNr, result in zip(toProbe, probed):
+        results[fileNr] = result
+        key = _probeCacheKey(fileNames[fileNr])
+        _PROBE_CACHE.setdefault(key, {}).update(result)
+        _PROBE_CACHE.move_to_end(key)
+
+    while len(_PROBE_CACHE) > MAX_PROBE_CACHE_FILES:
+        _PROBE_CACHE.popitem(last=False)
+
+    return results
+
+
+def _combine(arrays, combineFunction, maskedCombineFunction, axis=0):
+    """ Stacks or concatenates a list of arrays. Uses the masked version if one of them is masked.
+    """
+    if any(isinstance(array, ma.MaskedArray) for array in arrays):
+        return maskedCombineFunction(arrays, axis=axis)
+    else:
+        return combineFunction(arrays, axis=axis)
+
+
+def _splitRange(rows, offsets):
+    """ Splits an ascending range of rows over the files, given the start offset of each file.
+
+        Returns a list of (fileNr, localSlice) tuples.
+    """
+    result = []
+    if len(rows) == 0:
+        return result
+
+    firstFile = int(np.searchsorted(offsets, rows[0], side='right')) - 1
+    lastFile = int(np.searchsorted(offsets, rows[-1], side='right')) - 1
+    for fileNr in range(firstFile, lastFile + 1):
+        fileStart, fileStop = int(offsets[fileNr]), int(offsets[fileNr + 1])
+        first = max(0, -(-(fileStart - rows.start) // rows.step))  # ceil division
+        last = min(len(rows), -(-(fileStop - rows.start) // rows.step))
+        subRows = rows[first:last]
+        if len(subRows) > 0:
+            result.append((fileNr, slice(subRows.start - fileStart,
+                                         subRows[-1] - fileStart + 1, subRows.step)))
+    return result
+
+
+
+class AggregatedArrayRti(BaseRti):
+    """ Presents an array of the template file, aggregated over all files of the aggregation.
+    """
+    _defaultIconGlyph = RtiIconFactory.ARRAY
+
+    def __init__(self, aggregationRti, templateRti, relPath, fileShapes,
+                 nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+
+            :param aggregationRti: the FileAggregationRti that opens the files.
+            :param templateRti: the item in the template file. Is used for the meta data.
+            :param relPath: path of the item relative to the root of each file.
+            :param fileShapes: list with the shape of the array in each file.
+        """
+        super(AggregatedArrayRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._aggregationRti = aggregationRti
+        self._templateRti = templateRti
+        self._relPath = relPath
+        self._fileShapes = [tuple(shape) for shape in fileShapes]
+
+        # Start row of each file in the concatenated array
+        self._offsets = np.zeros(len(self._fileShapes) + 1, dtype=np.int64)
+        if self._aggregationRti.isStacked:
+            self._arrayShape = (len(self._fileShapes), ) + self._fileShapes[0]
+        else:
+            np.cumsum([shape[0] for shape in self._fileShapes], out=self._offsets[1:])
+            self._arrayShape = (int(self._offsets[-1]), ) + self._fileShapes[0][1:]
+
+
+    def hasChildren(self):
+        """ Returns False. Aggregated arrays have no children.
+        """
+        return False
+
+
+    @property
+    def isSliceable(self):
+        """ Returns True because the underlying data can be sliced.
+        """
+        return True
+
+
+    def _readFile(self, fileNr, index):
+        """ Reads the index from the array in a single file.
+        """
+        return self._aggregationRti.readFileItem(fileNr, self._relPath, index)
+
+
+    def __getitem__(self, index):
+        """ Called when using the RTI with an index (e.g. rti[0]).
+
+            Only the files that are touched by the index of the first dimension are read.
+        """
+        index = np.index_exp[index]
+        if Ellipsis in index:
+            pos = index.index(Ellipsis)
+            index = (index[:pos] + (slice(None),) * (self.nDims - len(index) + 1)
+                     + index[pos+1:])
+        index = index + (slice(None),) * (self.nDims - len(index))
+        firstIndex, restIndex = index[0], index[1:]
+
+        if self._aggregationRti.isStacked:
+            return self._getStacked(firstIndex, restIndex)
+        else:
+            return self._getConcatenated(firstIndex, restIndex)
+
+
+    def _getStacked(self, fileIndex, restIndex):
+        """ Reads a slice when the files are stacked along a new dimension.
+        """
+        fileNrs = range(len(self._fileShapes))[fileIndex]  # raises TypeError for fancy indexing
+        if isinstance(fileNrs, int):
+            return self._readFile(fileNrs, restIndex)
+
+        if len(fileNrs) == 0:
+            return _combine([self._readFile(0, restIndex)], np.stack, ma.stack)[0:0]
+
+        return _combine([self._readFile(fileNr, restIndex) for fileNr in fileNrs],
+                        np.stack, ma.stack)
+
+
+    def _getConcatenated(self, rowIndex, restIndex):
+        """ Reads a slice when the files are concatenated along the first dimension.
+        """
+        rows = range(self._arrayShape[0])[rowIndex]  # raises TypeError for fancy indexing
+        if isinstance(rows, int):
+            fileNr = int(np.searchsorted(self._offsets, rows, side='right')) - 1
+            return self._readFile(fileNr, (rows - int(self._offsets[fileNr]), ) + restIndex)
+
+        reverse = rows.step < 0
+        if reverse:
+            rows = rows[::-1]
+
+        parts = [self._readFile(fileNr, (localSlice, ) + restIndex)
+                 for fileNr, localSlice in _splitRange(rows, self._offsets)]
+        if not parts:
+            parts = [self._readFile(0, (slice(0, 0), ) + restIndex)]
+
+        result = _combine(parts, np.concatenate, ma.concatenate)
+        return result[::-1] if reverse else result
+
+
+    @property
+    def arrayShape(self):
+        """ Returns the shape of the aggregated array.
+        """
+        return self._arrayShape
+
+
+    @property
+    def dimensionNames(self):
+        """ Returns the dimension names of the template. Stacked arrays get an extra dimension.
+        """
+        templateNames = list(self._templateRti.dimensionNames)
+        if self._aggregationRti.isStacked:
+            return [STACK_DIM_NAME] + templateNames
+        else:
+            return templateNames
+
+
+    @property
+    def dimensionality(self):
+        """ String that describes if the RTI is an array, scalar, field, etc.
+        """
+        return "array"
+
+
+    @property
+    def elementTypeName(self):
+        """ String representation of the element type.
+        """
+        return self._templateRti.elementTypeName
+
+
+    @property
+    def attributes(self):
+        """ The attributes of the item in the template file.
+        """
+        return self._templateRti.attributes
+
+
+    @property
+    def unit(self):
+        """ The unit of the item in the template file.
+        """
+        return self._templateRti.unit
+
+
+    @property
+    def missingDataValue(self):
+        """ The missing data value of the item in the template file.
+        """
+        return self._templateRti.missingDataValue
+
+
+    @property
+    def summary(self):
+        """ Returns a summary of the contents of the RTI.  E.g. 'array 20 x 30' elements.
+        """
+        return shapeToSummary(self.arrayShape)
+
+
+
+class AggregatedGroupRti(BaseRti):
+    """ Presents a group (or other item with children) of the template file.
+    """
+    _defaultIconGlyph = RtiIconFactory.FOLDER
+
+    def __init__(self, aggregationRti, templateRti, nodeName='', fileName='',
+                 iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+
+            :param aggregationRti: the FileAggregationRti that opens the files.
+            :param templateRti: the item in the template file.
+        """
+        super(AggregatedGroupRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._aggregationRti = aggregationRti
+        self._templateRti = templateRti
+
+
+    @property
+    def attributes(self):
+        """ The attributes of the item in the template file.
+        """
+        return self._templateRti.attributes
+
+
+    def _fetchAllChildren(self):
+        """ Creates aggregated items for the children of the template item.
+        """
+        return self._aggregationRti.createAggregatedChildren(self._templateRti)
+
+
+
+class FileAggregationRti(BaseRti):
+    """ Base class for the aggregation of multiple files.
+
+        The fileName is a directory or a glob pattern. Descendants set the isStacked class
+        attribute.
+    """
+    _defaultIconGlyph = RtiIconFactory.FOLDER
+    isStacked = True
+
+    def __init__(self, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(FileAggregationRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._fileNames = []
+        self._absClassName = None
+        self._templateRti = None
+        self._fileShapes = {}  # relPath -> list of shapes, one per file
+        self._fileRtis = {}  # fileNr -> file RTI, only for files that use the file handle pool
+
+        fileNames = aggregationFileNames(fileName)
+        if not fileNames:
+            self.setException(IOError("No files found matching: {}".format(fileName)))
+        else:
+            # Imported here to prevent circular imports
+            from argos.repo.filesytemrtis import _detectRtiFromFileName
+
+            # Opening the aggregation opens the files, so it can only be done in the background
+            # if their library is thread safe.
+            rtiClass, _rtiRegItem = _detectRtiFromFileName(fileNames[0])
+            self._fetchInBackground = rtiClass is None or rtiClass._fetchInBackground
+
+
+    @property
+    def fileNames(self):
+        """ The list of files that are aggregated.
+        """
+        return self._fileNames
+
+
+    def _openResources(self):
+        """ Opens the template file and probes the shapes of all its arrays in all files.
+        """
+        # Imported here to prevent circular imports
+        from argos.repo.filesytemrtis import _detectRtiFromFileName
+
+        self._fileNames = aggregationFileNames(self._fileName)
+        if not self._fileNames:
+            raise IOError("No files found matching: {}".format(self._fileName))
+
+        templateFileName = self._fileNames[0]
+        rtiClass, rtiRegItem = _detectRtiFromFileName(templateFileName)
+        if rtiClass is None:
+            raise rtiRegItem.exception
+        self._absClassName = "{}.{}".format(rtiClass.__module__, rtiClass.__name__)
+        logger.info("Aggregating {} files using {} with template: {}"
+                    .format(len(self._fileNames), self._absClassName, templateFileName))
+
+        self._templateRti = rtiClass.createFromFileName(templateFileName, self.iconColor)
+        arrayPaths = self._findArrayPaths(self._templateRti)
+        probed = probeFiles(self._absClassName, self._fileNames, arrayPaths)
+
+        self._fileShapes = {}
+        for relPath in arrayPaths:
+            shapes = [result[relPath][0] if result[relPath] else None for result in probed]
+            problem = self._checkShapes(shapes)
+            if problem:
+                logger.warning("Not aggregating {}: {}".format(relPath, problem))
+            else:
+                self._fileShapes[relPath] = shapes
+
+
+    def _checkShapes(self, shapes):
+        """ Returns a string that describes why the shapes can't be aggregated or None if they can.
+        """
+        first = shapes[0]
+        for fileNr, shape in enumerate(shapes):
+            if shape is None:
+                return "not found in {}".format(self._fileNames[fileNr])
+            elif self.isStacked and shape != first:
+                return "shape {} in {} differs from {}".format(
+                    shape, self._fileNames[fileNr], first)
+            elif not self.isStacked and (len(shape) == 0 or shape[1:] != first[1:]):
+                return "shape {} in {} can't be concatenated with {}".format(
+                    shape, self._fileNames[fileNr], first)
+        return None
+
+
+    def _findArrayPaths(self, templateRti):
+        """ Walks the tree of the template and returns the paths of the sliceable items.
+
+            The template itself is included (with an empty path) if it's sliceable, so that
+            files that consist of a single array (e.g. .npy files) can be aggregated as well.
+        """
+        arrayPaths = []
+
+        def _walk(item, relPath):
+            "Recursively visits the items and inserts their children"
+            if len(arrayPaths) >= MAX_AGGREGATED_ARRAYS:
+                return
+            if not item.isOpen:
+                item.open()
+            if item.exception is not None:
+                return
+            if item.isSliceable and item.nDims > 0:
+                arrayPaths.append(relPath)
+            if item.hasChildren() and item.canFetchChildren():
+                for childItem in item.fetchChildren():
+                    item.insertChild(childItem)
+            for childItem in item.childItems:
+                _walk(childItem, childItem.nodeName if not relPath
+                      else relPath + '/' + childItem.nodeName)
+
+        _walk(templateRti, '')
+        return arrayPaths
+
+
+    def _closeResources(self):
+        """ Closes all open files and the template file.
+        """
+        for fileRti in self._fileRtis.values():
+            fileRti.finalize()
+        self._fileRtis.clear()
+
+        if self._templateRti is not None:
+            self._templateRti.finalize()
+        self._templateRti = None
+        self._fileShapes = {}
+
+
+    def readFileItem(self, fileNr, relPath, index):
+        """ Reads the index from the item at relPath in a file, opening the file if needed.
+
+            Files of which the RTI class uses the file handle pool are kept. The pool releases
+            their file handles when too many are open and reopens them on the next access.
+            Other files are closed after reading.
+        """
+        fileRti = self._fileRtis.get(fileNr)
+        if fileRti is None:
+            rtiClass = importSymbol(self._absClassName)
+            fileRti = rtiClass.createFromFileName(self._fileNames[fileNr], self.iconColor)
+            if rtiClass._poolFileHandle:
+                self._fileRtis[fileNr] = fileRti
+        try:
+            return openRtiAtPath(fileRti, relPath)[index]
+        finally:
+            if fileNr not in self._fileRtis:
+                fileRti.finalize()
+
+
+    def createAggregatedChildren(self, templateItem):
+        """ Creates aggregated items for the children of an item in the template file.
+
+            Children that are neither aggregated arrays, nor contain them, are skipped.
+        """
+        childItems = []
+        for templateChild in templateItem.childItems:
+            relPath = templateChild.nodePath[len(self._templateRti.nodePath) + 1:]
+            if relPath in self._fileShapes:
+                childItems.append(AggregatedArrayRti(
+                    self, templateChild, relPath, self._fileShapes[relPath],
+                    nodeName=templateChild.nodeName, fileName=self.fileName,
+                    iconColor=self.iconColor))
+            elif any(path.startswith(relPath + '/') for path in self._fileShapes):
+                childItems.append(AggregatedGroupRti(
+                    self, templateChild, nodeName=templateChild.nodeName,
+                    fileName=self.fileName, iconColor=self.iconColor))
+        return childItems
+
+
+    def _fetchAllChildren(self):
+        """ Creates the aggregated items for the template file.
+
+            If the template itself is sliceable, its aggregated array is the first child.
+        """
+        childItems = []
+        if '' in self._fileShapes:
+            childItems.append(AggregatedArrayRti(
+                self, self._templateRti, '', self._fileShapes[''],
+                nodeName=self._templateRti.nodeName, fileName=self.fileName,
+                iconColor=self.iconColor))
+        return childItems + self.createAggregatedChildren(self._templateRti)
+
+
+    @property
+    def summary(self):
+        """ Returns the number of aggregated files.
+        """
+        return "{} files".format(len(self._fileNames)) if self.isOpen else ""
+
+
+
+class StackedFilesRti(FileAggregationRti):
+    """ Aggregates files by stacking their arrays along a new, leading, dimension.
+    """
+    isStacked = True
+
+
+
+class ConcatenatedFilesRti(FileAggregationRti):
+    """ Aggregates files by concatenating their arrays along the first dimension.
+    """
+    isStacked = False
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Repository Tree Items (RTI) for Parquet and Arrow IPC (Feather) files.
+
+    The files are memory mapped with pyarrow and each column is shown as a child item. When a
+    column is sliced, only that column is read, and only from the row groups (Parquet) or record
+    batches (Arrow IPC) that overlap with the requested rows.
+
+    See: https://arrow.apache.org/docs/python/
+"""
+from __future__ import absolute_import
+
+import logging
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
+from argos.utils.cls import checkType
+
+logger = logging.getLogger(__name__)
+
+MAX_QUICK_LOOK_SIZE = 1000
+
+
+def arrowToNumpy(arrowArray):
+    """ Converts an Arrow array to a numpy array.
+
+        The Arrow buffer is used without copying if the type allows it (primitive types without
+        null values). Null values are returned as a masked array.
+    """
+    checkType(arrowArray, pa.Array)
+    if arrowArray.null_count == 0:
+        return arrowArray.to_numpy(zero_copy_only=False)
+
+    mask = arrowArray.is_null().to_numpy(zero_copy_only=False)
+    arrowType = arrowArray.type
+    if pa.types.is_integer(arrowType) or pa.types.is_floating(arrowType):
+        # Fill the nulls so that integers are not converted to floats.
+        arrowArray = pc.fill_null(arrowArray, pa.scalar(0, type=arrowType))
+    elif pa.types.is_boolean(arrowType):
+        # Fill the nulls so that booleans are not converted to objects.
+        arrowArray = pc.fill_null(arrowArray, pa.scalar(False))
+    return np.ma.MaskedArray(arrowArray.to_numpy(zero_copy_only=False), mask=mask)
+
+
+def _decodeMetadata(metadata):
+    """ Converts an Arrow metadata dictionary (bytes to bytes) into a dictionary of strings.
+    """
+    if not metadata:
+        return {}
+    return {key.decode('utf-8', 'replace'): value.decode('utf-8', 'replace')
+            for key, value in metadata.items()}
+
+
+
+class ArrowColumnRti(BaseRti):
+    """ Contains a single column of a Parquet or Arrow IPC file.
+
+        The data is read from the file RTI when the column is sliced.
+    """
+    _defaultIconGlyph = RtiIconFactory.FIELD
+
+    def __init__(self, fileRti, field, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+
+            :param fileRti: the AbstractArrowFileRti that contains this column.
+            :param field: the pyarrow.Field that describes this column.
+        """
+        super(ArrowColumnRti, self).__init__(nodeName=nodeName, fileName=fileName,
+                                             iconColor=iconColor)
+        checkType(fileRti, AbstractArrowFileRti)
+        checkType(field, pa.Field)
+        self._fileRti = fileRti
+        self._field = field
+
+
+    def hasChildren(self):
+        """ Returns False. Columns never have child nodes.
+        """
+        return False
+
+
+    @property
+    def isSliceable(self):
+        """ Returns True because the column can be sliced.
+        """
+        return True
+
+
+    def __getitem__(self, index):
+        """ Called when using the RTI with an index (e.g. rti[0]).
+            Reads only the rows of this column that are selected by the index.
+        """
+        return self._fileRti.readColumn(self._field.name, index)
+
+
+    @property
+    def nDims(self):
+        """ The number of dimensions of the column. Will always be 1.
+        """
+        return 1
+
+
+    @property
+    def arrayShape(self):
+        """ Returns the shape of the column
+        """
+        return (self._fileRti.numRows, )
+
+
+    @property
+    def dimensionNames(self):
+        """ Returns a list with the dimension names
+        """
+        return ['rows']
+
+
+    @property
+    def dimensionality(self):
+        """ String that describes if the RTI is an array, scalar, field, etc.
+        """
+        return "column"
+
+
+    @property
+    def elementTypeName(self):
+        """ String representation of the element type.
+        """
+        return str(self._field.type)
+
+
+    @property
+    def attributes(self):
+        """ The attributes dictionary. Contains the metadata of the Arrow field
+        """
+        attributes = _decodeMetadata(self._field.metadata)
+        attributes['nullable'] = self._field.nullable
+        return attributes
+
+
+    @property
+    def summary(self):
+        """ Returns a summary of the contents of the RTI.  E.g. 'array 20 x 30' elements.
+        """
+        return shapeToSummary(self.arrayShape)
+
+
+    def quickLook(self, width: int):
+        """ Returns a string representation fof the RTI to use in the Quik Look pane.
+        """
+        if self._fileRti.numRows > MAX_QUICK_LOOK_SIZE:
+            return "{} of {}".format(self.typeName, self.summary)
+        else:
+            return str(self[...])
+
+
+
+class AbstractArrowFileRti(BaseRti):
+    """ Base class for files that are read with pyarrow.
+
+        The rows of the file are divided into blocks (the row groups of Parquet files or the
+        record batches of Arrow IPC files). Descendants must set the _schema and
+        _blockRowCounts attributes in _openResources and implement _readBlocks.
+    """
+    _defaultIconGlyph = RtiIconFactory.FILE
+
+    def __init__(self, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(AbstractArrowFileRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._checkFileExists()
+        self._schema = None
+        self._blockRowCounts = []
+        self._blockOffsets = np.zeros(1, dtype=np.int64)
+
+
+    def hasChildren(self):
+        """ Returns True so that a triangle is added that expands the node and opens the file
+        """
+        return True
+
+
+    def _setBlockRowCounts(self, blockRowCounts):
+        """ Sets the number of rows per block and calculates the first row of each block.
+        """
+        self._blockRowCounts = list(blockRowCounts)
+        self._blockOffsets = np.zeros(len(self._blockRowCounts) + 1, dtype=np.int64)
+        np.cumsum(self._blockRowCounts, out=self._blockOffsets[1:])
+
+
+    def _closeResources(self):
+        """ Closes the underlying resources
+        """
+        self._schema = None
+        self._setBlockRowCounts([])
+
+
+    @property
+    def numRows(self):
+        """ The total number of rows in the file.
+        """
+        return int(self._blockOffsets[-1])
+
+
+    @property
+    def attributes(self):
+        """ The attributes dictionary. Contains the metadata of the schema.
+        """
+        if self._schema is None:
+            return {}
+        attributes = _decodeMetadata(self._schema.metadata)
+        attributes['rows'] = self.numRows
+        attributes['blocks'] = len(self._blockRowCounts)
+        return attributes
+
+
+    def _readBlocks(self, blockNrs, columnName):
+        """ Reads a single column from the blocks. Returns a pyarrow.Table.
+
+            Abstract method. Must be implemented by the descendants
+        """
+        raise NotImplementedError()
+
+
+    def readColumn(self, columnName, index):
+        """ Reads the rows that are selected by the index from a column.
+
+            Only the blocks that overlap with the rows are read. Slices and integers are
+            supported directly. Other indexes (e.g. lists) read the complete column first.
+        """
+        assert self._schema is not None, "File not opened: {}".format(self.fileName)
+
+        index = np.index_exp[index]
+        if len(index) > 1:
+            raise IndexError("Too many indices for 1D column: {}".format(index))
+        rowIndex = index[0] if index else Ellipsis
+
+        if rowIndex is Ellipsis:
+            rowIndex = slice(None)
+
+        try:
+            rows = range(self.numRows)[rowIndex]  # Raises TypeError for fancy indexing
+        except TypeError:
+            return self._readRows(columnName, 0, self.numRows)[rowIndex]
+
+        if isinstance(rows, int):
+            return self._readRows(columnName, rows, rows + 1)[0]
+
+        if len(rows) == 0:
+            return self._readRows(columnName, 0, 0)
+
+        firstRow, lastRow = min(rows[0], rows[-1]), max(rows[0], rows[-1])
+        array = self._readRows(columnName, firstRow, lastRow + 1)
+        start = rows.start - firstRow
+        stop = rows.stop - firstRow
+        return array[start:stop if stop >= 0 else None:rows.step]
+
+
+    def _readRows(self, columnName, startRow, stopRow):
+        """ Reads the rows from startRow to stopRow (exclusive) from a column.
+
+            Returns a numpy array, or masked array if the column contains nulls.
+        """
+        if stopRow <= startRow:
+            firstBlock, lastBlock = 0, 0  # Read the first block to get an empty array of the type
+        else:
+            firstBlock = int(np.searchsorted(self._blockOffsets, startRow, side='right')) - 1
+            lastBlock = int(np.searchsorted(self._blockOffsets, stopRow, side='left'))
+
+        blockNrs = list(range(firstBlock, max(lastBlock, firstBlock + 1)))
+        if not self._blockRowCounts:
+            blockNrs = []
+
+        logger.debug("Reading rows {}:{} of column {!r} from blocks {}"
+                     .format(startRow, stopRow, columnName, blockNrs))
+        table = self._readBlocks(blockNrs, columnName)
+        blockStart = int(self._blockOffsets[firstBlock]) if blockNrs else 0
+        chunked = table.column(0).slice(startRow - blockStart, max(0, stopRow - startRow))
+
+        if chunked.num_chunks == 1:
+            arrowArray = chunked.chunk(0)  # No concatenation needed, allows zero copy
+        elif chunked.num_chunks == 0:
+            arrowArray = pa.array([], type=chunked.type)
+        else:
+            arrowArray = pa.concat_arrays(chunked.chunks)
+
+        return arrowToNumpy(arrowArray)
+
+
+    def _fetchAllChildren(self):
+        """ Adds a child item for each column.
+        """
+        assert self._schema is not None, "File not opened: {}".format(self.fileName)
+        childItems = []
+        for field in self._schema:
+            childItems.append(ArrowColumnRti(self, field, nodeName=field.name,
+                                             fileName=self.fileName, iconColor=self.iconColor))
+        return childItems
+
+
+    @property
+    def summary(self):
+        """ Returns a summary of the contents of the RTI.
+        """
+        if self._schema is None:
+            return ""
+        else:
+            return "{} rows x {} columns".format(self.numRows, len(self._schema))
+
+
+
+class ParquetFileRti(AbstractArrowFileRti):
+    """ Reads a Parquet file using pyarrow. Row groups are only read when needed.
+    """
+    def __init__(self, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ParquetFileRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._parquetFile = None
+
+
+    def _openResources(self):
+        """ Memory maps the file and reads the meta data.
+        """
+        self._parquetFile = pq.ParquetFile(self._fileName, memory_map=True)
+        self._schema = self._parquetFile.schema_arrow
+        metadata = self._parquetFile.metadata
+        self._setBlockRowCounts(
+            [metadata.row_group(groupNr).num_rows for groupNr in range(metadata.num_row_groups)])
+
+
+    def _closeResources(self):
+        """ Closes the underlying resources
+        """
+        if self._parquetFile is not None:
+            self._parquetFile.close()
+        self._parquetFile = None
+        super(ParquetFileRti, self)._closeResources()
+
+
+    def _readBlocks(self, blockNrs, columnName):
+        """ Reads a single column from the row groups. Returns a pyarrow.Table.
+        """
+        return self._parquetFile.read_row_groups(blockNrs, columns=[columnName])
+
+
+
+class ArrowIpcFileRti(AbstractArrowFileRti):
+    """ Reads an Arrow IPC file (also known as Feather V2) by memory mapping it.
+
+        The record batches refer directly to the memory map, so no data is copied. The Arrow IPC
+        streaming format, which doesn't allow random access, is supported as well, but then
+        the complete file is read when opening it.
+    """
+    def __init__(self, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ArrowIpcFileRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        self._memoryMap = None
+        self._batches = []
+
+
+    def _openResources(self):
+        """ Memory maps the file and reads the record batch headers.
+        """
+        self._memoryMap = pa.memory_map(self._fileName, 'r')
+        try:
+            reader = pa.ipc.open_file(self._memoryMap)
+            self._batches = [reader.get_batch(batchNr)
+                             for batchNr in range(reader.num_record_batches)]
+        except pa.ArrowInvalid:
+            logger.debug("Not an Arrow IPC file, trying the IPC stream format: {}"
+                         .format(self._fileName))
+            self._memoryMap.seek(0)
+            reader = pa.ipc.open_stream(self._memoryMap)
+            self._batches = list(reader)
+
+        self._schema = reader.schema
+        self._setBlockRowCounts([batch.num_rows for batch in self._batches])
+
+
+    def _closeResources(self):
+        """ Closes the underlying resources
+        """
+        self._batches = []
+        if self._memoryMap is not None:
+            self._memoryMap.close()
+        self._memoryMap = None
+        super(ArrowIpcFileRti, self)._closeResources()
+
+
+    def _readBlocks(self, blockNrs, columnName):
+        """ Reads a single column from the record batches. Returns a pyarrow.Table.
+        """
+        columnNr = self._schema.get_field_index(columnName)
+        batches = [self._batches[blockNr].select([columnNr]) for blockNr in blockNrs]
+        return pa.Table.from_batches(batches, schema=pa.schema([self._schema.field(columnNr)]))
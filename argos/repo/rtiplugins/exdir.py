@@ -31,7 +31,7 @@ except:
     from collections.abc import MutableMapping # Python > 3.10
 
 from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
-from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.repo.baserti import BaseRti, FileHandleAttribute, MetadataProperty, shapeToSummary
 from argos.repo.filesytemrtis import createRtiFromFileName
 from argos.repo.rtiplugins.hdf5 import dimNamesFromDataset  # We can reuse it, the exdir module follows the h5py API.
 from argos.utils.cls import checkType, isAnArray
@@ -124,6 +124,7 @@ class ExdirScalarRti(BaseRti):
 
     """
     _defaultIconGlyph = RtiIconFactory.SCALAR
+    _exdirDataset = FileHandleAttribute()
 
     def __init__(self, exdirDataset, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -134,6 +135,12 @@ class ExdirScalarRti(BaseRti):
         self._exdirDataset = exdirDataset
 
 
+    def _refreshFileHandles(self):
+        """ Gets the dataset again from the parent group after the file has been reopened.
+        """
+        self._exdirDataset = self.parentItem._exdirGroup[self.nodeName]
+
+
     def hasChildren(self):
         """ Returns False. Leaf nodes never have children. """
         return False
@@ -172,35 +179,35 @@ class ExdirScalarRti(BaseRti):
         return "scalar"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
         return dataSetElementType(self._exdirDataset)
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
         return flattenDict(self._exdirDataset.attrs.to_dict()) # add to_dict() ?
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
         return dataSetUnit(self._exdirDataset)
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
         return dataSetMissingValue(self._exdirDataset)
 
 
-    @property
+    @MetadataProperty
     def summary(self):
         """ Returns a summary of the contents of the RTI. In this case the scalar as a string
         """
@@ -212,6 +219,7 @@ class ExdirFieldRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a field in a structured HDF-5 variable.
     """
     _defaultIconGlyph = RtiIconFactory.FIELD
+    _exdirDataset = FileHandleAttribute()
 
     def __init__(self, exdirDataset, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor.
@@ -222,13 +230,19 @@ class ExdirFieldRti(BaseRti):
         self._exdirDataset = exdirDataset
 
 
+    def _refreshFileHandles(self):
+        """ Gets the dataset again from the parent dataset after the file has been reopened.
+        """
+        self._exdirDataset = self.parentItem._exdirDataset
+
+
     def hasChildren(self):
         """ Returns False. Field nodes never have children.
         """
         return False
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
             Returns the attributes of the variable that contains this field.
@@ -281,7 +295,7 @@ class ExdirFieldRti(BaseRti):
             return fieldDtype.shape
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
             If the field contains a subarray the shape may be longer than 1.
@@ -296,7 +310,7 @@ class ExdirFieldRti(BaseRti):
         return "field"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
@@ -304,7 +318,7 @@ class ExdirFieldRti(BaseRti):
         return str(self._exdirDataset.dtype.fields[fieldName][0])
 
 
-    @property
+    @MetadataProperty
     def dimensionNames(self):
         """ Returns a list with the dimension names of the underlying NCDF variable
         """
@@ -313,7 +327,7 @@ class ExdirFieldRti(BaseRti):
         return dimNamesFromDataset(self._exdirDataset) + subArrayDims
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
@@ -329,7 +343,7 @@ class ExdirFieldRti(BaseRti):
             return unit
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -359,6 +373,7 @@ class ExdirDatasetRti(BaseRti):
         This includes dimenions scales, which are then displayed with a different icon.
     """
     _defaultIconGlyph = RtiIconFactory.ARRAY # the iconGlyph property is overridden below
+    _exdirDataset = FileHandleAttribute()
 
     def __init__(self, exdirDataset, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -373,6 +388,12 @@ class ExdirDatasetRti(BaseRti):
         absFileNames = [os.path.join(exdirDir, fn) for fn in fileNames]
         self._hasRaws = sum([os.path.isdir(f) for f in absFileNames]) > 0
 
+
+    def _refreshFileHandles(self):
+        """ Gets the dataset again from the parent group after the file has been reopened.
+        """
+        self._exdirDataset = self.parentItem._exdirGroup[self.nodeName]
+
     def hasChildren(self):
         """ Returns True if the variable has a structured type, otherwise returns False.
         """
@@ -394,7 +415,7 @@ class ExdirDatasetRti(BaseRti):
         return maskedEqual(self._exdirDataset.__getitem__(index), self.missingDataValue)
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
         """
@@ -408,28 +429,28 @@ class ExdirDatasetRti(BaseRti):
         return "array"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
         return dataSetElementType(self._exdirDataset)
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
         return flattenDict(self._exdirDataset.attrs.to_dict()) #add .to_dict() ?
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
         return dataSetUnit(self._exdirDataset)
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -476,6 +497,7 @@ class ExdirRawRti(BaseRti):
     """ Repository Tree Item (RTI) that contains an Exdir Raw.
     """
     _defaultIconGlyph = RtiIconFactory.FOLDER
+    _exdirRaw = FileHandleAttribute()
 
     def __init__(self, exdirRaw, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -486,6 +508,15 @@ class ExdirRawRti(BaseRti):
         self._exdirRaw = exdirRaw
 
 
+    def _refreshFileHandles(self):
+        """ Gets the raw again from the parent group or dataset after the file has been reopened.
+        """
+        if isinstance(self.parentItem, ExdirDatasetRti):
+            self._exdirRaw = self.parentItem._exdirDataset.require_raw(self.nodeName)
+        else:
+            self._exdirRaw = self.parentItem._exdirGroup[self.nodeName]
+
+
     def _fetchAllChildren(self): # Raw is treated like a directory
         """ Fetches all sub groups and variables that this group contains.
         """
@@ -511,6 +542,7 @@ class ExdirGroupRti(BaseRti):
     """ Repository Tree Item (RTI) that contains an Exdir group.
     """
     _defaultIconGlyph = RtiIconFactory.FOLDER
+    _exdirGroup = FileHandleAttribute()
 
     def __init__(self, exdirGroup, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -521,7 +553,13 @@ class ExdirGroupRti(BaseRti):
         self._exdirGroup = exdirGroup
 
 
-    @property
+    def _refreshFileHandles(self):
+        """ Gets the group again from the parent group after the file has been reopened.
+        """
+        self._exdirGroup = self.parentItem._exdirGroup[self.nodeName]
+
+
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
@@ -566,6 +604,7 @@ class ExdirFileRti(ExdirGroupRti):
     """ Reads an Exdir file using the exdir package.
     """
     _defaultIconGlyph = RtiIconFactory.FILE
+    _poolFileHandle = True
 
     def __init__(self, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -23,6 +23,7 @@
 from __future__ import absolute_import
 
 import enum
+import functools
 import logging, os
 from typing import Callable, Optional
 
@@ -30,7 +31,8 @@ import numpy as np
 import h5py
 
 from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
-from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.repo.baserti import BaseRti, FileHandleAttribute, MetadataProperty, shapeToSummary
+from argos.repo.fileindex import EXCLUDED_PROPERTIES, IndexNode, globalFileIndex, parentPath
 from argos.utils.cls import toString, checkType, isAnArray
 from argos.utils.defs import DIM_TEMPLATE, SUB_DIM_TEMPLATE, CONTIGUOUS
 from argos.utils.masks import maskedEqual
@@ -253,15 +255,40 @@ class H5pyScalarRti(BaseRti):
 
     """
     _defaultIconGlyph = RtiIconFactory.SCALAR
+    _h5Dataset = FileHandleAttribute()
 
-    def __init__(self, h5Dataset, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+    def __init__(self, h5Dataset, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF,
+                 h5Path=None):
         """ Constructor
+
+            If h5Dataset is None, the RTI is created from the file index and h5Path is used to
+            get the dataset when the file is opened.
         """
         super(H5pyScalarRti, self).__init__(
             nodeName=nodeName, fileName=fileName, iconColor=iconColor)
-        checkType(h5Dataset, h5py.Dataset)
+        checkType(h5Dataset, h5py.Dataset, allowNone=True)
         self._h5Dataset = h5Dataset
-        self._vecEnumCls = _create_enum_factory(h5Dataset)
+        self._h5Path = h5Path if h5Dataset is None else h5Dataset.name
+
+
+    @functools.cached_property
+    def _vecEnumCls(self):
+        """ Function that converts the data to Python enums. None if the data is not an enum.
+        """
+        return _create_enum_factory(self._h5Dataset)
+
+
+    def invalidateCaches(self):
+        """ Removes the cached values that were read from the file.
+        """
+        super(H5pyScalarRti, self).invalidateCaches()
+        self.__dict__.pop('_vecEnumCls', None)
+
+
+    def _refreshFileHandles(self):
+        """ Gets the dataset again after the file handle pool has reopened the file.
+        """
+        self._h5Dataset = self.fileHandleOwner().h5File[self._h5Path]
 
 
     def hasChildren(self):
@@ -294,42 +321,42 @@ class H5pyScalarRti(BaseRti):
         return tuple()
 
 
-    @property
+    @MetadataProperty
     def dimensionality(self):
         """ String that describes if the RTI is an array, scalar, field, etc.
         """
         return "empty" if self._h5Dataset.shape is None else "scalar"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
         return dataSetType(self._h5Dataset.dtype, '')
 
 
-    @property
+    @MetadataProperty
     def typeName(self):
         """ String representation of the type. By default, the elementTypeName + dimensionality.
         """
         return dataSetType(self._h5Dataset.dtype, self.dimensionality)
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
         return attrsToDict(self._h5Dataset.attrs)
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
         return dataSetUnit(self._h5Dataset)
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -340,7 +367,7 @@ class H5pyScalarRti(BaseRti):
             return dataSetMissingValue(self._h5Dataset)
 
 
-    @property
+    @MetadataProperty
     def summary(self):
         """ Returns a summary of the contents of the RTI. In this case the scalar as a string
         """
@@ -371,6 +398,7 @@ class H5pyFieldRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a field in a structured HDF-5 variable.
     """
     _defaultIconGlyph = RtiIconFactory.FIELD
+    _h5Dataset = FileHandleAttribute()
 
     def __init__(self, h5Dataset, nodeName, subArray, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor.
@@ -378,18 +406,25 @@ class H5pyFieldRti(BaseRti):
         super(H5pyFieldRti, self).__init__(nodeName, fileName=fileName, iconColor=iconColor)
         checkType(h5Dataset, h5py.Dataset)
         self._h5Dataset = h5Dataset
+        self._h5Path = h5Dataset.name
 
         self._subArray = subArray # The array that this field contains. Can be h5Dataset itself.
         self._isStructured = bool(self._subArray.dtype.names)
 
 
+    def _refreshFileHandles(self):
+        """ Gets the dataset again after the file handle pool has reopened the file.
+        """
+        self._h5Dataset = self.fileHandleOwner().h5File[self._h5Path]
+
+
     def hasChildren(self):
         """ Returns False. Field nodes never have children.
         """
         return self._isStructured
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
             Returns the attributes of the variable that contains this field.
@@ -422,14 +457,14 @@ class H5pyFieldRti(BaseRti):
         return len(self.arrayShape) # h5py datasets don't have an ndim property
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
         """
         return self._subArray.shape
 
 
-    @property
+    @MetadataProperty
     def chunking(self):
         """ List with chunk sizes if chunked storage is used. Or 'contiguous' for contiguous storage
         """
@@ -444,21 +479,21 @@ class H5pyFieldRti(BaseRti):
         return "field"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
         return dataSetType(self._subArray.dtype, '')
 
 
-    @property
+    @MetadataProperty
     def typeName(self):
         """ String representation of the type. By default, the elementTypeName + dimensionality.
         """
         return dataSetType(self._subArray.dtype, self.dimensionality)
 
 
-    @property
+    @MetadataProperty
     def dimensionNames(self):
         """ Returns a list with the dimension names of the underlying HDF5 variable
         """
@@ -468,7 +503,7 @@ class H5pyFieldRti(BaseRti):
         return datasetDimNames + subArrayDims
 
 
-    @property
+    @MetadataProperty
     def dimensionPaths(self):
         """ Returns a list with the full path names of the dimensions.
         """
@@ -478,7 +513,7 @@ class H5pyFieldRti(BaseRti):
         return datasetDimNames + subArrayDims
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
@@ -494,7 +529,7 @@ class H5pyFieldRti(BaseRti):
             return unit
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -552,17 +587,48 @@ class H5pyDatasetRti(BaseRti):
         This includes dimenions scales, which are then displayed with a different icon.
     """
     #_defaultIconGlyph = RtiIconFactory.ARRAY # the iconGlyph property is overridden below
+    _h5Dataset = FileHandleAttribute()
 
-    def __init__(self, h5Dataset, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
+    def __init__(self, h5Dataset, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF,
+                 h5Path=None):
         """ Constructor
+
+            If h5Dataset is None, the RTI is created from the file index and h5Path is used to
+            get the dataset when the file is opened.
         """
         super(H5pyDatasetRti, self).__init__(nodeName, fileName=fileName, iconColor=iconColor)
-        checkType(h5Dataset, h5py.Dataset)
+        checkType(h5Dataset, h5py.Dataset, allowNone=True)
         self._h5Dataset = h5Dataset
-        self._isStructured = bool(self._h5Dataset.dtype.names)
-        self._vecEnumCls = _create_enum_factory(h5Dataset)
+        self._h5Path = h5Path if h5Dataset is None else h5Dataset.name
 
-    @property
+
+    @MetadataProperty
+    def _isStructured(self):
+        """ True if the dataset has a structured data type. The fields are then its children.
+        """
+        return bool(self._h5Dataset.dtype.names)
+
+
+    @functools.cached_property
+    def _vecEnumCls(self):
+        """ Function that converts the data to Python enums. None if the data is not an enum.
+        """
+        return _create_enum_factory(self._h5Dataset)
+
+
+    def invalidateCaches(self):
+        """ Removes the cached values that were read from the file.
+        """
+        super(H5pyDatasetRti, self).invalidateCaches()
+        self.__dict__.pop('_vecEnumCls', None)
+
+
+    def _refreshFileHandles(self):
+        """ Gets the dataset again after the file handle pool has reopened the file.
+        """
+        self._h5Dataset = self.fileHandleOwner().h5File[self._h5Path]
+
+    @MetadataProperty
     def iconGlyph(self):
         """ Shows an Array icon for regular datasets but a dimension icon for dimension scales
         """
@@ -601,14 +667,14 @@ class H5pyDatasetRti(BaseRti):
         return maskedEqual(array, self.missingDataValue)
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
         """
         return self._h5Dataset.shape
 
 
-    @property
+    @MetadataProperty
     def chunking(self):
         """ List with chunk sizes if chunked storage is used. Or 'contiguous' for contiguous storage
         """
@@ -623,49 +689,49 @@ class H5pyDatasetRti(BaseRti):
         return "array"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
         return dataSetType(self._h5Dataset.dtype, '')
 
 
-    @property
+    @MetadataProperty
     def typeName(self):
         """ String representation of the type. By default, the elementTypeName + dimensionality.
         """
         return dataSetType(self._h5Dataset.dtype, self.dimensionality)
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
         return attrsToDict(self._h5Dataset.attrs)
 
 
-    @property
+    @MetadataProperty
     def dimensionNames(self):
         """ Returns a list with the dimension names of the underlying HDF-5 dataset.
         """
         return dimNamesFromDataset(self._h5Dataset)  # TODO: cache?
 
 
-    @property
+    @MetadataProperty
     def dimensionPaths(self):
         """ Returns a list with the full path names of the dimensions.
         """
         return dimNamesFromDataset(self._h5Dataset, forToolTip=True)
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit of the RTI by calling dataSetUnit on the underlying dataset
         """
         return dataSetUnit(self._h5Dataset)
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -711,56 +777,97 @@ class H5pyGroupRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a HDF-5 group.
     """
     _defaultIconGlyph = RtiIconFactory.FOLDER
+    _h5Group = FileHandleAttribute()
 
-    def __init__(self, h5Group, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
+    def __init__(self, h5Group, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF, h5Path=None):
         """ Constructor
+
+            If h5Group is None, the RTI is created from the file index and h5Path is used to
+            get the group when the file is opened.
         """
         super(H5pyGroupRti, self).__init__(nodeName, fileName=fileName, iconColor=iconColor)
         checkType(h5Group, h5py.Group, allowNone=True)
 
         self._h5Group = h5Group
+        self._h5Path = h5Path if h5Group is None else h5Group.name
 
 
-    @property
+    def _refreshFileHandles(self):
+        """ Gets the group again after the file handle pool has reopened the file.
+        """
+        self._h5Group = self.fileHandleOwner().h5File[self._h5Path]
+
+
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
         return attrsToDict(self._h5Group.attrs if self._h5Group else {})
 
 
-    def _fetchAllChildren(self):
-        """ Fetches all sub groups and variables that this group contains.
+    def _indexedChildren(self):
+        """ Returns the file index nodes of the children of this group.
+
+            Returns None if the file was not opened from the file index, or if the children of
+            this group are not in the index because it's a soft link to one of its ancestors.
+        """
+        owner = self.fileHandleOwner()
+        if owner is None or owner._indexNodes is None:
+            return None
+        else:
+            return owner._indexNodes.get(self._h5Path)
+
+
+    def _iterChildren(self):
+        """ Yields all sub groups and variables that this group contains.
+
+            The member names are read at once, the members themselves one page at a time.
+            If the file was opened from the file index, the children are created from the index
+            without reading the file.
         """
-        assert self._h5Group is not None, "dataset undefined (file not opened?)"
         assert self.canFetchChildren(), "canFetchChildren must be True"
 
-        childItems = []
+        indexNodes = self._indexedChildren()
+        if indexNodes is not None:
+            for indexNode in indexNodes:
+                rtiClass = _INDEXED_RTI_CLASSES[indexNode.className]
+                childItem = rtiClass(None, nodeName=indexNode.path.rsplit('/', 1)[-1],
+                                     fileName=self.fileName, iconColor=self.iconColor,
+                                     h5Path=indexNode.path)
+                childItem.restoreMetadata(indexNode.metadata)
+                yield childItem
+            return
+
+        assert self._h5Group is not None, "dataset undefined (file not opened?)"
 
-        for childName, h5Child in self._h5Group.items():
+        # Get the group via the attribute for every child so that it's reopened if the file
+        # handle pool has released the file in between two pages.
+        for childName in list(self._h5Group.keys()):
+            h5Child = self._h5Group.get(childName)
             if isinstance(h5Child, h5py.Group):
-                childItems.append(H5pyGroupRti(
+                yield H5pyGroupRti(
                     h5Child, nodeName=childName,
-                    fileName=self.fileName, iconColor=self.iconColor))
+                    fileName=self.fileName, iconColor=self.iconColor)
             elif isinstance(h5Child, h5py.Dataset):
                 # The shape can be None in case of Null datasets.
                 if h5Child.shape is None or len(h5Child.shape) == 0:
-                    childItems.append(H5pyScalarRti(
+                    yield H5pyScalarRti(
                         h5Child, nodeName=childName,
-                        fileName=self.fileName, iconColor=self.iconColor))
+                        fileName=self.fileName, iconColor=self.iconColor)
                 else:
-                    childItems.append(H5pyDatasetRti(
+                    yield H5pyDatasetRti(
                         h5Child, nodeName=childName,
-                        fileName=self.fileName, iconColor=self.iconColor))
+                        fileName=self.fileName, iconColor=self.iconColor)
 
             elif isinstance(h5Child, h5py.Datatype):
                 #logger.debug("Ignored DataType item: {}".format(childName))
                 pass
+            elif h5Child is None:
+                logger.warning("Ignored {}. It could not be read (dangling link?)".format(childName))
             else:
                 logger.warning("Ignored {}. It has an unexpected HDF-5 type: {}"
                             .format(childName, type(h5Child)))
 
-        return childItems
-
 
 
 class H5pyFileRti(H5pyGroupRti):
@@ -769,13 +876,50 @@ class H5pyFileRti(H5pyGroupRti):
         See http://www.h5py.org/
     """
     _defaultIconGlyph = RtiIconFactory.FILE
+    _poolFileHandle = True
+    _h5File = FileHandleAttribute()
 
     def __init__(self, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
         """
-        super(H5pyFileRti, self).__init__(None, nodeName, fileName=fileName, iconColor=iconColor)
+        super(H5pyFileRti, self).__init__(None, nodeName, fileName=fileName, iconColor=iconColor,
+                                          h5Path='/')
         self._checkFileExists()
         self._h5File = None
+        self._indexNodes = None  # Maps group path to its child index nodes if opened from index.
+
+
+    @property
+    def h5File(self):
+        """ The underlying h5py.File. Is None if the file is not opened.
+        """
+        return self._h5File
+
+
+    def _openFromFileIndex(self):
+        """ Reads the tree from the file index if the file hasn't changed since it was indexed.
+
+            Otherwise, the file is indexed in a background thread so that it can be opened from
+            the index the next time.
+        """
+        self._indexNodes = None
+        fileIndex = globalFileIndex()
+        if not fileIndex.enabled or not os.path.isfile(self._fileName):
+            return False
+
+        indexNodes = fileIndex.load(self._fileName)
+        if indexNodes is None:
+            fileIndex.scheduleBuild(self._fileName, indexH5pyFile)
+            return False
+
+        logger.info("Opening from file index: {}".format(self._fileName))
+        self._indexNodes = {'/': []}
+        for indexNode in indexNodes:
+            self._indexNodes[parentPath(indexNode.path)].append(indexNode)
+            if indexNode.className == H5pyGroupRti.__name__ and \
+                    not indexNode.metadata.pop(_LINK_TO_ANCESTOR_KEY, False):
+                self._indexNodes[indexNode.path] = []
+        return True
 
 
     def _openResources(self):
@@ -799,3 +943,44 @@ class H5pyFileRti(H5pyGroupRti):
         self._h5File.close()
         self._h5File = None
         self._h5Group = None
+
+
+
+_INDEXED_RTI_CLASSES = {rtiClass.__name__: rtiClass
+                        for rtiClass in (H5pyGroupRti, H5pyDatasetRti, H5pyScalarRti)}
+
+# Marks groups that link to one of their ancestors. Their children are read from the file.
+_LINK_TO_ANCESTOR_KEY = '_linkToAncestor'
+
+
+def indexH5pyFile(fileName):
+    """ Returns the file index nodes of all groups and datasets in an HDF-5 file.
+
+        Is called by the file index in a background thread. The file is opened separately, the
+        RTIs in the repository tree are not used. Fields of compound datasets are not indexed,
+        they are created from the file when the dataset is expanded.
+    """
+    fileRti = H5pyFileRti(nodeName=os.path.basename(fileName), fileName=fileName)
+    fileRti._openResources()
+    try:
+        indexNodes = []
+
+        def _addChildren(groupRti, groupPath, ancestorIds):
+            "Adds the index nodes of the children and further descendants of a group"
+            for childItem in groupRti._iterChildren():
+                childPath = groupPath.rstrip('/') + '/' + childItem.nodeName
+                metadata = childItem.snapshotMetadata(EXCLUDED_PROPERTIES)
+                indexNodes.append(IndexNode(childPath, type(childItem).__name__, metadata))
+
+                # Soft links can point to an ancestor. Don't follow these to prevent recursion.
+                if isinstance(childItem, H5pyGroupRti):
+                    groupId = childItem._h5Group.id
+                    if groupId in ancestorIds:
+                        metadata[_LINK_TO_ANCESTOR_KEY] = True
+                    else:
+                        _addChildren(childItem, childPath, ancestorIds + [groupId])
+
+        _addChildren(fileRti, '/', [fileRti._h5Group.id])
+        return indexNodes
+    finally:
+        fileRti._closeResources()
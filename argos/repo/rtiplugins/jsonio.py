@@ -18,9 +18,13 @@
 """ Repository tree items that are read using JSON
 """
 
+import json
 import logging
+import mmap
+import os
+import re
 
-from argos.external.json_with_comments import parse_json_with_comments_file
+from argos.external.json_with_comments import parse_json_with_comments_string
 from argos.repo.baserti import BaseRti, lengthToSummary
 from argos.repo.memoryrtis import _createFromObject
 from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
@@ -30,13 +34,164 @@ from argos.utils.misc import pformat
 logger = logging.getLogger(__name__)
 
 
+# Files (and sub-trees) larger than this are indexed first and parsed only when expanded.
+INCREMENTAL_PARSE_SIZE = 64 * 1024 ** 2
+
+_WHITESPACE_RE = re.compile(rb'[ \t\n\r]*')
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Skips strings and other characters and matches the first bracket (or slash) that follows.
+# Written as an 'unrolled loop' to prevent catastrophic backtracking when there is no match.
+_NEXT_BRACKET_RE = re.compile(
+    rb'[^\[\]{}"/]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^\[\]{}"/]*)*([\[\]{}/])', re.DOTALL)
+_SCALAR_RE = re.compile(rb'[^,\]}\s/]+')
+
+_QUOTE, _SLASH = ord('"'), ord('/')
+_OPENING_BRACKETS = (ord('['), ord('{'))
+
+
+class JsonIndexError(ValueError):
+    """ Raised when a JSON document can't be indexed.
+
+        This happens when the document is invalid, but also when it contains comments. The
+        caller should then fall back on parsing the complete document.
+    """
+    pass
+
+
 def replace_lists_by_arrays(dct):
     """ Recursively walks a JSON dictionary and tries to replace"""
 
 
+def loadJsonFile(fileName):
+    """ Parses a JSON file that may contain comments.
+
+        Erasing the comments is done character by character in Python, which is very slow for
+        large files. Therefore, the file is first parsed directly with the (C-implemented) JSON
+        decoder. Only if this fails, and the file contains comment markers, the comments are
+        erased first.
+    """
+    with open(fileName, 'rb') as jsonFile:
+        contents = jsonFile.read()
+
+    try:
+        return json.loads(contents)
+    except json.JSONDecodeError:
+        if b'//' not in contents and b'/*' not in contents:
+            raise # No comments, so the file is simply invalid.
+
+    logger.debug("Erasing comments from: {}".format(fileName))
+    return parse_json_with_comments_string(contents.decode('utf-8'))
+
+
+def _skipWhitespace(buffer, pos, end):
+    """ Returns the position of the first non-whitespace character at or after pos.
+    """
+    return _WHITESPACE_RE.match(buffer, pos, end).end()
+
+
+def _skipValue(buffer, pos, end):
+    """ Returns the end position of the JSON value that starts at pos, without decoding it.
+
+        Only strings and brackets are inspected, which is much faster than parsing the value.
+    """
+    if pos >= end:
+        raise JsonIndexError("Unexpected end of JSON data at position {}".format(pos))
+
+    firstChar = buffer[pos]
+    if firstChar == _QUOTE:
+        match = _STRING_RE.match(buffer, pos, end)
+        if not match:
+            raise JsonIndexError("Unterminated string at position {}".format(pos))
+        return match.end()
+
+    elif firstChar in _OPENING_BRACKETS:
+        depth = 0
+        while True:
+            match = _NEXT_BRACKET_RE.match(buffer, pos, end)
+            if not match:
+                raise JsonIndexError("Unterminated container at position {}".format(pos))
+            pos = match.end()
+            char = buffer[pos - 1]
+            if char in _OPENING_BRACKETS:
+                depth += 1
+            elif char == _SLASH:
+                raise JsonIndexError("Comment found at position {}".format(pos - 1))
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+    else:
+        match = _SCALAR_RE.match(buffer, pos, end)
+        if not match:
+            raise JsonIndexError("Unexpected character at position {}".format(pos))
+        return match.end()
+
+
+def indexJsonContainer(buffer, start=0, end=None):
+    """ Indexes the elements of the JSON object or array that is located in buffer[start:end]
+
+        The buffer should contain UTF-8 encoded JSON (e.g. bytes or a memory map). The elements
+        themselves are not decoded, only their position is determined. This way large documents
+        can be browsed without parsing them completely.
+
+        Returns (isObject, entries) tuple. The entries are a list of (key, valueStart, valueEnd)
+        tuples, one per element. For arrays the keys are None.
+
+        Raises JsonIndexError if the data is not a JSON object or array, or if comments are found.
+    """
+    end = len(buffer) if end is None else end
+    pos = _skipWhitespace(buffer, start, end)
+
+    opening = buffer[pos:pos+1]
+    if opening == b'{':
+        isObject, closing = True, b'}'
+    elif opening == b'[':
+        isObject, closing = False, b']'
+    else:
+        raise JsonIndexError("Expected an object or array at position {}".format(pos))
+
+    entries = []
+    pos = _skipWhitespace(buffer, pos + 1, end)
+    if buffer[pos:pos+1] != closing:
+        while True:
+            key = None
+            if isObject:
+                match = _STRING_RE.match(buffer, pos, end)
+                if not match:
+                    raise JsonIndexError("Expected a key at position {}".format(pos))
+                key = json.loads(match.group())
+                pos = _skipWhitespace(buffer, match.end(), end)
+                if buffer[pos:pos+1] != b':':
+                    raise JsonIndexError("Expected a colon at position {}".format(pos))
+                pos = _skipWhitespace(buffer, pos + 1, end)
+
+            valueEnd = _skipValue(buffer, pos, end)
+            entries.append((key, pos, valueEnd))
+
+            pos = _skipWhitespace(buffer, valueEnd, end)
+            separator = buffer[pos:pos+1]
+            if separator == b',':
+                pos = _skipWhitespace(buffer, pos + 1, end)
+            elif separator == closing:
+                break
+            else:
+                raise JsonIndexError("Expected a comma or {!r} at position {}"
+                                     .format(closing.decode(), pos))
+
+    if _skipWhitespace(buffer, pos + 1, end) != end:
+        raise JsonIndexError("Extra data after position {}".format(pos + 1))
+
+    return isObject, entries
+
+
 class JsonFileRti(BaseRti):
     """ Read JSON data with any comments filtered out.
         See https://github.com/sidneycadot/json_with_comments
+
+        Files larger than INCREMENTAL_PARSE_SIZE are not parsed completely when opened. Instead,
+        the elements of the top-level object or array are indexed by their byte offset in a
+        memory map of the file. An element is then parsed only when its node is expanded.
     """
     _defaultIconGlyph = RtiIconFactory.FILE
 
@@ -48,6 +203,11 @@ class JsonFileRti(BaseRti):
         self._checkFileExists()
         self._data = None
 
+        # Only used for incrementally parsed data.
+        self._buffer = None    # Buffer (memory map) that contains the unparsed JSON
+        self._isObject = None  # True if the indexed container is a JSON object
+        self._entries = None   # List with (key, start, end) tuple per element
+
 
     def hasChildren(self):
         """ Returns True if the item has (fetched or unfetched) children
@@ -55,13 +215,62 @@ class JsonFileRti(BaseRti):
         return True
 
 
+    @property
+    def _isIndexed(self):
+        """ Returns True if the data is indexed instead of parsed (i.e. incremental mode is used)
+        """
+        return self._entries is not None
+
+
     def _openResources(self):
-        """ Uses parse_json_with_comments_file to open the underlying file
+        """ Opens the underlying file.
+
+            Small files are parsed completely with loadJsonFile. Large files are memory mapped
+            and indexed, unless they contain comments. These are parsed completely as well.
         """
-        self._data = parse_json_with_comments_file(self._fileName)
+        if os.path.getsize(self._fileName) < INCREMENTAL_PARSE_SIZE:
+            self._data = loadJsonFile(self._fileName)
+        else:
+            with open(self._fileName, 'rb') as jsonFile:
+                buffer = mmap.mmap(jsonFile.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self._openIndexed(buffer, 0, len(buffer))
+            except JsonIndexError as ex:
+                logger.info("Unable to index {} ({}). Parsing all data.".format(self._fileName, ex))
+                buffer.close()
+                self._data = loadJsonFile(self._fileName)
+
         logger.info("READ JSON: type = {}".format(type(self._data)))
 
 
+    def _openIndexed(self, buffer, start, end):
+        """ Indexes the JSON container in buffer[start:end] so its elements can be parsed lazily.
+        """
+        self._isObject, self._entries = indexJsonContainer(buffer, start, end)
+        self._buffer = buffer
+        logger.debug("Indexed {} JSON elements in {}".format(len(self._entries), self))
+
+
+    def _createIndexedChildItems(self):
+        """ Creates child items from the index.
+
+            Containers become JsonSubTreeRtis, which are parsed when they are expanded. Scalars
+            are small so they are parsed immediately.
+        """
+        childItems = []
+        for nr, (key, start, end) in enumerate(self._entries):
+            nodeName = "elem-{}".format(nr) if key is None else str(key)
+            if self._buffer[start] in _OPENING_BRACKETS:
+                childItems.append(JsonSubTreeRti(
+                    self._buffer, start, end, nodeName=nodeName,
+                    iconColor=self.iconColor, fileName=self.fileName))
+            else:
+                childItems.append(_createFromObject(
+                    json.loads(self._buffer[start:end]), nodeName=nodeName,
+                    iconColor=self.iconColor, fileName=self.fileName))
+        return childItems
+
+
     def _fetchAllChildren(self):
         """ Adds a child item for each item
         """
@@ -69,6 +278,9 @@ class JsonFileRti(BaseRti):
         logger.debug("_fetchAllChildren of {!r} ({}):  {!r}"
                      .format(self, self.iconColor, self.fileName))
 
+        if self._isIndexed:
+            return self._createIndexedChildItems()
+
         if self.hasChildren():
             if isASequence(self._data):
                 for nr, elem in enumerate(self._data):
@@ -98,6 +310,17 @@ class JsonFileRti(BaseRti):
         """ Closes the underlying resources
         """
         self._data = None
+        self._releaseIndex()
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+
+
+    def _releaseIndex(self):
+        """ Forgets the index of the incrementally parsed data (if any)
+        """
+        self._isObject = None
+        self._entries = None
 
 
     def _containsScalar(self):
@@ -106,6 +329,7 @@ class JsonFileRti(BaseRti):
             Returns False if the file is closed.
         """
         return (self.isOpen and
+                not self._isIndexed and
                 not isASequence(self._data) and
                 not isAMapping(self._data) and
                 not isAnArray(self._data) and
@@ -142,6 +366,8 @@ class JsonFileRti(BaseRti):
         """
         if not self.isOpen:
             return ""
+        elif self._isIndexed:
+            return "" if self._isObject else "list"
         elif isASequence(self._data):
             return "list"
         elif isAMapping(self._data):
@@ -170,6 +396,8 @@ class JsonFileRti(BaseRti):
         """
         if not self.isOpen:
             return ""
+        elif self._isIndexed:
+            return "" if self._isObject else lengthToSummary(len(self._entries))
         elif isASequence(self._data):
             return lengthToSummary(len(self._data))
         elif isAMapping(self._data):
@@ -190,5 +418,56 @@ class JsonFileRti(BaseRti):
         """
         if not self.isOpen:
             return ""
+        elif self._isIndexed:
+            return "Large JSON data with {} elements. Elements are parsed when expanded."\
+                .format(len(self._entries))
         else:
             return pformat(self._data, width)
+
+
+
+class JsonSubTreeRti(JsonFileRti):
+    """ An object or array from an indexed JSON file that is only parsed when it is expanded.
+
+        The JSON text is read from the buffer (memory map) of the file RTI. This buffer is not
+        closed by this RTI. Large sub-trees are in turn indexed instead of parsed completely.
+    """
+    def __init__(self, buffer, start, end, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+
+            :param buffer: buffer (e.g. memory map) with the UTF-8 encoded JSON text of the file.
+            :param start: start position of the sub-tree in the buffer.
+            :param end: end position of the sub-tree in the buffer.
+        """
+        super(JsonSubTreeRti, self).__init__(nodeName=nodeName, fileName=fileName,
+                                             iconColor=iconColor)
+        self._sourceBuffer = buffer
+        self._start = start
+        self._end = end
+
+
+    @property
+    def iconGlyph(self):
+        """ Shows a folder icon for objects and a sequence icon for arrays.
+        """
+        if self._sourceBuffer[self._start] == ord('['):
+            return RtiIconFactory.SEQUENCE
+        else:
+            return RtiIconFactory.FOLDER
+
+
+    def _openResources(self):
+        """ Parses the sub-tree, or indexes it if it is large.
+        """
+        if self._end - self._start < INCREMENTAL_PARSE_SIZE:
+            self._data = json.loads(self._sourceBuffer[self._start:self._end])
+        else:
+            self._openIndexed(self._sourceBuffer, self._start, self._end)
+
+
+    def _closeResources(self):
+        """ Forgets the parsed data. The buffer is owned by the file RTI and is not closed.
+        """
+        self._data = None
+        self._buffer = None
+        self._releaseIndex()
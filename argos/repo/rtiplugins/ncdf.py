@@ -29,7 +29,7 @@ import math
 from netCDF4 import Dataset, Variable, Dimension
 
 from argos.utils.cls import checkType
-from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.repo.baserti import BaseRti, FileHandleAttribute, MetadataProperty, shapeToSummary
 from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
 from argos.utils.defs import SUB_DIM_TEMPLATE, CONTIGUOUS
 from argos.utils.masks import maskedEqual
@@ -95,6 +95,7 @@ class NcdfDimensionRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a NCDF group.
     """
     _defaultIconGlyph = RtiIconFactory.DIMENSION
+    _ncDim = FileHandleAttribute()
 
     def __init__(self, ncDim, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -104,12 +105,17 @@ class NcdfDimensionRti(BaseRti):
 
         self._ncDim = ncDim
 
+    def _refreshFileHandles(self):
+        """ Gets the dimension again from the parent group after the file has been reopened.
+        """
+        self._ncDim = self.parentItem._ncGroup.dimensions[self.nodeName]
+
     def hasChildren(self):
         """ Returns False. Dimension items never have children.
         """
         return False
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
@@ -123,6 +129,7 @@ class NcdfFieldRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a field in a structured NCDF variable.
     """
     _defaultIconGlyph = RtiIconFactory.FIELD
+    _ncVar = FileHandleAttribute()
 
     def __init__(self, ncVar, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor.
@@ -133,6 +140,11 @@ class NcdfFieldRti(BaseRti):
 
         self._ncVar = ncVar
 
+    def _refreshFileHandles(self):
+        """ Gets the variable again from the parent variable after the file has been reopened.
+        """
+        self._ncVar = self.parentItem._ncVar
+
     def hasChildren(self):
         """ Returns False. Field items never have children.
         """
@@ -183,7 +195,7 @@ class NcdfFieldRti(BaseRti):
             return fieldDtype.shape
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
             If the field contains a subarray the shape may be longer than 1.
@@ -191,7 +203,7 @@ class NcdfFieldRti(BaseRti):
         return self._ncVar.shape + self._subArrayShape
 
 
-    @property
+    @MetadataProperty
     def chunking(self):
         """ List with chunk sizes if chunked storage is used. Or 'contiguous' for contiguous storage
         """
@@ -206,7 +218,7 @@ class NcdfFieldRti(BaseRti):
         return "field"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
@@ -214,7 +226,7 @@ class NcdfFieldRti(BaseRti):
         return str(self._ncVar.dtype.fields[fieldName][0])
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
             Returns the attributes of the variable that contains this field.
@@ -222,7 +234,7 @@ class NcdfFieldRti(BaseRti):
         return ncVarAttributes(self._ncVar)
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit attribute of the underlying ncdf variable.
 
@@ -241,7 +253,7 @@ class NcdfFieldRti(BaseRti):
             return unit
 
 
-    @property
+    @MetadataProperty
     def dimensionNames(self):
         """ Returns a list with the dimension names of the underlying NCDF variable
         """
@@ -250,7 +262,7 @@ class NcdfFieldRti(BaseRti):
         return list(self._ncVar.dimensions + tuple(subArrayDims))
 
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
@@ -291,6 +303,7 @@ class NcdfVariableRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a NCDF variable.
     """
     #_defaultIconGlyph = RtiIconFactory.ARRAY
+    _ncVar = FileHandleAttribute()
 
     def __init__(self, ncVar, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -306,6 +319,11 @@ class NcdfVariableRti(BaseRti):
             # or AttributeError, depending on its version.
             self._isStructured = False
 
+    def _refreshFileHandles(self):
+        """ Gets the variable again from the parent group after the file has been reopened.
+        """
+        self._ncVar = self.parentItem._ncGroup.variables[self.nodeName]
+
     def hasChildren(self):
         """ Returns True if the variable has a structured type, otherwise returns False.
         """
@@ -339,21 +357,21 @@ class NcdfVariableRti(BaseRti):
         return self._ncVar.__getitem__(index)
 
 
-    @property
+    @MetadataProperty
     def nDims(self):
         """ The number of dimensions of the underlying array
         """
         return self._ncVar.ndim
 
 
-    @property
+    @MetadataProperty
     def arrayShape(self):
         """ Returns the shape of the underlying array.
         """
         return self._ncVar.shape
 
 
-    @property
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
             Returns the attributes of the variable that contains this field.
@@ -361,14 +379,14 @@ class NcdfVariableRti(BaseRti):
         return ncVarAttributes(self._ncVar)
 
 
-    @property
+    @MetadataProperty
     def unit(self):
         """ Returns the unit attribute of the underlying ncdf variable
         """
         return ncVarUnit(self._ncVar)
 
 
-    @property
+    @MetadataProperty
     def chunking(self):
         """ List with chunk sizes if chunked storage is used. Or 'contiguous' for contiguous storage
         """
@@ -383,7 +401,7 @@ class NcdfVariableRti(BaseRti):
         return "scalar" if self.nDims == 0 else "array"
 
 
-    @property
+    @MetadataProperty
     def elementTypeName(self):
         """ String representation of the element type.
         """
@@ -396,7 +414,7 @@ class NcdfVariableRti(BaseRti):
         return ('compound' if dtype.names else str(dtype))
 
 
-    @property
+    @MetadataProperty
     def dimensionNames(self):
         """ Returns a list with the dimension names of the underlying NCDF variable
         """
@@ -410,14 +428,14 @@ class NcdfVariableRti(BaseRti):
 #        return [dim.group().path for dim in self._ncVar.dimensions.values()] # TODO: cache?
 #
 
-    @property
+    @MetadataProperty
     def missingDataValue(self):
         """ Returns the value to indicate missing data. None if no missing-data value is specified.
         """
         return variableMissingValue(self._ncVar)
 
 
-    @property
+    @MetadataProperty
     def summary(self):
         """ Returns a summary of the contents of the RTI.  E.g. 'array 20 x 30' elements.
         """
@@ -464,6 +482,7 @@ class NcdfGroupRti(BaseRti):
     """ Repository Tree Item (RTI) that contains a NCDF group.
     """
     _defaultIconGlyph = RtiIconFactory.FOLDER
+    _ncGroup = FileHandleAttribute()
 
     def __init__(self, ncGroup, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -474,7 +493,13 @@ class NcdfGroupRti(BaseRti):
         self._ncGroup = ncGroup
 
 
-    @property
+    def _refreshFileHandles(self):
+        """ Gets the group again from the parent group after the file has been reopened.
+        """
+        self._ncGroup = self.parentItem._ncGroup.groups[self.nodeName]
+
+
+    @MetadataProperty
     def attributes(self):
         """ The attributes dictionary.
         """
@@ -514,6 +539,8 @@ class NcdfFileRti(NcdfGroupRti):
         See http://unidata.github.io/netcdf4-python/
     """
     _defaultIconGlyph = RtiIconFactory.FILE
+    _poolFileHandle = True
+    _fetchInBackground = False  # The NetCDF-C library is not thread safe.
 
     def __init__(self, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
         """ Constructor
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Repository Tree Item (RTI) for raw binary files without a header.
+
+    The file is memory-mapped with numpy.memmap so that only the bytes that a slice touches are
+    read from disk. The layout of the array (element type, byte order, shape, offset and order)
+    is read from a descriptor file next to the data file. This descriptor is a small JSON file
+    with the same name as the data file plus the '.rawdesc' extension. For example:
+
+        {"dtype": "uint16", "byteOrder": ">", "shape": [100, 512, 512], "offset": 0, "order": "C"}
+
+    The shape may contain a single -1, which is then calculated from the file size. If the
+    shape is omitted the file is opened as a 1D array.
+
+    If there is no descriptor, the layout can be entered in the dialog that is shown when the
+    file is opened via File | Open As | Raw binary file...
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from argos.qt import QtWidgets
+from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
+from argos.repo.memoryrtis import ArrayRti
+from argos.utils.cls import checkType
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTOR_EXTENSION = '.rawdesc'
+
+BYTE_ORDERS = {'<': 'little-endian', '>': 'big-endian', '=': 'native'}
+ORDERS = {'C': 'C (row-major)', 'F': 'Fortran (column-major)'}
+DTYPES = ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'uint64', 'int64',
+          'float16', 'float32', 'float64', 'complex64', 'complex128']
+
+# Layouts that were entered in the dialog during this session but not saved in a descriptor.
+_SESSION_LAYOUTS = {}
+
+
+def rawDescriptorFileName(fileName):
+    """ Returns the name of the descriptor file that belongs to a raw binary file.
+    """
+    return fileName + DESCRIPTOR_EXTENSION
+
+
+def checkRawLayout(layout):
+    """ Checks the layout dictionary and returns a copy with the defaults filled in.
+
+        Raises a ValueError if the layout is invalid.
+    """
+    checkType(layout, dict)
+    unknownKeys = set(layout.keys()) - {'dtype', 'byteOrder', 'shape', 'offset', 'order'}
+    if unknownKeys:
+        raise ValueError("Unknown keys in raw layout: {}".format(sorted(unknownKeys)))
+
+    if 'dtype' not in layout:
+        raise ValueError("The raw layout must specify the dtype")
+
+    result = {
+        'dtype': str(layout['dtype']),
+        'byteOrder': layout.get('byteOrder', '='),
+        'shape': layout.get('shape', None),
+        'offset': int(layout.get('offset', 0)),
+        'order': layout.get('order', 'C'),
+    }
+    np.dtype(result['dtype'])  # Raises TypeError for unknown types
+
+    if result['byteOrder'] not in BYTE_ORDERS:
+        raise ValueError("Byte order should be one of {}, got: {!r}"
+                         .format(list(BYTE_ORDERS.keys()), result['byteOrder']))
+
+    if result['order'] not in ORDERS:
+        raise ValueError("Order should be one of {}, got: {!r}"
+                         .format(list(ORDERS.keys()), result['order']))
+
+    if result['offset'] < 0:
+        raise ValueError("Offset must be non-negative, got: {}".format(result['offset']))
+
+    if result['shape'] is not None:
+        shape = tuple(int(dimSize) for dimSize in result['shape'])
+        if shape.count(-1) > 1 or any(dimSize < -1 for dimSize in shape):
+            raise ValueError("Invalid shape: {}".format(shape))
+        result['shape'] = shape
+
+    return result
+
+
+def readRawDescriptor(fileName):
+    """ Reads the layout from the descriptor that belongs to a raw binary file.
+
+        Returns None if there is no descriptor.
+    """
+    descriptorFileName = rawDescriptorFileName(fileName)
+    if not os.path.exists(descriptorFileName):
+        return None
+
+    with open(descriptorFileName, 'r') as descriptorFile:
+        return checkRawLayout(json.load(descriptorFile))
+
+
+def writeRawDescriptor(fileName, layout):
+    """ Writes the layout in the descriptor file that belongs to a raw binary file.
+    """
+    layout = checkRawLayout(layout)
+    if layout['shape'] is not None:
+        layout['shape'] = list(layout['shape'])
+
+    descriptorFileName = rawDescriptorFileName(fileName)
+    logger.info("Writing raw layout descriptor: {}".format(descriptorFileName))
+    with open(descriptorFileName, 'w') as descriptorFile:
+        json.dump(layout, descriptorFile, indent=4)
+
+
+def setSessionRawLayout(fileName, layout):
+    """ Uses the layout for the raw binary file until the application is closed.
+
+        Takes precedence over the layout in the descriptor file.
+    """
+    _SESSION_LAYOUTS[os.path.abspath(fileName)] = checkRawLayout(layout)
+
+
+def getRawLayout(fileName):
+    """ Returns the layout of a raw binary file, or None if it is not known.
+    """
+    layout = _SESSION_LAYOUTS.get(os.path.abspath(fileName), None)
+    return layout if layout is not None else readRawDescriptor(fileName)
+
+
+def memmapRawFile(fileName, layout):
+    """ Memory maps a raw binary file read-only, given a layout dictionary.
+    """
+    layout = checkRawLayout(layout)
+    dtype = np.dtype(layout['dtype']).newbyteorder(layout['byteOrder'])
+    offset = layout['offset']
+
+    numBytes = os.path.getsize(fileName) - offset
+    numElements = max(0, numBytes) // dtype.itemsize
+
+    shape = layout['shape']
+    if shape is None:
+        shape = (numElements, )
+    elif -1 in shape:
+        knownSize = int(np.prod([dimSize for dimSize in shape if dimSize != -1]))
+        if knownSize == 0 or numElements % knownSize != 0:
+            raise ValueError("File size of {} bytes is not consistent with shape {} of {}"
+                             .format(numBytes, shape, dtype))
+        shape = tuple(numElements // knownSize if dimSize == -1 else dimSize
+                      for dimSize in shape)
+
+    requiredElements = int(np.prod(shape))
+    if requiredElements > numElements:
+        raise ValueError("File {} is too small for an array of shape {} of {} at offset {}"
+                         .format(fileName, shape, dtype, offset))
+
+    if requiredElements == 0:
+        return np.zeros(shape, dtype=dtype)  # Zero-length files can't be memory mapped
+    else:
+        return np.memmap(fileName, dtype=dtype, mode='r', offset=offset, shape=shape,
+                         order=layout['order'])
+
+
+
+class RawBinaryFileRti(ArrayRti):
+    """ Memory maps a headerless binary file with numpy.memmap.
+
+        The layout is taken from the descriptor file (see module documentation) or from the
+        layout that the user entered when opening the file.
+    """
+    _defaultIconGlyph = RtiIconFactory.FILE
+
+    def __init__(self, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor. Initializes as an ArrayRTI with None as underlying array.
+        """
+        super(RawBinaryFileRti, self).__init__(None, nodeName=nodeName, fileName=fileName,
+                                               iconColor=iconColor)
+        self._checkFileExists()
+
+
+    def hasChildren(self):
+        """ Returns True if the item has (fetched or unfetched) children
+
+            Returns True so that the file can be opened, even though the array has no children.
+        """
+        return True
+
+
+    def _openResources(self):
+        """ Memory maps the underlying file using the layout.
+        """
+        layout = getRawLayout(self._fileName)
+        if layout is None:
+            raise IOError("No layout for raw binary file. Open it via 'File | Open As' to "
+                          "specify it, or create a descriptor file: {}"
+                          .format(rawDescriptorFileName(self._fileName)))
+
+        self._array = memmapRawFile(self._fileName, layout)
+        self.attributes.clear()
+        self.attributes.update(layout)
+
+
+    def _closeResources(self):
+        """ Closes the underlying resources
+        """
+        self._array = None
+        self.attributes.clear()
+
+
+
+class RawLayoutDialog(QtWidgets.QDialog):
+    """ Dialog window that lets the user enter the layout of a raw binary file.
+    """
+    def __init__(self, fileName, layout=None, parent=None):
+        """ Constructor
+
+            :param fileName: name of the raw binary file.
+            :param layout: initial layout. If None, a layout of bytes is used.
+        """
+        super(RawLayoutDialog, self).__init__(parent=parent)
+
+        self._fileName = fileName
+        layout = checkRawLayout({'dtype': 'uint8'} if layout is None else layout)
+
+        self.setWindowTitle('Raw binary layout')
+        self.setModal(True)
+        mainLayout = QtWidgets.QVBoxLayout(self)
+
+        fileLabel = QtWidgets.QLabel("{}\n({:,} bytes)".format(
+            fileName, os.path.getsize(fileName) if os.path.exists(fileName) else 0))
+        fileLabel.setWordWrap(True)
+        mainLayout.addWidget(fileLabel)
+
+        formLayout = QtWidgets.QFormLayout()
+        mainLayout.addLayout(formLayout)
+
+        self.dtypeComboBox = QtWidgets.QComboBox()
+        self.dtypeComboBox.setEditable(True)
+        self.dtypeComboBox.addItems(DTYPES)
+        self.dtypeComboBox.setCurrentText(layout['dtype'])
+        formLayout.addRow("Element type", self.dtypeComboBox)
+
+        self.byteOrderComboBox = QtWidgets.QComboBox()
+        for key, label in BYTE_ORDERS.items():
+            self.byteOrderComboBox.addItem(label, key)
+        self.byteOrderComboBox.setCurrentIndex(self.byteOrderComboBox.findData(layout['byteOrder']))
+        formLayout.addRow("Byte order", self.byteOrderComboBox)
+
+        self.shapeLineEdit = QtWidgets.QLineEdit()
+        self.shapeLineEdit.setPlaceholderText("e.g. 100, 512, 512 (empty for 1D)")
+        if layout['shape'] is not None:
+            self.shapeLineEdit.setText(", ".join(str(dimSize) for dimSize in layout['shape']))
+        formLayout.addRow("Shape", self.shapeLineEdit)
+
+        self.offsetLineEdit = QtWidgets.QLineEdit(str(layout['offset']))
+        formLayout.addRow("Offset (bytes)", self.offsetLineEdit)
+
+        self.orderComboBox = QtWidgets.QComboBox()
+        for key, label in ORDERS.items():
+            self.orderComboBox.addItem(label, key)
+        self.orderComboBox.setCurrentIndex(self.orderComboBox.findData(layout['order']))
+        formLayout.addRow("Order", self.orderComboBox)
+
+        self.saveCheckBox = QtWidgets.QCheckBox("Save layout in descriptor file")
+        self.saveCheckBox.setToolTip(rawDescriptorFileName(fileName))
+        self.saveCheckBox.setChecked(True)
+        mainLayout.addWidget(self.saveCheckBox)
+
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok |
+                                               QtWidgets.QDialogButtonBox.Cancel)
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.rejected.connect(self.reject)
+        mainLayout.addWidget(buttonBox)
+
+
+    def getLayout(self):
+        """ Returns the layout dictionary as entered by the user.
+
+            Raises a ValueError if the input is invalid.
+        """
+        shapeText = self.shapeLineEdit.text().strip().strip('()[]')
+        try:
+            shape = [int(part) for part in shapeText.split(',') if part.strip()] or None
+            offset = int(self.offsetLineEdit.text() or 0)
+        except ValueError as ex:
+            raise ValueError("Shape and offset must be integers: {}".format(ex))
+
+        return checkRawLayout({
+            'dtype': self.dtypeComboBox.currentText().strip(),
+            'byteOrder': self.byteOrderComboBox.currentData(),
+            'shape': shape,
+            'offset': offset,
+            'order': self.orderComboBox.currentData()})
+
+
+    def accept(self):
+        """ Checks the layout and stores it before closing the dialog.
+        """
+        try:
+            layout = self.getLayout()
+            memmapRawFile(self._fileName, layout)  # Test if the file fits the layout
+        except (ValueError, TypeError) as ex:
+            QtWidgets.QMessageBox.warning(self, "Invalid layout", str(ex))
+            return
+
+        setSessionRawLayout(self._fileName, layout)
+
+        if self.saveCheckBox.isChecked():
+            try:
+                writeRawDescriptor(self._fileName, layout)
+            except OSError as ex:
+                logger.warning("Unable to save raw layout descriptor: {}".format(ex))
+                QtWidgets.QMessageBox.warning(
+                    self, "Unable to save descriptor",
+                    "The layout is only used until Argos is closed.\n\n{}".format(ex))
+
+        super(RawLayoutDialog, self).accept()
+
+
+def askRawLayout(fileName, parent=None):
+    """ Shows the RawLayoutDialog so that the user can enter or change the layout of the file.
+
+        Returns True if the dialog was accepted.
+    """
+    try:
+        layout = getRawLayout(fileName)
+    except Exception as ex:
+        logger.warning("Ignoring invalid raw layout descriptor: {}".format(ex))
+        layout = None
+
+    dialog = RawLayoutDialog(fileName, layout=layout, parent=parent)
+    return dialog.exec_() == QtWidgets.QDialog.Accepted
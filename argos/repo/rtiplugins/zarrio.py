@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Repository Tree Items (RTIs) for Zarr stores.
+
+    It uses the zarr package to open directory-based Zarr stores (format version 2 and 3).
+    See https://zarr.readthedocs.io/
+"""
+from __future__ import absolute_import
+
+import itertools
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import zarr
+
+from argos.repo.iconfactory import RtiIconFactory, ICON_COLOR_UNDEF
+from argos.repo.baserti import BaseRti, shapeToSummary
+from argos.utils.cls import checkType, isAnArray, toString
+from argos.utils.defs import DIM_TEMPLATE
+from argos.utils.masks import maskedEqual
+
+logger = logging.getLogger(__name__)
+
+MAX_QUICK_LOOK_SIZE = 1000
+
+# Thread pool that reads and decompresses chunks concurrently. Created when first needed.
+_CHUNK_READ_EXECUTOR = None
+
+
+def _chunkReadExecutor():
+    """ Returns the thread pool that is used to read the chunks of all Zarr arrays.
+    """
+    global _CHUNK_READ_EXECUTOR
+    if _CHUNK_READ_EXECUTOR is None:
+        _CHUNK_READ_EXECUTOR = ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix='zarr-chunks')
+    return _CHUNK_READ_EXECUTOR
+
+
+def _splitDimension(dimIndex, dimSize, chunkSize):
+    """ Splits the index of a single dimension at the chunk boundaries.
+
+        Returns a list of (inputSelection, outputSelection) tuples, one per chunk that is touched
+        by the index. The outputSelection is None if the dimension is removed by an integer index.
+        Returns None if the index is not an integer or a slice with a positive step.
+    """
+    if isinstance(dimIndex, (int, np.integer)):
+        pos = int(dimIndex) + dimSize if dimIndex < 0 else int(dimIndex)
+        if not 0 <= pos < dimSize:
+            raise IndexError("Index {} out of range for dimension of size {}"
+                             .format(dimIndex, dimSize))
+        return [(pos, None)]
+
+    if not isinstance(dimIndex, slice):
+        return None
+
+    start, stop, step = dimIndex.indices(dimSize)
+    if step <= 0:
+        return None
+
+    pieces = []
+    outStart = 0
+    pos = start
+    while pos < stop:
+        chunkEnd = min(stop, (pos // chunkSize + 1) * chunkSize)
+        numElements = (chunkEnd - pos + step - 1) // step
+        pieces.append((slice(pos, pos + (numElements - 1) * step + 1, step),
+                       slice(outStart, outStart + numElements)))
+        outStart += numElements
+        pos += numElements * step
+    return pieces
+
+
+def _ascendingIndex(index, shape):
+    """ Expands the Ellipsis and replaces slices that have a negative step.
+
+        Zarr doesn't support negative steps. These slices are replaced by a slice that selects
+        the same elements in ascending order. Returns the new index and the index that must be
+        applied afterwards to restore the order of the elements.
+    """
+    index = np.index_exp[index]
+    if Ellipsis in index:
+        pos = index.index(Ellipsis)
+        index = index[:pos] + (slice(None),) * (len(shape) - len(index) + 1) + index[pos+1:]
+    index = index + (slice(None),) * (len(shape) - len(index))
+
+    ascIndex = []
+    reverse = []
+    for dimIndex, dimSize in zip(index, shape):
+        if isinstance(dimIndex, slice) and dimIndex.step is not None and dimIndex.step < 0:
+            start, stop, step = dimIndex.indices(dimSize)
+            numElements = len(range(start, stop, step))
+            last = start + (numElements - 1) * step
+            ascIndex.append(slice(last, start + 1, -step) if numElements else slice(0, 0))
+            reverse.append(slice(None, None, -1))
+        else:
+            ascIndex.append(dimIndex)
+            if not isinstance(dimIndex, (int, np.integer)):
+                reverse.append(slice(None))
+
+    ascIndex.extend(index[len(shape):])  # Let Zarr raise an IndexError for too many indices
+    return tuple(ascIndex), tuple(reverse)
+
+
+def readChunksConcurrently(zarrArray, index):
+    """ Reads the index from the Zarr array, fetching the chunks it touches in parallel.
+
+        The selection is split up at the chunk boundaries and each part is read (and
+        decompressed) by the thread pool. Indexes that are not a combination of integers and
+        slices are passed to the Zarr array directly.
+    """
+    shape = zarrArray.shape
+    chunks = zarrArray.chunks
+    index, reverse = _ascendingIndex(index, shape)
+
+    if len(index) != len(shape) or len(shape) == 0:
+        return zarrArray[index]
+
+    dimPieces = []
+    for dimIndex, dimSize, chunkSize in zip(index, shape, chunks):
+        pieces = _splitDimension(dimIndex, dimSize, chunkSize)
+        if pieces is None:
+            # Fancy indexing, let Zarr handle it
+            result = zarrArray[index]
+            return result[reverse] if reverse else result
+        dimPieces.append(pieces)
+
+    outShape = tuple(pieces[-1][1].stop if pieces else 0
+                     for pieces in dimPieces if not pieces or pieces[0][1] is not None)
+    tasks = list(itertools.product(*dimPieces))
+
+    if len(tasks) <= 1:
+        result = zarrArray[index]
+    else:
+        result = np.empty(outShape, dtype=zarrArray.dtype)
+
+        def _readPart(task):
+            "Reads the part of the selection that falls in a single chunk"
+            inSel = tuple(inp for inp, _ in task)
+            outSel = tuple(out for _, out in task if out is not None)
+            result[outSel] = zarrArray[inSel]
+
+        # Consume the iterator so that any exceptions are raised here.
+        for _ in _chunkReadExecutor().map(_readPart, tasks):
+            pass
+
+    return result[reverse] if reverse else result
+
+
+def zarrDimensionNames(zarrArray):
+    """ Returns the dimension names of a Zarr array.
+
+        Uses the dimension names of the metadata (Zarr format 3), or else the _ARRAY_DIMENSIONS
+        attribute (the convention used by xarray for format 2). Falls back on 'dim-0', 'dim-1',
+        etc. for dimensions without a name.
+    """
+    dimNames = None
+    metadata = getattr(zarrArray, 'metadata', None)
+    if metadata is not None:
+        dimNames = getattr(metadata, 'dimension_names', None)
+
+    if not dimNames:
+        dimNames = zarrArray.attrs.get('_ARRAY_DIMENSIONS', None)
+
+    if not dimNames or len(dimNames) != len(zarrArray.shape):
+        dimNames = [None] * len(zarrArray.shape)
+
+    return [str(dimName) if dimName else DIM_TEMPLATE.format(dimNr)
+            for dimNr, dimName in enumerate(dimNames)]
+
+
+def zarrUnit(zarrArray):
+    """ Returns the unit of the Zarr array by looking in the attributes.
+
+        It searches in the attributes for one of the following keys:
+        'unit', 'units', 'Unit', 'Units', 'UNIT', 'UNITS'. If these are not found, the empty
+        string is returned.
+    """
+    attributes = zarrArray.attrs
+    for key in ('unit', 'units', 'Unit', 'Units', 'UNIT', 'UNITS'):
+        if key in attributes:
+            return toString(attributes[key])
+    return ''
+
+
+def zarrMissingValue(zarrArray):
+    """ Returns the missingData value of a Zarr array
+
+        Looks for one of the following attributes: _FillValue, missing_value, MissingValue,
+        missingValue. If these are not found the fill value of the array is used.
+
+        The fill value of Zarr arrays is zero by default. Since this is also a common data
+        value, a fill value of zero is not used to mask the data. Returns None if there is no
+        missing value.
+    """
+    attributes = zarrArray.attrs
+    for key in ('missing_value', 'MissingValue', 'missingValue', 'FillValue', '_FillValue'):
+        if key in attributes:
+            missingDataValue = attributes[key]
+            if isAnArray(missingDataValue) and len(missingDataValue) == 1:
+                return missingDataValue[0]
+            else:
+                return missingDataValue
+
+    fillValue = zarrArray.fill_value
+    if fillValue is None or zarrArray.dtype.kind not in 'iufc':
+        return None
+    elif fillValue == 0:
+        return None
+    else:
+        return fillValue
+
+
+def _zarrGroupMembers(zarrGroup):
+    """ Returns a list of (name, member) tuples, sorted by name.
+    """
+    if hasattr(zarrGroup, 'members'):
+        members = zarrGroup.members()  # Zarr-python >= 3
+    else:
+        members = zarrGroup.items()
+    return sorted(members, key=lambda member: member[0])
+
+
+def _createArrayRti(zarrArray, nodeName, fileName, iconColor):
+    """ Creates a ZarrScalarRti or ZarrArrayRti depending on the number of dimensions.
+    """
+    if len(zarrArray.shape) == 0:
+        return ZarrScalarRti(zarrArray, nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+    else:
+        return ZarrArrayRti(zarrArray, nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+
+
+
+class ZarrScalarRti(BaseRti):
+    """ Repository Tree Item (RTI) that contains a zero-dimensional Zarr array.
+    """
+    _defaultIconGlyph = RtiIconFactory.SCALAR
+
+    def __init__(self, zarrArray, nodeName='', fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ZarrScalarRti, self).__init__(
+            nodeName=nodeName, fileName=fileName, iconColor=iconColor)
+        checkType(zarrArray, zarr.Array)
+        self._zarrArray = zarrArray
+
+
+    def hasChildren(self):
+        """ Returns False. Leaf nodes never have children. """
+        return False
+
+
+    @property
+    def isSliceable(self):
+        """ Returns True because the underlying data can be sliced.
+        """
+        return True
+
+
+    def __getitem__(self, index):
+        """ Called when using the RTI with an index (e.g. rti[0]).
+        """
+        return self._zarrArray[()]
+
+
+    @property
+    def arrayShape(self):
+        """ Returns the shape of the wrapper array. Will always be an empty tuple()
+        """
+        return tuple()
+
+
+    @property
+    def dimensionality(self):
+        """ String that describes if the RTI is an array, scalar, field, etc.
+        """
+        return "scalar"
+
+
+    @property
+    def elementTypeName(self):
+        """ String representation of the element type.
+        """
+        return str(self._zarrArray.dtype)
+
+
+    @property
+    def attributes(self):
+        """ The attributes dictionary.
+        """
+        return dict(self._zarrArray.attrs)
+
+
+    @property
+    def unit(self):
+        """ Returns the unit of the RTI by calling zarrUnit on the underlying array
+        """
+        return zarrUnit(self._zarrArray)
+
+
+    @property
+    def missingDataValue(self):
+        """ Returns the value to indicate missing data. None if no missing-data value is specified.
+        """
+        return zarrMissingValue(self._zarrArray)
+
+
+    @property
+    def summary(self):
+        """ Returns a summary of the contents of the RTI. In this case the scalar as a string
+        """
+        return str(self._zarrArray[()])
+
+
+
+class ZarrArrayRti(BaseRti):
+    """ Repository Tree Item (RTI) that contains a Zarr array.
+
+        The chunks that a slice touches are read concurrently by a thread pool.
+    """
+    _defaultIconGlyph = RtiIconFactory.ARRAY
+
+    def __init__(self, zarrArray, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ZarrArrayRti, self).__init__(nodeName, fileName=fileName, iconColor=iconColor)
+        checkType(zarrArray, zarr.Array)
+        self._zarrArray = zarrArray
+
+
+    def hasChildren(self):
+        """ Returns False. Zarr arrays never have children.
+        """
+        return False
+
+
+    @property
+    def isSliceable(self):
+        """ Returns True because the underlying data can be sliced.
+        """
+        return True
+
+
+    def __getitem__(self, index):
+        """ Called when using the RTI with an index (e.g. rti[0]).
+            Reads the chunks concurrently and converts the result to a masked array using the
+            missing data value as fill_value
+        """
+        array = np.asarray(readChunksConcurrently(self._zarrArray, index))
+        return maskedEqual(array, self.missingDataValue)
+
+
+    @property
+    def arrayShape(self):
+        """ Returns the shape of the underlying array.
+        """
+        return self._zarrArray.shape
+
+
+    @property
+    def chunking(self):
+        """ List with chunk sizes.
+        """
+        return self._zarrArray.chunks
+
+
+    @property
+    def dimensionality(self):
+        """ String that describes if the RTI is an array, scalar, field, etc.
+        """
+        return "array"
+
+
+    @property
+    def elementTypeName(self):
+        """ String representation of the element type.
+        """
+        return str(self._zarrArray.dtype)
+
+
+    @property
+    def attributes(self):
+        """ The attributes dictionary.
+        """
+        return dict(self._zarrArray.attrs)
+
+
+    @property
+    def dimensionNames(self):
+        """ Returns a list with the dimension names of the underlying Zarr array.
+        """
+        return zarrDimensionNames(self._zarrArray)
+
+
+    @property
+    def unit(self):
+        """ Returns the unit of the RTI by calling zarrUnit on the underlying array
+        """
+        return zarrUnit(self._zarrArray)
+
+
+    @property
+    def missingDataValue(self):
+        """ Returns the value to indicate missing data. None if no missing-data value is specified.
+        """
+        return zarrMissingValue(self._zarrArray)
+
+
+    @property
+    def summary(self):
+        """ Returns a summary of the contents of the RTI.  E.g. 'array 20 x 30' elements.
+        """
+        return shapeToSummary(self.arrayShape)
+
+
+    def quickLook(self, width: int):
+        """ Returns a string representation fof the RTI to use in the Quik Look pane.
+        """
+        if self._zarrArray.size > MAX_QUICK_LOOK_SIZE:
+            return "{} of {}".format(self.typeName, self.summary)
+        else:
+            return str(self[...])
+
+
+
+class ZarrGroupRti(BaseRti):
+    """ Repository Tree Item (RTI) that contains a Zarr group.
+    """
+    _defaultIconGlyph = RtiIconFactory.FOLDER
+
+    def __init__(self, zarrGroup, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ZarrGroupRti, self).__init__(nodeName, fileName=fileName, iconColor=iconColor)
+        checkType(zarrGroup, zarr.Group, allowNone=True)
+        self._zarrGroup = zarrGroup
+
+
+    @property
+    def attributes(self):
+        """ The attributes dictionary.
+        """
+        return dict(self._zarrGroup.attrs) if self._zarrGroup is not None else {}
+
+
+    def _fetchAllChildren(self):
+        """ Fetches all sub groups and arrays that this group contains.
+        """
+        assert self._zarrGroup is not None, "group undefined (file not opened?)"
+        assert self.canFetchChildren(), "canFetchChildren must be True"
+
+        childItems = []
+        for childName, zarrChild in _zarrGroupMembers(self._zarrGroup):
+            if isinstance(zarrChild, zarr.Group):
+                childItems.append(ZarrGroupRti(
+                    zarrChild, nodeName=childName,
+                    fileName=self.fileName, iconColor=self.iconColor))
+            elif isinstance(zarrChild, zarr.Array):
+                childItems.append(_createArrayRti(
+                    zarrChild, nodeName=childName,
+                    fileName=self.fileName, iconColor=self.iconColor))
+            else:
+                logger.warning("Ignored {}. It has an unexpected Zarr type: {}"
+                               .format(childName, type(zarrChild)))
+        return childItems
+
+
+
+class ZarrStoreRti(ZarrGroupRti):
+    """ Opens a directory-based Zarr store using the zarr package.
+
+        If the root of the store is an array instead of a group, the array is added as the
+        only child.
+    """
+    _defaultIconGlyph = RtiIconFactory.FILE
+
+    def __init__(self, nodeName, fileName='', iconColor=ICON_COLOR_UNDEF):
+        """ Constructor
+        """
+        super(ZarrStoreRti, self).__init__(None, nodeName, fileName=fileName, iconColor=iconColor)
+        self._checkFileExists()
+        self._rootArray = None
+
+
+    def _openResources(self):
+        """ Opens the root group (or array) of the store read-only.
+        """
+        logger.info("Opening: {}".format(self._fileName))
+        root = zarr.open(self._fileName, mode='r')
+        if isinstance(root, zarr.Array):
+            self._rootArray = root
+        else:
+            self._zarrGroup = root
+
+
+    def _fetchAllChildren(self):
+        """ Fetches the members of the root group, or the root array itself.
+        """
+        if self._rootArray is not None:
+            nodeName = os.path.splitext(self.nodeName)[0] or self.nodeName
+            return [_createArrayRti(self._rootArray, nodeName=nodeName,
+                                    fileName=self.fileName, iconColor=self.iconColor)]
+        else:
+            return super(ZarrStoreRti, self)._fetchAllChildren()
+
+
+    def _closeResources(self):
+        """ Forgets the root group. Zarr stores don't keep file handles open.
+        """
+        logger.info("Closing: {}".format(self._fileName))
+        self._zarrGroup = None
+        self._rootArray = None
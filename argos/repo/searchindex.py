@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Search index with the paths of all nodes in the files that are opened in the repository.
+
+    The files are walked in a background thread. The node paths are stored in an in-memory
+    trigram index so that substring, glob and regular expression queries don't have to test
+    every path.
+
+    The walks use the worker thread that fetches the children of the repository tree, since not
+    all file libraries are thread safe. Files of libraries that can't be used in a background
+    thread at all (e.g. NetCDF-C) are walked in the GUI thread. A file is walked in chunks of
+    WALK_CHUNK_NODES nodes, and only one file at a time, so that fetching the children of the
+    tree never has to wait for more than a single chunk.
+"""
+import collections
+import fnmatch
+import itertools
+import logging
+import re
+
+from argos.qt import Qt, QtCore, QtSignal, QtSlot
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.repotreemodel import RepoTreeModel, _fetchExecutor, isFileRti
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SUBSTRING = 'Substring'
+SEARCH_GLOB = 'Glob'
+SEARCH_REGEX = 'Regex'
+SEARCH_MODES = (SEARCH_SUBSTRING, SEARCH_GLOB, SEARCH_REGEX)
+
+# Limits for walking a file. Soft links in HDF-5 files can make the tree infinitely deep.
+MAX_WALK_DEPTH = 32
+MAX_NODES_PER_FILE = 1000000
+
+# Number of nodes that is walked before other tasks can use the worker thread.
+WALK_CHUNK_NODES = 200
+
+# Characters with a special meaning in a glob pattern.
+_GLOB_WILDCARDS_RE = re.compile(r'\*|\?|\[[^\]]*\]')
+
+
+def _trigrams(text):
+    """ Returns the set of all substrings of length 3 in text.
+    """
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+def _literalParts(query, mode):
+    """ Returns the (lower case) substrings that must occur in every path that matches the query.
+
+        For regular expressions no substrings are returned. All paths are then tested.
+    """
+    if mode == SEARCH_SUBSTRING:
+        return [query.lower()]
+    elif mode == SEARCH_GLOB:
+        return [part.lower() for part in _GLOB_WILDCARDS_RE.split(query) if part]
+    elif mode == SEARCH_REGEX:
+        return []
+    else:
+        raise ValueError("Unknown search mode: {!r}".format(mode))
+
+
+def compileQuery(query, mode):
+    """ Returns a function that returns True if a (lower case) path matches the query.
+
+        The search is case insensitive. Globs must match the complete path, where a '*' also
+        matches slashes, so that '*/temperature' finds the temperature nodes in all files.
+        Raises re.error if the query is not a valid regular expression.
+    """
+    if mode == SEARCH_SUBSTRING:
+        lowerQuery = query.lower()
+        return lambda path: lowerQuery in path
+    elif mode == SEARCH_GLOB:
+        return re.compile(fnmatch.translate(query.lower())).match
+    elif mode == SEARCH_REGEX:
+        return re.compile(query, re.IGNORECASE).search
+    else:
+        raise ValueError("Unknown search mode: {!r}".format(mode))
+
+
+
+class PathIndex(object):
+    """ In-memory trigram index of node paths.
+
+        The paths are grouped per root path (the path of the file RTI in the repository tree), so
+        that all paths of a file can be replaced or removed at once.
+    """
+    def __init__(self):
+        """ Constructor
+        """
+        self._paths = {}  # Maps path ID to the path.
+        self._lowerPaths = {}  # Maps path ID to the lower case path.
+        self._idsByRoot = {}  # Maps root path to the list of IDs of its paths.
+        self._idsByTrigram = collections.defaultdict(set)
+        self._nextId = 0
+
+
+    def __len__(self):
+        return len(self._paths)
+
+
+    @property
+    def rootPaths(self):
+        """ The root paths that are in the index
+        """
+        return list(self._idsByRoot.keys())
+
+
+    def hasRoot(self, rootPath):
+        """ Returns True if the paths of the root are in the index.
+        """
+        return rootPath in self._idsByRoot
+
+
+    def addPaths(self, rootPath, paths):
+        """ Adds the paths of a root, replacing its current paths.
+
+            The root path itself is not added. The paths should start with the root path.
+        """
+        self.removeRoot(rootPath)
+
+        pathIds = []
+        for path in paths:
+            pathId = self._nextId
+            self._nextId += 1
+            lowerPath = path.lower()
+            self._paths[pathId] = path
+            self._lowerPaths[pathId] = lowerPath
+            for trigram in _trigrams(lowerPath):
+                self._idsByTrigram[trigram].add(pathId)
+            pathIds.append(pathId)
+        self._idsByRoot[rootPath] = pathIds
+
+
+    def removeRoot(self, rootPath):
+        """ Removes the paths of a root. Does nothing if the root is not in the index.
+        """
+        for pathId in self._idsByRoot.pop(rootPath, []):
+            del self._paths[pathId]
+            for trigram in _trigrams(self._lowerPaths.pop(pathId)):
+                idsOfTrigram = self._idsByTrigram[trigram]
+                idsOfTrigram.discard(pathId)
+                if not idsOfTrigram:
+                    del self._idsByTrigram[trigram]
+
+
+    def removeRootsBelow(self, path):
+        """ Removes the paths of the roots that are equal to path or are a descendant of it.
+        """
+        prefix = path.rstrip('/') + '/'
+        for rootPath in self.rootPaths:
+            if rootPath == path or rootPath.startswith(prefix):
+                self.removeRoot(rootPath)
+
+
+    def _candidateIds(self, literalParts):
+        """ Returns the IDs of the paths that contain all trigrams of the literal parts.
+
+            Returns None if there are no trigrams, in which case all paths are candidates.
+        """
+        trigrams = set()
+        for part in literalParts:
+            trigrams.update(_trigrams(part))
+
+        if not trigrams:
+            return None
+
+        # Start with the rarest trigram to keep the intersections small.
+        postings = sorted((self._idsByTrigram.get(trigram, set()) for trigram in trigrams),
+                          key=len)
+        candidateIds = set(postings[0])
+        for posting in postings[1:]:
+            if not candidateIds:
+                break
+            candidateIds.intersection_update(posting)
+        return candidateIds
+
+
+    def search(self, query, mode=SEARCH_SUBSTRING, maxResults=None):
+        """ Returns the paths that match the query, in the order in which they were added.
+
+            See compileQuery for the matching rules. Raises re.error if the query is not a valid
+            regular expression.
+
+            :param maxResults: maximum number of returned paths. If None, all are returned.
+        """
+        if not query:
+            return []
+
+        matches = compileQuery(query, mode)
+        candidateIds = self._candidateIds(_literalParts(query, mode))
+        if candidateIds is None:
+            candidateIds = self._paths.keys()
+
+        results = []
+        for pathId in sorted(candidateIds):
+            if matches(self._lowerPaths[pathId]):
+                results.append(self._paths[pathId])
+                if maxResults is not None and len(results) >= maxResults:
+                    break
+        return results
+
+
+
+def _iterNodePaths(item, itemPath, depth, maxDepth):
+    """ Fetches the descendants of the item and yields their paths, depth first.
+    """
+    childItems = item.fetchChildren()
+    item.insertChildren(childItems)
+    for childItem in childItems:
+        childPath = itemPath + '/' + childItem.nodeName
+        yield childPath
+        if depth < maxDepth and childItem.hasChildren():
+            yield from _iterNodePaths(childItem, childPath, depth + 1, maxDepth)
+
+
+
+class NodePathWalker(object):
+    """ Fetches all descendants of an RTI, in chunks, and collects their paths.
+
+        The RTI should be a private copy that is not shown in the repository tree, so that it can
+        be walked in a background thread. It is closed when the walk is finished.
+    """
+    def __init__(self, rti, rootPath, maxDepth=MAX_WALK_DEPTH, maxNodes=MAX_NODES_PER_FILE):
+        """ Constructor
+
+            :param rootPath: the path of the RTI. The paths of the descendants are relative to this.
+        """
+        self.rti = rti
+        self.rootPath = rootPath
+        self.paths = []
+        self.isFinished = False
+        self._maxNodes = maxNodes
+        self._pathIterator = _iterNodePaths(rti, rootPath.rstrip('/'), 1, maxDepth)
+
+
+    def walkChunk(self, maxPaths=WALK_CHUNK_NODES):
+        """ Adds the paths of (at most) the next maxPaths descendants.
+
+            Returns True if the walk is finished. The RTI is closed then, or if an exception is
+            raised.
+        """
+        try:
+            with globalFileHandlePool().pinned(self.rti):
+                numPaths = min(maxPaths, self._maxNodes - len(self.paths))
+                chunk = list(itertools.islice(self._pathIterator, numPaths))
+                self.paths.extend(chunk)
+                if len(chunk) < numPaths:
+                    self.finish()
+                elif len(self.paths) >= self._maxNodes:
+                    if next(self._pathIterator, None) is not None:
+                        logger.warning("More than {} nodes in {}. Stopped indexing."
+                                       .format(self._maxNodes, self.rootPath))
+                    self.finish()
+        except Exception:
+            self.finish()
+            raise
+        return self.isFinished
+
+
+    def finish(self):
+        """ Stops the walk and closes the RTI.
+        """
+        self.isFinished = True
+        self._pathIterator = None
+        self.rti.close()
+
+
+
+def walkNodePaths(rti, rootPath, maxDepth=MAX_WALK_DEPTH, maxNodes=MAX_NODES_PER_FILE):
+    """ Fetches all descendants of the RTI and returns their paths. The RTI is closed afterwards.
+
+        See NodePathWalker, which walks the RTI in chunks.
+    """
+    walker = NodePathWalker(rti, rootPath, maxDepth=maxDepth, maxNodes=maxNodes)
+    while not walker.walkChunk():
+        pass
+    return walker.paths
+
+
+
+class SearchIndexer(QtCore.QObject):
+    """ Keeps a PathIndex with the node paths of the files that are opened in the repository.
+
+        When a file is opened in the repository tree, a private copy of its RTI is created and
+        walked in the background thread that also fetches the children of the repository tree
+        (see repotreemodel.py). When the file is removed from the tree, its paths are removed.
+
+        The files are walked one by one. After each chunk the walk is submitted to the worker
+        thread again, behind the fetches that were started in the meantime. The private copies
+        are not added to the file handle pool, so at most one extra file is open.
+    """
+    # Emitted (in the GUI thread) when the paths of a file are added to or removed from the index.
+    sigIndexChanged = QtSignal()
+
+    # Emitted from the worker thread when a file has been walked. Parameter: (rootPath, walker).
+    sigFileWalked = QtSignal(str, object)
+
+    def __init__(self, repoTreeModel, parent=None):
+        """ Constructor
+        """
+        super(SearchIndexer, self).__init__(parent=parent)
+        self._repoTreeModel = repoTreeModel
+        self._pathIndex = PathIndex()
+        self._pendingWalkers = {}  # Maps root path to the NodePathWalker that walks it.
+        self._walkQueue = collections.deque()  # The NodePathWalkers that are waiting.
+        self._currentWalker = None
+
+        # The private copies are inserted in a separate model so that they are never shown.
+        self._walkModel = RepoTreeModel(parent=self)
+
+        self.sigFileWalked.connect(self._onFileWalked, type=Qt.QueuedConnection)
+        self._repoTreeModel.sigItemChanged.connect(self._onItemChanged)
+        self._repoTreeModel.rowsAboutToBeRemoved.connect(self._onRowsAboutToBeRemoved)
+
+
+    def finalize(self):
+        """ Disconnects signals
+        """
+        self._repoTreeModel.sigItemChanged.disconnect(self._onItemChanged)
+        self._repoTreeModel.rowsAboutToBeRemoved.disconnect(self._onRowsAboutToBeRemoved)
+
+
+    @property
+    def pathIndex(self):
+        """ The PathIndex with the paths of the walked files.
+        """
+        return self._pathIndex
+
+
+    def isIndexing(self):
+        """ Returns True if files are being walked in the background.
+        """
+        return bool(self._pendingWalkers)
+
+
+    def search(self, query, mode=SEARCH_SUBSTRING, maxResults=None):
+        """ Returns the node paths that match the query. See PathIndex.search.
+        """
+        return self._pathIndex.search(query, mode=mode, maxResults=maxResults)
+
+
+    @QtSlot(object)
+    def _onItemChanged(self, rti):
+        """ Schedules walking the file of the RTI when it has been opened.
+        """
+        # Directories are not walked as they can contain a huge number of files.
+        if rti is None or not rti.isOpen or not isFileRti(rti):
+            return
+
+        rootPath = rti.nodePath
+        if rootPath in self._pendingWalkers or self._pathIndex.hasRoot(rootPath):
+            return
+
+        self.scheduleWalk(rti)
+
+
+    def scheduleWalk(self, rti):
+        """ Walks the file of the RTI in the background and adds its node paths to the index.
+
+            The walk starts when the walks that were scheduled before are finished. A walk of the
+            same file that is still pending, e.g. because the file changed while it was walked,
+            is cancelled.
+        """
+        rootPath = rti.nodePath
+        logger.debug("Scheduling search indexing of: {}".format(rootPath))
+        try:
+            fileRti = type(rti).createFromFileName(rti.fileName, rti.iconColor,
+                                                   nodeName=rti.nodeName)
+        except Exception as ex:
+            logger.warning("Unable to index {} for searching: {}".format(rootPath, ex))
+            return
+
+        fileRti.excludeFromFileHandlePool()
+
+        oldWalker = self._pendingWalkers.get(rootPath)
+        if oldWalker in self._walkQueue:
+            logger.debug("Cancelling walk that has not started: {}".format(rootPath))
+            self._walkQueue.remove(oldWalker)
+            self._removeWalkedCopy(oldWalker)
+        # A walk in progress stops at its next chunk and its result is discarded.
+
+        walker = NodePathWalker(fileRti, rootPath)
+        self._walkModel.insertItem(fileRti)
+        self._pendingWalkers[rootPath] = walker
+        self._walkQueue.append(walker)
+        if self._currentWalker is None:
+            self._startNextWalk()
+
+
+    def _removeWalkedCopy(self, walker):
+        """ Closes the private copy of a walker and removes it from the walk model.
+        """
+        fileIndex = self._walkModel.index(walker.rti.childNumber(), 0)
+        self._walkModel.deleteItemAtIndex(fileIndex)
+
+
+    def _startNextWalk(self):
+        """ Submits the first chunk of the next walk to the worker thread.
+        """
+        if not self._walkQueue:
+            return
+
+        self._currentWalker = self._walkQueue.popleft()
+        self._submitChunk(self._currentWalker)
+
+
+    def _submitChunk(self, walker):
+        """ Schedules walking the next chunk of a file.
+
+            Files that can't be fetched in the background (see BaseRti.canFetchInBackground) are
+            walked in the GUI thread, one chunk per event loop iteration.
+        """
+        if walker.rti.canFetchInBackground():
+            _fetchExecutor().submit(self._walkChunk, walker)
+        else:
+            QtCore.QTimer.singleShot(0, lambda: self._walkChunk(walker))
+
+
+    def _walkChunk(self, walker):
+        """ Walks a chunk of a file. Is executed in the worker thread or in the GUI thread.
+
+            Submits the next chunk until the walk is finished, or until the file has been removed
+            or is walked again.
+        """
+        if self._pendingWalkers.get(walker.rootPath) is not walker:
+            walker.finish()
+        else:
+            try:
+                walker.walkChunk()
+            except Exception as ex:
+                logger.warning("Unable to index {} for searching: {}".format(walker.rootPath, ex))
+                walker.paths = []
+
+        if walker.isFinished:
+            self.sigFileWalked.emit(walker.rootPath, walker)
+        else:
+            self._submitChunk(walker)
+
+
+    @QtSlot(str, object)
+    def _onFileWalked(self, rootPath, walker):
+        """ Adds the paths of a walked file to the index. Is called in the GUI thread.
+        """
+        self._removeWalkedCopy(walker)
+        self._currentWalker = None
+        self._startNextWalk()
+
+        if self._pendingWalkers.get(rootPath) is not walker:
+            logger.debug("File removed or changed while it was indexed: {}".format(rootPath))
+            return
+
+        del self._pendingWalkers[rootPath]
+        self._pathIndex.addPaths(rootPath, walker.paths)
+        logger.debug("Indexed {} paths for searching: {}".format(len(walker.paths), rootPath))
+        self.sigIndexChanged.emit()
+
+
+    @QtSlot(QtCore.QModelIndex, int, int)
+    def _onRowsAboutToBeRemoved(self, parentIndex, first, last):
+        """ Removes the paths of the files that are removed from the repository tree.
+        """
+        oldNumRoots = len(self._pathIndex.rootPaths)
+        for row in range(first, last + 1):
+            item = self._repoTreeModel.getItem(self._repoTreeModel.index(row, 0, parentIndex))
+            if item is None:
+                continue
+            nodePath = item.nodePath
+            prefix = nodePath.rstrip('/') + '/'
+            self._pendingWalkers = {
+                rootPath: walker for rootPath, walker in self._pendingWalkers.items()
+                if rootPath != nodePath and not rootPath.startswith(prefix)}
+            self._pathIndex.removeRootsBelow(nodePath)
+
+        if len(self._pathIndex.rootPaths) != oldNumRoots:
+            self.sigIndexChanged.emit()
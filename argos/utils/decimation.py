@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Min/max decimation of long one-dimensional series for plotting.
+
+    The samples are divided in buckets, one per pixel column. Of each bucket the first, last,
+    minimum and maximum valid samples are kept (M4 aggregation). Drawing lines through these
+    points gives the same picture as drawing all samples, the peaks are preserved.
+
+    See: Jugel et al., M4: A Visualization-Oriented Time Series Data Aggregation, VLDB 2014.
+"""
+import logging
+import math
+
+import numpy as np
+
+from argos.utils.cls import isAnArray
+
+logger = logging.getLogger(__name__)
+
+# Buckets are processed in chunks of at most this many samples to limit the memory usage.
+MAX_CHUNK_SIZE = 2 ** 22
+
+# With this many samples per bucket or fewer, decimation yields no reduction.
+MIN_BUCKET_SIZE = 4
+
+
+class Envelope(object):
+    """ The decimated series.
+
+        Consists of the sample indices (xs), the sample values (ys) and a connect array that is
+        True if the line between a point and the next point should be drawn. The arrays have
+        the same length; the last connect element is always False.
+    """
+    def __init__(self, xs, ys, connect):
+        """ Constructor
+        """
+        self.xs = xs
+        self.ys = ys
+        self.connect = connect
+
+
+    def __len__(self):
+        return len(self.xs)
+
+
+    def __repr__(self):
+        return "<Envelope: {} points>".format(len(self))
+
+
+    @classmethod
+    def createEmpty(cls, dtype):
+        """ Creates an envelope without points.
+        """
+        return cls(np.zeros(0, dtype=np.intp), np.zeros(0, dtype=dtype), np.zeros(0, dtype=bool))
+
+
+    def select(self, start, stop):
+        """ Returns the points with start <= xs < stop as a new envelope.
+
+            The line from the last selected point to the next (unselected) point is not drawn.
+        """
+        first, last = np.searchsorted(self.xs, [start, stop])
+        connect = self.connect[first:last].copy()
+        if len(connect) > 0:
+            connect[-1] = False
+        return Envelope(self.xs[first:last], self.ys[first:last], connect)
+
+
+    @classmethod
+    def concatenate(cls, envelopes):
+        """ Concatenates envelopes. The envelopes should be sorted and should not overlap.
+        """
+        return cls(np.concatenate([env.xs for env in envelopes]),
+                   np.concatenate([env.ys for env in envelopes]),
+                   np.concatenate([env.connect for env in envelopes]))
+
+
+
+def _extremeValues(dtype):
+    """ Returns a (lowest, highest) tuple with the extreme values that can be stored in dtype.
+
+        Used as fill value for invalid samples when searching the minimum (highest) or
+        maximum (lowest).
+    """
+    if dtype.kind == 'f':
+        return -np.inf, np.inf
+    else:
+        info = np.iinfo(dtype)
+        return info.min, info.max
+
+
+def _validSamples(values, mask):
+    """ Returns a boolean array that is True for the samples that are finite and not masked.
+
+        Returns None if all samples are valid, so that the caller can take a faster path.
+    """
+    valid = np.isfinite(values) if values.dtype.kind == 'f' else None
+
+    if isAnArray(mask):
+        if valid is None:
+            valid = ~mask
+        else:
+            np.logical_and(valid, ~mask, out=valid)
+
+    if valid is not None and valid.all():
+        return None
+    else:
+        return valid
+
+
+def _bucketEnvelope(values, mask, offset, bucketSize):
+    """ Returns the envelope of samples that fit in an integer number of buckets.
+
+        :param values: samples of the chunk. The length must be a multiple of bucketSize.
+        :param mask: mask array of the chunk, or False.
+        :param offset: index of the first sample of the chunk in the series.
+        :param bucketSize: the number of samples per bucket.
+        :return: (envelope, leadingGap, trailingGap) tuple. The gaps are True if there are invalid
+            samples before the first point or after the last point of the chunk.
+    """
+    numBuckets = len(values) // bucketSize
+    buckets = values.reshape(numBuckets, bucketSize)
+    valid = _validSamples(values, mask)
+
+    if valid is None:
+        # Fast path without copies of the data.
+        bucketIndices = np.empty((numBuckets, 4), dtype=np.intp)
+        bucketIndices[:, 0] = 0
+        bucketIndices[:, 1] = buckets.argmin(axis=1)
+        bucketIndices[:, 2] = buckets.argmax(axis=1)
+        bucketIndices[:, 3] = bucketSize - 1
+        hasValid = np.ones(numBuckets, dtype=bool)
+    else:
+        validBuckets = valid.reshape(numBuckets, bucketSize)
+        lowest, highest = _extremeValues(values.dtype)
+        bucketIndices = np.empty((numBuckets, 4), dtype=np.intp)
+        bucketIndices[:, 0] = validBuckets.argmax(axis=1)
+        bucketIndices[:, 1] = np.where(validBuckets, buckets, highest).argmin(axis=1)
+        bucketIndices[:, 2] = np.where(validBuckets, buckets, lowest).argmax(axis=1)
+        bucketIndices[:, 3] = bucketSize - 1 - validBuckets[:, ::-1].argmax(axis=1)
+        hasValid = validBuckets.any(axis=1)
+        # If the minimum or maximum is a fill value it's equal to the first valid sample.
+        np.copyto(bucketIndices[:, 1], bucketIndices[:, 0],
+                  where=~np.take_along_axis(validBuckets, bucketIndices[:, 1:2], axis=1)[:, 0])
+        np.copyto(bucketIndices[:, 2], bucketIndices[:, 0],
+                  where=~np.take_along_axis(validBuckets, bucketIndices[:, 2:3], axis=1)[:, 0])
+
+    # Sort the four points of each bucket by index and remove duplicates.
+    bucketIndices.sort(axis=1)
+    keep = np.ones((numBuckets, 4), dtype=bool)
+    keep[:, 1:] = bucketIndices[:, 1:] != bucketIndices[:, :-1]
+    keep &= hasValid[:, np.newaxis]
+
+    bucketIndices += (np.arange(numBuckets, dtype=np.intp) * bucketSize)[:, np.newaxis]
+    indices = bucketIndices[keep]   # Indices relative to the start of the chunk
+
+    if len(indices) == 0:
+        return Envelope.createEmpty(values.dtype), True, True
+
+    connect = np.empty(len(indices), dtype=bool)
+    if valid is None:
+        connect[:-1] = True
+        leadingGap = trailingGap = False
+    else:
+        # Two consecutive points are connected if all samples in between are valid. The points
+        # themselves are valid, so the reduction from one point up to the next suffices.
+        invalid = np.logical_not(valid, out=valid)
+        gapAfter = np.logical_or.reduceat(invalid, indices)
+        np.logical_not(gapAfter[:-1], out=connect[:-1])
+        leadingGap = bool(invalid[:indices[0]].any())
+        trailingGap = bool(gapAfter[-1])
+    connect[-1] = False
+
+    return Envelope(indices + offset, values[indices], connect), leadingGap, trailingGap
+
+
+def minMaxEnvelope(data, mask, numColumns, start=0, stop=None):
+    """ Decimates the samples data[start:stop] to at most four points per pixel column.
+
+        Samples that are masked or not finite are skipped. Lines between points are only drawn
+        if all samples in between are valid, so gaps in the data remain visible.
+
+        If there are at most MIN_BUCKET_SIZE samples per column, all valid samples are returned.
+
+        :param data: one-dimensional numpy array with real numbers.
+        :param mask: boolean array with the same shape as data, or a single boolean for all
+            samples (as the mask of an ArrayWithMask).
+        :param numColumns: the number of pixel columns.
+        :param start: the index of the first sample.
+        :param stop: the index after the last sample. If None, the length of the data.
+        :return: an Envelope object.
+    """
+    assert data.ndim == 1, "Expected one-dimensional data, got: {}".format(data.shape)
+    assert numColumns > 0, "numColumns should be positive, got: {}".format(numColumns)
+
+    start = max(0, start)
+    stop = len(data) if stop is None else min(stop, len(data))
+    numSamples = stop - start
+
+    if numSamples <= 0 or (not isAnArray(mask) and mask):
+        return Envelope.createEmpty(data.dtype)
+
+    bucketSize = math.ceil(numSamples / numColumns)
+    if bucketSize <= MIN_BUCKET_SIZE:
+        bucketSize = 1
+
+    # The chunks consist of whole buckets, except for the last one.
+    chunkSize = max(1, MAX_CHUNK_SIZE // bucketSize) * bucketSize
+    chunkBounds = []
+    for chunkStart in range(start, stop, chunkSize):
+        chunkStop = min(stop, chunkStart + chunkSize)
+        fullStop = chunkStart + (chunkStop - chunkStart) // bucketSize * bucketSize
+        if fullStop > chunkStart:
+            chunkBounds.append((chunkStart, fullStop, bucketSize))
+        if chunkStop > fullStop:
+            chunkBounds.append((fullStop, chunkStop, chunkStop - fullStop))
+
+    envelopes = []
+    prevTrailingGap = True
+    for chunkStart, chunkStop, chunkBucketSize in chunkBounds:
+        chunkMask = mask[chunkStart:chunkStop] if isAnArray(mask) else False
+        envelope, leadingGap, trailingGap = _bucketEnvelope(
+            data[chunkStart:chunkStop], chunkMask, chunkStart, chunkBucketSize)
+
+        if len(envelope) == 0:
+            prevTrailingGap = True
+            continue
+
+        if envelopes and (prevTrailingGap or leadingGap):
+            envelopes[-1].connect[-1] = False
+        elif envelopes:
+            envelopes[-1].connect[-1] = True
+
+        envelopes.append(envelope)
+        prevTrailingGap = trailingGap
+
+    if not envelopes:
+        return Envelope.createEmpty(data.dtype)
+    else:
+        return Envelope.concatenate(envelopes)
@@ -32,6 +32,22 @@ from argos.utils.cls import checkType, isAnArray, checkIsAnArray, arrayIsStructu
 
 logger = logging.getLogger(__name__)
 
+# Number of elements that sanitizeForPlotting processes at once, so that the temporary boolean
+# arrays stay small.
+SANITIZE_CHUNK_SIZE = 2 ** 16
+
+# Methods for sampling the data when calculating statistics, e.g. for the auto-range methods.
+SAMPLING_OFF = 'off'              # Exact statistics of all data.
+SAMPLING_SUBSAMPLE = 'subsample'  # Exact statistics of a strided subsample (see _subsampleArray).
+SAMPLING_SKETCH = 'sketch'        # Approximate statistics of all data (see QuantileSketch).
+SAMPLING_METHODS = (SAMPLING_OFF, SAMPLING_SUBSAMPLE, SAMPLING_SKETCH)
+
+# Number of values per level of a QuantileSketch. Determines the accuracy, see QuantileSketch.
+SKETCH_CAPACITY = 2 ** 15
+
+# Number of elements that QuantileSketch.fromArrayWithMask sorts at once.
+SKETCH_CHUNK_SIZE = 2 ** 20
+
 
 class ConsistencyError(Exception):
     """ Raised when the mask of an ArrayWithMask object has an inconsistent shape."""
@@ -210,6 +226,47 @@ class ArrayWithMask():
         replaceMaskedValueWithFloat(self.data, self.mask, np.nan, copyOnReplace=False)
 
 
+
+class PlotBuffers():
+    """ Reusable output buffers for sanitizeForPlotting.
+
+        The buffers are only reallocated when the shape or data type changes. A plot that is
+        redrawn often, e.g. the cross sections of the image plot on every mouse move, therefore
+        doesn't allocate new arrays each time. Note that the arrays returned by
+        sanitizeForPlotting are overwritten by the next call with the same buffers.
+    """
+    def __init__(self):
+        self._plotData = None
+        self._connected = None
+        self._scratch = np.empty(SANITIZE_CHUNK_SIZE, dtype=bool)
+
+
+    def plotData(self, shape, dtype):
+        """ Returns the buffer for the plot data.
+        """
+        if (self._plotData is None or self._plotData.shape != shape or
+                self._plotData.dtype != dtype):
+            self._plotData = np.empty(shape, dtype=dtype)
+        return self._plotData
+
+
+    def connected(self, shape):
+        """ Returns the buffer for the connected array.
+        """
+        if self._connected is None or self._connected.shape != shape:
+            self._connected = np.empty(shape, dtype=bool)
+        return self._connected
+
+
+    def scratch(self, shape):
+        """ Returns a temporary boolean array for a chunk.
+        """
+        size = int(np.prod(shape))
+        if self._scratch.size < size:
+            self._scratch = np.empty(size, dtype=bool)
+        return self._scratch[:size].reshape(shape)
+
+
 #############
 # functions #
 #############
@@ -256,6 +313,80 @@ def replaceMaskedValueWithFloat(data, mask, replacementValue, copyOnReplace=True
         return replaceMaskedValue(data, mask, replacementValue, copyOnReplace=copyOnReplace)
 
 
+def sanitizeForPlotting(data, mask, replaceMasked=False, buffers=None):
+    """ Prepares data for plotting with PyQtGraph in a single pass over the data.
+
+        Returns a (plotData, connected) tuple. The connected array is True for values that are
+        finite and not masked, and can be used as the connect parameter of a PlotDataItem.
+        In the plotData infinite values are replaced by NaNs because PyQtGraph fails on them. If
+        replaceMasked is True, masked values are replaced by NaNs as well; integers are then
+        converted to floats.
+
+        The data is processed in chunks of about SANITIZE_CHUNK_SIZE elements. Each chunk is
+        written into the output buffers with out= arguments, so that no temporary arrays of the
+        size of the data are made. The data is only copied to the plot data buffer when values
+        have to be replaced, otherwise the data itself is returned. Integer data has no infinite
+        values and is therefore not checked.
+
+        :param data: numpy array with real numbers (at least one dimension).
+        :param mask: boolean array with the same shape as data, or a single boolean.
+        :param replaceMasked: if True, masked values are replaced by NaNs.
+        :param buffers: PlotBuffers object to write the results to. If None, new arrays are made.
+    """
+    assert data.ndim >= 1, "Expected at least one dimension, got shape: {}".format(data.shape)
+    if buffers is None:
+        buffers = PlotBuffers()
+
+    maskIsArray = isAnArray(mask)
+    connected = buffers.connected(data.shape)
+    isFloat = data.dtype.kind == 'f'
+
+    if not isFloat and not (replaceMasked and (maskIsArray or mask)):
+        if maskIsArray:
+            np.logical_not(mask, out=connected)
+        else:
+            connected.fill(not mask)
+        return data, connected
+
+    plotData = None  # Allocated when the first value has to be replaced.
+
+    rowSize = int(np.prod(data.shape[1:]))
+    rowsPerChunk = max(1, SANITIZE_CHUNK_SIZE // max(1, rowSize))
+    for start in range(0, len(data), rowsPerChunk):
+        chunk = slice(start, start + rowsPerChunk)
+        chunkData = data[chunk]
+        chunkConnected = connected[chunk]
+        invalid = buffers.scratch(chunkData.shape)
+
+        if isFloat:
+            np.isfinite(chunkData, out=invalid)  # Reused for the invalid values below.
+        else:
+            invalid.fill(True)
+
+        if maskIsArray:
+            np.greater(invalid, mask[chunk], out=chunkConnected)  # finite and not masked
+        elif mask:
+            chunkConnected.fill(False)
+        else:
+            chunkConnected[...] = invalid
+
+        # The values that have to be replaced. NaNs are kept as they are.
+        if replaceMasked:
+            np.logical_not(chunkConnected, out=invalid)
+        else:
+            np.isinf(chunkData, out=invalid)
+
+        if plotData is None and invalid.any():
+            plotData = buffers.plotData(data.shape, np.result_type(data.dtype, np.float32))
+            np.copyto(plotData[:start], data[:start])
+
+        if plotData is not None:
+            np.copyto(plotData[chunk], chunkData)
+            np.copyto(plotData[chunk], np.nan, where=invalid)
+
+    return (data if plotData is None else plotData), connected
+
+
 def nanPercentileOfSubsampledArrayWithMask(arrayWithMask, percentiles, subsample, *args, **kwargs):
     """ Sub samples the array and then calls maskedNanPercentile on this.
 
@@ -273,6 +404,411 @@ def nanPercentileOfSubsampledArrayWithMask(arrayWithMask, percentiles, subsample
 
 
 
+class ArrayStatistics():
+    """ Statistics of the valid (not masked and not NaN) values of an ArrayWithMask.
+
+        The valid values are sorted once in the constructor. After that, percentiles are looked up
+        in the sorted values, so that all auto-range methods can share them without going through
+        the data again.
+    """
+    def __init__(self, arrayWithMask, subsample):
+        """ Constructor
+
+            :param ArrayWithMask arrayWithMask: the array to calculate the statistics from.
+            :param bool subsample: if True, the array is subsampled first (see _subsampleArray).
+        """
+        checkType(subsample, bool)
+        checkType(arrayWithMask, ArrayWithMask)
+
+        data = arrayWithMask.data
+        mask = arrayWithMask.mask
+        if subsample:
+            data = _subsampleArray(data)
+            if isAnArray(mask):
+                mask = _subsampleArray(mask)
+
+        if isAnArray(mask):
+            values = data[~mask]  # Makes a copy, which can therefore be sorted in place.
+            values.sort()
+        elif mask:
+            values = np.array([], dtype=data.dtype)
+        else:
+            values = np.sort(data, axis=None)
+
+        # NaNs are sorted to the end of the array.
+        if values.dtype.kind in 'fc':
+            numValid = int(np.searchsorted(values, np.nan))
+        else:
+            numValid = len(values)
+
+        self._values = values[:numValid]
+
+
+    @property
+    def numValid(self):
+        """ The number of values that are not masked and not NaN.
+        """
+        return len(self._values)
+
+
+    @property
+    def minimum(self):
+        """ The minimum of the valid values. NaN if there are no valid values.
+        """
+        return self._values[0] if self.numValid > 0 else np.nan
+
+
+    @property
+    def maximum(self):
+        """ The maximum of the valid values. NaN if there are no valid values.
+        """
+        return self._values[-1] if self.numValid > 0 else np.nan
+
+
+    @property
+    def finiteRange(self):
+        """ The (minimum, maximum) tuple of the finite valid values.
+
+            Returns (NaN, NaN) if there are no finite valid values.
+        """
+        if self._values.dtype.kind not in 'fc':
+            return (self.minimum, self.maximum)
+
+        # Infinite values are sorted to the start and end of the array.
+        start = np.searchsorted(self._values, -np.inf, side='right')
+        end = np.searchsorted(self._values, np.inf, side='left')
+        if start >= end:
+            return (np.nan, np.nan)
+        else:
+            return (self._values[start], self._values[end - 1])
+
+
+    def histogram(self, bins):
+        """ Returns the number of valid values per bin, like np.histogram(values, bins)[0].
+
+            The values are counted by searching the bin edges in the sorted values, so this takes
+            O(len(bins) * log(numValid)) time.
+
+            :param bins: monotonically increasing array with the bin edges.
+        """
+        edges = np.searchsorted(self._values, bins, side='left')
+        # As in np.histogram, the last bin includes its right edge.
+        edges[-1] = np.searchsorted(self._values, bins[-1], side='right')
+        return np.diff(edges)
+
+
+    def percentiles(self, percentiles):
+        """ Returns the percentiles of the valid values as an array.
+
+            Gives the same result as np.nanpercentile (with the default linear interpolation) on
+            the valid values. Returns NaNs if there are no valid values.
+        """
+        numValid = self.numValid
+        if numValid == 0:
+            return np.full(len(percentiles), np.nan)
+
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (numValid - 1)
+        lowIdx = np.floor(ranks).astype(np.intp)
+        highIdx = np.minimum(lowIdx + 1, numValid - 1)
+        weights = ranks - lowIdx
+
+        low = self._values[lowIdx].astype(np.float64)
+        high = self._values[highIdx].astype(np.float64)
+
+        # Interpolate the same way as np.percentile so that the results are identical.
+        with np.errstate(invalid='ignore'):
+            diff = high - low
+            return np.where(weights >= 0.5, high - diff * (1 - weights), low + diff * weights)
+
+
+
+class QuantileSketch():
+    """ Mergeable sketch that approximates the quantiles of a stream of values.
+
+        This is a KLL sketch with the same capacity for every level. The values at level h each
+        represent 2**h input values. When a level holds more than `capacity` values, these are
+        sorted and every other value, starting at a random offset of 0 or 1, is promoted to the
+        next level. Batches of values are added in a single vectorised pass: a batch is sorted
+        once and halved until it fits in a level.
+
+        Error bound: a promotion at level h changes the rank of any value by -2**h, 0 or +2**h,
+        with an expected change of zero. At most n / (capacity * 2**h) promotions take place at
+        level h, so for n values the rank error of a quantile has a standard deviation of less
+        than sqrt(2) * n / capacity. With the default capacity of 2**15 the rank error is therefore
+        less than 0.013% of n in 99.7% of the cases (three standard deviations). The minimum and
+        maximum are exact. If no more than `capacity` values are added, all quantiles are exact.
+
+        See: Karnin, Lang and Liberty, "Optimal Quantile Approximation in Streams", 2016.
+    """
+    def __init__(self, capacity=SKETCH_CAPACITY, seed=0):
+        """ Constructor
+
+            :param int capacity: the number of values per level.
+            :param seed: seed for the random offsets. The default makes the results reproducible.
+        """
+        assert capacity >= 2, "capacity must be at least 2, got: {}".format(capacity)
+        self._capacity = capacity
+        self._rng = np.random.default_rng(seed)
+        self._levels = []  # Sorted arrays. Level h holds values with weight 2**h.
+        self._count = 0
+        self._minimum = np.nan
+        self._maximum = np.nan
+
+
+    @classmethod
+    def fromArrayWithMask(cls, arrayWithMask, chunkSize=None, **kwargs):
+        """ Creates a sketch of the valid (not masked and not NaN) values of an ArrayWithMask.
+
+            The array is processed in chunks so that no copy of all valid values is needed.
+            The kwargs are passed on to the constructor.
+        """
+        checkType(arrayWithMask, ArrayWithMask)
+        sketch = cls(**kwargs)
+        if chunkSize is None:
+            chunkSize = SKETCH_CHUNK_SIZE
+
+        mask = arrayWithMask.mask
+        if not isAnArray(mask) and mask:
+            return sketch  # All values are masked.
+
+        # The chunks consist of complete rows so that non-contiguous arrays are not copied.
+        data = np.atleast_1d(arrayWithMask.data)
+        if isAnArray(mask):
+            mask = np.atleast_1d(mask)
+
+        rowSize = int(np.prod(data.shape[1:]))
+        rowsPerChunk = max(1, chunkSize // max(1, rowSize))
+        isFloat = data.dtype.kind in 'fc'
+        for start in range(0, len(data), rowsPerChunk):
+            chunk = data[start:start + rowsPerChunk].reshape(-1)
+            if isAnArray(mask):
+                valid = ~mask[start:start + rowsPerChunk].reshape(-1)
+                if isFloat:
+                    valid &= ~np.isnan(chunk)
+                chunk = chunk[valid]  # Makes a copy, which can therefore be sorted in place.
+                chunk.sort()
+            elif isFloat:
+                chunk = chunk[~np.isnan(chunk)]
+                chunk.sort()
+            else:
+                chunk = np.sort(chunk)
+            sketch._addSorted(chunk)
+
+        return sketch
+
+
+    @property
+    def capacity(self):
+        """ The number of values per level.
+        """
+        return self._capacity
+
+
+    @property
+    def numValid(self):
+        """ The number of values that have been added to the sketch.
+        """
+        return self._count
+
+
+    @property
+    def minimum(self):
+        """ The minimum of the values. NaN if no values have been added.
+        """
+        return self._minimum
+
+
+    @property
+    def maximum(self):
+        """ The maximum of the values. NaN if no values have been added.
+        """
+        return self._maximum
+
+
+    def update(self, values):
+        """ Adds an array of values to the sketch. The values may not contain NaNs.
+        """
+        self._addSorted(np.sort(values, axis=None))
+
+
+    def _addSorted(self, values):
+        """ Adds a sorted 1D array of values to the sketch.
+        """
+        if len(values) == 0:
+            return
+
+        if self._count == 0:
+            self._minimum, self._maximum = values[0], values[-1]
+        else:
+            self._minimum = min(self._minimum, values[0])
+            self._maximum = max(self._maximum, values[-1])
+        self._count += len(values)
+
+        # Halve the sorted batch until it fits in a level. A value that is left over when the
+        # length is odd stays behind at the current level.
+        level = 0
+        while len(values) > self._capacity:
+            if len(values) % 2 == 1:
+                self._addToLevel(level, values[-1:])
+                values = values[:-1]
+            values = values[self._rng.integers(2)::2]
+            level += 1
+
+        self._addToLevel(level, values)
+        self._compress()
+
+
+    def merge(self, other):
+        """ Adds the values of another sketch to this sketch.
+        """
+        checkType(other, QuantileSketch)
+        if other.numValid == 0:
+            return
+
+        if self._count == 0:
+            self._minimum, self._maximum = other._minimum, other._maximum
+        else:
+            self._minimum = min(self._minimum, other._minimum)
+            self._maximum = max(self._maximum, other._maximum)
+        self._count += other._count
+
+        for level, values in enumerate(other._levels):
+            self._addToLevel(level, values)
+        self._compress()
+
+
+    def _addToLevel(self, level, values):
+        """ Merges sorted values into a level.
+        """
+        while len(self._levels) <= level:
+            self._levels.append(values[:0])
+
+        if len(self._levels[level]) == 0:
+            self._levels[level] = values
+        else:
+            # Timsort is linear for the concatenation of two sorted arrays.
+            self._levels[level] = np.sort(np.concatenate((self._levels[level], values)),
+                                          kind='stable')
+
+
+    def _compress(self):
+        """ Promotes values of the levels that hold more than capacity values.
+        """
+        level = 0
+        while level < len(self._levels):
+            values = self._levels[level]
+            if len(values) > self._capacity:
+                numRemaining = len(values) % 2
+                self._levels[level] = values[len(values) - numRemaining:]
+                self._addToLevel(level + 1,
+                                 values[:len(values) - numRemaining][self._rng.integers(2)::2])
+            level += 1
+
+
+    def percentiles(self, percentiles):
+        """ Returns the approximate percentiles of the values as an array.
+
+            Uses the same linear interpolation as np.percentile. Returns NaNs if no values have
+            been added.
+        """
+        if self._count == 0:
+            return np.full(len(percentiles), np.nan)
+
+        values = np.concatenate(self._levels)
+        valueWeights = np.concatenate([np.full(len(levelValues), 2 ** level, dtype=np.int64)
+                                       for level, levelValues in enumerate(self._levels)])
+        sortIdx = np.argsort(values, kind='stable')
+        values = values[sortIdx]
+
+        # The position in the sorted input of the last value that each sketch value represents.
+        # Promotions keep the total weight equal to the count since only even numbers of values
+        # are halved.
+        lastPositions = np.cumsum(valueWeights[sortIdx]) - 1
+        assert lastPositions[-1] == self._count - 1, "Bug: total weight differs from the count"
+
+        def valuesAt(positions):
+            """ Returns the value at each position in the sorted input. """
+            idx = np.searchsorted(lastPositions, positions, side='left')
+            result = values[np.minimum(idx, len(values) - 1)].astype(np.float64)
+            result[positions <= 0] = self._minimum
+            result[positions >= self._count - 1] = self._maximum
+            return result
+
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (self._count - 1)
+        lowPos = np.floor(ranks)
+        weights = ranks - lowPos
+        low = valuesAt(lowPos)
+        high = valuesAt(np.minimum(lowPos + 1, self._count - 1))
+
+        with np.errstate(invalid='ignore'):
+            diff = high - low
+            return np.where(weights >= 0.5, high - diff * (1 - weights), low + diff * weights)
+
+
+
+def calcArrayStatistics(arrayWithMask, sampling):
+    """ Calculates the statistics of the valid values of an ArrayWithMask.
+
+        :param sampling: one of the SAMPLING_METHODS. Returns a QuantileSketch if it is
+            SAMPLING_SKETCH, and an ArrayStatistics object otherwise.
+    """
+    if sampling == SAMPLING_SKETCH:
+        return QuantileSketch.fromArrayWithMask(arrayWithMask)
+    elif sampling in (SAMPLING_OFF, SAMPLING_SUBSAMPLE):
+        return ArrayStatistics(arrayWithMask, subsample=sampling == SAMPLING_SUBSAMPLE)
+    else:
+        raise ValueError("sampling must be one of {}, got: {!r}"
+                         .format(SAMPLING_METHODS, sampling))
+
+
+
+class StatisticsCache():
+    """ Caches the statistics of the slice of an inspector and of parts of it.
+
+        The auto-range methods of all range config tree items (axes, color scale, cross plots) use
+        the same cache so that the statistics are calculated only once. The owner must call
+        invalidate when its slice changes.
+
+        Only the statistics of the most recent part of each kind are kept. E.g. when the cursor
+        moves to another row, the statistics of the previous row are removed. Otherwise the
+        cache would keep a sorted copy of every row and column the cursor passes.
+    """
+    def __init__(self):
+        """ Constructor
+        """
+        self._statistics = {}  # Maps (kind, sampling) to a (key, statistics) tuple.
+
+
+    def __len__(self):
+        return len(self._statistics)
+
+
+    def invalidate(self):
+        """ Removes all cached statistics.
+        """
+        self._statistics.clear()
+
+
+    def statistics(self, key, sampling, getArray):
+        """ Returns the statistics of the array that is returned by getArray.
+
+            :param key: hashable that identifies the array within the slice. Either None for the
+                complete slice, or a (kind, index) tuple for a part. E.g. ('row', 3) for a cross
+                section. Only the statistics of the most recent index per kind are kept.
+            :param sampling: one of the SAMPLING_METHODS, see calcArrayStatistics.
+            :param getArray: function that returns the ArrayWithMask. Is only called if the
+                statistics are not yet cached.
+        """
+        kind = key[0] if isinstance(key, tuple) else key
+        cacheKey = (kind, sampling)
+        cachedKey, statistics = self._statistics.get(cacheKey, (None, None))
+        if statistics is None or cachedKey != key:
+            statistics = calcArrayStatistics(getArray(), sampling)
+            self._statistics[cacheKey] = (key, statistics)
+        return statistics
+
+
+
 def _subsampleArray(array, targetNumElements=40000):
     """ Sub samples an array or masked array.
 
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Argos.
+#
+# Argos is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Argos is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Argos. If not, see <http://www.gnu.org/licenses/>.
+
+""" Cache for the tiles (or blocks) of slices that are read in parts.
+
+    Is used by the tiled reading of the image plot and the block reading of the table inspector.
+"""
+from __future__ import division, print_function
+
+import collections
+import logging
+
+from argos.utils.cls import isAnArray
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2
+
+
+def _tileBytes(tile):
+    """ Returns the number of bytes of an ArrayWithMask tile.
+    """
+    numBytes = tile.data.nbytes
+    if isAnArray(tile.mask):
+        numBytes += tile.mask.nbytes
+    return numBytes
+
+
+
+class TileCache(object):
+    """ Least recently used cache of tiles. The total number of bytes of the tiles is bounded.
+    """
+    def __init__(self, maxBytes=DEFAULT_CACHE_BYTES):
+        """ Constructor
+
+            :param maxBytes: maximum number of bytes of all tiles. The most recently added tile is
+                always kept, even if it's larger.
+        """
+        self._maxBytes = maxBytes
+        self._tiles = collections.OrderedDict()
+        self._numBytes = 0
+
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+
+    @property
+    def maxBytes(self):
+        """ Maximum number of bytes of all tiles.
+        """
+        return self._maxBytes
+
+
+    @property
+    def numBytes(self):
+        """ The number of bytes of all tiles in the cache.
+        """
+        return self._numBytes
+
+
+    def get(self, key):
+        """ Returns the tile with the key and marks it as most recently used. None if not cached.
+        """
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+
+    def put(self, key, tile):
+        """ Adds a tile. The least recently used tiles are removed if the cache is full.
+        """
+        if key in self._tiles:
+            self._numBytes -= _tileBytes(self._tiles.pop(key))
+
+        self._tiles[key] = tile
+        self._numBytes += _tileBytes(tile)
+
+        while self._numBytes > self._maxBytes and len(self._tiles) > 1:
+            _, oldTile = self._tiles.popitem(last=False)
+            self._numBytes -= _tileBytes(oldTile)
+
+
+    def clear(self):
+        """ Removes all tiles.
+        """
+        self._tiles.clear()
+        self._numBytes = 0
@@ -42,6 +42,8 @@ from argos.qt import Qt, QUrl, QtCore, QtGui, QtWidgets, QtSignal, QtSlot
 from argos.qt.misc import getWidgetGeom, getWidgetState
 from argos.reg.basereg import nameToIdentifier
 from argos.reg.dialog import PluginsDialog
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.fileindex import globalFileIndex
 from argos.repo.iconfactory import RtiIconFactory
 from argos.repo.registry import RtiRegistry
 from argos.repo.repotreeview import RepoWidget
@@ -131,6 +133,7 @@ class MainWindow(QtWidgets.QMainWindow):
         logger.debug("Finalizing: {}".format(self))
 
         self.testWalkDialog.finalize()
+        self.repoWidget.searchWidget.finalize()
 
         # Disconnect signals
         self.collector.sigContentsChanged.disconnect(self.collectorContentsChanged)
@@ -160,7 +163,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self._collector.sigShowMessage.connect(self.sigShowMessage)
 
         self.configWidget = ConfigWidget(self._configTreeModel)
-        self.repoWidget = RepoWidget(self.argosApplication.repo, self.collector)
+        self.repoWidget = RepoWidget(self.argosApplication.repo, self.collector,
+                                     searchIndexer=self.argosApplication.searchIndexer)
 
         # self._configTreeModel.insertItem(self.repoWidget.repoTreeView.config) # No configurable items yet
 
@@ -325,6 +329,27 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.configMenu.addSeparator()
 
+        self.useFileIndexAction = self.configMenu.addAction("Use File &Index")
+        self.useFileIndexAction.setCheckable(True)
+        self.useFileIndexAction.setToolTip(
+            "Store the tree structure and metadata of opened HDF-5 files so that they open "
+            "faster the next time.")
+        self.useFileIndexAction.toggled.connect(self.setFileIndexEnabled)
+        self.configMenu.aboutToShow.connect(
+            lambda: self.useFileIndexAction.setChecked(globalFileIndex().enabled))
+
+        self.configMenu.addAction("Clear File Index", self.clearFileIndex)
+
+        self.watchFilesAction = self.configMenu.addAction("&Watch Files for Changes")
+        self.watchFilesAction.setCheckable(True)
+        self.watchFilesAction.setToolTip(
+            "Update the opened files and expanded directories when they change on disk.")
+        self.watchFilesAction.toggled.connect(self.setFileWatchingEnabled)
+        self.configMenu.aboutToShow.connect(
+            lambda: self.watchFilesAction.setChecked(app.fileWatcher.enabled))
+
+        self.configMenu.addSeparator()
+
         self.configMenu.addAction(
             "Show Config Files...",
             lambda: self.openInExternalApp(argosConfigDirectory()))
@@ -360,6 +385,8 @@ class MainWindow(QtWidgets.QMainWindow):
             helpMenu.addAction(
                 "Walk &All Nodes",
                 lambda: self.testWalkDialog.walkAllRepoNodes(True, True), "Meta+W")  # meta works on MacOs
+            helpMenu.addAction(
+                "File Handle Pool Statistics...", self.showFileHandlePoolStatistics)
 
             helpMenu.addSeparator()
             helpMenu.addAction(self.myTestAction)
@@ -803,6 +830,16 @@ class MainWindow(QtWidgets.QMainWindow):
             :rtype fileMode: QtWidgets.QFileDialog.FileMode constant
         """
         checkIsASequence(fileNames, allowNone=True)
+
+        rtiClass = rtiRegItem.getClass(tryImport=True) if rtiRegItem else None
+        isAggregation = False
+        if rtiClass is not None:
+            # Imported here so that the plugin is only loaded when it's used.
+            from argos.repo.rtiplugins.aggregation import FileAggregationRti
+            isAggregation = issubclass(rtiClass, FileAggregationRti)
+        if isAggregation:
+            fileMode = QtWidgets.QFileDialog.Directory
+
         if fileNames is None:
             dialog = QtWidgets.QFileDialog(self, caption=caption)
 
@@ -827,21 +864,33 @@ class MainWindow(QtWidgets.QMainWindow):
             else:
                 fileNames = []
 
+            if isAggregation and fileNames:
+                # Aggregations are opened with a glob pattern in the selected directory.
+                pattern, ok = QtWidgets.QInputDialog.getText(
+                    self, caption or rtiRegItem.name, "Files to aggregate (glob pattern):",
+                    text='*')
+                fileNames = [os.path.join(fileNames[0], pattern)] if ok and pattern else []
+
             # Only add files that were added via the dialog box (not via the command line).
             self._argosApplication.addToRecentFiles(fileNames, rtiRegItemName)
 
-        fileRootIndex = None
+        if rtiClass is not None:
+            # Imported here so that the plugin is only loaded when it's used.
+            from argos.repo.rtiplugins.rawio import RawBinaryFileRti, askRawLayout
+            if issubclass(rtiClass, RawBinaryFileRti):
+                # Let the user specify the layout of raw files. Skip files where this is cancelled.
+                fileNames = [fileName for fileName in fileNames
+                             if askRawLayout(fileName, parent=self)]
 
         logger.debug("Adding files: {}".format(fileNames))
-        for fileName in fileNames:
-            fileRootIndex = self.argosApplication.repo.loadFile(fileName, rtiRegItem=rtiRegItem)
+        fileRootIndex = self.argosApplication.repo.loadFiles(fileNames, rtiRegItem=rtiRegItem)
 
         if len(fileNames) == 1: # Only expand and open the file if the user selected one.
             logger.debug("Opening file: {}".format(fileNames[0]))
             self.repoWidget.repoTreeView.setExpanded(fileRootIndex, True)
 
         # Select last opened file
-        if fileRootIndex is not None:
+        if fileRootIndex.isValid():
             self.repoWidget.repoTreeView.setCurrentIndex(fileRootIndex)
 
 
@@ -1045,6 +1094,38 @@ class MainWindow(QtWidgets.QMainWindow):
         self.testWalkDialog.raise_()
 
 
+    def showFileHandlePoolStatistics(self):
+        """ Shows the usage statistics of the file handle pool in a message box.
+        """
+        stats = globalFileHandlePool().statistics()
+        msg = "\n".join("{}: {}".format(key, value) for key, value in stats.items())
+        QtWidgets.QMessageBox.information(self, "File Handle Pool Statistics", msg)
+
+
+    @QtSlot(bool)
+    def setFileIndexEnabled(self, enabled):
+        """ Enables or disables the persistent file index.
+        """
+        globalFileIndex().enabled = enabled
+
+
+    @QtSlot(bool)
+    def setFileWatchingEnabled(self, enabled):
+        """ Enables or disables watching the files in the repository for changes.
+        """
+        self.argosApplication.fileWatcher.enabled = enabled
+
+
+    def clearFileIndex(self):
+        """ Removes all files from the persistent file index.
+        """
+        try:
+            globalFileIndex().clear()
+        except Exception as ex:
+            logger.exception("Unable to clear the file index: {}".format(ex))
+            QtWidgets.QMessageBox.warning(self, "Clear File Index", str(ex))
+
+
     @QtSlot()
     def myTest(self):
         """ Function for small ad-hoc tests that can be called from the menu.
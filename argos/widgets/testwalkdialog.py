@@ -424,6 +424,9 @@ class TestWalkDialog(QtWidgets.QDialog):
         wasOpen = self.repoTreeView.isExpanded(index)
         self.repoTreeView.setCurrentIndex(index)
         self.repoTreeView.expand(index)
+        repoModel.fetchMoreSynchronously(index)  # Children may be fetched in the background
+        while repoModel.canFetchMore(index):  # and in pages
+            repoModel.fetchMoreSynchronously(index)
 
         if self.allDetailTabsCheckBox.isChecked():
             # Try properties, attributes and quicklook tabs
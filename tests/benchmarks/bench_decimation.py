@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks the frame time of a line plot of a long series.
+
+    Compares the original path (passing all samples and a connect array of the same length to
+    the PyQtGraph plot data item) with the min/max envelope of the samples per pixel column,
+    which is used by the PgLinePlot1d when decimation is enabled.
+
+    Run with QT_QPA_PLATFORM=offscreen to render without a display.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pyqtgraph as pg
+
+from argos.qt import QtWidgets
+from argos.utils.decimation import minMaxEnvelope
+
+PLOT_WIDTH = 1000
+
+
+def createSeries(numSamples):
+    """ Returns a noisy sine wave with some gaps of NaNs and a mask with some masked samples.
+    """
+    rng = np.random.default_rng(seed=1)
+    data = np.sin(np.linspace(0, 100 * np.pi, numSamples, dtype=np.float32))
+    data += rng.normal(scale=0.1, size=numSamples).astype(np.float32)
+    data[numSamples // 3: numSamples // 3 + numSamples // 100] = np.nan
+    mask = np.zeros(numSamples, dtype=bool)
+    mask[::1013] = True
+    return data, mask
+
+
+def drawAllSamples(plotWidget, data, mask):
+    """ Draws the series the way the line plot did before decimation was added.
+    """
+    connected = np.logical_and(np.isfinite(data), ~mask)
+    plotWidget.plotItem.clear()
+    plotWidget.plotItem.addItem(pg.PlotDataItem(data, connect=connected))
+    plotWidget.grab()
+
+
+def drawEnvelope(plotWidget, data, mask):
+    """ Draws the min/max envelope of the series.
+    """
+    envelope = minMaxEnvelope(data, mask, PLOT_WIDTH)
+    plotWidget.plotItem.clear()
+    plotWidget.plotItem.addItem(pg.PlotDataItem(envelope.xs, envelope.ys,
+                                                connect=envelope.connect))
+    plotWidget.grab()
+
+
+def timeFunction(fun, plotWidget, data, mask):
+    """ Times the function and prints the frame time.
+    """
+    startTime = time.perf_counter()
+    fun(plotWidget, data, mask)
+    duration = time.perf_counter() - startTime
+    print("{:20s}: {:10.1f} ms".format(fun.__name__, duration * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--max-samples', type=int, default=10 ** 7,
+                        help="Largest number of samples. Starts at 10 thousand and multiplies "
+                        "by 10 until this number is reached.")
+    parser.add_argument('--skip-all-samples', action='store_true',
+                        help="Only time the envelope, e.g. for 200 million samples.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # Don't time the debug messages.
+
+    app = QtWidgets.QApplication([])
+    plotWidget = pg.PlotWidget()
+    plotWidget.resize(PLOT_WIDTH, 600)
+    plotWidget.show()
+    app.processEvents()
+
+    numSamples = 10 ** 4
+    while numSamples <= args.max_samples:
+        data, mask = createSeries(numSamples)
+        print("Series with {} samples".format(numSamples))
+        if not args.skip_all_samples:
+            timeFunction(drawAllSamples, plotWidget, data, mask)
+        timeFunction(drawEnvelope, plotWidget, data, mask)
+        numSamples *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks listing a large directory in the repository tree.
+
+    Compares the original path (os.listdir followed by matching every glob of every registered
+    plugin with fnmatch, plus stat calls, per file) with the DirectoryRti, which uses os.scandir
+    and the compiled RtiGlobMatcher of the registry.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from argos.repo.filesytemrtis import DirectoryRti, UnknownFileRti
+from argos.repo.registry import globalRtiRegistry, ICON_COLOR_UNKNOWN
+from argos.utils.dirs import normRealPath
+
+# Mostly files of unknown type, as in a typical data directory, and some that match a plugin.
+EXTENSIONS = ['.txt', '.log', '.h5', '.nc', '.csv', '.png', '.xyz', '']
+
+
+def createDirectory(dirName, numFiles):
+    """ Creates numFiles empty files in the directory.
+    """
+    for fileNr in range(numFiles):
+        fileName = 'file{:06d}{}'.format(fileNr, EXTENSIONS[fileNr % len(EXTENSIONS)])
+        with open(os.path.join(dirName, fileName), 'w'):
+            pass
+
+
+def legacyMatch(filePath):
+    """ Returns the first registry item that matches the path by calling fnmatch for every glob.
+    """
+    for rtiRegItem in globalRtiRegistry().items:
+        if rtiRegItem.pathNameMatchesGlobs(filePath):
+            return rtiRegItem
+    return None
+
+
+def legacyListing(dirName):
+    """ Lists the directory the way the DirectoryRti did before using os.scandir.
+
+        To be able to compare, the plugin classes are not imported and all files are created as
+        UnknownFileRti.
+    """
+    childItems = []
+    for fileName in sorted(os.listdir(dirName), key=lambda s: s.lower()):
+        if fileName.startswith('.'):
+            continue
+        filePath = os.path.join(dirName, fileName)
+        legacyMatch(os.path.normpath(os.path.abspath(filePath)))
+        os.path.isdir(filePath)
+        nodeName = os.path.basename(normRealPath(filePath))
+        childItems.append(UnknownFileRti(nodeName=nodeName, fileName=filePath,
+                                         iconColor=ICON_COLOR_UNKNOWN))
+    return childItems
+
+
+def scandirListing(dirName):
+    """ Lists the directory with os.scandir and the glob matcher, as done by the DirectoryRti.
+
+        To be able to compare, the plugin classes are not imported and all files are created as
+        UnknownFileRti.
+    """
+    globMatcher = globalRtiRegistry().globMatcher
+    childItems = []
+    with os.scandir(dirName) as scanIterator:
+        dirEntries = [entry for entry in scanIterator if not entry.name.startswith('.')]
+    dirEntries.sort(key=lambda entry: entry.name.lower())
+    for dirEntry in dirEntries:
+        globMatcher.match(os.path.normpath(os.path.abspath(dirEntry.path)))
+        dirEntry.is_dir()
+        childItems.append(UnknownFileRti(nodeName=dirEntry.name, fileName=dirEntry.path,
+                                         iconColor=ICON_COLOR_UNKNOWN))
+    return childItems
+
+
+def directoryRtiListing(dirName):
+    """ Fetches all children of a DirectoryRti, including the creation of the plugin RTIs.
+    """
+    dirRti = DirectoryRti(nodeName=os.path.basename(dirName), fileName=dirName)
+    return dirRti.fetchChildren()
+
+
+def matchLegacy(filePaths):
+    """ Only matches the file paths with the globs using fnmatch.
+    """
+    for filePath in filePaths:
+        legacyMatch(filePath)
+
+
+def matchCompiled(filePaths):
+    """ Only matches the file paths with the globs using the compiled glob matcher.
+    """
+    globMatcher = globalRtiRegistry().globMatcher
+    for filePath in filePaths:
+        globMatcher.match(filePath)
+
+
+def timeFunction(fun, arg, numFiles):
+    """ Times the function and prints its throughput.
+    """
+    startTime = time.perf_counter()
+    fun(arg)
+    duration = time.perf_counter() - startTime
+    print("{:30s}: {:8.3f} sec, {:10.0f} files/s".format(fun.__name__, duration,
+                                                         numFiles / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num-files', type=int, default=100000,
+                        help="Number of files in the generated directory.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # Don't time the debug messages.
+    globalRtiRegistry().unmarshall(None)  # Default plugins
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        createDirectory(tempDir, args.num_files)
+        filePaths = [os.path.join(tempDir, fileName) for fileName in os.listdir(tempDir)]
+        print("Directory with {} files".format(len(filePaths)))
+
+        timeFunction(matchLegacy, filePaths, args.num_files)
+        timeFunction(matchCompiled, filePaths, args.num_files)
+        timeFunction(legacyListing, tempDir, args.num_files)
+        timeFunction(scandirListing, tempDir, args.num_files)
+        timeFunction(directoryRtiListing, tempDir, args.num_files)
+
+
+if __name__ == '__main__':
+    main()
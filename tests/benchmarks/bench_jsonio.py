@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks the throughput of the different ways to read JSON files.
+
+    Compares the original path (erasing comments in Python before parsing), the fast path that
+    uses the C JSON decoder directly, and the indexing that is used for incremental parsing.
+"""
+import argparse
+import json
+import mmap
+import os
+import tempfile
+import time
+
+from argos.external.json_with_comments import parse_json_with_comments_file
+from argos.repo.rtiplugins.jsonio import loadJsonFile, indexJsonContainer
+
+
+def createJsonFile(fileName, numRecords):
+    """ Writes a JSON file with an object of numRecords records.
+    """
+    data = {
+        "record-{}".format(nr): {
+            "name": "http://example.com/item/{}".format(nr),
+            "values": list(range(nr % 50)),
+            "valid": nr % 2 == 0,
+        } for nr in range(numRecords)}
+
+    with open(fileName, 'w') as jsonFile:
+        json.dump(data, jsonFile)
+
+
+def indexFile(fileName):
+    """ Memory maps and indexes the top-level container of the file.
+    """
+    with open(fileName, 'rb') as jsonFile:
+        buffer = mmap.mmap(jsonFile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return indexJsonContainer(buffer)
+    finally:
+        buffer.close()
+
+
+def timeFunction(fun, fileName, fileSizeMb):
+    """ Times the function and prints its throughput.
+    """
+    startTime = time.perf_counter()
+    fun(fileName)
+    duration = time.perf_counter() - startTime
+    print("{:30s}: {:8.3f} sec, {:8.1f} MB/s".format(fun.__name__, duration, fileSizeMb / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num-records', type=int, default=100000,
+                        help="Number of records in the generated JSON file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        fileName = os.path.join(tempDir, 'bench.json')
+        createJsonFile(fileName, args.num_records)
+        fileSizeMb = os.path.getsize(fileName) / 1024 ** 2
+        print("File size: {:.1f} MB".format(fileSizeMb))
+
+        timeFunction(parse_json_with_comments_file, fileName, fileSizeMb)
+        timeFunction(loadJsonFile, fileName, fileSizeMb)
+        timeFunction(indexFile, fileName, fileSizeMb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks the statistics that are used by the auto-range methods.
+
+    Compares the exact percentiles of all data, of a strided subsample and of a QuantileSketch.
+    Prints the duration and the rank error of the 1% and 99% percentiles (in percent of the
+    number of values). The periodic input shows the aliasing of the strided subsample.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from argos.utils.masks import ArrayWithMask, SAMPLING_METHODS, calcArrayStatistics
+
+PERCENTILES = (1, 99)
+
+
+def createData(kind, shape):
+    """ Returns a float32 image with random or periodic values.
+    """
+    if kind == 'random':
+        rng = np.random.default_rng(seed=1)
+        return rng.standard_gamma(2.0, size=shape).astype(np.float32)
+    elif kind == 'periodic':
+        # Narrow peaks every 100 columns, which a stride that is a multiple of 100 misses.
+        cols = np.arange(shape[1])
+        row = np.where(cols % 100 < 3, 10.0, 0.0) + np.sin(cols / 7.0)
+        return np.tile(row.astype(np.float32), (shape[0], 1))
+    else:
+        raise ValueError("Unknown kind: {}".format(kind))
+
+
+def rankErrors(sortedData, values):
+    """ Returns the rank errors of the percentile values in percent.
+    """
+    lowRanks = np.searchsorted(sortedData, values, side='left')
+    highRanks = np.searchsorted(sortedData, values, side='right')
+    targets = np.array(PERCENTILES) / 100 * len(sortedData)
+    errors = np.where(targets < lowRanks, lowRanks - targets,
+                      np.where(targets > highRanks, targets - highRanks, 0))
+    return 100 * errors / len(sortedData)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--size', type=int, default=5000,
+                        help="Number of rows and columns of the image.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    shape = (args.size, args.size)
+    for kind in ['random', 'periodic']:
+        data = createData(kind, shape)
+        sortedData = np.sort(data, axis=None)
+        print("{} {}".format(kind, shape))
+        for sampling in SAMPLING_METHODS:
+            startTime = time.perf_counter()
+            statistics = calcArrayStatistics(ArrayWithMask(data, False, 0), sampling)
+            values = statistics.percentiles(PERCENTILES)
+            duration = time.perf_counter() - startTime
+            errors = rankErrors(sortedData, values)
+            print("    {:10s}: {:10.3f} ms, rank errors: {}"
+                  .format(sampling, duration * 1000, np.round(errors, 4)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks preparing slices for plotting.
+
+    Compares the original multi-pass sanitisation of the plot inspectors (np.isfinite, a logical
+    and with the inverted mask and two replaceMaskedValueWithFloat calls, which each copy the
+    data) with sanitizeForPlotting, which does it in one chunked pass with reused buffers.
+
+    The 1D inputs correspond to a line plot or a cross section of the image plot, the 2D inputs
+    to a complete image.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from argos.utils.masks import PlotBuffers, replaceMaskedValueWithFloat, sanitizeForPlotting
+
+
+def createData(shape, dtype):
+    """ Returns data with some infinite values and a mask with some masked values.
+    """
+    rng = np.random.default_rng(seed=1)
+    data = (rng.random(shape) * 1000).astype(dtype)
+    if data.dtype.kind == 'f':
+        data.flat[::997] = np.inf
+    mask = np.zeros(shape, dtype=bool)
+    mask.flat[::1013] = True
+    return data, mask
+
+
+def multiPass(data, mask, buffers):
+    """ Sanitizes the data the way the plot inspectors did before sanitizeForPlotting was added.
+    """
+    connected = np.isfinite(data)
+    connected = np.logical_and(connected, ~mask)
+    plotData = replaceMaskedValueWithFloat(data, np.logical_not(connected), np.nan,
+                                           copyOnReplace=True)
+    plotData = replaceMaskedValueWithFloat(plotData, np.isinf(plotData), np.nan,
+                                           copyOnReplace=True)
+    return plotData, connected
+
+
+def fused(data, mask, buffers):
+    """ Sanitizes the data in a single pass.
+    """
+    return sanitizeForPlotting(data, mask, replaceMasked=True, buffers=buffers)
+
+
+def timeFunction(fun, data, mask, repeat):
+    """ Times the function and prints the mean duration per call.
+    """
+    buffers = PlotBuffers()
+    fun(data, mask, buffers)  # Allocates the buffers
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        fun(data, mask, buffers)
+    duration = (time.perf_counter() - startTime) / repeat
+    print("    {:12s}: {:10.3f} ms".format(fun.__name__, duration * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help="Number of times each function is called per input.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    shapes = [(2000,), (10 ** 5,), (10 ** 7,), (1000, 1000), (4000, 4000)]
+    for dtype in [np.float32, np.float64, np.uint16]:
+        for shape in shapes:
+            data, mask = createData(shape, dtype)
+            print("{} {}".format(np.dtype(dtype).name, shape))
+            timeFunction(multiPass, data, mask, args.repeat)
+            timeFunction(fused, data, mask, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
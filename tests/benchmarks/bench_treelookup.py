@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks the row and name lookups in the tree models.
+
+    Times BaseTreeModel.parent (called by Qt for every index while scrolling) and
+    findByNodePath for the last child of a group, with a varying number of siblings. Since the
+    row numbers are stored in the items and the children are indexed by name, the durations
+    should not depend on the number of siblings.
+
+    The garbage collector is disabled while timing, as timeit does. Otherwise its collections,
+    which scan all items of the tree, dominate the durations of the largest trees.
+"""
+import argparse
+import gc
+import logging
+import time
+
+from argos.qt.treemodels import BaseTreeModel
+from argos.qt.treeitems import BaseTreeItem
+
+
+def createModel(numSiblings):
+    """ Returns a (model, lastIndex, lastPath) tuple for a model with numSiblings children in a
+        group, and numSiblings siblings of the group's parent.
+    """
+    model = BaseTreeModel()
+    parentItem = BaseTreeItem('parent')
+    parentIndex = model.insertItem(parentItem)
+    parentItem.insertChild(BaseTreeItem('group'))
+    groupIndex = model.index(0, 0, parentIndex)
+    childItems = [BaseTreeItem('child{}'.format(nr)) for nr in range(numSiblings)]
+    model.insertItems(childItems, parentIndex=groupIndex)
+
+    # The parent's siblings are the children of the invisible root.
+    model.insertItems([BaseTreeItem('sibling{}'.format(nr)) for nr in range(numSiblings)],
+                      position=0)
+    lastIndex = model.index(numSiblings - 1, 0, groupIndex)
+    lastPath = 'parent/group/child{}'.format(numSiblings - 1)
+    return model, lastIndex, lastPath
+
+
+def timeLookups(numSiblings, repeat):
+    """ Returns the mean duration of looking up the parent index and path of the last child.
+    """
+    model, lastIndex, lastPath = createModel(numSiblings)
+    rootItem = model.invisibleRootTreeItem
+    rootItem.findByNodePath(lastPath)  # Builds the name indices
+
+    gc.disable()
+    try:
+        startTime = time.perf_counter()
+        for _ in range(repeat):
+            model.parent(model.parent(lastIndex))  # As done by Qt while scrolling
+            rootItem.findByNodePath(lastPath)
+        return (time.perf_counter() - startTime) / repeat
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat', type=int, default=2000,
+                        help="Number of lookups per number of siblings.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for numSiblings in [100, 10000, 100000, 1000000]:
+        duration = timeLookups(numSiblings, args.repeat)
+        print("{:8d} siblings: {:8.2f} us per lookup".format(numSiblings, duration * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the aggregation of multiple files
+
+"""
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.registry import globalRtiRegistry
+from argos.repo.rtiplugins import aggregation
+from argos.repo.rtiplugins.aggregation import (
+    ConcatenatedFilesRti, StackedFilesRti, aggregationFileNames)
+
+
+class TestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        if not globalRtiRegistry().items:
+            globalRtiRegistry().unmarshall(None)  # Use the default plugins
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.numFiles = 9
+        self.rowCounts = [3 + fileNr % 4 for fileNr in range(self.numFiles)]
+        self.stackData = []
+        self.concatData = []
+        for fileNr in range(self.numFiles):
+            stackArray = np.full((4, 5), fileNr, dtype=np.float32) + np.arange(5)
+            concatArray = np.arange(self.rowCounts[fileNr] * 2).reshape(-1, 2) + 100 * fileNr
+            self.stackData.append(stackArray)
+            self.concatData.append(concatArray)
+
+            fileName = os.path.join(self.tempDir.name, 'day{:02d}.h5'.format(fileNr))
+            with h5py.File(fileName, 'w') as h5File:
+                group = h5File.create_group('group')
+                group.create_dataset('stack', data=stackArray)
+                h5File.create_dataset('concat', data=concatArray)
+                if fileNr > 0:
+                    h5File.create_dataset('extra', data=np.zeros(3))  # Missing in first file
+                if fileNr != 4:
+                    h5File.create_dataset('partial', data=np.zeros(3))  # Missing in one file
+
+        with open(os.path.join(self.tempDir.name, 'readme.txt'), 'w') as textFile:
+            textFile.write("Not included")
+
+        self.pattern = os.path.join(self.tempDir.name, '*.h5')
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+
+    def _openAggregation(self, rtiClass):
+        aggRti = rtiClass(nodeName='*.h5', fileName=self.pattern)
+        for childItem in aggRti.fetchChildren():
+            aggRti.insertChild(childItem)
+        self.assertIsNone(aggRti.exception)
+        return aggRti
+
+
+    def test_file_names(self):
+
+        self.assertEqual(len(aggregationFileNames(self.pattern)), self.numFiles)
+        self.assertEqual(len(aggregationFileNames(self.tempDir.name)), self.numFiles + 1)
+
+
+    def test_stacked(self):
+
+        aggRti = self._openAggregation(StackedFilesRti)
+        try:
+            self.assertTrue(aggRti.canFetchInBackground())  # HDF-5 files can be opened in a thread
+
+            # The concat arrays differ in shape so can't be stacked. Extra and partial are missing
+            self.assertEqual([child.nodeName for child in aggRti.childItems], ['group'])
+            groupRti = aggRti.childItems[0]
+            stackRti = groupRti.fetchChildren()[0]
+            self.assertEqual(stackRti.arrayShape, (self.numFiles, 4, 5))
+            self.assertEqual(stackRti.dimensionNames[0], aggregation.STACK_DIM_NAME)
+
+            expected = np.stack(self.stackData)
+            for index in [Ellipsis, 3, (slice(2, 7), 1), (slice(None, None, -2), 0, slice(1, 3)),
+                          (slice(4, 4), ), (-1, Ellipsis, 2)]:
+                np.testing.assert_array_equal(stackRti[index], expected[index],
+                                              err_msg=str(index))
+        finally:
+            aggRti.finalize()
+
+
+    def test_concatenated(self):
+
+        pool = globalFileHandlePool()
+        oldMaxOpenFiles = pool.maxOpenFiles
+        pool.maxOpenFiles = 2
+        aggRti = self._openAggregation(ConcatenatedFilesRti)
+        try:
+            self.assertEqual([child.nodeName for child in aggRti.childItems], ['concat', 'group'])
+            concatRti = aggRti.childItems[0]
+            self.assertEqual(concatRti.arrayShape, (sum(self.rowCounts), 2))
+
+            expected = np.concatenate(self.concatData)
+            for index in [Ellipsis, 0, -1, 7, (slice(2, 30, 4), 1), (slice(None, None, -3), ),
+                          (slice(40, 1, -5), slice(None)), (slice(11, 11), ), (slice(5, 6), )]:
+                np.testing.assert_array_equal(concatRti[index], expected[index],
+                                              err_msg=str(index))
+                self.assertLessEqual(pool.numOpenFiles, pool.maxOpenFiles)
+
+            # The member files are registered with the file handle pool.
+            self.assertEqual(len(aggRti._fileRtis), self.numFiles)
+            numOpen = sum(not fileRti.isFileHandleReleased for fileRti in aggRti._fileRtis.values())
+            self.assertLessEqual(numOpen, pool.maxOpenFiles)
+        finally:
+            pool.maxOpenFiles = oldMaxOpenFiles
+            aggRti.finalize()
+        self.assertEqual(pool.numOpenFiles, 0)
+
+
+    def test_flat_files(self):
+
+        data = [np.arange(6).reshape(2, 3) + 10 * fileNr for fileNr in range(3)]
+        for fileNr, array in enumerate(data):
+            np.save(os.path.join(self.tempDir.name, 'flat{}.npy'.format(fileNr)), array)
+
+        pattern = os.path.join(self.tempDir.name, '*.npy')
+        for rtiClass, combine in [(StackedFilesRti, np.stack),
+                                  (ConcatenatedFilesRti, np.concatenate)]:
+            aggRti = rtiClass(nodeName='*.npy', fileName=pattern)
+            try:
+                childItems = aggRti.fetchChildren()
+                self.assertIsNone(aggRti.exception)
+                self.assertEqual(len(childItems), 1)
+                np.testing.assert_array_equal(childItems[0][...], combine(data))
+                self.assertEqual(aggRti._fileRtis, {})  # Numpy files are not kept open.
+            finally:
+                aggRti.finalize()
+
+
+    def test_probe_cache_size(self):
+
+        oldMaxFiles = aggregation.MAX_PROBE_CACHE_FILES
+        aggregation.MAX_PROBE_CACHE_FILES = 3
+        try:
+            aggregation._PROBE_CACHE.clear()
+            aggRti = self._openAggregation(StackedFilesRti)
+            aggRti.finalize()
+            self.assertEqual(len(aggregation._PROBE_CACHE), 3)
+            lastFileName = aggregationFileNames(self.pattern)[-1]
+            self.assertEqual(list(aggregation._PROBE_CACHE)[-1][0], lastFileName)
+        finally:
+            aggregation.MAX_PROBE_CACHE_FILES = oldMaxFiles
+
+
+if __name__ == '__main__':
+    unittest.main()
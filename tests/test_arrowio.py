@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the Parquet and Arrow IPC plugin
+
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from argos.repo.rtiplugins.arrowio import ArrowIpcFileRti, ParquetFileRti, arrowToNumpy
+
+
+class TestArrowFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.numRows = 1000
+        self.ints = np.arange(self.numRows, dtype=np.int32)
+        self.floats = np.linspace(0, 1, self.numRows)
+        self.table = pa.table({
+            'ints': self.ints,
+            'floats': self.floats,
+            'nullable': pa.array([None if i % 7 == 0 else i for i in range(self.numRows)],
+                                 type=pa.int64()),
+        })
+
+        self.parquetFileName = os.path.join(self.tempDir.name, 'test.parquet')
+        pq.write_table(self.table, self.parquetFileName, row_group_size=128)
+
+        self.arrowFileName = os.path.join(self.tempDir.name, 'test.arrow')
+        with pa.OSFile(self.arrowFileName, 'wb') as sink:
+            with pa.ipc.new_file(sink, self.table.schema) as writer:
+                for batch in self.table.to_batches(max_chunksize=100):
+                    writer.write_batch(batch)
+
+        self.streamFileName = os.path.join(self.tempDir.name, 'test.arrows')
+        with pa.OSFile(self.streamFileName, 'wb') as sink:
+            with pa.ipc.new_stream(sink, self.table.schema) as writer:
+                writer.write_table(self.table, max_chunksize=300)
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+
+    def test_zero_copy(self):
+
+        arrowArray = pa.array(self.floats)
+        array = arrowToNumpy(arrowArray)
+        self.assertEqual(array.ctypes.data, arrowArray.buffers()[1].address)
+
+        masked = arrowToNumpy(pa.array([1, None, 3], type=pa.int16()))
+        self.assertEqual(masked.dtype, np.int16)
+        np.testing.assert_array_equal(masked.mask, [False, True, False])
+
+        booleans = arrowToNumpy(pa.array([True, None, False, None]))
+        self.assertEqual(booleans.dtype, np.bool_)
+        np.testing.assert_array_equal(booleans.mask, [False, True, False, True])
+        np.testing.assert_array_equal(booleans.compressed(), [True, False])
+
+
+    def test_read_columns(self):
+
+        nullableMask = np.arange(self.numRows) % 7 == 0
+        for rtiClass, fileName in [(ParquetFileRti, self.parquetFileName),
+                                   (ArrowIpcFileRti, self.arrowFileName),
+                                   (ArrowIpcFileRti, self.streamFileName)]:
+            fileRti = rtiClass(nodeName=os.path.basename(fileName), fileName=fileName)
+            fileRti.open()
+            try:
+                self.assertIsNone(fileRti.exception)
+                self.assertEqual(fileRti.numRows, self.numRows)
+                intsRti, floatsRti, nullableRti = fileRti.fetchChildren()
+                self.assertEqual(intsRti.nodeName, 'ints')
+                self.assertEqual(intsRti.arrayShape, (self.numRows, ))
+
+                for index in [slice(None), slice(90, 310), slice(250, 20, -3), slice(5, 5),
+                              (slice(None, None, 77),), 555, -1, Ellipsis, [3, 1, 999]]:
+                    np.testing.assert_array_equal(intsRti[index], self.ints[index],
+                                                  err_msg=str(index))
+                    np.testing.assert_array_equal(floatsRti[index], self.floats[index],
+                                                  err_msg=str(index))
+
+                nullable = nullableRti[95:205]
+                np.testing.assert_array_equal(nullable.mask, nullableMask[95:205])
+                np.testing.assert_array_equal(nullable.compressed(),
+                                              self.ints[95:205][~nullableMask[95:205]])
+
+                with self.assertRaises(IndexError):
+                    intsRti[self.numRows]
+            finally:
+                fileRti.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the min/max decimation of long series.
+"""
+import math
+import unittest
+
+import numpy as np
+
+from argos.utils import decimation
+from argos.utils.decimation import Envelope, minMaxEnvelope
+
+
+def validSamples(data, mask):
+    """ Returns a boolean array that is True for finite, unmasked samples.
+    """
+    valid = np.isfinite(data)
+    if isinstance(mask, np.ndarray):
+        valid &= ~mask
+    return valid
+
+
+
+class TestMinMaxEnvelope(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(seed=42)
+        self.oldChunkSize = decimation.MAX_CHUNK_SIZE
+
+
+    def tearDown(self):
+        decimation.MAX_CHUNK_SIZE = self.oldChunkSize
+
+
+    def checkEnvelope(self, data, mask, numColumns, start, stop):
+        """ Compares the envelope with the minimum and maximum of every bucket.
+        """
+        envelope = minMaxEnvelope(data, mask, numColumns, start, stop)
+        valid = validSamples(data, mask)
+        xs = envelope.xs
+
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertTrue(np.all(valid[xs]))
+        np.testing.assert_array_equal(envelope.ys, data[xs])
+
+        for nr in range(len(xs) - 1):
+            self.assertEqual(envelope.connect[nr], valid[xs[nr]:xs[nr + 1]].all(),
+                             msg="Point {} of {}".format(nr, envelope))
+        if len(xs) > 0:
+            self.assertFalse(envelope.connect[-1])
+
+        bucketSize = math.ceil((stop - start) / numColumns)
+        if bucketSize <= decimation.MIN_BUCKET_SIZE:
+            bucketSize = 1
+
+        for bucketStart in range(start, stop, bucketSize):
+            bucketStop = min(stop, bucketStart + bucketSize)
+            bucketValid = valid[bucketStart:bucketStop]
+            inBucket = (xs >= bucketStart) & (xs < bucketStop)
+            if bucketValid.any():
+                bucketData = data[bucketStart:bucketStop][bucketValid]
+                self.assertLessEqual(np.count_nonzero(inBucket), 4)
+                self.assertEqual(envelope.ys[inBucket].min(), bucketData.min())
+                self.assertEqual(envelope.ys[inBucket].max(), bucketData.max())
+            else:
+                self.assertFalse(inBucket.any())
+
+        return envelope
+
+
+    def test_random(self):
+
+        for chunkSize in [7, 100, self.oldChunkSize]:
+            decimation.MAX_CHUNK_SIZE = chunkSize
+            for _ in range(20):
+                numSamples = int(self.rng.integers(1, 2000))
+                data = self.rng.normal(size=numSamples)
+                data[self.rng.random(numSamples) < 0.05] = np.nan
+                mask = self.rng.random(numSamples) < self.rng.choice([0.0, 0.01, 0.5])
+                numColumns = int(self.rng.integers(1, 100))
+                start = int(self.rng.integers(0, numSamples))
+                stop = int(self.rng.integers(start, numSamples + 1))
+                self.checkEnvelope(data, mask, numColumns, start, stop)
+
+
+    def test_integers(self):
+
+        data = self.rng.integers(-100, 100, size=1000).astype(np.int16)
+        data[10] = np.iinfo(np.int16).max
+        mask = np.zeros(len(data), dtype=bool)
+        mask[5:9] = True
+        self.checkEnvelope(data, False, 10, 0, len(data))
+        self.checkEnvelope(data, mask, 10, 0, len(data))
+
+
+    def test_peaks_preserved(self):
+
+        data = np.zeros(1000000)
+        data[123457] = 5
+        data[876543] = -7
+        envelope = self.checkEnvelope(data, False, 500, 0, len(data))
+        self.assertLessEqual(len(envelope), 4 * 500)
+        self.assertEqual(envelope.ys.max(), 5)
+        self.assertEqual(envelope.ys.min(), -7)
+        self.assertTrue(envelope.connect[:-1].all())
+
+
+    def test_masked(self):
+
+        data = np.arange(100.0)
+        self.assertEqual(len(minMaxEnvelope(data, True, 10)), 0)
+        self.assertEqual(len(minMaxEnvelope(data, np.ones(100, dtype=bool), 10)), 0)
+        self.assertEqual(len(minMaxEnvelope(data, False, 10, 50, 50)), 0)
+
+        # With few samples per column all valid samples are returned.
+        envelope = minMaxEnvelope(data, data % 10 == 3, 50)
+        self.assertEqual(len(envelope), 90)
+
+
+    def test_select(self):
+
+        data = np.sin(np.arange(10000) / 100)
+        overview = minMaxEnvelope(data, False, 100)
+        detail = minMaxEnvelope(data, False, 100, 4000, 5000)
+        envelope = Envelope.concatenate([overview.select(0, 4000), detail,
+                                         overview.select(5000, len(data))])
+        self.assertTrue(np.all(np.diff(envelope.xs) > 0))
+        self.assertEqual(envelope.xs[0], 0)
+        self.assertEqual(envelope.xs[-1], len(data) - 1)
+        self.assertFalse(envelope.connect[np.searchsorted(envelope.xs, 4000) - 1])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests reading Exdir files
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    import exdir
+except ImportError:
+    exdir = None
+
+from argos.repo.registry import globalRtiRegistry
+
+if exdir is not None:
+    from argos.repo.rtiplugins.exdir import (
+        ExdirDatasetRti, ExdirFieldRti, ExdirFileRti, ExdirGroupRti, ExdirRawRti)
+
+
+def fetchAll(item):
+    """ Fetches and inserts the children of the item and all its descendants.
+    """
+    if item.canFetchChildren():
+        item.insertChildren(item.fetchChildren())
+    for childItem in item.childItems:
+        fetchAll(childItem)
+
+
+@unittest.skipUnless(exdir, "The exdir package is not installed")
+class TestExdirFileHandles(unittest.TestCase):
+
+    def setUp(self):
+        if not globalRtiRegistry().items:
+            globalRtiRegistry().unmarshall(None)  # Use the default plugins
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tempDir.name, 'test.exdir')
+        self.data = np.arange(12).reshape(3, 4)
+        self.table = np.zeros(3, dtype=[('a', np.int32), ('b', np.float64)])
+        self.table['a'] = [1, 2, 3]
+        self.table['b'] = [0.5, 1.5, 2.5]
+
+        exdirFile = exdir.File(self.fileName, 'w')
+        group = exdirFile.require_group('group')
+        dataset = group.require_dataset('data', data=self.data)
+        group.require_dataset('table', data=self.table)
+        raw = dataset.require_raw('raw')
+        with open(os.path.join(str(raw.directory), 'notes.txt'), 'w') as textFile:
+            textFile.write("notes")
+        group.require_raw('groupRaw')
+        exdirFile.close()
+
+        self.fileRti = ExdirFileRti.createFromFileName(self.fileName, '#00FF00')
+        fetchAll(self.fileRti)
+
+
+    def tearDown(self):
+        self.fileRti.finalize()
+        self.tempDir.cleanup()
+
+
+    def test_tree(self):
+
+        groupRti = self.fileRti.childByNodeName('group')
+        self.assertIsInstance(groupRti, ExdirGroupRti)
+        self.assertIsInstance(groupRti.childByNodeName('data'), ExdirDatasetRti)
+        self.assertIsInstance(groupRti.childByNodeName('groupRaw'), ExdirRawRti)
+        self.assertIsInstance(groupRti.childByNodeName('table').childByNodeName('b'),
+                              ExdirFieldRti)
+        rawRti = groupRti.childByNodeName('data').childByNodeName('raw')
+        self.assertIsInstance(rawRti, ExdirRawRti)
+        self.assertEqual([child.nodeName for child in rawRti.childItems], ['notes.txt'])
+
+
+    def test_release_and_reopen(self):
+
+        groupRti = self.fileRti.childByNodeName('group')
+        dataRti = groupRti.childByNodeName('data')
+        fieldRti = groupRti.childByNodeName('table').childByNodeName('b')
+        rawRti = dataRti.childByNodeName('raw')
+        groupRawRti = groupRti.childByNodeName('groupRaw')
+
+        for _ in range(2):
+            self.fileRti.releaseFileHandle()
+            self.assertTrue(self.fileRti.isFileHandleReleased)
+
+            # Reading any item reopens the file and refreshes all items.
+            np.testing.assert_array_equal(dataRti[1:, ::2], self.data[1:, ::2])
+            self.assertFalse(self.fileRti.isFileHandleReleased)
+            np.testing.assert_array_equal(fieldRti[(slice(None), )], self.table['b'])
+            self.assertEqual(groupRti.attributes, {})
+            self.assertTrue(os.path.isdir(str(rawRti._exdirRaw.directory)))
+            self.assertTrue(os.path.isdir(str(groupRawRti._exdirRaw.directory)))
+            for item in (groupRti, dataRti, fieldRti, rawRti, groupRawRti):
+                self.assertIsNone(item.exception, msg=item.nodePath)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
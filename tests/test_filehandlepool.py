@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the file handle pool
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import h5py
+import numpy as np
+from netCDF4 import Dataset
+
+from argos.qt import QtWidgets
+from argos.repo.filehandlepool import FileHandlePool, globalFileHandlePool
+from argos.repo.repotreemodel import _fetchExecutor
+from argos.repo.rtiplugins.hdf5 import H5pyFileRti
+from argos.repo.rtiplugins.ncdf import NcdfFileRti
+
+
+class TestFileHandlePool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        self.pool = globalFileHandlePool()
+        self.oldCfg = self.pool.marshall()
+        self.pool.releaseAll()
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.data = np.arange(12, dtype=np.float64).reshape(3, 4)
+
+        self.h5FileNames = []
+        for fileNr in range(2):
+            fileName = os.path.join(self.tempDir.name, 'file{}.h5'.format(fileNr))
+            with h5py.File(fileName, 'w') as h5File:
+                group = h5File.create_group('group')
+                group.create_dataset('data', data=self.data + fileNr)
+            self.h5FileNames.append(fileName)
+
+        self.ncFileName = os.path.join(self.tempDir.name, 'file.nc')
+        with Dataset(self.ncFileName, 'w') as ncFile:
+            group = ncFile.createGroup('group')
+            group.createDimension('y', 3)
+            group.createDimension('x', 4)
+            var = group.createVariable('data', 'f8', ('y', 'x'))
+            var[:] = self.data
+
+
+    def tearDown(self):
+        self.pool.releaseAll()
+        self.pool.unmarshall(self.oldCfg)
+        self.tempDir.cleanup()
+
+
+    def _openFile(self, rtiClass, fileName):
+        fileRti = rtiClass(nodeName=os.path.basename(fileName), fileName=fileName)
+        fileRti.open()
+        for childItem in fileRti.fetchChildren():
+            fileRti.insertChild(childItem)
+        return fileRti
+
+
+    def _dataRti(self, fileRti):
+        groupRti = fileRti.childByNodeName('group')
+        for childItem in groupRti.fetchChildren():
+            groupRti.insertChild(childItem)
+        return groupRti.childByNodeName('data')
+
+
+    def test_least_recently_used(self):
+
+        self.pool.maxOpenFiles = 1
+        fileRti0 = self._openFile(H5pyFileRti, self.h5FileNames[0])
+        dataRti0 = self._dataRti(fileRti0)
+        fileRti1 = self._openFile(H5pyFileRti, self.h5FileNames[1])
+        dataRti1 = self._dataRti(fileRti1)
+        try:
+            self.assertTrue(fileRti0.isOpen)
+            self.assertTrue(fileRti0.isFileHandleReleased)
+            self.assertFalse(fileRti1.isFileHandleReleased)
+            self.assertEqual(self.pool.numOpenFiles, 1)
+
+            # Accessing the dataset reopens the file transparently and releases the other one.
+            np.testing.assert_array_equal(dataRti0[1:, ::2], self.data[1:, ::2])
+            self.assertFalse(fileRti0.isFileHandleReleased)
+            self.assertTrue(fileRti1.isFileHandleReleased)
+
+            np.testing.assert_array_equal(dataRti1[...], self.data + 1)
+            self.assertTrue(fileRti0.isFileHandleReleased)
+            self.assertGreaterEqual(self.pool.statistics()['reopened'], 2)
+        finally:
+            fileRti0.close()
+            fileRti1.close()
+
+        self.assertEqual(self.pool.numOpenFiles, 0)
+
+
+    def test_netcdf(self):
+
+        fileRti = self._openFile(NcdfFileRti, self.ncFileName)
+        dataRti = self._dataRti(fileRti)
+        try:
+            fileRti.releaseFileHandle()
+            self.assertTrue(fileRti.isFileHandleReleased)
+            self.assertEqual(dataRti.arrayShape, (3, 4))
+            self.assertFalse(fileRti.isFileHandleReleased)
+
+            fileRti.releaseFileHandle()
+            np.testing.assert_array_equal(dataRti[:, 1], self.data[:, 1])
+            self.assertEqual(list(dataRti.dimensionNames), ['y', 'x'])
+        finally:
+            fileRti.close()
+
+
+    def test_release_in_gui_thread(self):
+
+        self.pool.maxOpenFiles = 1
+        ncFileRti = self._openFile(NcdfFileRti, self.ncFileName)
+        h5FileRti = H5pyFileRti(nodeName='file0.h5', fileName=self.h5FileNames[0])
+
+        closeThreads = []
+        closeResources = ncFileRti._closeResources
+
+        def recordThread():
+            closeThreads.append(threading.current_thread())
+            closeResources()
+
+        ncFileRti._closeResources = recordThread
+        try:
+            # Opening the HDF-5 file in the fetch thread doesn't release the NetCDF file there.
+            _fetchExecutor().submit(h5FileRti.open).result()
+            self.assertFalse(h5FileRti.isFileHandleReleased)
+            self.assertFalse(ncFileRti.isFileHandleReleased)
+            self.assertEqual(self.pool.numOpenFiles, 2)
+
+            QtWidgets.QApplication.processEvents()
+            self.assertTrue(ncFileRti.isFileHandleReleased)
+            self.assertEqual(closeThreads, [threading.main_thread()])
+            self.assertEqual(self.pool.numOpenFiles, 1)
+        finally:
+            h5FileRti.close()
+            ncFileRti.close()
+
+
+    def test_refresh_errors(self):
+
+        fileName = self.h5FileNames[0]
+        with h5py.File(fileName, 'a') as h5File:
+            h5File['group'].create_dataset('other', data=self.data * 2)
+
+        fileRti = self._openFile(H5pyFileRti, fileName)
+        dataRti = self._dataRti(fileRti)
+        groupRti = dataRti.parentItem
+        otherRti = groupRti.childByNodeName('other')
+
+        # A file that is stored in the file has its own file handle (e.g. in Exdir raw data).
+        nestedRti = H5pyFileRti(nodeName='nested.h5', fileName=self.h5FileNames[1])
+        groupRti.insertChild(nestedRti)
+        try:
+            fileRti.releaseFileHandle()
+            with h5py.File(fileName, 'a') as h5File:
+                del h5File['group/data']
+
+            # Refreshing the removed dataset fails, the other items are still refreshed.
+            np.testing.assert_array_equal(otherRti[...], self.data * 2)
+            self.assertIsInstance(dataRti.exception, KeyError)
+            self.assertIsNone(otherRti.exception)
+            self.assertIsNone(nestedRti.exception)
+            self.assertFalse(nestedRti.isOpen)
+        finally:
+            fileRti.finalize()
+
+
+    def test_idle_timeout(self):
+
+        fileRti = self._openFile(H5pyFileRti, self.h5FileNames[0])
+        try:
+            self.pool.idleTimeout = 60
+            self.pool.releaseIdleFiles()
+            self.assertFalse(fileRti.isFileHandleReleased)
+
+            numReleased = self.pool.statistics()['released (idle)']
+            self.pool.idleTimeout = 0.01
+            time.sleep(0.02)
+            self.pool.releaseIdleFiles()
+            self.assertTrue(fileRti.isFileHandleReleased)
+            self.assertEqual(self.pool.statistics()['released (idle)'], numReleased + 1)
+        finally:
+            fileRti.close()
+
+
+    def test_excluded_from_pool(self):
+
+        self.pool.maxOpenFiles = 1
+        fileRti0 = self._openFile(H5pyFileRti, self.h5FileNames[0])
+        copyRti = H5pyFileRti(nodeName='copy', fileName=self.h5FileNames[1])
+        copyRti.excludeFromFileHandlePool()
+        copyRti.insertChildren(copyRti.fetchChildren())
+        try:
+            self.assertFalse(copyRti.usesFileHandlePool)
+            self.assertTrue(fileRti0.usesFileHandlePool)
+            self.assertEqual(self.pool.numOpenFiles, 1)
+            self.assertFalse(fileRti0.isFileHandleReleased)  # Not released for the copy
+
+            np.testing.assert_array_equal(self._dataRti(copyRti)[...], self.data + 1)
+            self.assertFalse(fileRti0.isFileHandleReleased)
+            self.assertRaises(AssertionError, copyRti.excludeFromFileHandlePool)
+        finally:
+            fileRti0.close()
+            copyRti.close()
+
+        self.assertEqual(self.pool.numOpenFiles, 0)
+
+
+    def test_marshall(self):
+
+        pool = FileHandlePool()
+        pool.unmarshall({'maxOpenFiles': 3, 'idleTimeout': None})
+        self.assertEqual(pool.marshall(), {'maxOpenFiles': 3, 'idleTimeout': None})
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the persistent file index
+"""
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from argos.repo.fileindex import globalFileIndex, parentPath
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.rtiplugins.hdf5 import H5pyFileRti, indexH5pyFile
+
+
+def fetchAllDescendants(rti, maxDepth=4):
+    """ Fetches the children of the RTI and its descendants. Returns a list of all items.
+
+        The recursion stops at maxDepth because soft links can make a cycle.
+    """
+    items = []
+    for childItem in rti.fetchChildren():
+        rti.insertChild(childItem)
+        items.append(childItem)
+        if maxDepth > 1 and childItem.hasChildren() and not childItem.isSliceable:
+            items.extend(fetchAllDescendants(childItem, maxDepth - 1))
+    return items
+
+
+class TestFileIndex(unittest.TestCase):
+
+    PROPERTIES = ['elementTypeName', 'unit', 'missingDataValue', 'summary', 'iconGlyph']
+    ARRAY_PROPERTIES = ['arrayShape', 'chunksString', 'dimensionNames']
+
+    def metadataOf(self, item):
+        """ Returns a list with the metadata of the item
+        """
+        names = self.PROPERTIES + (self.ARRAY_PROPERTIES if item.isSliceable else [])
+        return [getattr(item, name) for name in names]
+
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileIndex = globalFileIndex()
+        self.oldCfg = self.fileIndex.marshall()
+        self.fileIndex.dbFileName = os.path.join(self.tempDir.name, 'index.sqlite')
+        self.fileIndex.enabled = True
+
+        self.data = np.arange(24, dtype=np.float32).reshape(4, 6)
+        self.fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(self.fileName, 'w') as h5File:
+            group = h5File.create_group('group')
+            dataset = group.create_dataset('data', data=self.data, chunks=(2, 3))
+            dataset.attrs['units'] = 'm/s'
+            dataset.attrs['_FillValue'] = np.float32(-1)
+            group.create_dataset('scalar', data=42)
+            group['loop'] = h5py.SoftLink('/group')  # Must not cause infinite recursion
+            h5File.create_group('empty')
+
+
+    def tearDown(self):
+        self.fileIndex.unmarshall(self.oldCfg)
+        self.fileIndex.dbFileName = None
+        self.tempDir.cleanup()
+
+
+    def openFile(self):
+        fileRti = H5pyFileRti(nodeName='test.h5', fileName=self.fileName)
+        fileRti.open()
+        return fileRti
+
+
+    def test_open_from_index(self):
+
+        # The first time the file is opened as usual and the index is built in the background.
+        fileRti = self.openFile()
+        try:
+            self.assertFalse(fileRti.isFileHandleReleased)
+            # Returns the build that was started when opening, or builds it if that's finished.
+            future = self.fileIndex.scheduleBuild(self.fileName, indexH5pyFile)
+            future.result()
+            expectedItems = fetchAllDescendants(fileRti, maxDepth=2)
+            expected = {item.nodePath: self.metadataOf(item) for item in expectedItems}
+        finally:
+            fileRti.close()
+
+        self.assertIsNotNone(self.fileIndex.load(self.fileName))
+
+        # The second time the tree is built from the index, without opening the file.
+        fileRti = self.openFile()
+        try:
+            self.assertTrue(fileRti.isOpen)
+            self.assertTrue(fileRti.isFileHandleReleased)
+            items = fetchAllDescendants(fileRti, maxDepth=2)
+            actual = {item.nodePath: self.metadataOf(item) for item in items}
+            self.assertTrue(fileRti.isFileHandleReleased)
+            self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+            for nodePath, values in expected.items():
+                np.testing.assert_equal(actual[nodePath], values, err_msg=nodePath)
+
+            # The children of a soft link to an ancestor are not indexed but read from the file.
+            loopRti = fileRti.findByNodePath('group/loop')
+            self.assertEqual([child.nodeName for child in fetchAllDescendants(loopRti, 1)],
+                             ['data', 'loop', 'scalar'])
+            self.assertFalse(fileRti.isFileHandleReleased)
+            fileRti.releaseFileHandle()
+
+            # Reading data opens the file.
+            dataRti = fileRti.findByNodePath('group/data')
+            np.testing.assert_array_equal(dataRti[1:3, :], self.data[1:3, :])
+            self.assertFalse(fileRti.isFileHandleReleased)
+            self.assertEqual(fileRti.findByNodePath('group/scalar')[()], 42)
+        finally:
+            fileRti.close()
+
+        self.assertFalse(fileRti.isFileHandleReleased)
+        self.assertEqual(globalFileHandlePool().numOpenFiles, 0)
+
+
+    def test_changed_file(self):
+
+        self.assertIsNone(self.fileIndex.load(self.fileName))  # Not yet indexed
+        fileRti = self.openFile()
+        fileRti.close()
+        self.fileIndex.scheduleBuild(self.fileName, indexH5pyFile).result()
+        self.assertIsNotNone(self.fileIndex.load(self.fileName))
+
+        with h5py.File(self.fileName, 'a') as h5File:
+            h5File.create_dataset('new', data=np.arange(3))
+        self.assertIsNone(self.fileIndex.load(self.fileName))
+
+        fileRti = self.openFile()
+        try:
+            self.assertFalse(fileRti.isFileHandleReleased)
+            self.assertIn('new', [child.nodeName for child in fetchAllDescendants(fileRti)])
+        finally:
+            fileRti.close()
+
+
+    def test_disabled(self):
+
+        self.fileIndex.enabled = False
+        fileRti = self.openFile()
+        fileRti.close()
+        self.assertFalse(self.fileIndex.isBuilding(self.fileName))
+        self.assertIsNone(self.fileIndex.load(self.fileName))
+
+
+    def test_parent_path(self):
+
+        self.assertIsNone(parentPath('/'))
+        self.assertEqual(parentPath('/group'), '/')
+        self.assertEqual(parentPath('/group/data'), '/group')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
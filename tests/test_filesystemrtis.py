@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the file system RTIs and matching file names with the registry globs.
+"""
+import os
+import tempfile
+import unittest
+
+from argos.repo.filesytemrtis import DirectoryRti, UnknownFileRti, createRtiFromFileName
+from argos.repo.registry import RtiGlobMatcher, RtiRegItem, globalRtiRegistry
+
+
+def firstMatchingItem(rtiRegItems, path):
+    """ Returns the first item that matches by calling pathNameMatchesGlobs for each item.
+    """
+    for rtiRegItem in rtiRegItems:
+        if rtiRegItem.pathNameMatchesGlobs(path):
+            return rtiRegItem
+    return None
+
+
+
+class TestRtiGlobMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.regItems = [
+            RtiRegItem('Archive', globs='*.tar.gz;*.tgz'),
+            RtiRegItem('Prefixed', globs='/data/prefix*1.nc'),
+            RtiRegItem('NetCDF', globs='*.nc;*.nc4'),
+            RtiRegItem('Gzip', globs='*.gz'),
+            RtiRegItem('Numbered', globs='*.[0-9][0-9][0-9];*.b?n'),
+            RtiRegItem('Empty', globs=''),
+            RtiRegItem('Readme', globs='*README'),
+        ]
+        self.matcher = RtiGlobMatcher(self.regItems)
+
+
+    def test_same_as_fnmatch(self):
+
+        paths = ['/data/file.nc', '/data/prefix_a1.nc', '/data/prefix_a2.nc', '/data/file.nc4',
+                 '/data/file.tar.gz', '/data/file.gz', '/data/file.tgz', '/data/file.001',
+                 '/data/file.0001', '/data/file.bin', '/data/file.ban', '/data/README',
+                 '/data/file.NC', '/data/file', '/data.nc/file', '/data/file.', '']
+
+        for path in paths:
+            self.assertIs(self.matcher.match(path), firstMatchingItem(self.regItems, path),
+                          msg="path: {!r}".format(path))
+
+
+    def test_first_item_wins(self):
+
+        self.assertEqual(self.matcher.match('/data/prefix_a1.nc').name, 'Prefixed')
+        self.assertEqual(self.matcher.match('/data/file.tar.gz').name, 'Archive')
+        self.assertEqual(self.matcher.match('/data/file.gz').name, 'Gzip')
+
+
+    def test_registry_rebuilds_matcher(self):
+
+        registry = globalRtiRegistry()
+        oldCfg = registry.marshall()
+        try:
+            registry.unmarshall([RtiRegItem('NetCDF', globs='*.nc').marshall()])
+            self.assertEqual(registry.getRtiRegItemByExtension('/data/file.nc').name, 'NetCDF')
+            self.assertIsNone(registry.getRtiRegItemByExtension('/data/file.h5'))
+
+            registry.unmarshall([RtiRegItem('HDF-5', globs='*.h5').marshall()])
+            self.assertIsNone(registry.getRtiRegItemByExtension('/data/file.nc'))
+            self.assertEqual(registry.getRtiRegItemByExtension('/data/file.h5').name, 'HDF-5')
+        finally:
+            registry.unmarshall(oldCfg)
+
+
+
+class TestDirectoryRti(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = globalRtiRegistry()
+        self.oldCfg = self.registry.marshall()
+        self.registry.unmarshall(None)
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.dirName = self.tempDir.name
+        for fileName in ['b.txt', 'A.json', '.hidden', 'c.npy']:
+            with open(os.path.join(self.dirName, fileName), 'w') as file:
+                file.write('{}')
+        os.mkdir(os.path.join(self.dirName, 'subDir'))
+        os.symlink(os.path.join(self.dirName, 'b.txt'), os.path.join(self.dirName, 'link.txt'))
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+        self.registry.unmarshall(self.oldCfg)
+
+
+    def test_children(self):
+
+        dirRti = DirectoryRti(nodeName='dir', fileName=self.dirName)
+        childItems = dirRti.fetchChildren()
+
+        # Hidden files are skipped, symbolic links get the name of their target.
+        self.assertEqual([child.nodeName for child in childItems],
+                         ['A.json', 'b.txt', 'c.npy', 'b.txt', 'subDir'])
+
+        for childItem in childItems:
+            expectedItem = createRtiFromFileName(childItem.fileName)
+            self.assertIs(type(childItem), type(expectedItem))
+            self.assertEqual(childItem.iconColor, expectedItem.iconColor)
+            self.assertIsNone(childItem.exception)
+
+        self.assertIsInstance(childItems[1], UnknownFileRti)
+        self.assertIsInstance(childItems[4], DirectoryRti)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
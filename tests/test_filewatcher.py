@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests updating the repository tree when files change on disk
+"""
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from argos.qt import QtWidgets
+from argos.repo.filesytemrtis import DirectoryRti
+from argos.repo.filewatcher import RepoFileWatcher
+from argos.repo.registry import globalRtiRegistry
+from argos.repo.repotreemodel import RepoTreeModel
+from argos.repo.rtiplugins.hdf5 import H5pyFileRti
+
+from test_repotreemodel import processEventsUntil
+
+
+def childNames(item):
+    """ Returns the node names of the children of the item.
+    """
+    return [childItem.nodeName for childItem in item.childItems]
+
+
+
+class TestRepoFileWatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        if not globalRtiRegistry().items:
+            globalRtiRegistry().unmarshall(None)  # Use the default plugins
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.model = RepoTreeModel()
+        self.watcher = RepoFileWatcher(self.model, enabled=True, debounceDelay=10)
+
+
+    def tearDown(self):
+        self.watcher.finalize()
+        for row in reversed(range(self.model.rowCount())):
+            self.model.deleteItemAtIndex(self.model.index(row, 0))
+        self.tempDir.cleanup()
+
+
+    def writeFile(self, fileName):
+        with open(os.path.join(self.tempDir.name, fileName), 'w') as file:
+            file.write('dummy')
+
+
+    def test_directory(self):
+
+        for fileName in ['a.txt', 'c.txt', 'e.txt']:
+            self.writeFile(fileName)
+
+        dirRti = DirectoryRti(nodeName='dir', fileName=self.tempDir.name)
+        dirIndex = self.model.insertItem(dirRti)
+        self.model.fetchMore(dirIndex)
+        self.assertEqual(self.watcher.watchedPaths, [self.tempDir.name])
+        firstItem = dirRti.child(0)
+
+        self.writeFile('b.txt')
+        self.writeFile('.hidden')
+        self.writeFile('f.txt')
+        os.remove(os.path.join(self.tempDir.name, 'c.txt'))
+        processEventsUntil(lambda: childNames(dirRti) == ['a.txt', 'b.txt', 'e.txt', 'f.txt'])
+
+        # The existing items are kept.
+        self.assertIs(dirRti.child(0), firstItem)
+        for row, childItem in enumerate(dirRti.childItems):
+            self.assertEqual(childItem.childNumber(), row)
+
+        # Closing the directory stops watching it
+        self.model.removeAllChildrenAtIndex(dirIndex)
+        dirRti.close()
+        self.assertEqual(self.watcher.watchedPaths, [])
+
+
+    def test_partially_fetched_directory(self):
+
+        for fileName in ['a.txt', 'c.txt', 'e.txt']:
+            self.writeFile(fileName)
+
+        self.model.fetchPageSize = 2
+        dirRti = DirectoryRti(nodeName='dir', fileName=self.tempDir.name)
+        dirIndex = self.model.insertItem(dirRti)
+        self.model.fetchMore(dirIndex)
+        self.assertEqual(childNames(dirRti), ['a.txt', 'c.txt'])
+
+        # Only files that are sorted before the last fetched child are added.
+        self.writeFile('b.txt')
+        self.writeFile('d.txt')
+        self.watcher.refreshPath(self.tempDir.name)
+        self.assertEqual(childNames(dirRti), ['a.txt', 'b.txt', 'c.txt'])
+
+
+    def test_hdf5_file(self):
+
+        fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(fileName, 'w') as h5File:
+            group = h5File.create_group('group')
+            group.create_dataset('ds1', data=np.arange(3))
+            group.create_dataset('ds2', data=np.arange(4))
+            h5File.create_group('unfetched').create_dataset('ds', data=np.arange(3))
+
+        fileRti = H5pyFileRti.createFromFileName(fileName, '#00FF00')
+        fileIndex = self.model.insertItem(fileRti)
+        ds1Rti, _ds1Index = self.model.findItemAndIndex('/test.h5/group/ds1')
+        groupRti = ds1Rti.parentItem
+        self.assertEqual(self.watcher.watchedPaths, [fileName])
+        self.assertEqual(ds1Rti.arrayShape, (3, ))
+
+        # HDF-5 doesn't allow writing a file that is opened in the same process.
+        fileRti.releaseFileHandle()
+        with h5py.File(fileName, 'a') as h5File:
+            group = h5File['group']
+            del group['ds1']
+            del group['ds2']
+            group.create_dataset('ds1', data=np.arange(5) * 10)
+            group.create_dataset('ds3', data=np.arange(2))
+        self.watcher.refreshPath(fileName)
+
+        # The expanded items are kept, only the changed children are updated.
+        self.assertIs(fileRti.childByNodeName('group'), groupRti)
+        self.assertEqual(childNames(fileRti), ['group', 'unfetched'])
+        self.assertEqual(childNames(groupRti), ['ds1', 'ds3'])
+        self.assertIs(groupRti.childByNodeName('ds1'), ds1Rti)
+        self.assertEqual(ds1Rti.arrayShape, (5, ))
+        np.testing.assert_array_equal(ds1Rti[:], np.arange(5) * 10)
+        np.testing.assert_array_equal(groupRti.childByNodeName('ds3')[:], np.arange(2))
+
+        # Removing the file stops watching it
+        self.model.deleteItemAtIndex(fileIndex)
+        self.assertEqual(self.watcher.watchedPaths, [])
+
+
+    def test_read_during_sync(self):
+
+        fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(fileName, 'w') as h5File:
+            group = h5File.create_group('group')
+            group.create_dataset('ds1', data=np.arange(3))
+            group.create_dataset('ds2', data=np.arange(4))
+
+        fileRti = H5pyFileRti.createFromFileName(fileName, '#00FF00')
+        self.model.insertItem(fileRti)
+        ds1Rti, _ds1Index = self.model.findItemAndIndex('/test.h5/group/ds1')
+        groupRti = ds1Rti.parentItem
+
+        fileRti.releaseFileHandle()
+        with h5py.File(fileName, 'a') as h5File:
+            group = h5File['group']
+            del group['ds2']
+            group.create_dataset('ds3', data=np.arange(2))
+
+        # Views read the items when rows are removed or inserted, before the sync is done.
+        numReads = []
+        def readItems(*_args):
+            numReads.append(len(ds1Rti[...]))
+
+        changedItems = []
+        def onItemChanged(item):
+            changedItems.append((item.nodePath, childNames(groupRti)))
+
+        self.model.rowsAboutToBeRemoved.connect(readItems)
+        self.model.rowsInserted.connect(readItems)
+        self.model.sigItemChanged.connect(onItemChanged)
+        try:
+            self.watcher.refreshPath(fileName)
+        finally:
+            self.model.rowsAboutToBeRemoved.disconnect(readItems)
+            self.model.rowsInserted.disconnect(readItems)
+            self.model.sigItemChanged.disconnect(onItemChanged)
+
+        self.assertEqual(numReads, [3, 3])
+        self.assertEqual(childNames(groupRti), ['ds1', 'ds3'])
+        np.testing.assert_array_equal(ds1Rti[:], np.arange(3))
+        np.testing.assert_array_equal(groupRti.childByNodeName('ds3')[:], np.arange(2))
+        for item in [fileRti, groupRti] + groupRti.childItems:
+            self.assertIsNone(item.exception, msg=item.nodePath)
+
+        # The items that remain are only reported as changed when the sync is done. The removed
+        # item reports that it's closed.
+        self.assertEqual(changedItems, [
+            ('/test.h5/group/ds2', ['ds1', 'ds2']), ('/test.h5/group/ds1', ['ds1', 'ds3']),
+            ('/test.h5/group', ['ds1', 'ds3']), ('/test.h5', ['ds1', 'ds3'])])
+
+
+    def test_disabled(self):
+
+        self.watcher.enabled = False
+        dirRti = DirectoryRti(nodeName='dir', fileName=self.tempDir.name)
+        dirIndex = self.model.insertItem(dirRti)
+        self.model.fetchMore(dirIndex)
+        self.assertEqual(self.watcher.watchedPaths, [])
+
+        self.watcher.enabled = True
+        self.assertEqual(self.watcher.watchedPaths, [self.tempDir.name])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
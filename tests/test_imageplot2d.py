@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the positions of the images in the 2D image plot.
+"""
+import time
+import unittest
+
+import numpy as np
+
+from argos.collect.collector import Collector
+from argos.config.configtreemodel import ConfigTreeModel
+from argos.inspector.abstract import UpdateReason
+from argos.inspector.pgplugins import imageplot2d, imagepyramid, tiledimage
+from argos.inspector.pgplugins.imageplot2d import PgImagePlot2d
+from argos.qt import QtCore, QtWidgets
+from argos.repo.memoryrtis import ArrayRti
+
+
+class TestImagePositions(unittest.TestCase):
+    """ The center of pixel (row, col) of the slice must be at (col, row) in the view, where the
+        probe and cross-hair put it. Also for the tiles and the pyramid levels.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        self.oldMinTiledPixels = imageplot2d.MIN_TILED_PIXELS
+        self.oldOverviewSize = tiledimage.OVERVIEW_SIZE
+        self.oldMinPyramidPixels = imagepyramid.MIN_PYRAMID_PIXELS
+
+        self.nRows, self.nCols = 600, 700
+        self.collector = Collector(windowNumber=1)
+        self.inspector = PgImagePlot2d(self.collector)
+        self.configModel = ConfigTreeModel()
+        self.configModel.setInvisibleRootItem(self.inspector.config)
+        self.collector.clearAndSetComboBoxes(self.inspector.axesNames())
+        data = np.arange(self.nRows * self.nCols, dtype=np.float32).reshape(self.nRows, self.nCols)
+        self.collector.setRti(ArrayRti(data, nodeName='data'))
+
+
+    def tearDown(self):
+        self.inspector.finalize()
+        imageplot2d.MIN_TILED_PIXELS = self.oldMinTiledPixels
+        tiledimage.OVERVIEW_SIZE = self.oldOverviewSize
+        imagepyramid.MIN_PYRAMID_PIXELS = self.oldMinPyramidPixels
+
+
+    def assertPixelCenter(self, imageItem, localCol, localRow, col, row):
+        """ Checks that the center of a pixel of the image item is at (col, row) in the view.
+        """
+        viewPos = imageItem.mapToParent(QtCore.QPointF(localCol + 0.5, localRow + 0.5))
+        self.assertAlmostEqual(viewPos.x(), col)
+        self.assertAlmostEqual(viewPos.y(), row)
+
+
+    def test_plain(self):
+
+        self.inspector.updateContents(reason=UpdateReason.RTI_CHANGED)
+        self.assertIsNone(self.inspector.tiledImageLayer.reader)
+        self.assertIsNone(self.inspector.pyramidLayer.pyramid)
+        for row, col in [(0, 0), (5, 3), (self.nRows - 1, self.nCols - 1)]:
+            self.assertPixelCenter(self.inspector.imageItem, col, row, col, row)
+
+
+    def test_tiled(self):
+
+        imageplot2d.MIN_TILED_PIXELS = 100 * 100
+        tiledimage.OVERVIEW_SIZE = 256
+        self.inspector.updateContents(reason=UpdateReason.RTI_CHANGED)
+        layer = self.inspector.tiledImageLayer
+        stride = layer.reader.overviewStride
+        self.assertEqual(stride, 3)
+
+        # The overview covers the complete slice.
+        overviewItem = self.inspector.imageItem
+        height, width = overviewItem.image.shape[1], overviewItem.image.shape[0]
+        self.assertPixelCenter(overviewItem, -0.5, -0.5, -0.5, -0.5)
+        self.assertPixelCenter(overviewItem, width - 0.5, height - 0.5,
+                               self.nCols - 0.5, self.nRows - 0.5)
+
+        tileId = (0, 1, 1)
+        layer.reader.readTile(tileId)
+        layer._showTile(tileId)
+        rowStart, colStart = tiledimage.TILE_SIZE, tiledimage.TILE_SIZE
+        for row, col in [(rowStart, colStart), (self.nRows - 1, self.nCols - 1)]:
+            self.assertPixelCenter(layer.tileItems[tileId], col - colStart, row - rowStart,
+                                   col, row)
+
+
+    def test_pyramid(self):
+
+        imagepyramid.MIN_PYRAMID_PIXELS = 100 * 100
+        self.inspector.config.tiledReadingCti.data = False
+        self.inspector.updateContents(reason=UpdateReason.RTI_CHANGED)
+        layer = self.inspector.pyramidLayer
+
+        endTime = time.time() + 5
+        while layer.pyramid is None and time.time() < endTime:
+            self.qApp.processEvents()
+        self.assertIsNotNone(layer.pyramid)
+
+        # A pixel of level 1 covers 2 by 2 pixels of the slice.
+        layer._showLevel(1)
+        levelItem = layer._levelItem
+        self.assertPixelCenter(levelItem, -0.5, -0.5, -0.5, -0.5)
+        self.assertPixelCenter(levelItem, 2.5, 1.5, 5.5, 3.5)
+
+
+    def test_pyramid_kept_on_config_change(self):
+
+        imagepyramid.MIN_PYRAMID_PIXELS = 100 * 100
+        self.inspector.config.tiledReadingCti.data = False
+        self.inspector.resize(150, 150)  # Small enough to show level 1.
+        self.inspector.show()
+        self.inspector.updateContents(reason=UpdateReason.RTI_CHANGED)
+        layer = self.inspector.pyramidLayer
+
+        endTime = time.time() + 5
+        while layer.pyramid is None and time.time() < endTime:
+            self.qApp.processEvents()
+        pyramid = layer.pyramid
+        self.assertIsNotNone(pyramid)
+        self.assertEqual(layer.levelNr, 1)
+
+        # The slice is the same after a config change, so the pyramid and level are kept.
+        self.inspector.updateContents(reason=UpdateReason.CONFIG_CHANGED)
+        self.qApp.processEvents()
+        self.assertIs(layer.pyramid, pyramid)
+        self.assertEqual(layer.levelNr, 1)
+        self.assertFalse(self.inspector.imageItem.isVisible())
+
+        # A different reduction requires a new pyramid.
+        self.inspector.config.pyramidCti.data = imagepyramid.REDUCTIONS.index(
+            imagepyramid.REDUCTION_MAX)
+        self.inspector.updateContents(reason=UpdateReason.CONFIG_CHANGED)
+        self.assertIsNone(layer.pyramid)
+        self.assertEqual(layer.reduction, imagepyramid.REDUCTION_MAX)
+
+        # A new slice as well.
+        self.inspector.updateContents(reason=UpdateReason.RTI_CHANGED)
+        self.assertIsNone(layer.pyramid)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the multi-resolution pyramid of images.
+"""
+import time
+import unittest
+
+import numpy as np
+
+from argos.inspector.pgplugins.imagepyramid import (
+    REDUCTIONS, ImagePyramid, ImagePyramidBuilder, reduceImage, reduceMask)
+from argos.qt import QtWidgets
+
+
+def reduceBlocks(image, reduction):
+    """ Reference implementation that reduces each block of 2x2 pixels separately.
+    """
+    nRows, nCols = (image.shape[0] + 1) // 2, (image.shape[1] + 1) // 2
+    result = np.full((nRows, nCols), np.nan)
+    for row in range(nRows):
+        for col in range(nCols):
+            block = image[2 * row:2 * row + 2, 2 * col:2 * col + 2]
+            block = block[~np.isnan(block)]
+            if len(block) > 0:
+                result[row, col] = {'mean': np.mean, 'max': np.max, 'min': np.min}[reduction](block)
+    return result
+
+
+
+class TestReduceImage(unittest.TestCase):
+
+    def test_reductions(self):
+
+        rng = np.random.default_rng(seed=7)
+        for shape in [(8, 6), (7, 5), (1, 1), (2, 9)]:
+            image = rng.normal(size=shape)
+            image[rng.random(shape) < 0.3] = np.nan
+            for reduction in REDUCTIONS:
+                np.testing.assert_allclose(reduceImage(image, reduction),
+                                           reduceBlocks(image, reduction),
+                                           err_msg="{} of {}".format(reduction, shape))
+
+
+    def test_masked(self):
+
+        image = np.full((4, 4), np.nan)
+        image[0, 0] = 3.0
+        for reduction in REDUCTIONS:
+            reduced = reduceImage(image, reduction)
+            self.assertEqual(reduced[0, 0], 3.0)
+            self.assertTrue(np.isnan(reduced[1:, :]).all())
+            self.assertTrue(np.isnan(reduced[:, 1:]).all())
+
+
+    def test_masked_integers(self):
+
+        rng = np.random.default_rng(seed=3)
+        image = rng.integers(0, 1000, size=(9, 6)).astype(np.uint16)
+        mask = rng.random(image.shape) < 0.4
+        mask[:2, :2] = True
+        reference = np.where(mask, np.nan, image)
+        for reduction in REDUCTIONS:
+            reduced = reduceImage(image, reduction, mask)
+            self.assertEqual(reduced.dtype, np.float32)
+            np.testing.assert_allclose(reduced, reduceBlocks(reference, reduction), rtol=1e-6)
+
+        np.testing.assert_array_equal(reduceMask(mask), np.isnan(reduceBlocks(reference, 'max')))
+
+
+    def test_pyramid(self):
+
+        image = np.arange(1000 * 600, dtype=np.float32).reshape(1000, 600)
+        pyramid = ImagePyramid(image, reduction='max', minLevelSize=100)
+        self.assertEqual(pyramid.numLevels, 3)
+        self.assertIs(pyramid.level(0), image)
+        self.assertEqual(pyramid.level(2).shape, (250, 150))
+        self.assertEqual(pyramid.level(2)[-1, -1], image.max())
+
+        self.assertEqual(pyramid.levelForPixelSize(0.5), 0)
+        self.assertEqual(pyramid.levelForPixelSize(2.5), 1)
+        self.assertEqual(pyramid.levelForPixelSize(100), 2)
+
+
+
+class TestImagePyramidBuilder(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def test_last_build_only(self):
+
+        pyramids = []
+        builder = ImagePyramidBuilder()
+        builder.sigPyramidBuilt.connect(pyramids.append)
+
+        first = builder.build(np.zeros((2048, 2048)))
+        second = builder.build(np.ones((1024, 1024)), reduction='min')
+        first.result()
+        second.result()
+
+        endTime = time.time() + 5
+        while not pyramids and time.time() < endTime:
+            self.qApp.processEvents()
+
+        self.assertEqual(len(pyramids), 1)
+        self.assertEqual(pyramids[0].reduction, 'min')
+        self.assertEqual(pyramids[0].level(0).shape, (1024, 1024))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
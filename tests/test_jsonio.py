@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the JSON reading functions of the jsonio plugin
+
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from argos.repo.rtiplugins.jsonio import loadJsonFile, indexJsonContainer, JsonIndexError
+
+
+class TestJsonIndexing(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {"a": [1, {"b": "]}\"["}], "c": 3.5, "url": "http://x//y", "d": None}
+        self.buffer = json.dumps(self.data).encode('utf-8')
+
+
+    def test_index_object(self):
+
+        isObject, entries = indexJsonContainer(self.buffer)
+        self.assertTrue(isObject)
+        self.assertEqual([key for key, _, _ in entries], list(self.data.keys()))
+
+        for key, start, end in entries:
+            self.assertEqual(json.loads(self.buffer[start:end]), self.data[key])
+
+
+    def test_index_array(self):
+
+        buffer = b' [ [1, [2]], "x" , {} ] \n'
+        isObject, entries = indexJsonContainer(buffer)
+        self.assertFalse(isObject)
+        self.assertEqual([json.loads(buffer[start:end]) for _, start, end in entries],
+                         [[1, [2]], "x", {}])
+
+        # Sub tree
+        _, start, end = entries[0]
+        isObject, subEntries = indexJsonContainer(buffer, start, end)
+        self.assertEqual(len(subEntries), 2)
+
+
+    def test_invalid(self):
+
+        self.assertRaises(JsonIndexError, indexJsonContainer, b'3')
+        self.assertRaises(JsonIndexError, indexJsonContainer, b'[1, 2')
+        self.assertRaises(JsonIndexError, indexJsonContainer, b'[1] 2')
+        self.assertRaises(JsonIndexError, indexJsonContainer, b'[1, // comment\n 2]')
+        self.assertRaises(JsonIndexError, indexJsonContainer, b'[[1, /* comment */ 2]]')
+
+
+    def test_load_with_comments(self):
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            fileName = os.path.join(tempDir, 'test.json')
+            with open(fileName, 'w') as jsonFile:
+                jsonFile.write('{"url": "http://x", // line comment\n "b": /* block */ 2}')
+            self.assertEqual(loadJsonFile(fileName), {"url": "http://x", "b": 2})
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests showing images with a separate mask overlay.
+"""
+import unittest
+
+import numpy as np
+
+from argos.inspector.pgplugins.maskedimage import MaskedImageItem, imageArrayFromSlice
+from argos.qt import QtWidgets
+from argos.utils.masks import ArrayWithMask
+
+
+class TestImageArrayFromSlice(unittest.TestCase):
+
+    def test_integers(self):
+
+        data = np.arange(12, dtype=np.uint16).reshape(3, 4)
+        mask = data % 5 == 0
+        imageArray, maskArray = imageArrayFromSlice(ArrayWithMask(data, mask, 0))
+        self.assertEqual(imageArray.dtype, np.uint16)
+        self.assertTrue(np.shares_memory(imageArray, data))
+        np.testing.assert_array_equal(imageArray, data.T)
+        np.testing.assert_array_equal(maskArray, mask.T)
+
+        # Masks without masked values are not used
+        self.assertIsNone(imageArrayFromSlice(ArrayWithMask(data, False, 0))[1])
+        self.assertIsNone(imageArrayFromSlice(ArrayWithMask(data, np.zeros_like(mask), 0))[1])
+        self.assertTrue(imageArrayFromSlice(ArrayWithMask(data, True, 0))[1].all())
+
+
+    def test_floats(self):
+
+        data = np.array([[1.0, np.inf], [-np.inf, np.nan]], dtype=np.float32)
+        imageArray, maskArray = imageArrayFromSlice(ArrayWithMask(data, False, 0))
+        self.assertEqual(imageArray.dtype, np.float32)
+        self.assertEqual(imageArray[0, 0], 1.0)
+        self.assertTrue(np.isnan(imageArray[1, 0]))
+        self.assertTrue(np.isnan(imageArray[0, 1]))
+        self.assertEqual(data[0, 1], np.inf)  # The slice is not changed
+        self.assertIsNone(maskArray)
+
+        finite = np.ones((2, 2), dtype=np.float32)
+        self.assertTrue(np.shares_memory(imageArrayFromSlice(ArrayWithMask(finite, False, 0))[0],
+                                         finite))
+
+
+
+class TestMaskedImageItem(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def test_histogram(self):
+
+        data = np.full((50, 40), 7, dtype=np.int16)
+        data[:10, :] = 1000
+        imageItem = MaskedImageItem()
+        imageItem.setImage(data, autoLevels=False)
+        self.assertGreater(imageItem.getHistogram()[0].max(), 900)
+
+        imageItem.setMask(data == 1000)
+        bins, counts = imageItem.getHistogram()
+        self.assertLess(bins.max(), 1000)
+        self.assertEqual(counts.sum(), 40 * 40)
+
+        imageItem.setMask(np.ones(data.shape, dtype=bool))
+        self.assertEqual(imageItem.getHistogram(), (None, None))
+
+        imageItem.clear()
+        self.assertIsNone(imageItem.maskArray)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
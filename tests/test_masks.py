@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the functions of the masks module.
+"""
+import unittest
+
+import numpy as np
+
+from argos.utils import masks
+from argos.utils.masks import (
+    SAMPLING_OFF, SAMPLING_SKETCH, SAMPLING_SUBSAMPLE, ArrayStatistics, ArrayWithMask,
+    PlotBuffers, QuantileSketch, StatisticsCache, calcArrayStatistics,
+    nanPercentileOfSubsampledArrayWithMask, sanitizeForPlotting)
+
+
+def referenceSanitize(data, mask, replaceMasked):
+    """ Sanitizes the data in multiple passes, the way the plot inspectors originally did.
+    """
+    connected = np.isfinite(data)
+    if isinstance(mask, np.ndarray):
+        connected &= ~mask
+    elif mask:
+        connected[...] = False
+
+    plotData = data.astype(np.result_type(data.dtype, np.float32))
+    plotData[~np.isfinite(plotData)] = np.nan
+    if replaceMasked:
+        plotData[~connected] = np.nan
+    return plotData, connected
+
+
+
+class TestSanitizeForPlotting(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(seed=5)
+        self.oldChunkSize = masks.SANITIZE_CHUNK_SIZE
+
+
+    def tearDown(self):
+        masks.SANITIZE_CHUNK_SIZE = self.oldChunkSize
+
+
+    def check(self, data, mask, replaceMasked, buffers=None):
+        """ Compares the result with the reference implementation.
+        """
+        plotData, connected = sanitizeForPlotting(data, mask, replaceMasked, buffers=buffers)
+        refPlotData, refConnected = referenceSanitize(data, mask, replaceMasked)
+        np.testing.assert_array_equal(connected, refConnected)
+        np.testing.assert_array_equal(plotData, refPlotData)
+        return plotData, connected
+
+
+    def test_random(self):
+
+        for chunkSize in [5, 64, self.oldChunkSize]:
+            masks.SANITIZE_CHUNK_SIZE = chunkSize
+            buffers = PlotBuffers()
+            for shape in [(1000,), (37, 23), (1, 300)]:
+                data = self.rng.normal(size=shape)
+                data[self.rng.random(shape) < 0.05] = np.nan
+                data[self.rng.random(shape) < 0.05] = np.inf
+                for mask in [False, True, self.rng.random(shape) < 0.1]:
+                    for replaceMasked in [False, True]:
+                        self.check(data, mask, replaceMasked, buffers)
+
+
+    def test_no_copies(self):
+
+        data = np.arange(100, dtype=np.int32)
+        mask = data % 3 == 0
+        plotData, connected = self.check(data, mask, replaceMasked=False)
+        self.assertIs(plotData, data)
+
+        plotData, connected = self.check(data, mask, replaceMasked=True)
+        self.assertEqual(plotData.dtype, np.float64)
+
+        floats = np.linspace(0, 1, 100, dtype=np.float32)
+        floats[5] = np.nan
+        plotData, _ = self.check(floats, mask, replaceMasked=False)
+        self.assertIs(plotData, floats)
+
+        # Column of an image (not contiguous)
+        image = self.rng.normal(size=(50, 40))
+        image[::7, 3] = -np.inf
+        self.check(image[:, 3], False, replaceMasked=False)
+
+
+    def test_reused_buffers(self):
+
+        buffers = PlotBuffers()
+        data = np.array([1.0, np.inf, 3.0])
+        plotData1, connected1 = sanitizeForPlotting(data, False, buffers=buffers)
+        plotData2, connected2 = sanitizeForPlotting(data * 2, False, buffers=buffers)
+        self.assertIs(plotData1, plotData2)
+        self.assertIs(connected1, connected2)
+        np.testing.assert_array_equal(plotData2, [2.0, np.nan, 6.0])
+
+
+
+class TestArrayStatistics(unittest.TestCase):
+
+    PERCENTILES = (0.0, 0.1, 1, 20, 50, 80, 99, 99.9, 100.0)
+
+    def test_same_as_nanpercentile(self):
+
+        rng = np.random.default_rng(seed=11)
+        for dtype in [np.float32, np.float64, np.int16, np.uint8]:
+            for shape in [(1,), (1000,), (300, 500)]:
+                data = (rng.normal(size=shape) * 100).astype(dtype)
+                if data.dtype.kind == 'f':
+                    data[rng.random(shape) < 0.05] = np.nan
+                for mask in [False, rng.random(shape) < 0.2]:
+                    awm = ArrayWithMask(data, mask, 0)
+                    for subsample in [False, True]:
+                        np.testing.assert_allclose(
+                            ArrayStatistics(awm, subsample).percentiles(self.PERCENTILES),
+                            nanPercentileOfSubsampledArrayWithMask(awm, self.PERCENTILES, subsample),
+                            rtol=1e-6, err_msg="{} {}".format(np.dtype(dtype).name, shape))
+
+
+    def test_no_valid_values(self):
+
+        data = np.array([np.nan, 1.0, 2.0])
+        for awm in [ArrayWithMask(data, True, 0),
+                    ArrayWithMask(data, np.array([False, True, True]), 0)]:
+            statistics = ArrayStatistics(awm, subsample=False)
+            self.assertEqual(statistics.numValid, 0)
+            self.assertTrue(np.isnan(statistics.minimum))
+            self.assertTrue(np.isnan(statistics.percentiles((1, 99))).all())
+
+        statistics = ArrayStatistics(ArrayWithMask(data, False, 0), subsample=False)
+        self.assertEqual(statistics.numValid, 2)
+        self.assertEqual((statistics.minimum, statistics.maximum), (1.0, 2.0))
+
+
+    def test_histogram(self):
+
+        rng = np.random.default_rng(seed=23)
+        data = rng.normal(size=(200, 300))
+        data[:5, :] = np.inf
+        data[5:8, :] = -np.inf
+        data[10:20, 10:20] = np.nan
+        mask = rng.random(data.shape) < 0.1
+        statistics = ArrayStatistics(ArrayWithMask(data, mask, 0), subsample=False)
+
+        valid = data[~mask & np.isfinite(data)]
+        self.assertEqual(statistics.finiteRange, (valid.min(), valid.max()))
+
+        for bins in [np.linspace(valid.min(), valid.max(), 500), np.array([-1.0, 0.0, 0.5]),
+                     np.array([valid.max(), valid.max()])]:
+            np.testing.assert_array_equal(statistics.histogram(bins),
+                                          np.histogram(valid, bins=bins)[0])
+
+        integers = np.arange(10, dtype=np.uint8)
+        statistics = ArrayStatistics(ArrayWithMask(integers, False, 0), subsample=False)
+        self.assertEqual(statistics.finiteRange, (0, 9))
+        np.testing.assert_array_equal(statistics.histogram(np.array([0, 4, 9])), [4, 6])
+
+        infinite = ArrayStatistics(ArrayWithMask(np.array([np.inf, -np.inf]), False, 0), False)
+        self.assertTrue(np.isnan(infinite.finiteRange).all())
+
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    PERCENTILES = (0.0, 0.1, 1, 20, 50, 80, 99, 99.9, 100.0)
+
+    def checkRankErrors(self, sketch, data, maxRankError):
+        """ Checks that the ranks of the approximated percentiles are close to the requested ones.
+        """
+        sortedData = np.sort(data, axis=None)
+        approx = sketch.percentiles(self.PERCENTILES)
+        lowRanks = np.searchsorted(sortedData, approx, side='left') / len(sortedData)
+        highRanks = np.searchsorted(sortedData, approx, side='right') / len(sortedData)
+        targets = np.array(self.PERCENTILES) / 100
+        self.assertTrue(np.all(lowRanks <= targets + maxRankError), (lowRanks, targets))
+        self.assertTrue(np.all(highRanks >= targets - maxRankError), (highRanks, targets))
+
+
+    def test_exact_below_capacity(self):
+
+        rng = np.random.default_rng(seed=13)
+        data = rng.normal(size=1000)
+        sketch = QuantileSketch(capacity=1024)
+        sketch.update(data[:600])
+        sketch.update(data[600:])
+        np.testing.assert_allclose(sketch.percentiles(self.PERCENTILES),
+                                   np.percentile(data, self.PERCENTILES))
+
+
+    def test_error_bound(self):
+
+        rng = np.random.default_rng(seed=17)
+        capacity = 256
+        data = np.concatenate([rng.normal(size=200000), rng.exponential(size=100000) * 50])
+        sketch = QuantileSketch.fromArrayWithMask(ArrayWithMask(data, False, 0),
+                                                  capacity=capacity, chunkSize=5000)
+        self.assertEqual(sketch.numValid, len(data))
+        self.assertEqual((sketch.minimum, sketch.maximum), (data.min(), data.max()))
+
+        # Four standard deviations of the documented bound.
+        self.checkRankErrors(sketch, data, 4 * np.sqrt(2) / capacity)
+
+
+    def test_merge(self):
+
+        rng = np.random.default_rng(seed=19)
+        parts = [rng.integers(0, 5000, size=size) for size in (30000, 5, 70000)]
+        sketch = QuantileSketch(capacity=512)
+        for part in parts:
+            other = QuantileSketch(capacity=512, seed=len(part))
+            other.update(part)
+            sketch.merge(other)
+        sketch.merge(QuantileSketch())
+
+        data = np.concatenate(parts)
+        self.assertEqual(sketch.numValid, len(data))
+        self.checkRankErrors(sketch, data, 4 * np.sqrt(2) / 512)
+
+
+    def test_masked(self):
+
+        data = np.arange(20000, dtype=np.float32)
+        data[::3] = np.nan
+        mask = data > 15000
+        sketch = calcArrayStatistics(ArrayWithMask(data, mask, 0), SAMPLING_SKETCH)
+        exact = calcArrayStatistics(ArrayWithMask(data, mask, 0), SAMPLING_OFF)
+        self.assertEqual(sketch.numValid, exact.numValid)
+        self.assertEqual((sketch.minimum, sketch.maximum), (exact.minimum, exact.maximum))
+
+        self.assertEqual(calcArrayStatistics(ArrayWithMask(data, True, 0), SAMPLING_SKETCH)
+                         .numValid, 0)
+        self.assertTrue(np.isnan(QuantileSketch().percentiles((1, 99))).all())
+        self.assertRaises(ValueError, calcArrayStatistics, ArrayWithMask(data, False, 0), True)
+
+
+
+class TestStatisticsCache(unittest.TestCase):
+
+    def test_cache(self):
+
+        calls = []
+        def getArray():
+            calls.append(1)
+            return ArrayWithMask(np.arange(10.0), False, 0)
+
+        cache = StatisticsCache()
+        first = cache.statistics(None, SAMPLING_SUBSAMPLE, getArray)
+        self.assertIs(cache.statistics(None, SAMPLING_SUBSAMPLE, getArray), first)
+        self.assertEqual(len(calls), 1)
+
+        cache.statistics(('row', 3), SAMPLING_SUBSAMPLE, getArray)
+        cache.statistics(None, SAMPLING_SKETCH, getArray)
+        self.assertEqual(len(calls), 3)
+
+        cache.invalidate()
+        self.assertIsNot(cache.statistics(None, SAMPLING_SUBSAMPLE, getArray), first)
+        self.assertEqual(len(calls), 4)
+
+
+    def test_latest_part_only(self):
+
+        cache = StatisticsCache()
+        getArray = lambda: ArrayWithMask(np.arange(10.0), False, 0)
+        cache.statistics(None, SAMPLING_SUBSAMPLE, getArray)
+        for row in range(500):
+            cache.statistics(('row', row), SAMPLING_SUBSAMPLE, getArray)
+            cache.statistics(('col', row), SAMPLING_SUBSAMPLE, getArray)
+        self.assertEqual(len(cache), 3)
+
+        rowStatistics = cache.statistics(('row', 499), SAMPLING_SUBSAMPLE, getArray)
+        self.assertIs(cache.statistics(('row', 499), SAMPLING_SUBSAMPLE, getArray), rowStatistics)
+        self.assertIsNot(cache.statistics(('row', 3), SAMPLING_SUBSAMPLE, getArray), rowStatistics)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the raw binary plugin
+
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from argos.repo.rtiplugins.rawio import (
+    RawBinaryFileRti, checkRawLayout, memmapRawFile, readRawDescriptor, writeRawDescriptor)
+
+
+class TestRawBinary(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tempDir.name, 'frames.raw')
+
+        self.header = b'HEADER--'
+        self.data = np.arange(4 * 5 * 6, dtype='>u2').reshape(4, 5, 6, order='F')
+        with open(self.fileName, 'wb') as rawFile:
+            rawFile.write(self.header)
+            rawFile.write(self.data.tobytes(order='F'))
+
+        self.layout = {'dtype': 'uint16', 'byteOrder': '>', 'shape': [-1, 5, 6],
+                       'offset': len(self.header), 'order': 'F'}
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+
+    def test_layout(self):
+
+        self.assertEqual(checkRawLayout({'dtype': 'float32'}),
+                         {'dtype': 'float32', 'byteOrder': '=', 'shape': None,
+                          'offset': 0, 'order': 'C'})
+
+        for invalid in [{}, {'dtype': 'int8', 'order': 'X'}, {'dtype': 'int8', 'shape': [-1, -1]},
+                        {'dtype': 'int8', 'unknown': 1}, {'dtype': 'int8', 'offset': -3}]:
+            with self.assertRaises(ValueError, msg=str(invalid)):
+                checkRawLayout(invalid)
+
+        self.assertIsNone(readRawDescriptor(self.fileName))
+        writeRawDescriptor(self.fileName, self.layout)
+        self.assertEqual(readRawDescriptor(self.fileName), checkRawLayout(self.layout))
+
+
+    def test_memmap(self):
+
+        array = memmapRawFile(self.fileName, self.layout)
+        self.assertIsInstance(array, np.memmap)
+        self.assertEqual(array.shape, (4, 5, 6))
+        np.testing.assert_array_equal(array, self.data)
+
+        flat = memmapRawFile(self.fileName, {'dtype': 'uint8'})
+        self.assertEqual(flat.shape, (len(self.header) + self.data.nbytes, ))
+
+        with self.assertRaises(ValueError):
+            memmapRawFile(self.fileName, dict(self.layout, shape=[5, 5, 6]))
+
+
+    def test_rti(self):
+
+        rti = RawBinaryFileRti('frames.raw', fileName=self.fileName)
+        rti.open()
+        self.assertIsNotNone(rti.exception)  # No layout yet
+        rti.close()
+
+        writeRawDescriptor(self.fileName, self.layout)
+        rti.open()
+        try:
+            self.assertIsNone(rti.exception)
+            self.assertEqual(rti.arrayShape, (4, 5, 6))
+            np.testing.assert_array_equal(rti[1:3, :, 2], self.data[1:3, :, 2])
+        finally:
+            rti.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests fetching children of the repository tree in the background
+"""
+import os
+import tempfile
+import time
+import unittest
+
+import h5py
+import netCDF4
+import numpy as np
+
+from argos.qt import Qt, QtWidgets
+from argos.repo.filesytemrtis import DirectoryRti
+from argos.repo.registry import globalRtiRegistry
+from argos.repo.repotreemodel import LoadingRti, RepoTreeModel
+from argos.repo.rtiplugins.hdf5 import H5pyFileRti
+from argos.repo.rtiplugins.ncdf import NcdfFileRti
+
+
+def processEventsUntil(condition, timeout=10.0):
+    """ Processes Qt events until the condition function returns True.
+    """
+    endTime = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < endTime, "Timeout while processing events"
+        QtWidgets.QApplication.processEvents()
+        time.sleep(0.001)
+
+
+class TestAsyncFetching(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(self.fileName, 'w') as h5File:
+            group = h5File.create_group('group')
+            for nr in range(5):
+                group.create_dataset('ds{}'.format(nr), data=np.arange(nr + 1))
+
+        self.model = RepoTreeModel(asyncFetching=True)
+        fileRti = H5pyFileRti.createFromFileName(self.fileName, '#00FF00')
+        self.fileIndex = self.model.insertItem(fileRti)
+        self.fileRti = fileRti
+
+
+    def tearDown(self):
+        self.model.deleteItemAtIndex(self.fileIndex)
+        self.tempDir.cleanup()
+
+
+    def test_fetch_in_background(self):
+
+        self.assertTrue(self.model.canFetchMore(self.fileIndex))
+        self.model.fetchMore(self.fileIndex)
+        self.assertFalse(self.model.canFetchMore(self.fileIndex))
+
+        # Until the fetch is processed, a placeholder is shown.
+        self.assertIsInstance(self.fileRti.childItems[0], LoadingRti)
+        processEventsUntil(lambda: not self.model.isFetching(self.fileRti))
+
+        self.assertEqual([child.nodeName for child in self.fileRti.childItems], ['group'])
+        self.assertTrue(self.fileRti.isOpen)
+        self.assertIsNone(self.fileRti.exception)
+
+
+    def test_find_waits_for_fetch(self):
+
+        self.model.fetchMore(self.fileIndex)
+        item, _index = self.model.findItemAndIndex('/test.h5/group/ds3')
+        self.assertEqual(item.arrayShape, (4, ))
+        self.assertFalse(any(isinstance(child, LoadingRti) for child in self.fileRti.childItems))
+        self.assertFalse(self.model.isFetching(self.fileRti))
+
+        # The queued finished signal is ignored because the fetch is already processed
+        QtWidgets.QApplication.processEvents()
+        self.assertEqual(self.fileRti.nChildren(), 1)
+
+
+    def test_cancel(self):
+
+        self.model.fetchMore(self.fileIndex)
+        self.assertTrue(self.model.cancelFetch(self.fileIndex))
+        self.model.removeAllChildrenAtIndex(self.fileIndex)
+        processEventsUntil(lambda: not self.model.isFetching(self.fileRti))
+
+        self.assertEqual(self.fileRti.nChildren(), 0)
+        self.assertFalse(self.fileRti.isOpen)
+        self.assertTrue(self.model.canFetchMore(self.fileIndex))
+        self.assertFalse(self.model.cancelFetch(self.fileIndex))
+
+
+    def test_metadata_snapshot(self):
+
+        groupRti, groupIndex = self.model.findItemAndIndex('/test.h5/group')
+        self.model.fetchMore(groupIndex)
+        processEventsUntil(lambda: not self.model.isFetching(groupRti))
+
+        # The metadata is read in the worker thread. Painting the rows when the file handle is
+        # released should therefore not reopen the file.
+        self.fileRti.releaseFileHandle()
+        for row in range(self.model.rowCount(groupIndex)):
+            for col in range(self.model.columnCount(groupIndex)):
+                for role in (Qt.DisplayRole, Qt.ToolTipRole, Qt.DecorationRole):
+                    self.model.data(self.model.index(row, col, groupIndex), role)
+        self.assertTrue(self.fileRti.isFileHandleReleased)
+
+        dataRti = groupRti.childByNodeName('ds3')
+        self.assertEqual(dataRti.arrayShape, (4, ))
+        self.assertEqual(dataRti.summary, '4 elements')
+
+
+    def test_netcdf_in_gui_thread(self):
+
+        # The NetCDF-C library is not thread safe and is used to read the data in the GUI thread.
+        fileName = os.path.join(self.tempDir.name, 'test.nc')
+        with netCDF4.Dataset(fileName, 'w') as ncFile:
+            ncFile.createDimension('x', 3)
+            group = ncFile.createGroup('group')
+            group.createVariable('var', 'f8', ('x', ))
+
+        ncRti = NcdfFileRti.createFromFileName(fileName, '#00FF00')
+        ncIndex = self.model.insertItem(ncRti)
+        try:
+            self.assertFalse(ncRti.canFetchInBackground())
+            self.model.fetchMore(ncIndex)
+            self.assertFalse(self.model.isFetching(ncRti))
+            self.assertEqual([child.nodeName for child in ncRti.childItems], ['x', 'group'])
+
+            groupRti = ncRti.childByNodeName('group')
+            self.assertFalse(groupRti.canFetchInBackground())
+            self.model.fetchMore(self.model.index(groupRti.childNumber(), 0, ncIndex))
+            self.assertEqual([child.nodeName for child in groupRti.childItems], ['var'])
+        finally:
+            self.model.deleteItemAtIndex(ncIndex)
+
+        self.assertTrue(self.fileRti.canFetchInBackground())
+
+
+
+
+class TestPagedFetching(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        if not globalRtiRegistry().items:
+            globalRtiRegistry().unmarshall(None)  # Use the default plugins
+
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.numChildren = 25
+        self.fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(self.fileName, 'w') as h5File:
+            for nr in range(self.numChildren - 1):
+                h5File.create_dataset('ds{:02d}'.format(nr), data=np.arange(nr + 1))
+        for nr in range(self.numChildren - 1):
+            with open(os.path.join(self.tempDir.name, 'file{:02d}.txt'.format(nr)), 'w') as f:
+                f.write("dummy")
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+
+    def test_directory(self):
+
+        model = RepoTreeModel(fetchPageSize=10)
+        dirRti = DirectoryRti(nodeName='dir', fileName=self.tempDir.name)
+        dirIndex = model.insertItem(dirRti)
+        try:
+            numFetched = []
+            while model.canFetchMore(dirIndex):
+                model.fetchMore(dirIndex)
+                numFetched.append(dirRti.nChildren())
+            self.assertEqual(numFetched, [10, 20, 25])
+            self.assertEqual(dirRti.childItems[-1].nodeName, 'test.h5')
+
+            # Removing the children resets the paging
+            model.removeAllChildrenAtIndex(dirIndex)
+            self.assertTrue(model.canFetchMore(dirIndex))
+
+            # Finding an item fetches pages until it's found.
+            item, _index = model.findItemAndIndex('/dir/file12.txt')
+            self.assertEqual(item.nodeName, 'file12.txt')
+            self.assertEqual(dirRti.nChildren(), 20)
+        finally:
+            model.deleteItemAtIndex(dirIndex)
+
+
+    def test_hdf5_async(self):
+
+        model = RepoTreeModel(asyncFetching=True, fetchPageSize=10)
+        fileRti = H5pyFileRti.createFromFileName(self.fileName, '#00FF00')
+        fileIndex = model.insertItem(fileRti)
+        try:
+            model.fetchMore(fileIndex)
+            processEventsUntil(lambda: not model.isFetching(fileRti))
+            self.assertEqual(fileRti.nChildren(), 10)
+
+            # Release the file handle between two pages. The next page reopens it.
+            fileRti.releaseFileHandle()
+            while model.canFetchMore(fileIndex):
+                model.fetchMore(fileIndex)
+                processEventsUntil(lambda: not model.isFetching(fileRti))
+
+            self.assertEqual([child.nodeName for child in fileRti.childItems],
+                             ['ds{:02d}'.format(nr) for nr in range(self.numChildren - 1)])
+            self.assertEqual(fileRti.childItems[-1].arrayShape, (self.numChildren - 1, ))
+        finally:
+            model.deleteItemAtIndex(fileIndex)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests searching the node paths of the opened files
+"""
+import fnmatch
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+
+import h5py
+import netCDF4
+import numpy as np
+
+from argos.collect.collector import Collector
+from argos.qt import QtWidgets
+from argos.repo.filehandlepool import globalFileHandlePool
+from argos.repo.repotreemodel import RepoTreeModel, _fetchExecutor
+from argos.repo.repotreeview import RepoTreeView
+from argos.repo.rtiplugins.hdf5 import H5pyFileRti
+from argos.repo.rtiplugins.ncdf import NcdfFileRti
+from argos.repo.searchindex import NodePathWalker, PathIndex, SearchIndexer, walkNodePaths
+from argos.repo.searchindex import SEARCH_SUBSTRING, SEARCH_GLOB, SEARCH_REGEX
+
+from test_repotreemodel import processEventsUntil
+
+
+class TestPathIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.pathsA = ['/a.nc/surface_temperature', '/a.nc/group', '/a.nc/group/Temperature',
+                       '/a.nc/group/pressure', '/a.nc/lat', '/a.nc/lon']
+        self.pathsB = ['/dir/b.h5/surface_temperature', '/dir/b.h5/time', '/dir/b.h5/x[0]']
+        self.index = PathIndex()
+        self.index.addPaths('/a.nc', self.pathsA)
+        self.index.addPaths('/dir/b.h5', self.pathsB)
+
+
+    def bruteForce(self, query, mode):
+        """ Returns the matching paths by testing all paths.
+        """
+        allPaths = self.pathsA + self.pathsB
+        if mode == SEARCH_SUBSTRING:
+            return [path for path in allPaths if query.lower() in path.lower()]
+        elif mode == SEARCH_GLOB:
+            return [path for path in allPaths if fnmatch.fnmatchcase(path.lower(), query.lower())]
+        else:
+            return [path for path in allPaths if re.search(query, path, re.IGNORECASE)]
+
+
+    def test_search(self):
+
+        queries = [
+            ('temperature', SEARCH_SUBSTRING), ('TEMP', SEARCH_SUBSTRING), ('la', SEARCH_SUBSTRING),
+            ('x[0]', SEARCH_SUBSTRING), ('notfound', SEARCH_SUBSTRING),
+            ('*/surface_temperature', SEARCH_GLOB), ('*/l??', SEARCH_GLOB),
+            ('*/x[[]0]', SEARCH_GLOB), ('*group/*', SEARCH_GLOB), ('temperature', SEARCH_GLOB),
+            ('^/a.nc/.*ure$', SEARCH_REGEX), ('l[ao][tn]$', SEARCH_REGEX),
+        ]
+        for query, mode in queries:
+            self.assertEqual(self.index.search(query, mode), self.bruteForce(query, mode),
+                             msg="query: {!r} ({})".format(query, mode))
+
+        self.assertEqual(self.index.search('*/surface_temperature', SEARCH_GLOB),
+                         ['/a.nc/surface_temperature', '/dir/b.h5/surface_temperature'])
+        self.assertEqual(self.index.search('a', SEARCH_SUBSTRING, maxResults=2),
+                         self.pathsA[:2])
+        self.assertEqual(self.index.search('', SEARCH_SUBSTRING), [])
+        self.assertRaises(re.error, self.index.search, '(', SEARCH_REGEX)
+
+
+    def test_remove(self):
+
+        self.index.removeRootsBelow('/dir')
+        self.assertEqual(self.index.rootPaths, ['/a.nc'])
+        self.assertEqual(self.index.search('surface', SEARCH_SUBSTRING),
+                         ['/a.nc/surface_temperature'])
+
+        # Replacing the paths of a root
+        self.index.addPaths('/a.nc', ['/a.nc/surface_pressure'])
+        self.assertEqual(self.index.search('surface', SEARCH_SUBSTRING),
+                         ['/a.nc/surface_pressure'])
+        self.assertEqual(len(self.index), 1)
+
+        self.index.removeRoot('/a.nc')
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.search('surface', SEARCH_SUBSTRING), [])
+
+
+
+class TestSearchIndexer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tempDir.name, 'test.h5')
+        with h5py.File(self.fileName, 'w') as h5File:
+            group = h5File.create_group('group/subgroup')
+            group.create_dataset('surface_temperature', data=np.arange(3))
+            h5File.create_dataset('surface_temperature', data=np.arange(3))
+
+        self.model = RepoTreeModel(asyncFetching=True)
+        self.indexer = SearchIndexer(self.model)
+        self.treeView = RepoTreeView(self.model, Collector(windowNumber=1))
+        self.fileRti = H5pyFileRti.createFromFileName(self.fileName, '#00FF00')
+        self.fileIndex = self.model.insertItem(self.fileRti)
+
+
+    def tearDown(self):
+        self.indexer.finalize()
+        self.treeView.finalize()
+        if self.fileIndex.isValid():
+            self.model.deleteItemAtIndex(self.fileIndex)
+        self.tempDir.cleanup()
+
+
+    def test_index_opened_file(self):
+
+        self.assertEqual(self.indexer.search('temp'), [])
+
+        # Opening the file indexes it in the background.
+        self.model.fetchMore(self.fileIndex)
+        processEventsUntil(lambda: not self.model.isFetching(self.fileRti))
+        processEventsUntil(lambda: not self.indexer.isIndexing())
+
+        self.assertEqual(self.indexer.search('*/surface_temperature', mode=SEARCH_GLOB),
+                         ['/test.h5/group/subgroup/surface_temperature',
+                          '/test.h5/surface_temperature'])
+
+        # Only the ancestors of the selected item are expanded.
+        index = self.treeView.selectPath('/test.h5/group/subgroup/surface_temperature')
+        self.assertTrue(index.isValid())
+        self.assertEqual(self.treeView.getCurrentItem()[0].nodeName, 'surface_temperature')
+        subgroupIndex = index.parent()
+        self.assertTrue(self.treeView.isExpanded(subgroupIndex))
+        self.assertTrue(self.treeView.isExpanded(subgroupIndex.parent()))
+        self.assertFalse(self.treeView.isExpanded(index))
+        self.assertFalse(self.treeView.selectPath('/test.h5/notfound').isValid())
+
+        # Removing the file removes its paths.
+        self.model.deleteItemAtIndex(self.fileIndex)
+        self.fileIndex = self.model.index(0, 0)
+        self.assertEqual(self.indexer.search('temp'), [])
+        self.assertEqual(self.indexer.pathIndex.rootPaths, [])
+
+
+    def test_walk_in_chunks(self):
+
+        expected = walkNodePaths(H5pyFileRti.createFromFileName(self.fileName, '#00FF00'),
+                                 '/test.h5')
+        self.assertEqual(len(expected), 4)
+
+        pool = globalFileHandlePool()
+        numOpenFiles = pool.numOpenFiles
+        copyRti = H5pyFileRti.createFromFileName(self.fileName, '#00FF00')
+        copyRti.excludeFromFileHandlePool()
+        walker = NodePathWalker(copyRti, '/test.h5')
+        self.assertFalse(walker.walkChunk(maxPaths=3))
+        self.assertEqual(walker.paths, expected[:3])
+        self.assertTrue(copyRti.isOpen)
+        self.assertEqual(pool.numOpenFiles, numOpenFiles)  # The copy is not in the pool.
+
+        self.assertTrue(walker.walkChunk(maxPaths=3))
+        self.assertEqual(walker.paths, expected)
+        self.assertFalse(copyRti.isOpen)
+
+
+    def test_one_walk_at_a_time(self):
+
+        otherRti = H5pyFileRti.createFromFileName(self.fileName, '#00FF00', nodeName='other.h5')
+        otherIndex = self.model.insertItem(otherRti)
+        try:
+            self.indexer.scheduleWalk(self.fileRti)
+            self.indexer.scheduleWalk(otherRti)
+            self.assertEqual(len(self.indexer._walkQueue), 1)  # Waits for the first walk.
+
+            # Scheduling it again replaces the waiting walk.
+            self.indexer.scheduleWalk(otherRti)
+            self.assertEqual(len(self.indexer._walkQueue), 1)
+            self.assertEqual(self.indexer._walkModel.rowCount(), 2)
+
+            processEventsUntil(lambda: not self.indexer.isIndexing())
+            self.assertEqual(self.indexer.pathIndex.rootPaths, ['/test.h5', '/other.h5'])
+            self.assertEqual(len(self.indexer.search('*/surface_temperature', SEARCH_GLOB)), 4)
+        finally:
+            self.model.deleteItemAtIndex(otherIndex)
+
+
+    def test_changed_while_walked(self):
+
+        # Blocks the worker thread so that the test can change the file between the chunks.
+        blockers = [threading.Event(), threading.Event()]
+        _fetchExecutor().submit(blockers[0].wait)
+        self.indexer.scheduleWalk(self.fileRti)
+        firstWalker = self.indexer._currentWalker
+        _fetchExecutor().submit(blockers[1].wait)
+
+        blockers[0].set()
+        while not firstWalker.isFinished:
+            time.sleep(0.001)
+        self.assertIn('/test.h5/surface_temperature', firstWalker.paths)
+
+        # The file changes after it has been walked, but before the result is processed.
+        with h5py.File(self.fileName, 'a') as h5File:
+            del h5File['surface_temperature']
+            h5File.create_dataset('pressure', data=np.arange(3))
+        self.indexer.scheduleWalk(self.fileRti)
+        blockers[1].set()
+
+        processEventsUntil(lambda: not self.indexer.isIndexing())
+        self.assertEqual(self.indexer.search('/test.h5/*', SEARCH_GLOB),
+                         ['/test.h5/group', '/test.h5/group/subgroup',
+                          '/test.h5/group/subgroup/surface_temperature', '/test.h5/pressure'])
+        self.assertEqual(self.indexer._walkModel.rowCount(), 0)
+
+
+    def test_netcdf_in_gui_thread(self):
+
+        fileName = os.path.join(self.tempDir.name, 'test.nc')
+        with netCDF4.Dataset(fileName, 'w') as ncFile:
+            ncFile.createDimension('x', 3)
+            ncFile.createGroup('group').createVariable('surface_temperature', 'f8', ('x', ))
+
+        ncRti = NcdfFileRti.createFromFileName(fileName, '#00FF00')
+        ncIndex = self.model.insertItem(ncRti)
+        try:
+            self.indexer.scheduleWalk(ncRti)
+            self.assertTrue(self.indexer.isIndexing())
+            processEventsUntil(lambda: not self.indexer.isIndexing())
+            self.assertIn('/test.nc/group/surface_temperature', self.indexer.search('temp'))
+        finally:
+            self.model.deleteItemAtIndex(ncIndex)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
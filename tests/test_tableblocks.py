@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests reading the slice of the table inspector in blocks.
+"""
+import unittest
+
+import numpy as np
+
+from argos.inspector.qtplugins.table import TableInspectorModel
+from argos.inspector.qtplugins.tableblocks import (
+    BLOCK_COLS, BLOCK_ROWS, PREFETCH_DISTANCE, BlockPrefetcher, SliceBlockReader)
+from argos.qt import QtWidgets
+from argos.utils.masks import ArrayWithMask
+from argos.utils.tilecache import TileCache
+
+
+class TestSliceBlockReader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def setUp(self):
+        self.nRows, self.nCols = 3 * BLOCK_ROWS + 10, 4 * BLOCK_COLS + 5
+        self.data = np.arange(self.nRows * self.nCols).reshape(self.nRows, self.nCols)
+        self.mask = (self.data % 7) == 0
+        self.regions = []
+        self.cache = TileCache()
+        self.reader = SliceBlockReader(self.readRegion, self.data.shape, 'slice', self.cache)
+
+
+    def readRegion(self, rowSlice, colSlice):
+        """ Reads a region of the test data and remembers which regions were read.
+        """
+        self.regions.append((rowSlice, colSlice))
+        return ArrayWithMask(self.data[rowSlice, colSlice], self.mask[rowSlice, colSlice], 0)
+
+
+    def test_blocks(self):
+
+        blockIds = self.reader.blocksInRect((-5, self.nRows + 5), (-5, self.nCols + 5))
+        self.assertEqual(len(blockIds), 4 * 5)
+
+        covered = np.zeros(self.data.shape, dtype=int)
+        for blockId in blockIds:
+            block = self.reader.readBlock(blockId)
+            rowSlice, colSlice = self.reader.blockRegion(blockId)
+            np.testing.assert_array_equal(block.data, self.data[rowSlice, colSlice])
+            np.testing.assert_array_equal(block.mask, self.mask[rowSlice, colSlice])
+            covered[rowSlice, colSlice] += 1
+        self.assertTrue(np.all(covered == 1))
+
+        self.assertEqual(self.reader.blocksInRect((BLOCK_ROWS, BLOCK_ROWS), (0, BLOCK_COLS)),
+                         [(1, 0), (1, 1)])
+        self.assertEqual(self.reader.blocksInRect((self.nRows, self.nRows + 9), (0, 0)), [])
+
+
+    def test_cells(self):
+
+        row, col = 2 * BLOCK_ROWS + 3, BLOCK_COLS + 7
+        for _ in range(2):
+            block, blockRow, blockCol = self.reader.cellBlock(row, col)
+            self.assertEqual(block.data[blockRow, blockCol], self.data[row, col])
+        self.assertEqual(len(self.regions), 1)  # The second time the block is cached.
+
+
+    def test_bounded_cache(self):
+
+        blockBytes = BLOCK_ROWS * BLOCK_COLS * (self.data.itemsize + 1)
+        self.cache = TileCache(maxBytes=3 * blockBytes)
+        self.reader = SliceBlockReader(self.readRegion, self.data.shape, 'slice', self.cache)
+        for blockCol in range(4):
+            self.reader.readBlock((0, blockCol))
+        self.assertEqual(len(self.cache), 3)
+        self.assertLessEqual(self.cache.numBytes, self.cache.maxBytes)
+        self.assertIsNone(self.reader.cachedBlock((0, 0)))
+
+
+    def test_prefetch(self):
+
+        prefetcher = BlockPrefetcher()
+        prefetcher.setReader(self.reader)
+
+        # Not scrolling
+        prefetcher.prefetch((0, 40), (0, 10), 0, 0)
+        self.assertEqual(prefetcher.pendingBlockIds, [])
+
+        # Scrolling down reads the blocks below the view.
+        prefetcher.prefetch((BLOCK_ROWS - 40, BLOCK_ROWS - 1), (0, 10), 1, 0)
+        self.assertEqual(prefetcher.pendingBlockIds,
+                         [(1 + i, 0) for i in range(PREFETCH_DISTANCE)])
+        while prefetcher.pendingBlockIds:
+            prefetcher.readNextBlock()
+        self.assertIsNotNone(self.reader.cachedBlock((1, 0)))
+
+        # Cached blocks are not read again
+        prefetcher.prefetch((BLOCK_ROWS - 40, BLOCK_ROWS - 1), (0, 10), 1, 0)
+        self.assertEqual(prefetcher.pendingBlockIds, [])
+
+        # Scrolling left from the first column has nothing to read.
+        prefetcher.prefetch((0, 40), (0, 10), 0, -1)
+        self.assertEqual(prefetcher.pendingBlockIds, [])
+
+        prefetcher.prefetch((0, 40), (BLOCK_COLS, BLOCK_COLS + 10), 0, -1)
+        self.assertEqual(prefetcher.pendingBlockIds, [(0, 0)])
+        prefetcher.setReader(None)
+        self.assertEqual(prefetcher.pendingBlockIds, [])
+
+
+
+class TestBlockTableModel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.qApp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+    def test_same_cells(self):
+
+        nRows, nCols = BLOCK_ROWS + 3, BLOCK_COLS + 2
+        data = np.zeros((nRows, nCols), dtype=[('a', np.int32), ('b', np.float64)])
+        data['a'] = np.arange(nRows * nCols).reshape(nRows, nCols)
+        data['b'] = -data['a']
+        mask = np.zeros(data.shape, dtype=[('a', bool), ('b', bool)])
+        mask['b'][::3, :] = True
+        slicedArray = ArrayWithMask(data, mask, None)
+
+        def readRegion(rowSlice, colSlice):
+            return slicedArray[rowSlice, colSlice]
+
+        rtiInfo = {'x-dim': 'dim-1', 'y-dim': 'dim-0'}
+        reader = SliceBlockReader(readRegion, data.shape, 'slice', TileCache())
+        fullModel = TableInspectorModel()
+        fullModel.updateState(slicedArray, rtiInfo, separateFields=True)
+        blockModel = TableInspectorModel()
+        blockModel.updateState(None, rtiInfo, separateFields=True, blockReader=reader)
+
+        self.assertEqual(blockModel.rowCount(), nRows)
+        self.assertEqual(blockModel.columnCount(), 2 * nCols)
+        for row, col in [(0, 0), (0, 1), (3, 5), (BLOCK_ROWS + 2, 2 * BLOCK_COLS + 3)]:
+            self.assertEqual(blockModel._cellValue(blockModel.index(row, col)),
+                             fullModel._cellValue(fullModel.index(row, col)))
+            self.assertEqual(blockModel._cellMask(blockModel.index(row, col)),
+                             fullModel._cellMask(fullModel.index(row, col)))
+
+        self.assertEqual(blockModel._cellValue(blockModel.index(0, 3)), data['b'][0, 1])
+        self.assertTrue(blockModel._cellMask(blockModel.index(3, 1)))
+        self.assertEqual(blockModel.arrayIndex(3, 5), (3, 2, 'b'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
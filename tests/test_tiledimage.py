@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests tiled reading of large images.
+"""
+import unittest
+
+import numpy as np
+
+from argos.inspector.pgplugins.tiledimage import (
+    TILE_SIZE, OVERVIEW_SIZE, TiledSliceReader, levelForPixelSize)
+from argos.utils.masks import ArrayWithMask
+from argos.utils.tilecache import TileCache
+
+
+class TestTileCache(unittest.TestCase):
+
+    def test_lru(self):
+
+        tile = ArrayWithMask(np.zeros(100, dtype=np.uint8), False, 0)
+        cache = TileCache(maxBytes=300)
+        for key in 'abc':
+            cache.put(key, tile)
+        self.assertEqual(cache.numBytes, 300)
+
+        cache.get('a')  # Now 'b' is the least recently used
+        cache.put('d', tile)
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+
+        # The mask is counted as well
+        cache.put('e', ArrayWithMask(np.zeros(100, dtype=np.uint8), np.zeros(100, dtype=bool), 0))
+        self.assertEqual(cache.numBytes, 300)
+        self.assertEqual(len(cache), 2)
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.numBytes), (0, 0))
+
+
+
+class TestTiledSliceReader(unittest.TestCase):
+
+    def setUp(self):
+        self.nRows, self.nCols = 2 * TILE_SIZE + 100, 3 * OVERVIEW_SIZE + 7
+        self.data = np.arange(self.nRows * self.nCols, dtype=float).reshape(self.nRows, self.nCols)
+        self.mask = (self.data % 7) == 0
+        self.regions = []
+        self.cache = TileCache()
+        self.reader = TiledSliceReader(self.readRegion, self.data.shape, 'slice', self.cache)
+
+
+    def readRegion(self, rowSlice, colSlice):
+        """ Reads a region of the test data and remembers which regions were read.
+        """
+        self.regions.append((rowSlice, colSlice))
+        return ArrayWithMask(self.data[rowSlice, colSlice], self.mask[rowSlice, colSlice], 0.0)
+
+
+    def test_levels(self):
+
+        self.assertEqual(levelForPixelSize(0.1), 0)
+        self.assertEqual(levelForPixelSize(1.9), 0)
+        self.assertEqual(levelForPixelSize(2.0), 1)
+        self.assertEqual(levelForPixelSize(17), 4)
+        self.assertEqual(levelForPixelSize(np.nan), 0)
+
+
+    def test_overview(self):
+
+        self.assertEqual(self.reader.overviewStride, 4)
+        self.assertEqual(self.reader.overviewLevel, 2)
+        overview = self.reader.readOverview()
+        np.testing.assert_array_equal(overview.data, self.data[::4, ::4])
+
+        self.reader.readOverview()
+        self.assertEqual(len(self.regions), 1)
+
+
+    def test_tiles(self):
+
+        tileIds = self.reader.tilesInRect(0, (TILE_SIZE - 10, TILE_SIZE + 10), (0, 10))
+        self.assertEqual(sorted(tileIds), [(0, 0, 0), (0, 1, 0)])
+
+        # All tiles together cover the complete slice.
+        for level in range(2):
+            tileIds = self.reader.tilesInRect(level, (-5, self.nRows + 5), (-5, self.nCols + 5))
+            covered = np.zeros(self.data.shape, dtype=int)
+            for tileId in tileIds:
+                tile = self.reader.readTile(tileId)
+                rowSlice, colSlice = self.reader.tileRegion(tileId)
+                np.testing.assert_array_equal(tile.data, self.data[rowSlice, colSlice])
+                np.testing.assert_array_equal(tile.mask, self.mask[rowSlice, colSlice])
+                self.assertLessEqual(max(tile.shape), TILE_SIZE)
+                covered[rowSlice.start:rowSlice.stop, colSlice.start:colSlice.stop] += 1
+            self.assertTrue(np.all(covered == 1))
+
+        # The center tiles come first
+        tileIds = self.reader.tilesInRect(0, (0, self.nRows), (0, self.nCols))
+        self.assertEqual(tileIds[0], (0, 1, 3))
+
+        # Cached tiles are not read again
+        numRegions = len(self.regions)
+        self.reader.readTile((0, 1, 1))
+        self.assertEqual(len(self.regions), numRegions)
+        self.assertIsNone(self.reader.cachedTile((3, 0, 0)))
+
+
+    def test_full_resolution(self):
+
+        row, col = TILE_SIZE + 3, 2 * TILE_SIZE + 1
+        for _ in range(2):  # From the slice, then from the cached tile.
+            value, masked = self.reader.readValue(row, col)
+            self.assertEqual(value, self.data[row, col])
+            self.assertEqual(masked, self.mask[row, col])
+            self.reader.readTile((0, 1, 2))
+
+        rowArray = self.reader.readRow(row)
+        np.testing.assert_array_equal(rowArray.data, self.data[row, :])
+        np.testing.assert_array_equal(rowArray.mask, self.mask[row, :])
+        self.assertIs(self.reader.readRow(row), rowArray)
+
+        colArray = self.reader.readCol(col)
+        np.testing.assert_array_equal(colArray.data, self.data[:, col])
+        np.testing.assert_array_equal(colArray.mask, self.mask[:, col])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -140,6 +140,133 @@ class TestGetByPath(unittest.TestCase):
         self.assertIs(checkItem, self.item2)
 
 
+
+class TestInsertItems(unittest.TestCase):
+
+    def setUp(self):
+        self.model = BaseTreeModel()
+        self.parentItem = BaseTreeItem('parent')
+        self.parentIndex = self.model.insertItem(self.parentItem)
+        self.model.insertItem(BaseTreeItem('last'), parentIndex=self.parentIndex)
+
+        self.insertedRanges = []
+        self.model.rowsInserted.connect(
+            lambda _parent, first, last: self.insertedRanges.append((first, last)))
+
+
+    def testInsertItems(self):
+
+        childItems = [BaseTreeItem('child{}'.format(nr)) for nr in range(5)]
+        grandChild = childItems[2].insertChild(BaseTreeItem('grandChild'))
+        lastIndex = self.model.insertItems(childItems, position=0, parentIndex=self.parentIndex)
+
+        self.assertEqual(self.insertedRanges, [(0, 4)])  # Only one notification
+        self.assertIs(self.model.getItem(lastIndex), childItems[-1])
+        self.assertEqual([child.nodeName for child in self.parentItem.childItems],
+                         ['child0', 'child1', 'child2', 'child3', 'child4', 'last'])
+        self.assertEqual(childItems[3].nodePath, '/parent/child3')
+        self.assertEqual(grandChild.nodePath, '/parent/child2/grandChild')
+        self.assertIs(childItems[0].parentItem, self.parentItem)
+
+        # Empty list
+        self.assertFalse(self.model.insertItems([], parentIndex=self.parentIndex).isValid())
+        self.assertEqual(len(self.insertedRanges), 1)
+
+
+
+
+class TestRowAndNameLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.rootItem = BaseTreeItem('root')
+        self.rootItem.insertChildren([BaseTreeItem('item{}'.format(nr)) for nr in range(5)])
+
+
+    def checkRowNumbers(self):
+        for row, childItem in enumerate(self.rootItem.childItems):
+            self.assertEqual(childItem.childNumber(), row)
+
+
+    def testRowNumbers(self):
+
+        self.checkRowNumbers()
+        self.rootItem.insertChild(BaseTreeItem('first'), position=0)
+        self.checkRowNumbers()
+        self.rootItem.insertChildren([BaseTreeItem('a'), BaseTreeItem('b')], position=3)
+        self.checkRowNumbers()
+        self.rootItem.removeChild(1)
+        self.checkRowNumbers()
+        self.assertEqual(self.rootItem.childByNodeName('b').childNumber(), 3)
+
+
+    def testDuplicateNames(self):
+
+        self.rootItem.insertChild(BaseTreeItem('item2'))
+        self.assertIs(self.rootItem.childByNodeName('item2'), self.rootItem.child(2))
+
+        duplicate = self.rootItem.insertChild(BaseTreeItem('item3'), position=0)
+        self.assertIs(self.rootItem.childByNodeName('item3'), duplicate)
+
+        self.rootItem.removeChild(0)
+        self.assertIs(self.rootItem.childByNodeName('item3'), self.rootItem.child(3))
+        self.rootItem.removeChild(2)
+        self.assertIs(self.rootItem.childByNodeName('item2'), self.rootItem.child(4))
+
+        self.rootItem.child(0).nodeName = 'renamed'
+        self.assertIs(self.rootItem.childByNodeName('renamed'), self.rootItem.child(0))
+        self.assertRaises(IndexError, self.rootItem.childByNodeName, 'item0')
+
+        self.rootItem.removeAllChildren()
+        self.assertRaises(IndexError, self.rootItem.childByNodeName, 'renamed')
+
+
+
+class ScanCountingList(list):
+    """ List that counts how often it is searched or iterated over.
+    """
+    def __init__(self, *args):
+        super(ScanCountingList, self).__init__(*args)
+        self.numScans = 0
+
+    def index(self, *args):
+        self.numScans += 1
+        return super(ScanCountingList, self).index(*args)
+
+    def __iter__(self):
+        self.numScans += 1
+        return super(ScanCountingList, self).__iter__()
+
+
+
+class TestLookupWithoutScans(unittest.TestCase):
+    """ Checks that the row and name lookups don't search the list of siblings.
+
+        The timing of the lookups is in tests/benchmarks/bench_treelookup.py
+    """
+    def testNoScans(self):
+
+        model = BaseTreeModel()
+        parentItem = BaseTreeItem('parent')
+        parentIndex = model.insertItem(parentItem)
+        parentItem.insertChild(BaseTreeItem('group'))
+        groupIndex = model.index(0, 0, parentIndex)
+        groupItem = model.getItem(groupIndex)
+        model.insertItems([BaseTreeItem('child{}'.format(nr)) for nr in range(1000)],
+                          parentIndex=groupIndex)
+        rootItem = model.invisibleRootTreeItem
+        self.assertIs(rootItem.findByNodePath('parent/group/child999'), groupItem.child(999))
+
+        groupItem._childItems = ScanCountingList(groupItem.childItems)
+        lastIndex = model.index(999, 0, groupIndex)
+        for _ in range(10):
+            self.assertEqual(model.parent(lastIndex), groupIndex)
+            self.assertEqual(groupItem.child(999).childNumber(), 999)
+            self.assertIs(rootItem.findByNodePath('parent/group/child999'), groupItem.child(999))
+            self.assertIs(groupItem.childByNodeName('child500'), groupItem.child(500))
+        self.assertEqual(groupItem.childItems.numScans, 0)
+
+
+
 if __name__ == '__main__':
     logging.basicConfig(level='DEBUG', stream=sys.stderr,
                         format='%(asctime)s %(filename)25s:%(lineno)-4d : %(levelname)-7s: %(message)s')
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests the Zarr plugin on synthetic stores
+
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import zarr
+
+from argos.repo.rtiplugins.zarrio import (
+    ZarrStoreRti, ZarrArrayRti, ZarrGroupRti, readChunksConcurrently)
+
+
+class TestZarrStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tempDir.name, 'test.zarr')
+
+        self.data = np.arange(35 * 22 * 3, dtype=np.float32).reshape(35, 22, 3)
+        root = zarr.open_group(self.fileName, mode='w')
+        root.attrs['title'] = 'synthetic'
+        array = root.create_array('data', shape=self.data.shape, chunks=(8, 5, 2),
+                                  dtype=self.data.dtype, fill_value=-1.0)
+        array[...] = self.data
+        array.attrs['units'] = 'K'
+        array.attrs['_ARRAY_DIMENSIONS'] = ['time', 'y', 'x']
+        sub = root.create_group('sub')
+        scalar = sub.create_array('answer', shape=(), dtype=np.int64)
+        scalar[()] = 42
+
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+
+    def test_chunked_reads(self):
+
+        array = zarr.open_array(os.path.join(self.fileName, 'data'), mode='r')
+        for index in [(slice(None), 3, slice(None)),
+                      (slice(2, 30, 3), slice(None, None, 4)),
+                      (Ellipsis, 1),
+                      (-1, slice(3, 17), slice(0, 3, 2)),
+                      (slice(9, 9),),
+                      4,
+                      ([1, 5, 20],),            # Fancy indexing is passed on to Zarr
+                      (slice(None, None, -2),),
+                      (slice(30, 2, -7), [0, 2], 1)]:
+            np.testing.assert_array_equal(readChunksConcurrently(array, index),
+                                          self.data[index], err_msg=str(index))
+
+        with self.assertRaises(IndexError):
+            readChunksConcurrently(array, (35, 0))
+
+
+    def test_store_rti(self):
+
+        storeRti = ZarrStoreRti('test.zarr', fileName=self.fileName)
+        storeRti.open()
+        try:
+            self.assertEqual(storeRti.attributes['title'], 'synthetic')
+            children = storeRti.fetchChildren()
+            self.assertEqual([child.nodeName for child in children], ['data', 'sub'])
+
+            dataRti, subRti = children
+            self.assertIsInstance(dataRti, ZarrArrayRti)
+            self.assertIsInstance(subRti, ZarrGroupRti)
+            self.assertEqual(dataRti.arrayShape, self.data.shape)
+            self.assertEqual(dataRti.chunking, (8, 5, 2))
+            self.assertEqual(dataRti.dimensionNames, ['time', 'y', 'x'])
+            self.assertEqual(dataRti.unit, 'K')
+            self.assertEqual(dataRti.missingDataValue, -1.0)
+            np.testing.assert_array_equal(dataRti[1:20, 4], self.data[1:20, 4])
+
+            scalarRti = subRti.fetchChildren()[0]
+            self.assertEqual(scalarRti.nodeName, 'answer')
+            self.assertEqual(scalarRti[()], 42)
+        finally:
+            storeRti.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()